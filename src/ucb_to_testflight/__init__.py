@@ -1,6 +1,27 @@
-"""Public package exports for ucb_to_testflight."""
+"""
+Public package exports for ucb_to_testflight.
 
-from .upload_parameters import UploadParameters
-from .upload_to_testflight import upload_to_testflight
+Exports are imported on first use so importing the package (or running the command entry with --help) stays cheap.
+"""
 
-__all__ = ["UploadParameters", "upload_to_testflight"]
+__all__ = ["UploadParameters", "upload_to_testflight", "upload_to_testflight_async"]
+
+_EXPORT_MODULES = {
+    "UploadParameters": ".upload_parameters",
+    "upload_to_testflight": ".upload_to_testflight",
+    "upload_to_testflight_async": ".upload_to_testflight_async",
+}
+
+
+def __getattr__(name: str):
+    if name not in _EXPORT_MODULES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    import importlib
+    value = getattr(importlib.import_module(_EXPORT_MODULES[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list:
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,166 @@
+"""
+A small App Store Connect API client: ES256 JWT auth and JSON:API requests over a shared HttpConnectionPool.
+
+Signing a token costs more than a keep-alive request, so signed tokens are cached (per issuer/key, for the whole process)
+and reused until TOKEN_REFRESH_MARGIN_SECONDS before they expire. The client is safe to share between threads.
+
+Only what our backends need is here. cryptography (for signing the token) is imported on first use.
+"""
+import base64
+import json
+import threading
+import time
+from typing import Callable, Optional
+
+from .http_connection_pool import HttpConnectionPool, HttpResponse
+
+API_BASE_URL = "https://api.appstoreconnect.apple.com"
+TOKEN_AUDIENCE = "appstoreconnect-v1"
+TOKEN_LIFETIME_SECONDS = 1200   # App Store Connect rejects tokens that live longer than 20 minutes
+TOKEN_REFRESH_MARGIN_SECONDS = 60   # A new token is signed this long before the cached one expires
+_RETRYABLE_CLIENT_ERROR_STATUSES = (408, 429)
+
+
+class AppStoreConnectError(RuntimeError):
+    """ App Store Connect answered with an error status. errors is the JSON:API errors list (if it sent one). """
+    status: int
+    errors: list
+
+    def __init__(self, method: str, path: str, status: int, errors: list) -> None:
+        details = "; ".join(f"{error.get('code', '')}: {error.get('detail') or error.get('title', '')}" for error in errors)
+        super().__init__(f"{method} {path} failed with HTTP {status}{f' ({details})' if details else ''}")
+        self.status = status
+        self.errors = errors
+
+    @property
+    def retryable(self) -> bool:
+        """ Worth asking again later (server errors, rate limiting). """
+        return self.status >= 500 or self.status in _RETRYABLE_CLIENT_ERROR_STATUSES
+
+
+def make_token(issuer_id: str, key_id: str, key_content: str, now: Optional[float] = None, lifetime: int = TOKEN_LIFETIME_SECONDS) -> str:
+    """ A signed App Store Connect API token (JWT, ES256). key_content is the .p8 file's PEM text. """
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature
+
+    issued_at = int(time.time() if now is None else now)
+    header = {"alg": "ES256", "kid": key_id, "typ": "JWT"}
+    payload = {"iss": issuer_id, "iat": issued_at, "exp": issued_at + lifetime, "aud": TOKEN_AUDIENCE}
+    signing_input = f"{_base64url(json.dumps(header).encode())}.{_base64url(json.dumps(payload).encode())}".encode()
+
+    private_key = serialization.load_pem_private_key(key_content.encode(), password=None)
+    r, s = decode_dss_signature(private_key.sign(signing_input, ec.ECDSA(hashes.SHA256())))
+    signature = r.to_bytes(32, "big") + s.to_bytes(32, "big")   # JWS wants raw r||s, not DER
+    return f"{signing_input.decode()}.{_base64url(signature)}"
+
+
+class TokenCache:
+    """ Signed tokens by (issuer id, key id, key), reused until shortly before they expire. """
+    lifetime: int
+    refresh_margin: int
+    signed_count: int   # Tokens signed (not reused) so far
+
+    def __init__(self, lifetime: int = TOKEN_LIFETIME_SECONDS, refresh_margin: int = TOKEN_REFRESH_MARGIN_SECONDS, clock: Callable[[], float] = time.time) -> None:
+        self.lifetime = lifetime
+        self.refresh_margin = refresh_margin
+        self.signed_count = 0
+        self._clock = clock
+        self._tokens = {}   # key -> (token, expires at)
+        self._lock = threading.Lock()
+
+    def token(self, issuer_id: str, key_id: str, key_content: str) -> str:
+        key = (issuer_id, key_id, key_content)
+        now = self._clock()
+        with self._lock:    # Held while signing too, so threads starting together don't all sign their own
+            cached = self._tokens.get(key)
+            if cached is not None and now < cached[1] - self.refresh_margin:
+                return cached[0]
+            token = make_token(issuer_id, key_id, key_content, now, self.lifetime)
+            self._tokens[key] = (token, int(now) + self.lifetime)
+            self.signed_count += 1
+            return token
+
+    def clear(self) -> None:
+        with self._lock:
+            self._tokens = {}
+
+
+_token_cache = TokenCache()
+
+
+class AppStoreConnectClient:
+    issuer_id: str
+    key_id: str
+    key_content: str
+    base_url: str
+    pool: HttpConnectionPool
+    token_cache: TokenCache
+
+    def __init__(
+        self,
+        issuer_id: str,
+        key_id: str,
+        key_content: str,
+        base_url: str = API_BASE_URL,
+        pool: Optional[HttpConnectionPool] = None,
+        token_cache: Optional[TokenCache] = None,
+    ) -> None:
+        self.issuer_id = issuer_id
+        self.key_id = key_id
+        self.key_content = key_content
+        self.base_url = base_url.rstrip("/")
+        self.pool = pool or HttpConnectionPool()
+        self.token_cache = token_cache or _token_cache
+
+    def token(self) -> str:
+        return self.token_cache.token(self.issuer_id, self.key_id, self.key_content)
+
+    def request(self, method: str, path: str, json_body: Optional[dict] = None, query: Optional[dict] = None) -> dict:
+        """ A JSON:API request. Returns the decoded response document. Raises AppStoreConnectError on an error status. """
+        return self._send(method, path, json_body, query).json() or {}
+
+    def get_if_changed(self, path: str, query: Optional[dict] = None, etag: Optional[str] = None) -> tuple:
+        """ (document, etag). document is None if it hasn't changed since etag (304 Not Modified). """
+        response = self._send("GET", path, query=query, headers={"If-None-Match": etag} if etag else None)
+        if response.status == 304:
+            return None, etag
+        return response.json() or {}, response.headers.get("etag")
+
+    def _send(self, method: str, path: str, json_body: Optional[dict] = None, query: Optional[dict] = None, headers: Optional[dict] = None) -> HttpResponse:
+        url = self.base_url + path
+        if query:
+            import urllib.parse
+            url += "?" + urllib.parse.urlencode(query)
+        headers = {"Authorization": f"Bearer {self.token()}", "Accept": "application/json", **(headers or {})}
+        body = None
+        if json_body is not None:
+            body = json.dumps(json_body).encode()
+            headers["Content-Type"] = "application/json"
+
+        response = self.pool.request(method, url, body=body, headers=headers)
+        if response.status == 401:
+            self.token_cache.clear()    # Don't keep handing out a token App Store Connect has stopped accepting
+        if not response.ok and response.status != 304:
+            raise AppStoreConnectError(method, path, response.status, _errors(response))
+        return response
+
+    def find_app_id(self, bundle_id: str) -> str:
+        apps = self.request("GET", "/v1/apps", query={"filter[bundleId]": bundle_id, "fields[apps]": "bundleId"})["data"]
+        if not apps:
+            raise AppStoreConnectError("GET", "/v1/apps", 404, [{"code": "NOT_FOUND", "detail": f"No app with bundle id {bundle_id}"}])
+        return apps[0]["id"]
+
+    def close(self) -> None:
+        self.pool.close()
+
+
+def _errors(response: HttpResponse) -> list:
+    try:
+        return list((response.json() or {}).get("errors", []))
+    except ValueError:
+        return []
+
+
+def _base64url(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
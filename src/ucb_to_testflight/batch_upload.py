@@ -0,0 +1,146 @@
+"""
+Uploads several builds (eg. white label/staging/prod flavours of one commit) from one process, a few at a time.
+
+BATCH_MANIFEST points to a JSON list of jobs:
+[
+    {"name": "prod", "output_directory": "Builds/prod", "changelog_path": "Builds/changelog.txt", "groups": ["qa", "clients"]},
+    {"name": "staging", "output_directory": "Builds/staging", "changelog_path": "Builds/changelog.txt"}
+]
+changelog_path is only needed when CHANGELOG_SOURCE is "file".
+Anything a job doesn't set (credentials, max_upload_attempts, attempt_timeout, ...) comes from the usual CLI/env/default parameters.
+Each job still gets its own max_upload_attempts and attempt_timeout.
+"""
+import json
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional
+
+from .upload_parameters import UploadParameters
+
+# Parameters a job can set for itself.
+JOB_PARAMETER_NAMES: tuple = (
+    "output_directory",
+    "changelog_path",
+    "groups",
+    "max_upload_attempts",
+    "attempt_timeout",
+    "show_fastlane_logs",
+)
+
+
+class BatchUploadParameters(UploadParameters):
+    batch_manifest: Path
+    max_concurrent_uploads: int = 2
+
+    _entry_parameter_names: tuple = UploadParameters._entry_parameter_names + (
+        "batch_manifest",
+        "max_concurrent_uploads",
+    )
+
+    def _get_unset_parameter_names(self) -> list[str]:
+        # Jobs bring their own output directory and changelog
+        return [name for name in super()._get_unset_parameter_names() if name not in JOB_PARAMETER_NAMES]
+
+
+class BatchJob:
+    name: str
+    overrides: dict
+
+    def __init__(self, name: str, overrides: dict) -> None:
+        self.name = name
+        self.overrides = overrides
+
+
+class BatchJobResult:
+    job: BatchJob
+    error: Optional[BaseException]
+    duration: float     # seconds
+
+    def __init__(self, job: BatchJob, error: Optional[BaseException], duration: float) -> None:
+        self.job = job
+        self.error = error
+        self.duration = duration
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None
+
+
+def load_batch_manifest(manifest_path: Path, changelog_source: str = "file") -> list[BatchJob]:
+    """ changelog_source is the batch's CHANGELOG_SOURCE: jobs only need a changelog_path when it's "file". """
+    with open(manifest_path, "r") as file:
+        entries = json.load(file)
+
+    if not isinstance(entries, list):
+        raise ValueError(f"Batch manifest {manifest_path} must be a JSON list of jobs.")
+
+    jobs = []
+    for index, entry in enumerate(entries):
+        name = str(entry.pop("name", f"job-{index + 1}"))
+
+        unknown = set(entry) - set(JOB_PARAMETER_NAMES)
+        if unknown:
+            raise ValueError(f"Batch job {name} has unknown keys: {', '.join(sorted(unknown))}")
+        required_names = ("output_directory", "changelog_path") if changelog_source == "file" else ("output_directory",)
+        for required in required_names:
+            if required not in entry:
+                raise ValueError(f"Batch job {name} is missing {required}")
+
+        overrides = dict(entry)
+        # Relative paths are relative to the manifest, not wherever the script happens to be run from
+        for path_name in ("output_directory", "changelog_path"):
+            if path_name in overrides:
+                overrides[path_name] = manifest_path.parent / overrides[path_name]
+        if isinstance(overrides.get("groups"), str):
+            overrides["groups"] = [group.strip() for group in overrides["groups"].split(",") if group.strip()]
+
+        jobs.append(BatchJob(name, overrides))
+    return jobs
+
+
+def run_batch(jobs: list[BatchJob], parameters: UploadParameters, max_concurrent_uploads: int, upload: Optional[Callable] = None) -> list[BatchJobResult]:
+    """ Runs every job (max_concurrent_uploads at a time) and returns the results in job order. Never raises for a failed job. """
+    if upload is None:
+        from .upload_to_testflight import upload_to_testflight as upload
+
+    def run_job(job: BatchJob) -> BatchJobResult:
+        print(f"[{job.name}] Starting upload from {job.overrides['output_directory']}")
+        return run_timed_job(job, lambda: upload(*parameters.get_values(**job.overrides)))
+
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrent_uploads), thread_name_prefix="batch-upload") as executor:
+        return list(executor.map(run_job, jobs))
+
+
+def run_timed_job(job: BatchJob, function: Callable[[], object]) -> BatchJobResult:
+    """ Call function and time it. A failure is printed and kept on the result rather than raised. """
+    start = time.monotonic()
+    try:
+        function()
+    except Exception as error:
+        traceback.print_exc()
+        return BatchJobResult(job, error, time.monotonic() - start)
+    return BatchJobResult(job, None, time.monotonic() - start)
+
+
+def print_batch_summary(results: list[BatchJobResult], total_duration: float) -> None:
+    max_name_length = max([len(result.job.name) for result in results], default=0)
+    print("\nBatch Summary ".ljust(32, "="))
+    for result in results:
+        status = "OK" if result.succeeded else "FAILED"
+        line = f"  {status:<6} {result.job.name:<{max_name_length}}  {_format_duration(result.duration)}"
+        if not result.succeeded:
+            line += f"  ({type(result.error).__name__}: {result.error})"
+        print(line)
+
+    failed_count = sum(1 for result in results if not result.succeeded)
+    job_seconds = sum(result.duration for result in results)
+    print(f"{len(results) - failed_count}/{len(results)} succeeded in {_format_duration(total_duration)} "
+          f"({_format_duration(job_seconds)} of uploading)")
+    print("=" * 32)
+
+
+def _format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(seconds, 60)
+    return f"{int(minutes)}m {seconds:04.1f}s" if minutes else f"{seconds:.1f}s"
@@ -0,0 +1,25 @@
+import time
+
+from . import tracing
+from .batch_upload import BatchUploadParameters, load_batch_manifest, print_batch_summary, run_batch
+
+
+def batch_upload_cmd_entry():
+    tracing.begin()
+    parameters = BatchUploadParameters()
+    parameters.load()
+    tracing.configure(parameters.trace_path, parameters.timings)
+    jobs = load_batch_manifest(parameters.batch_manifest, parameters.changelog_source)
+
+    start = time.monotonic()
+    results = run_batch(jobs, parameters, parameters.max_concurrent_uploads)
+    print_batch_summary(results, time.monotonic() - start)
+    if parameters.timings:
+        tracing.print_timings()
+
+    if not all(result.succeeded for result in results):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    batch_upload_cmd_entry()
@@ -0,0 +1,160 @@
+"""
+Creates/updates the venv upload-to-testflight.sh runs in, skipping all of pip when nothing has changed.
+
+What went into the venv is fingerprinted and stamped into it:
+ - inputs: pyproject.toml, the venv's python version and (if used) the wheelhouse contents,
+ - installed: the distributions actually in the venv's site-packages after installing (the resolved dependency set).
+The next run only recomputes those (a few file reads) and installs again if either differs.
+Git dependencies are only re-fetched when one of those changes, or with --force.
+
+WHEELHOUSE points pip at a directory of prebuilt wheels and stops it touching the network, so offline agents can bootstrap.
+Make one on a machine with network access with --build-wheelhouse.
+Git dependencies are declared as direct URLs (name @ git+https://...), which pip clones whatever --find-links says, so with a
+wheelhouse the dependencies are installed from its wheels by name first and then the project itself with --no-deps.
+
+This is run with the system python before the package is installed, so it only uses the standard library
+and doesn't import anything from the rest of the package.
+
+Usage: python3 src/ucb_to_testflight/bootstrap.py [venv_directory] [--wheelhouse DIR] [--build-wheelhouse DIR] [--force]
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+from typing import Callable, Optional
+
+PROJECT_DIRECTORY = Path(__file__).resolve().parents[2]
+STAMP_FILE_NAME = ".ucb-to-testflight-bootstrap.json"
+BUILD_REQUIREMENTS = ("setuptools", "wheel")
+
+
+def bootstrap(project_directory: Path, venv_directory: Path, wheelhouse: Optional[Path] = None, force: bool = False, run: Callable = subprocess.check_call) -> bool:
+    """ Make sure venv_directory has project_directory installed in it. Returns False if it already did (nothing was run). """
+    if not venv_python(venv_directory).exists():
+        import venv
+        print(f"Creating venv at {venv_directory}")
+        venv.create(venv_directory, with_pip=True)
+
+    stamp_path = venv_directory / STAMP_FILE_NAME
+    inputs = input_fingerprint(project_directory, venv_directory, wheelhouse)
+    if not force and _read_stamp(stamp_path) == {"inputs": inputs, "installed": installed_fingerprint(venv_directory)}:
+        print(f"Bootstrap up to date ({inputs[:12]}), skipping install")
+        return False
+
+    install(project_directory, venv_directory, wheelhouse, run)
+    stamp_path.write_text(json.dumps({"inputs": inputs, "installed": installed_fingerprint(venv_directory)}), encoding="utf-8")
+    return True
+
+
+def install(project_directory: Path, venv_directory: Path, wheelhouse: Optional[Path], run: Callable = subprocess.check_call) -> None:
+    pip = [str(venv_python(venv_directory)), "-m", "pip", "install", "--disable-pip-version-check"]
+    if wheelhouse is None:
+        run([*pip, "--upgrade", "pip"])
+    else:
+        pip += ["--no-index", "--find-links", str(wheelhouse)]
+    run([*pip, "--upgrade", *BUILD_REQUIREMENTS])
+    if wheelhouse is None:
+        run([*pip, "--no-build-isolation", "-e", str(project_directory)])
+        return
+
+    dependencies = wheelhouse_distributions(wheelhouse, exclude=_project_name(project_directory))
+    if dependencies:
+        run([*pip, *dependencies])
+    run([*pip, "--no-build-isolation", "--no-deps", "-e", str(project_directory)])
+
+
+def build_wheelhouse(project_directory: Path, wheelhouse: Path, run: Callable = subprocess.check_call) -> None:
+    """ Wheels for everything install() needs (including git dependencies), for bootstrapping without network access. """
+    wheelhouse.mkdir(parents=True, exist_ok=True)
+    run([sys.executable, "-m", "pip", "wheel", "--wheel-dir", str(wheelhouse), *BUILD_REQUIREMENTS, str(project_directory)])
+
+
+def wheelhouse_distributions(wheelhouse: Path, exclude: str = "") -> list:
+    """ Names of the distributions wheelhouse has wheels of (pip picks the newest of each), except exclude. """
+    names = {_normalize_name(entry.name.split("-")[0]) for entry in os.scandir(wheelhouse) if entry.name.endswith(".whl")}
+    names.discard(_normalize_name(exclude))
+    return sorted(names)
+
+
+def input_fingerprint(project_directory: Path, venv_directory: Path, wheelhouse: Optional[Path] = None) -> str:
+    digest = hashlib.sha256()
+    digest.update((project_directory / "pyproject.toml").read_bytes())
+    digest.update(b"\0python:" + _venv_python_version(venv_directory).encode("utf-8"))
+    if wheelhouse is not None:
+        digest.update(b"\0wheelhouse:")
+        for entry in sorted(os.scandir(wheelhouse), key=lambda entry: entry.name):
+            if entry.name.endswith((".whl", ".tar.gz", ".zip")):
+                digest.update(f"{entry.name}:{entry.stat().st_size}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def installed_fingerprint(venv_directory: Path) -> str:
+    """ Hash of every *.dist-info in the venv (their names carry the version), so changes made to the venv by hand are noticed. """
+    digest = hashlib.sha256()
+    for site_packages in sorted(_site_packages_directories(venv_directory)):
+        names = sorted(entry.name for entry in os.scandir(site_packages) if entry.name.endswith(".dist-info"))
+        digest.update("\n".join(names).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def venv_python(venv_directory: Path) -> Path:
+    if os.name == "nt":
+        return venv_directory / "Scripts" / "python.exe"
+    return venv_directory / "bin" / "python3"
+
+
+def _venv_python_version(venv_directory: Path) -> str:
+    config_path = venv_directory / "pyvenv.cfg"
+    if config_path.exists():
+        for line in config_path.read_text(encoding="utf-8").splitlines():
+            key, _, value = line.partition("=")
+            if key.strip() in ("version", "version_info"):
+                return value.strip()
+    return ""
+
+
+def _site_packages_directories(venv_directory: Path) -> list:
+    return [path for path in [*venv_directory.glob("lib/python*/site-packages"), venv_directory / "Lib" / "site-packages"] if path.is_dir()]
+
+
+def _project_name(project_directory: Path) -> str:
+    """ [project] name from pyproject.toml. A regex since tomllib isn't in the system pythons this runs with (3.9, 3.10). """
+    pyproject = (project_directory / "pyproject.toml").read_text(encoding="utf-8")
+    project_table = pyproject.partition("[project]")[2]
+    match = re.search(r"^\s*name\s*=\s*[\"']([^\"']+)[\"']", project_table, re.MULTILINE)
+    return match.group(1) if match else ""
+
+
+def _normalize_name(name: str) -> str:
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def _read_stamp(stamp_path: Path) -> Optional[dict]:
+    try:
+        return json.loads(stamp_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Create/update the venv upload-to-testflight.sh runs in.")
+    parser.add_argument("venv_directory", nargs="?", default=str(PROJECT_DIRECTORY / ".venv"))
+    parser.add_argument("--wheelhouse", default=os.environ.get("WHEELHOUSE") or None, help="(or $WHEELHOUSE) install from these prebuilt wheels, without network access")
+    parser.add_argument("--build-wheelhouse", metavar="DIRECTORY", help="download/build wheels for an offline --wheelhouse into DIRECTORY, then exit")
+    parser.add_argument("--force", action="store_true", help="install even if nothing has changed")
+    arguments = parser.parse_args()
+
+    if arguments.build_wheelhouse:
+        build_wheelhouse(PROJECT_DIRECTORY, Path(arguments.build_wheelhouse))
+        return
+
+    wheelhouse = Path(arguments.wheelhouse).resolve() if arguments.wheelhouse else None
+    bootstrap(PROJECT_DIRECTORY, Path(arguments.venv_directory), wheelhouse, arguments.force)
+
+
+if __name__ == "__main__":
+    main()
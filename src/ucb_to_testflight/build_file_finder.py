@@ -1,23 +1,68 @@
 """
 Looks for the build file in the environment variable OUTPUT_DIRECTORY.
 
-Made for Unity Cloud Build .ipa and .aab files.
+Made for Unity Cloud Build .ipa and .aab files. When there's no .ipa an .xcarchive is taken instead (see ipa_packager).
 Executable path is OUTPUT_DIRECTORY/executable_name.type for UCB.
 PS. UCB does expose the full path but it's in an API that I can't be bothered touching (https://build-api.cloud.unity3d.com/docs).
+
+The search is built on os.scandir so the file type info that comes with each directory entry is reused
+instead of stat-ing every entry again. Only matching files are stat-ed (for ranking).
 """
 import os
 from pathlib import Path
-from typing import Iterator
+from typing import Iterator, Optional
+
+from .ipa_validation import IpaValidationError, read_info_plist
+from .tracing import span
+
+# Directory names (lowercase suffixes) that never contain a build file. Skipped when searching recursively.
+PRUNED_DIRECTORY_SUFFIXES: tuple = (".dsym",)
+# Child directories (lowercase) to skip inside directories with the given suffix. Eg. *.xcarchive/dSYMs
+PRUNED_CHILD_DIRECTORIES: dict = {".xcarchive": ("dsyms",)}
+
+# Builds (and symbols) that are directories rather than files
+DIRECTORY_BUILD_EXTENSIONS: tuple = (".xcarchive", ".dsym")
+# Searched for (in order) when there is no build of the asked for type. An .xcarchive can be packaged into an .ipa.
+FALLBACK_EXTENSIONS: dict = {".ipa": (".xcarchive",)}
+
+DEFAULT_MAX_DEPTH = 4
+
+
+class BuildCandidate:
+    path: Path
+    size: int
+    modified_time: float
+    bundle_version: Optional[str]
+
+    def __init__(self, path: Path, size: int, modified_time: float) -> None:
+        self.path = path
+        self.size = size
+        self.modified_time = modified_time
+        self.bundle_version = None
+
+    def rank_key(self) -> tuple:
+        """ Bigger is better. Newest bundle version first, then newest file, then biggest file. """
+        return (parse_bundle_version(self.bundle_version), self.modified_time, self.size)
+
 
 class BuildFileFinder:
     file_extension: str
     file_path: Path
+    candidates: list    # BuildCandidates, best first
+    recursive: bool
+    max_depth: int
     _output_directory: Path
 
-    def __init__(self, output_directory: Path, file_extension: str):
+    def __init__(self, output_directory: Path, file_extension: str, recursive: bool = False, max_depth: int = DEFAULT_MAX_DEPTH):
         self._output_directory = output_directory
+        self.recursive = recursive
+        self.max_depth = max_depth
+        self.candidates = []
         self._set_file_extension(file_extension)
-        self._find_and_set_file()
+        with span("build_file_finder.search", **{"search.directory": str(output_directory), "search.recursive": recursive}) as current:
+            self._find_and_set_file()
+            current.set_attribute("search.candidate_count", len(self.candidates))
+            current.set_attribute("build.size_bytes", self.candidates[0].size)
 
     def _set_file_extension(self, file_extension: str) -> None:
         """ Set self.file_extension as a lowercase version of file_extension and add "." prefix if required. """
@@ -33,7 +78,7 @@ class BuildFileFinder:
     def _find_file(self) -> Path:
         for searcher in [self._search_output_directory]:    # If you want to search more places, add functions to this list
             path = searcher()
-            if path: 
+            if path:
                 return path
 
         raise FileNotFoundError(f"No {self.file_extension} file found!")
@@ -46,34 +91,99 @@ class BuildFileFinder:
         if not self._output_directory.exists():
             text = f"$OUTPUT_DIRECTORY ({self._output_directory.resolve()}) doesn't exist!"
             raise FileNotFoundError(text)
-        return self._choose_file(list(self._search_path(self._output_directory)))
-
-    def _search_path(self, root: Path, recursive=False) -> Iterator:
-        for file_name in os.listdir(root):
-            file_path = Path(os.path.join(root, file_name))
-
-            if file_path.is_dir() and recursive:
-                yield from self._search_path(file_path, recursive)
-
-            if not file_path.is_file(): continue
-            if not file_path.suffix.lower() == self.file_extension: continue
-
-            yield file_path
-
-    def _choose_file(self, paths: list):
-        if len(paths) == 0:
+        extensions = (self.file_extension,) + FALLBACK_EXTENSIONS.get(self.file_extension, ())
+        name = self._output_directory.name.lower()
+        if name.endswith(extensions) and (self._output_directory.is_file() or name.endswith(DIRECTORY_BUILD_EXTENSIONS)):
+            stat = self._output_directory.stat()   # The build itself (eg. from --watch)
+            return self._choose_file([BuildCandidate(self._output_directory, stat.st_size, stat.st_mtime)])
+
+        for extension in extensions:
+            candidates = list(self._search_path(self._output_directory, extension))
+            if candidates:
+                if extension != self.file_extension:
+                    print(f"No {self.file_extension} found, using the {extension} instead")
+                return self._choose_file(candidates)
+        return self._choose_file([])
+
+    def _search_path(self, root: Path, file_extension: Optional[str] = None) -> Iterator[BuildCandidate]:
+        return iter_build_candidates(root, file_extension or self.file_extension, self.recursive, self.max_depth)
+
+    def _choose_file(self, candidates: list):
+        if len(candidates) == 0:
             raise FileNotFoundError(f"Could not find any {self.file_extension} files in {str(self._output_directory.resolve())}")
 
-        if len(paths) == 1:
-            return paths[0]
-
-        print(f"Found {len(paths)} {self.file_extension} files:")
-        for file_path in paths:
-            print(f"  - {file_path}")
-
-        print("TODO: Write a smarter searcher. Taking first...")
-        return paths[0]
-
-
-def find_build_file_path(output_directory: Path, extension: str) -> Path:
-    return BuildFileFinder(output_directory, extension).file_path
+        if len(candidates) == 1:
+            self.candidates = candidates
+            return candidates[0].path
+
+        # Only worth opening the archives when there is a choice to make
+        for candidate in candidates:
+            candidate.bundle_version = read_bundle_version(candidate.path)
+        self.candidates = sorted(candidates, key=BuildCandidate.rank_key, reverse=True)
+
+        print(f"Found {len(candidates)} {candidates[0].path.suffix.lower()} files:")
+        for candidate in self.candidates:
+            print(f"  - {candidate.path} (version {candidate.bundle_version or '?'}, {candidate.size} bytes)")
+
+        print(f"Taking {self.candidates[0].path}")
+        return self.candidates[0].path
+
+
+def iter_build_candidates(root: Path, file_extension, recursive: bool = False, max_depth: int = DEFAULT_MAX_DEPTH, depth: int = 0) -> Iterator[BuildCandidate]:
+    """
+    Every file (or directory build, eg. .xcarchive) under root ending in file_extension (lowercase, with the "."). Unranked.
+    file_extension can be a tuple of them, to find several kinds in one scan.
+    """
+    extensions = (file_extension,) if isinstance(file_extension, str) else tuple(file_extension)
+    directory_extensions = tuple(extension for extension in extensions if extension in DIRECTORY_BUILD_EXTENSIONS)
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if directory_extensions and entry.name.lower().endswith(directory_extensions):
+                    stat = entry.stat()
+                    yield BuildCandidate(Path(entry.path), stat.st_size, stat.st_mtime)
+                    continue
+                if recursive and depth < max_depth and not _is_pruned(root, entry.name):
+                    yield from iter_build_candidates(Path(entry.path), file_extension, recursive, max_depth, depth + 1)
+                continue
+
+            # Suffix check first so non matching entries never cost a stat
+            if not entry.name.lower().endswith(extensions): continue
+            if not entry.is_file(): continue
+
+            stat = entry.stat()
+            yield BuildCandidate(Path(entry.path), stat.st_size, stat.st_mtime)
+
+
+def _is_pruned(parent: Path, directory_name: str) -> bool:
+    name = directory_name.lower()
+    if name.endswith(PRUNED_DIRECTORY_SUFFIXES):
+        return True
+
+    parent_suffix = os.path.splitext(str(parent))[1].lower()
+    return name in PRUNED_CHILD_DIRECTORIES.get(parent_suffix, ())
+
+
+def read_bundle_version(ipa_path: Path) -> Optional[str]:
+    """ CFBundleVersion from Payload/*.app/Info.plist (or an .xcarchive's Info.plist). None if it's not an .ipa or can't be read. """
+    try:
+        if ipa_path.is_dir():
+            import plistlib
+            with open(ipa_path / "Info.plist", "rb") as file:
+                version = plistlib.load(file).get("ApplicationProperties", {}).get("CFBundleVersion")
+        else:
+            version = read_info_plist(ipa_path).get("CFBundleVersion")
+    except (OSError, ValueError, IpaValidationError):
+        return None
+    return str(version) if version is not None else None
+
+
+def parse_bundle_version(version: Optional[str]) -> tuple:
+    """ "1.10.2" -> (1, 10, 2). Unknown versions sort before everything else. """
+    if not version:
+        return ()
+    return tuple(int(part) if part.isdigit() else -1 for part in version.split("."))
+
+
+def find_build_file_path(output_directory: Path, extension: str, recursive: bool = False, max_depth: int = DEFAULT_MAX_DEPTH) -> Path:
+    return BuildFileFinder(output_directory, extension, recursive, max_depth).file_path
@@ -0,0 +1,154 @@
+"""
+Waits for App Store Connect to finish processing an uploaded build (WAIT_FOR_PROCESSING), so the run ends when testers can actually get it.
+
+The build is polled quickly at first (small builds are often done in a minute or two), then less and less often,
+with jitter so builds uploaded together don't poll in lockstep. Polls send If-None-Match when App Store Connect gave an ETag,
+so an unchanged build costs a 304. It stops as soon as processing is VALID or has failed, or after MAX_PROCESSING_WAIT seconds.
+This runs after the upload has succeeded (and been recorded), so a poll that fails for a reason that can pass (network errors,
+5xx, 429) is reported and tried again on the same schedule rather than failing the run.
+"""
+import random
+import time
+from typing import Callable, Optional
+
+from .app_store_connect import AppStoreConnectClient, AppStoreConnectError
+from .tracing import span
+
+PROCESSED_STATES = ("VALID",)
+FAILED_PROCESSING_STATES = ("FAILED", "INVALID")
+
+
+class ProcessingPollSchedule:
+    initial_interval: float     # seconds before the second poll
+    backoff: float              # Each interval is this much longer than the last
+    max_interval: float         # seconds
+    jitter: float               # 0 to 1. Fraction of each interval that is randomised
+
+    def __init__(
+        self,
+        initial_interval: float = 5,
+        backoff: float = 1.5,
+        max_interval: float = 60,
+        jitter: float = 0.2,
+        random_source: Callable[[], float] = random.random,
+    ) -> None:
+        self.initial_interval = initial_interval
+        self.backoff = backoff
+        self.max_interval = max_interval
+        self.jitter = min(max(jitter, 0), 1)
+        self._random = random_source
+
+    def interval_after(self, poll: int) -> float:
+        """ Seconds to wait after poll (1 is the first). """
+        interval = min(self.max_interval, self.initial_interval * self.backoff ** (poll - 1))
+        return interval * (1 - self.jitter * self._random())
+
+
+class ProcessingResult:
+    state: Optional[str]    # The last processingState seen. None if the build never showed up
+    build_id: Optional[str]
+    app_id: Optional[str]   # None if App Store Connect couldn't be reached to look it up
+    duration: float         # seconds spent waiting
+    polls: int
+    not_modified: int       # Polls answered with 304
+    failed_polls: int       # Polls that failed (and were tried again)
+
+    def __init__(
+        self,
+        state: Optional[str],
+        build_id: Optional[str],
+        duration: float,
+        polls: int,
+        not_modified: int,
+        app_id: Optional[str] = None,
+        failed_polls: int = 0,
+    ) -> None:
+        self.state = state
+        self.build_id = build_id
+        self.app_id = app_id
+        self.duration = duration
+        self.polls = polls
+        self.not_modified = not_modified
+        self.failed_polls = failed_polls
+
+    @property
+    def processed(self) -> bool:
+        return self.state in PROCESSED_STATES
+
+    @property
+    def failed(self) -> bool:
+        return self.state in FAILED_PROCESSING_STATES
+
+
+def wait_for_build_processing(
+    client: AppStoreConnectClient,
+    app_id: Optional[str],
+    short_version: str,
+    build_version: str,
+    max_wait: float = 1800,
+    schedule: Optional[ProcessingPollSchedule] = None,
+    clock: Callable[[], float] = time.monotonic,
+    sleep: Callable[[float], None] = time.sleep,
+    bundle_id: str = "",
+) -> ProcessingResult:
+    """
+    Poll until the build is processed, processing fails, or max_wait seconds have passed. Doesn't raise for any of those,
+    or for polls that fail with an error that can pass; only for one that won't (eg. 401, or no app with bundle_id).
+    If app_id is None it's looked up from bundle_id first, as part of the first poll(s).
+    """
+    schedule = schedule or ProcessingPollSchedule()
+    start = clock()
+    etag = None
+    build = None
+    polls = 0
+    not_modified = 0
+    failed_polls = 0
+    last_state = None
+
+    with span("build_processing.wait", **{"build.version": build_version}) as current:
+        while True:
+            polls += 1
+            try:
+                if app_id is None:
+                    app_id = client.find_app_id(bundle_id)
+                document, etag = client.get_if_changed("/v1/builds", _builds_query(app_id, short_version, build_version), etag)
+            except (AppStoreConnectError, OSError) as error:
+                if isinstance(error, AppStoreConnectError) and not error.retryable:
+                    raise
+                failed_polls += 1
+                print(f"Couldn't check on build {short_version} ({build_version}) processing: {error}. Trying again.")
+            else:
+                if document is None:
+                    not_modified += 1
+                else:
+                    build = document["data"][0] if document["data"] else None
+
+            state = build["attributes"].get("processingState") if build else None
+            if state != last_state:
+                print(f"Build {short_version} ({build_version}) processing: {state or 'not listed yet'} ({clock() - start:.0f}s)")
+                last_state = state
+            if state in PROCESSED_STATES or state in FAILED_PROCESSING_STATES:
+                break
+
+            delay = schedule.interval_after(polls)
+            remaining = max_wait - (clock() - start)
+            if remaining <= 0:
+                break
+            sleep(min(delay, remaining))
+
+        result = ProcessingResult(state, build["id"] if build else None, clock() - start, polls, not_modified, app_id, failed_polls)
+        current.set_attribute("build.processing_state", state)
+        current.set_attribute("build_processing.polls", polls)
+        current.set_attribute("build_processing.not_modified", not_modified)
+        current.set_attribute("build_processing.failed_polls", failed_polls)
+    return result
+
+
+def _builds_query(app_id: str, short_version: str, build_version: str) -> dict:
+    return {
+        "filter[app]": app_id,
+        "filter[version]": build_version,
+        "filter[preReleaseVersion.version]": short_version,
+        "fields[builds]": "version,processingState,uploadedDate",
+        "limit": 1,
+    }
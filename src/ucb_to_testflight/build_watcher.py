@@ -0,0 +1,277 @@
+"""
+--watch: watch OUTPUT_DIRECTORY and upload each new build file as soon as it's completely written,
+so the upload overlaps the rest of the post build steps instead of waiting for them.
+
+A build counts as written when
+ - the writer closed it (inotify IN_CLOSE_WRITE) or it was moved into place (IN_MOVED_TO), or
+ - its size and modified time haven't changed for WATCH_SETTLE_SECONDS (for when inotify isn't available, eg. macOS),
+and, for an .ipa, its zip central directory and Info.plist can be read (a half written zip has no central directory yet).
+
+Build files already in the directory when watching starts are left alone, unless they're rewritten.
+Uploads run one at a time in the background while watching carries on.
+Watching stops after WATCH_MAX_UPLOADS builds, or when no new build has turned up for WATCH_IDLE_TIMEOUT seconds.
+"""
+import os
+import select
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional
+
+from .build_file_finder import DEFAULT_MAX_DEPTH, _is_pruned, iter_build_candidates
+from .ipa_validation import IpaValidationError, read_info_plist
+
+DEFAULT_SETTLE_SECONDS = 2.0
+DEFAULT_POLL_INTERVAL = 1.0
+
+# inotify(7)
+_IN_CLOSE_WRITE = 0x8
+_IN_MOVED_TO = 0x80
+_IN_CREATE = 0x100
+_IN_Q_OVERFLOW = 0x4000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct("iIII")   # wd, mask, cookie, len
+
+
+class _Inotify:
+    """ Just enough of inotify (through libc) to hear about files being written and directories appearing. """
+
+    def __init__(self) -> None:
+        import ctypes
+
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directories = {}   # wd -> Path
+
+    def watch(self, directory: Path) -> None:
+        import ctypes
+
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+        self.directories[wd] = directory
+
+    def wait(self, timeout: float) -> Optional[list]:
+        """ [(mask, path)] of what happened, within timeout seconds. None if events were lost (queue overflow). """
+        readable, _, _ = select.select([self.fd], [], [], max(0, timeout))
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + name_length].rstrip(b"\0")
+            offset += name_length
+            if mask & _IN_Q_OVERFLOW:
+                return None
+            if wd in self.directories:
+                events.append((mask, self.directories[wd] / os.fsdecode(name)))
+        return events
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class BuildWatcher:
+    output_directory: Path
+    file_extension: str
+    recursive: bool
+    max_depth: int
+    settle_seconds: float
+    poll_interval: float
+    uses_inotify: bool
+
+    def __init__(
+        self,
+        output_directory: Path,
+        file_extension: str = ".ipa",
+        recursive: bool = False,
+        max_depth: int = DEFAULT_MAX_DEPTH,
+        settle_seconds: float = DEFAULT_SETTLE_SECONDS,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        use_inotify: bool = True,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.output_directory = output_directory
+        self.file_extension = file_extension.lower() if file_extension.startswith(".") else "." + file_extension.lower()
+        self.recursive = recursive
+        self.max_depth = max_depth
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.uses_inotify = False
+        self._want_inotify = use_inotify
+        self._inotify = None
+        self._clock = clock
+        self._reported = {}     # path -> (size, modified time) of builds already handed out (or there at the start)
+        self._changing = {}     # path -> ((size, modified time), when it was first seen like that)
+        self._written = set()   # Paths the writer has closed since they were last checked
+        self._rescan = True
+        self._reported.update((candidate.path, _signature(candidate)) for candidate in self._scan())
+
+    def next_build(self, timeout: Optional[float] = None) -> Optional[Path]:
+        """ The next completely written build file, or None if there wasn't one within timeout seconds. """
+        deadline = self._clock() + timeout if timeout is not None else float("inf")
+        while True:
+            self._start_inotify()
+            if self._rescan or self._changing or not self.uses_inotify:
+                self._rescan = False
+                build = self._check_candidates()
+                if build is not None:
+                    return build
+
+            remaining = deadline - self._clock()
+            if remaining <= 0:
+                return None
+            wait = min(remaining, self.poll_interval)
+            if self._changing:
+                wait = min(wait, max(0.05, self.settle_seconds / 4))
+            self._wait(wait)
+
+    def close(self) -> None:
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+            self.uses_inotify = False
+
+    def __enter__(self) -> "BuildWatcher":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _check_candidates(self) -> Optional[Path]:
+        now = self._clock()
+        candidates = self._scan()
+        present = {candidate.path for candidate in candidates}
+        for path in [path for path in self._changing if path not in present]:
+            del self._changing[path]    # Deleted or renamed before it settled
+
+        for candidate in sorted(candidates, key=lambda candidate: candidate.modified_time):
+            signature = _signature(candidate)
+            if self._reported.get(candidate.path) == signature:
+                continue
+
+            written = candidate.path in self._written
+            first_seen = self._changing.get(candidate.path)
+            if first_seen is None or first_seen[0] != signature:
+                self._changing[candidate.path] = (signature, now)
+                settled = self.settle_seconds <= 0
+            else:
+                settled = now - first_seen[1] >= self.settle_seconds
+
+            if (written or settled) and self._is_complete(candidate.path):
+                self._written.discard(candidate.path)
+                self._changing.pop(candidate.path, None)
+                self._reported[candidate.path] = signature
+                return candidate.path
+            self._written.discard(candidate.path)
+        return None
+
+    def _is_complete(self, path: Path) -> bool:
+        if self.file_extension != ".ipa":
+            return True
+        try:
+            read_info_plist(path)
+        except (OSError, IpaValidationError):
+            return False
+        return True
+
+    def _scan(self) -> list:
+        if not self.output_directory.is_dir():
+            return []
+        try:
+            return list(iter_build_candidates(self.output_directory, self.file_extension, self.recursive, self.max_depth))
+        except FileNotFoundError:
+            return []   # Something was deleted mid scan, try again next time
+
+    def _wait(self, timeout: float) -> None:
+        if not self.uses_inotify:
+            time.sleep(timeout)
+            return
+        events = self._inotify.wait(timeout)
+        if events is None:
+            self._rescan = True     # Lost track, look at everything again
+            return
+        for mask, path in events:
+            if mask & _IN_ISDIR:
+                if mask & (_IN_CREATE | _IN_MOVED_TO):
+                    self._watch_tree(path)
+                self._rescan = True
+            elif path.name.lower().endswith(self.file_extension):
+                if mask & (_IN_CLOSE_WRITE | _IN_MOVED_TO):
+                    self._written.add(path)
+                self._rescan = True
+
+    def _start_inotify(self) -> None:
+        """ Once the output directory exists. Falls back to polling if inotify isn't there. """
+        if self._inotify is not None or not self._want_inotify or not self.output_directory.is_dir():
+            return
+        try:
+            self._inotify = _Inotify()
+            self._watch_tree(self.output_directory)
+        except (OSError, AttributeError) as error:    # AttributeError: no inotify in this libc
+            if self._inotify is not None:
+                self._inotify.close()
+                self._inotify = None
+            self._want_inotify = False
+            print(f"Watching {self.output_directory} by polling every {self.poll_interval:g}s (inotify isn't available: {error})")
+            return
+        self.uses_inotify = True
+        self._rescan = True     # Anything written before the watches were added
+
+    def _watch_tree(self, directory: Path) -> None:
+        depth = len(directory.relative_to(self.output_directory).parts)
+        watched = set(self._inotify.directories.values())
+        for root, directory_names, _ in os.walk(directory):
+            root_path = Path(root)
+            if root_path not in watched:
+                self._inotify.watch(root_path)
+            root_depth = depth + len(root_path.relative_to(directory).parts)
+            if not self.recursive or root_depth >= self.max_depth:
+                directory_names.clear()
+            else:
+                directory_names[:] = [name for name in directory_names if not _is_pruned(root_path, name)]
+
+
+def _signature(candidate) -> tuple:
+    return (candidate.size, candidate.modified_time)
+
+
+def watch_and_upload(parameters, upload: Optional[Callable] = None, watcher: Optional[BuildWatcher] = None) -> list:
+    """
+    Upload each build the watcher finds (with parameters' other values) until WATCH_MAX_UPLOADS or WATCH_IDLE_TIMEOUT.
+    Returns a BatchJobResult per build. Never raises for a failed upload.
+    """
+    from .batch_upload import BatchJob, run_timed_job
+
+    if upload is None:
+        from .upload_to_testflight import upload_to_testflight as upload
+    if watcher is None:
+        watcher = BuildWatcher(parameters.output_directory, ".ipa", parameters.search_recursively, parameters.max_search_depth, parameters.watch_settle_seconds)
+
+    idle_timeout = parameters.watch_idle_timeout if parameters.watch_idle_timeout > 0 else None
+    limit = f"{parameters.watch_max_uploads} build{'s' if parameters.watch_max_uploads != 1 else ''}" if parameters.watch_max_uploads > 0 else "builds"
+    print(f"Watching {parameters.output_directory} for {limit}" + (f" (giving up after {idle_timeout}s without one)" if idle_timeout else ""))
+
+    futures = []
+    with watcher, ThreadPoolExecutor(max_workers=1, thread_name_prefix="watch-upload") as executor:
+        while parameters.watch_max_uploads <= 0 or len(futures) < parameters.watch_max_uploads:
+            build_path = watcher.next_build(idle_timeout)
+            if build_path is None:
+                print(f"No new build in {idle_timeout}s, stopping.")
+                break
+            print(f"{build_path} is ready, uploading it.")
+            job = BatchJob(build_path.name, {"output_directory": build_path, "search_recursively": False})
+            futures.append(executor.submit(run_timed_job, job, lambda job=job: upload(*parameters.get_values(**job.overrides))))
+    return [future.result() for future in futures]
@@ -0,0 +1,10 @@
+"""Where ucb_to_testflight keeps state between runs (upload ledger etc.)."""
+import os
+from pathlib import Path
+
+
+def default_cache_directory() -> Path:
+    """ $XDG_CACHE_HOME/ucb-to-testflight, falling back to ~/.cache/ucb-to-testflight """
+    cache_home = os.environ.get("XDG_CACHE_HOME")
+    root = Path(cache_home) if cache_home else Path.home() / ".cache"
+    return root / "ucb-to-testflight"
@@ -0,0 +1,25 @@
+"""
+Gets the release notes ("What to Test") for the build.
+
+CHANGELOG_SOURCE picks where they come from:
+ - file: CHANGELOG_PATH, written by someone/something else.
+ - git: generated from the commits since the last upload (see git_changelog).
+"""
+from pathlib import Path
+
+CHANGELOG_SOURCES = ("file", "git")
+
+
+def check_changelog_source(changelog_source: str) -> None:
+    if changelog_source not in CHANGELOG_SOURCES:
+        raise ValueError(f"Unknown changelog source \"{changelog_source}\". Expected one of: {', '.join(CHANGELOG_SOURCES)}")
+
+
+def read_changelog_file(changelog_path: Path) -> str:
+    with open(changelog_path, "r") as file:
+        changelog = file.read()
+
+    print("\nFound Changelog ".ljust(32, "="))
+    print(changelog)
+    print("=" * 32)
+    return changelog
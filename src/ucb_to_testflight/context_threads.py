@@ -0,0 +1,22 @@
+"""
+Threads that carry on in the context (contextvars) of the code that started them.
+
+A plain ThreadPoolExecutor or Thread starts its work in an empty context, so whatever was set for the job that started it
+is lost: where its output goes when the upload daemon runs it (upload_daemon), and which span is current (tracing).
+asyncio tasks and asyncio.to_thread already copy the context.
+"""
+import contextvars
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class ContextThreadPoolExecutor(ThreadPoolExecutor):
+    """ A ThreadPoolExecutor whose tasks each run in a copy of the context they were submitted from. """
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def context_thread(target, args: tuple = (), **kwargs) -> threading.Thread:
+    """ threading.Thread(target=target, args=args, **kwargs), running target in a copy of the current context. """
+    return threading.Thread(target=contextvars.copy_context().run, args=(target, *args), **kwargs)
@@ -0,0 +1,223 @@
+"""
+Uploads the .ipa straight to App Store Connect (UPLOAD_BACKEND=direct) instead of going through fastlane/Transporter.
+
+ 1. Reserve: create a buildUpload for the app/version, then a buildUploadFile for the .ipa.
+    App Store Connect answers with upload operations (a URL, offset and length for each chunk of the file).
+ 2. Upload: chunks are PUT in parallel (MAX_PARALLEL_CHUNKS) over pooled keep-alive connections.
+    Each chunk is a slice of a memoryview over the memory mapped .ipa, so nothing is copied into Python buffers.
+ 3. Commit: mark the file uploaded, with its MD5.
+
+The reservation and which chunks are done are saved after every chunk (cache_directory/direct_uploads/<fingerprint>.json),
+so a retry or a re-run of the post build step only sends the chunks that are missing.
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from pathlib import Path
+from typing import Callable, Optional
+
+from .app_store_connect import AppStoreConnectClient, AppStoreConnectError
+from .context_threads import ContextThreadPoolExecutor
+from .ipa_validation import IpaInfo, _map_file
+from .retry_policy import UploadAttemptError
+from .tracing import span
+from .upload_throttling import TokenBucket, throttled
+
+DIRECT_UPLOAD_STATE_DIRECTORY_NAME = "direct_uploads"
+DEFAULT_MAX_PARALLEL_CHUNKS = 4
+IPA_UTI = "com.apple.ipa"
+
+# Any other 4xx means the reservation is no good any more (expired upload URLs, checksum mismatch, ...) and is dropped
+_RETRYABLE_CLIENT_ERROR_STATUSES = (408, 429)
+
+
+class DirectUploadState:
+    """ A reservation and the chunks of it already uploaded. Saved as JSON after every change. """
+    path: Path
+    build_upload_id: str
+    file_id: str
+    operations: list    # [{"method", "url", "offset", "length", "requestHeaders": [{"name", "value"}]}]
+    completed: set      # Indexes into operations
+    md5: str            # Hex. Empty until computed
+
+    def __init__(self, path: Path, build_upload_id: str, file_id: str, operations: list, completed: Optional[set] = None, md5: str = "") -> None:
+        self.path = path
+        self.build_upload_id = build_upload_id
+        self.file_id = file_id
+        self.operations = operations
+        self.completed = completed or set()
+        self.md5 = md5
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["DirectUploadState"]:
+        try:
+            data = json.loads(path.read_text())
+            return cls(path, data["build_upload_id"], data["file_id"], data["operations"], set(data["completed"]), data.get("md5", ""))
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError, TypeError):
+            print(f"Ignoring unreadable direct upload state {path}")
+            return None
+
+    def pending_indexes(self) -> list:
+        return [index for index in range(len(self.operations)) if index not in self.completed]
+
+    def mark_completed(self, index: int) -> None:
+        with self._lock:
+            self.completed.add(index)
+            self.save()
+
+    def save(self) -> None:
+        """ Written to a temporary file and renamed over the old one, so a kill mid write can't leave half a file. """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "build_upload_id": self.build_upload_id,
+            "file_id": self.file_id,
+            "operations": self.operations,
+            "completed": sorted(self.completed),
+            "md5": self.md5,
+        }
+        temporary_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        temporary_path.write_text(json.dumps(data))
+        os.replace(temporary_path, self.path)
+
+    def delete(self) -> None:
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def direct_upload_state_path(cache_directory: Path, fingerprint: str) -> Path:
+    return cache_directory / DIRECT_UPLOAD_STATE_DIRECTORY_NAME / f"{fingerprint}.json"
+
+
+def upload_ipa_direct(
+    client: AppStoreConnectClient,
+    ipa_path: Path,
+    ipa_info: IpaInfo,
+    state_path: Path,
+    max_parallel_chunks: int = DEFAULT_MAX_PARALLEL_CHUNKS,
+    timeout: Optional[float] = None,
+    clock: Callable[[], float] = time.monotonic,
+    bucket: Optional[TokenBucket] = None,
+) -> str:
+    """
+    One attempt at uploading ipa_path, carrying on from state_path if an earlier attempt got part way.
+    Chunks go no faster than bucket allows, if given (share one between attempts).
+    Returns the buildUpload id. Raises UploadAttemptError (timed_out if it ran out of time) so run_with_retries can retry it.
+    """
+    deadline = clock() + timeout if timeout else float("inf")
+    state = DirectUploadState.load(state_path)
+    try:
+        if state is None:
+            with span("direct_upload.reserve"):
+                state = _reserve(client, ipa_path, ipa_info, state_path)
+        elif state.completed:
+            print(f"Resuming direct upload of {ipa_path.name}: {len(state.completed)}/{len(state.operations)} chunks already uploaded")
+
+        with _map_file(ipa_path) as mapped:
+            _upload_chunks(client, state, mapped, max_parallel_chunks, deadline, clock, bucket)
+
+        with span("direct_upload.commit"):
+            client.request("PATCH", f"/v1/buildUploadFiles/{state.file_id}", {"data": {
+                "type": "buildUploadFiles",
+                "id": state.file_id,
+                "attributes": {"uploaded": True, "sourceFileChecksums": {"file": {"hash": state.md5, "algorithm": "MD5"}}},
+            }})
+    except AppStoreConnectError as error:
+        if state is not None and 400 <= error.status < 500 and error.status not in _RETRYABLE_CLIENT_ERROR_STATUSES:
+            state.delete()  # Start over with a new reservation next attempt
+        raise UploadAttemptError(str(error), output=str(error)) from error
+    except OSError as error:
+        raise UploadAttemptError(f"Direct upload failed: {error}", output=str(error)) from error
+
+    state.delete()
+    print(f"Uploaded {ipa_path.name} to App Store Connect (build upload {state.build_upload_id})")
+    return state.build_upload_id
+
+
+def _reserve(client: AppStoreConnectClient, ipa_path: Path, ipa_info: IpaInfo, state_path: Path) -> DirectUploadState:
+    app_id = client.find_app_id(ipa_info.bundle_id)
+    build_upload = client.request("POST", "/v1/buildUploads", {"data": {
+        "type": "buildUploads",
+        "attributes": {"cfBundleShortVersionString": ipa_info.short_version, "cfBundleVersion": ipa_info.build_version, "platform": "IOS"},
+        "relationships": {"app": {"data": {"type": "apps", "id": app_id}}},
+    }})["data"]
+    upload_file = client.request("POST", "/v1/buildUploadFiles", {"data": {
+        "type": "buildUploadFiles",
+        "attributes": {"assetType": "ASSET", "fileName": ipa_path.name, "fileSize": ipa_path.stat().st_size, "uti": IPA_UTI},
+        "relationships": {"buildUpload": {"data": {"type": "buildUploads", "id": build_upload["id"]}}},
+    }})["data"]
+
+    state = DirectUploadState(state_path, build_upload["id"], upload_file["id"], upload_file["attributes"]["uploadOperations"])
+    state.save()
+    print(f"Reserved direct upload of {ipa_path.name} ({ipa_info}): {len(state.operations)} chunks")
+    return state
+
+
+def _upload_chunks(
+    client: AppStoreConnectClient,
+    state: DirectUploadState,
+    mapped,
+    max_parallel_chunks: int,
+    deadline: float,
+    clock: Callable[[], float],
+    bucket: Optional[TokenBucket] = None,
+) -> None:
+    pending = state.pending_indexes()
+    view = memoryview(mapped)
+    try:
+        with span("direct_upload.chunks", **{"chunks.total": len(state.operations), "chunks.pending": len(pending)}), \
+                ContextThreadPoolExecutor(max(1, max_parallel_chunks), thread_name_prefix="direct-upload") as executor:
+            futures = {executor.submit(_put_chunk, client, state.operations[index], view, bucket): index for index in pending}
+
+            # The MD5 for the commit is worked out while the chunks go up (hashlib lets go of the GIL for big buffers)
+            if not state.md5:
+                import hashlib
+                state.md5 = hashlib.md5(view).hexdigest()
+                state.save()
+
+            failure = None
+            last_reported = len(state.completed) * 10 // max(1, len(state.operations))
+            remaining = set(futures)
+            while remaining:
+                time_left = max(0, deadline - clock()) if deadline != float("inf") else None
+                done, remaining = wait(remaining, timeout=time_left, return_when=FIRST_COMPLETED)
+                if not done:
+                    # In flight chunks are left to finish (they hold slices of the mapped file), nothing new starts
+                    for future in remaining:
+                        future.cancel()
+                    failure = failure or UploadAttemptError(f"Direct upload timed out with {len(remaining)} chunks left.", timed_out=True)
+                    done, remaining = wait(remaining).done, set()
+                for future in done:
+                    if future.cancelled():
+                        continue
+                    error = future.exception()
+                    if error is None:
+                        state.mark_completed(futures[future])
+                    elif failure is None:
+                        failure = error
+                        for other in remaining:
+                            other.cancel()
+                reported = len(state.completed) * 10 // max(1, len(state.operations))
+                if reported > last_reported:
+                    print(f"Uploaded {len(state.completed)}/{len(state.operations)} chunks ({reported * 10}%)")
+                    last_reported = reported
+            if failure is not None:
+                raise failure
+    finally:
+        view.release()
+
+
+def _put_chunk(client: AppStoreConnectClient, operation: dict, view: memoryview, bucket: Optional[TokenBucket] = None) -> None:
+    headers = {header["name"]: header["value"] for header in operation.get("requestHeaders") or []}
+    with view[operation["offset"]:operation["offset"] + operation["length"]] as chunk:
+        body, headers = throttled(chunk, headers, bucket)
+        response = client.pool.request(operation.get("method", "PUT"), operation["url"], body=body, headers=headers)
+        del body    # Its slices of the mapped file have to be gone before the file is unmapped
+    if not response.ok:
+        raise AppStoreConnectError(operation.get("method", "PUT"), f"chunk at offset {operation['offset']}", response.status, [])
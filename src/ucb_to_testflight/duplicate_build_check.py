@@ -0,0 +1,65 @@
+"""
+Asks App Store Connect whether it already has a build with the .ipa's version pair (CFBundleShortVersionString/CFBundleVersion)
+before anything is uploaded (DUPLICATE_BUILD_CHECK).
+
+Apple only turns a duplicate away once the whole file has been sent ("Redundant Binary Upload"), so catching it first saves a full
+transfer. It takes two small requests (the app's id, then builds filtered by version); if App Store Connect can't be asked
+(unreachable, an API key it can't be signed with, an answer that makes no sense) the upload goes ahead and is left to Apple
+to judge, as it was before.
+ - fail: stop with DuplicateBuildError (not retried)
+ - skip: stop without an error, like a build that's already in the upload ledger
+ - off: don't check
+"""
+from typing import Optional
+
+from .app_store_connect import AppStoreConnectClient, AppStoreConnectError
+from .ipa_validation import IpaInfo
+from .retry_policy import FatalUploadError
+from .tracing import span
+
+DUPLICATE_BUILD_CHECKS = ("fail", "skip", "off")
+
+
+class DuplicateBuildError(FatalUploadError):
+    """ App Store Connect already has a build with this version pair. """
+
+
+def check_duplicate_build_option(duplicate_build_check: str) -> None:
+    if duplicate_build_check not in DUPLICATE_BUILD_CHECKS:
+        raise ValueError(f"Unknown duplicate build check \"{duplicate_build_check}\". Expected one of: {', '.join(DUPLICATE_BUILD_CHECKS)}")
+
+
+def find_existing_build(client: AppStoreConnectClient, app_id: str, short_version: str, build_version: str) -> Optional[dict]:
+    """ The build of app_id with this version pair, if App Store Connect has one. """
+    builds = client.request("GET", "/v1/builds", query={
+        "filter[app]": app_id,
+        "filter[version]": build_version,
+        "filter[preReleaseVersion.version]": short_version,
+        "fields[builds]": "version,processingState,uploadedDate",
+        "limit": 1,
+    })["data"]
+    return builds[0] if builds else None
+
+
+def is_duplicate_build_skipped(client: AppStoreConnectClient, ipa_info: IpaInfo, duplicate_build_check: str) -> bool:
+    """ True (and says why) if App Store Connect already has this build and we're skipping it. Raises DuplicateBuildError if failing. """
+    if duplicate_build_check == "off":
+        return False
+
+    with span("preflight.duplicate_build", **{"build.version": ipa_info.build_version}) as current:
+        try:
+            build = find_existing_build(client, client.find_app_id(ipa_info.bundle_id), ipa_info.short_version, ipa_info.build_version)
+        except (AppStoreConnectError, OSError, ValueError) as error:   # ValueError: a key that can't be loaded, or an answer that isn't JSON
+            print(f"Couldn't check App Store Connect for an existing {ipa_info} ({error}). Uploading anyway.")
+            current.set_error(f"{type(error).__name__}: {error}")
+            return False
+        current.set_attribute("preflight.duplicate", build is not None)
+
+    if build is None:
+        return False
+    state = build["attributes"].get("processingState") or "unknown"
+    message = f"App Store Connect already has {ipa_info} (build {build['id']}, {state})"
+    if duplicate_build_check == "skip":
+        print(f"{message}. Skipping. (DUPLICATE_BUILD_CHECK=skip)")
+        return True
+    raise DuplicateBuildError(f"{message}. Bump CFBundleVersion, or set DUPLICATE_BUILD_CHECK=skip to skip builds like this.")
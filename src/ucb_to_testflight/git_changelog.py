@@ -0,0 +1,210 @@
+"""
+Builds release notes from the git commits since the last uploaded build (CHANGELOG_SOURCE=git).
+
+ - The range starts at the commit the last upload of this bundle id was built from (recorded in the upload ledger).
+   The first time there is nothing to start from, so it's the most recent 100 commits (CHANGELOG_MAX_COMMITS, which isn't a setting).
+ - Only conventional commits of CHANGELOG_COMMIT_TYPES make it in ("feat: ...", "fix(ui): ...").
+   An empty list keeps every commit.
+ - The result is cut (at a line) to fit TestFlight's "What to Test" limit.
+
+Parsed commit summaries are cached by sha, so each run only asks git about commits it hasn't seen before
+(one `git log --no-walk --stdin` for all of them) instead of walking the full history.
+"""
+import re
+import subprocess
+from pathlib import Path
+from typing import Optional
+
+CHANGELOG_CACHE_FILE_NAME = "changelog_cache.sqlite3"
+TESTFLIGHT_CHANGELOG_MAX_LENGTH = 4000
+CHANGELOG_MAX_COMMITS = 100
+DEFAULT_COMMIT_TYPES = ["feat", "fix", "perf"]
+
+# Headings for the usual types, in the order they're listed. Other types get their name as a heading, after these.
+COMMIT_TYPE_HEADINGS: dict = {
+    "feat": "New",
+    "fix": "Fixes",
+    "perf": "Performance",
+}
+
+_CONVENTIONAL_SUBJECT = re.compile(r"^(?P<type>[A-Za-z]+)(?:\((?P<scope>[^)]*)\))?(?P<breaking>!)?:\s*(?P<summary>.+)$")
+_FIELD_SEPARATOR = "\x1f"
+_RECORD_SEPARATOR = "\x1e"
+
+
+class CommitSummary:
+    sha: str
+    type: str           # "" if the subject isn't a conventional commit
+    scope: str
+    summary: str
+    breaking: bool
+
+    def __init__(self, sha: str, type: str, scope: str, summary: str, breaking: bool) -> None:
+        self.sha = sha
+        self.type = type
+        self.scope = scope
+        self.summary = summary
+        self.breaking = breaking
+
+    def __str__(self) -> str:
+        text = f"{self.scope}: {self.summary}" if self.scope else self.summary
+        return f"{text} (breaking)" if self.breaking else text
+
+
+def parse_commit_message(sha: str, message: str) -> CommitSummary:
+    subject, _, body = message.strip().partition("\n")
+    match = _CONVENTIONAL_SUBJECT.match(subject.strip())
+    if match is None:
+        return CommitSummary(sha, "", "", subject.strip(), False)
+    breaking = bool(match.group("breaking")) or "BREAKING CHANGE" in body
+    return CommitSummary(sha, match.group("type").lower(), match.group("scope") or "", match.group("summary").strip(), breaking)
+
+
+class CommitSummaryCache:
+    """ sha -> CommitSummary, in sqlite next to the upload ledger. A sha's message never changes so entries never expire. """
+    path: Path
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS commits (sha TEXT PRIMARY KEY, type TEXT, scope TEXT, summary TEXT, breaking INTEGER)")
+
+    def get_many(self, shas: list[str]) -> dict:
+        found = {}
+        with self._connect() as connection:
+            for start in range(0, len(shas), 500):  # Stay under sqlite's variable limit
+                batch = shas[start:start + 500]
+                rows = connection.execute(f"SELECT * FROM commits WHERE sha IN ({', '.join('?' for _ in batch)})", batch)
+                for row in rows:
+                    found[row["sha"]] = CommitSummary(row["sha"], row["type"], row["scope"], row["summary"], bool(row["breaking"]))
+        return found
+
+    def put_many(self, summaries: list[CommitSummary]) -> None:
+        with self._connect() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO commits (sha, type, scope, summary, breaking) VALUES (?, ?, ?, ?, ?)",
+                [(summary.sha, summary.type, summary.scope, summary.summary, int(summary.breaking)) for summary in summaries],
+            )
+
+    def _connect(self):
+        import sqlite3
+        from .upload_ledger import _ClosingConnection
+
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        return _ClosingConnection(connection)
+
+
+def head_commit(repository: Path) -> str:
+    return _git(repository, "rev-parse", "HEAD").strip()
+
+
+def list_commits(repository: Path, since_commit: Optional[str] = None, max_commits: int = CHANGELOG_MAX_COMMITS) -> list[str]:
+    """ shas (newest first) in since_commit..HEAD. The latest max_commits if since_commit is None or git doesn't know it (eg. history was rewritten). """
+    if since_commit:
+        try:
+            return _git(repository, "rev-list", "--no-merges", f"{since_commit}..HEAD").split()
+        except subprocess.CalledProcessError:
+            print(f"Commit {since_commit[:12]} (last upload) isn't in this repository anymore. Using the latest {max_commits} commits.")
+    return _git(repository, "rev-list", "--no-merges", f"--max-count={max_commits}", "HEAD").split()
+
+
+def summarize_commits(repository: Path, shas: list[str], cache: CommitSummaryCache) -> list[CommitSummary]:
+    """ CommitSummary for each sha (same order). Only shas missing from the cache are read from git. """
+    summaries = cache.get_many(shas)
+    missing = [sha for sha in shas if sha not in summaries]
+    if missing:
+        output = _git(repository, "log", "--no-walk=unsorted", "--stdin", f"--format=%H{_FIELD_SEPARATOR}%B{_RECORD_SEPARATOR}", input="\n".join(missing))
+        parsed = []
+        for record in output.split(_RECORD_SEPARATOR):
+            sha, separator, message = record.strip().partition(_FIELD_SEPARATOR)
+            if separator:
+                parsed.append(parse_commit_message(sha, message))
+        cache.put_many(parsed)
+        summaries.update({summary.sha: summary for summary in parsed})
+    return [summaries[sha] for sha in shas if sha in summaries]
+
+
+def format_changelog(summaries: list[CommitSummary], commit_types: list[str], max_length: int = TESTFLIGHT_CHANGELOG_MAX_LENGTH) -> str:
+    wanted = [commit_type.lower() for commit_type in commit_types]
+    grouped = {}
+    for summary in summaries:
+        if wanted and summary.type not in wanted:
+            continue
+        grouped.setdefault(summary.type, []).append(summary)
+
+    order = [commit_type for commit_type in COMMIT_TYPE_HEADINGS if commit_type in grouped]
+    order += [commit_type for commit_type in grouped if commit_type not in order]
+
+    lines = []
+    for commit_type in order:
+        if len(order) > 1 or commit_type:
+            if lines:
+                lines.append("")
+            lines.append(f"{COMMIT_TYPE_HEADINGS.get(commit_type, commit_type.capitalize() or 'Other')}:")
+        lines += [f"- {summary}" for summary in grouped[commit_type]]
+
+    if not lines:
+        return "No notable changes."
+    return _truncate_lines(lines, max_length)
+
+
+def generate_git_changelog(
+    repository: Path,
+    cache_directory: Path,
+    since_commit: Optional[str],
+    commit_types: list[str] = DEFAULT_COMMIT_TYPES,
+    max_length: int = TESTFLIGHT_CHANGELOG_MAX_LENGTH,
+) -> str:
+    shas = list_commits(repository, since_commit)
+    summaries = summarize_commits(repository, shas, CommitSummaryCache(cache_directory / CHANGELOG_CACHE_FILE_NAME))
+    changelog = format_changelog(summaries, commit_types, max_length)
+
+    range_text = f"{since_commit[:12]}..HEAD" if since_commit else f"the latest {len(shas)} commits"
+    print(f"\nChangelog from git ({range_text}) ".ljust(32, "="))
+    print(changelog)
+    print("=" * 32)
+    return changelog
+
+
+def changelog_since_last_upload(
+    repository: Path,
+    ledger,
+    bundle_id: Optional[str],
+    cache_directory: Path,
+    commit_types: list[str] = DEFAULT_COMMIT_TYPES,
+    max_length: int = TESTFLIGHT_CHANGELOG_MAX_LENGTH,
+) -> tuple[str, str]:
+    """ (changelog, HEAD sha). ledger (an UploadLedger) knows which commit the last upload was built from. Record the sha with the upload. """
+    head = head_commit(repository)
+    changelog = generate_git_changelog(repository, cache_directory, ledger.last_git_commit(bundle_id), commit_types, max_length)
+    return changelog, head
+
+
+def _truncate_lines(lines: list[str], max_length: int) -> str:
+    text = "\n".join(lines)
+    if len(text) <= max_length:
+        return text
+
+    kept = []
+    length = 0
+    for index, line in enumerate(lines):
+        more = f"... and {sum(1 for rest in lines[index:] if rest.startswith('- '))} more"  # Commits, not headings or blank lines
+        if length + len(line) + 1 + len(more) > max_length:
+            while kept and not kept[-1].startswith("- "):
+                kept.pop()  # A heading (or gap) with none of its commits under it
+            return "\n".join(kept + [more])[:max_length]
+        kept.append(line)
+        length += len(line) + 1
+    return text
+
+
+def _git(repository: Path, *arguments: str, input: Optional[str] = None) -> str:
+    return subprocess.run(
+        ["git", "-C", str(repository), *arguments],
+        input=input,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
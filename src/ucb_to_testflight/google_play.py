@@ -0,0 +1,261 @@
+"""
+Uploads an Android App Bundle (.aab) to a Google Play track (GOOGLE_PLAY_TRACK, internal by default) through the Play Developer API.
+
+Auth is a service account key (GOOGLE_PLAY_SERVICE_ACCOUNT_JSON): a signed RS256 assertion is exchanged for an access token,
+which is reused until shortly before it expires. Each attempt opens an edit, uploads the bundle, puts it on the track and commits the edit.
+
+The bundle goes up as a resumable media upload, RESUMABLE_CHUNK_SIZE at a time. When a chunk fails the session is asked how much
+it already has and the upload carries on from there, so a dropped connection near the end of a large bundle doesn't mean sending all of it again.
+cryptography (for signing the assertion) is imported on first use.
+"""
+import json
+import threading
+import time
+import urllib.parse
+from pathlib import Path
+from typing import Callable, Optional
+
+from .app_store_connect import _base64url
+from .build_file_finder import BuildFileFinder
+from .http_connection_pool import HttpConnectionPool, HttpResponse
+from .ipa_validation import _map_file
+from .retry_policy import RetryPolicy, UploadAttemptError, run_with_retries
+from .tracing import span
+from .upload_throttling import TokenBucket, throttled, upload_bucket
+
+GOOGLE_PLAY_API_URL = "https://androidpublisher.googleapis.com"
+GOOGLE_PLAY_SCOPE = "https://www.googleapis.com/auth/androidpublisher"
+ASSERTION_LIFETIME_SECONDS = 3600
+ACCESS_TOKEN_REFRESH_MARGIN_SECONDS = 60
+RESUMABLE_CHUNK_SIZE = 8 * 1024 * 1024  # Must be a multiple of 256 KiB
+MAX_CHUNK_RESUMES = 5   # Failed chunks carried on from within one attempt before the attempt fails
+RELEASE_NOTES_MAX_LENGTH = 500  # Google Play's limit
+_RETRYABLE_CLIENT_ERROR_STATUSES = (408, 429)
+
+
+class GooglePlayError(RuntimeError):
+    """ The Play Developer API answered with an error status. """
+    status: int
+
+    def __init__(self, method: str, path: str, status: int, message: str) -> None:
+        super().__init__(f"{method} {path} failed with HTTP {status}{f' ({message})' if message else ''}")
+        self.status = status
+
+    @property
+    def retryable(self) -> bool:
+        return self.status >= 500 or self.status in _RETRYABLE_CLIENT_ERROR_STATUSES
+
+
+def make_service_account_assertion(service_account: dict, now: Optional[float] = None, lifetime: int = ASSERTION_LIFETIME_SECONDS) -> str:
+    """ A signed (RS256) JWT to exchange for an access token at the service account's token_uri. """
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import padding
+
+    issued_at = int(time.time() if now is None else now)
+    header = {"alg": "RS256", "typ": "JWT", "kid": service_account.get("private_key_id", "")}
+    payload = {
+        "iss": service_account["client_email"],
+        "scope": GOOGLE_PLAY_SCOPE,
+        "aud": service_account["token_uri"],
+        "iat": issued_at,
+        "exp": issued_at + lifetime,
+    }
+    signing_input = f"{_base64url(json.dumps(header).encode())}.{_base64url(json.dumps(payload).encode())}".encode()
+
+    private_key = serialization.load_pem_private_key(service_account["private_key"].encode(), password=None)
+    signature = private_key.sign(signing_input, padding.PKCS1v15(), hashes.SHA256())
+    return f"{signing_input.decode()}.{_base64url(signature)}"
+
+
+class GooglePlayClient:
+    service_account: dict
+    base_url: str
+    pool: HttpConnectionPool
+
+    def __init__(
+        self,
+        service_account_json: str,
+        base_url: str = GOOGLE_PLAY_API_URL,
+        pool: Optional[HttpConnectionPool] = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.service_account = json.loads(service_account_json)
+        self.base_url = base_url.rstrip("/")
+        self.pool = pool or HttpConnectionPool()
+        self._clock = clock
+        self._token = None  # (access token, expires at)
+        self._lock = threading.Lock()
+
+    def access_token(self) -> str:
+        with self._lock:
+            now = self._clock()
+            if self._token is not None and now < self._token[1] - ACCESS_TOKEN_REFRESH_MARGIN_SECONDS:
+                return self._token[0]
+            body = urllib.parse.urlencode({
+                "grant_type": "urn:ietf:params:oauth:grant-type:jwt-bearer",
+                "assertion": make_service_account_assertion(self.service_account, now),
+            }).encode()
+            token_uri = self.service_account["token_uri"]
+            response = self.pool.request("POST", token_uri, body, {"Content-Type": "application/x-www-form-urlencoded"})
+            if not response.ok:
+                raise GooglePlayError("POST", token_uri, response.status, _error_message(response))
+            document = response.json()
+            self._token = (document["access_token"], now + int(document.get("expires_in", 3600)))
+            return self._token[0]
+
+    def request(self, method: str, path: str, json_body: Optional[dict] = None) -> dict:
+        """ A JSON request. Returns the decoded response. Raises GooglePlayError on an error status. """
+        body = json.dumps(json_body).encode() if json_body is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        return self.send(method, path, body, headers).json() or {}
+
+    def send(self, method: str, path: str, body=None, headers: Optional[dict] = None, query: Optional[dict] = None, expected: tuple = ()) -> HttpResponse:
+        """ path is relative to base_url, or a full URL (upload sessions). Statuses in expected aren't errors. """
+        url = path if "://" in path else self.base_url + path
+        if query:
+            url += "?" + urllib.parse.urlencode(query)
+        headers = {"Authorization": f"Bearer {self.access_token()}", **(headers or {})}
+        response = self.pool.request(method, url, body=body, headers=headers)
+        if response.status == 401:
+            with self._lock:
+                self._token = None
+        if not response.ok and response.status not in expected:
+            raise GooglePlayError(method, urllib.parse.urlsplit(url).path, response.status, _error_message(response))
+        return response
+
+    def close(self) -> None:
+        self.pool.close()
+
+
+def upload_bundle(
+    client: GooglePlayClient,
+    package_name: str,
+    edit_id: str,
+    aab_path: Path,
+    chunk_size: int = RESUMABLE_CHUNK_SIZE,
+    deadline: float = float("inf"),
+    clock: Callable[[], float] = time.monotonic,
+    bucket: Optional[TokenBucket] = None,
+) -> int:
+    """ Resumable upload of the bundle into the edit, no faster than bucket allows if given. Returns its versionCode. """
+    size = aab_path.stat().st_size
+    session_url = client.send(
+        "POST", f"/upload/androidpublisher/v3/applications/{package_name}/edits/{edit_id}/bundles",
+        b"", {"X-Upload-Content-Type": "application/octet-stream", "X-Upload-Content-Length": str(size)},
+        query={"uploadType": "resumable"},
+    ).headers["location"]
+
+    offset = 0
+    resumes = 0
+    with _map_file(aab_path) as mapped, span("google_play.upload_bundle", **{"aab.size_bytes": size}) as current:
+        while True:
+            if clock() >= deadline:
+                raise UploadAttemptError(f"Google Play upload timed out at {offset}/{size} bytes.", timed_out=True)
+            end = min(offset + chunk_size, size)
+            try:
+                body, headers = throttled(
+                    mapped[offset:end], {"Content-Type": "application/octet-stream", "Content-Range": f"bytes {offset}-{end - 1}/{size}"}, bucket,
+                )
+                response = client.send("PUT", session_url, body, headers, expected=(308,))
+            except (GooglePlayError, OSError) as error:
+                if (isinstance(error, GooglePlayError) and not error.retryable) or resumes >= MAX_CHUNK_RESUMES:
+                    raise
+                resumes += 1
+                print(f"Google Play upload chunk at {offset} failed ({error}), resuming")
+                response = client.send("PUT", session_url, b"", {"Content-Range": f"bytes */{size}"}, expected=(308,))
+
+            if response.status != 308:
+                current.set_attribute("google_play.resumes", resumes)
+                return int(response.json()["versionCode"])
+            offset = _next_offset(response)
+
+
+def _next_offset(response: HttpResponse) -> int:
+    """ Where to carry on from, going by a 308's Range header ("bytes=0-1234"). """
+    byte_range = response.headers.get("range")
+    if not byte_range:
+        return 0
+    return int(byte_range.rsplit("-", 1)[1]) + 1
+
+
+def upload_aab_attempt(
+    client: GooglePlayClient,
+    package_name: str,
+    aab_path: Path,
+    track: str,
+    release_notes: str = "",
+    release_notes_language: str = "en-US",
+    chunk_size: int = RESUMABLE_CHUNK_SIZE,
+    timeout: Optional[float] = None,
+    clock: Callable[[], float] = time.monotonic,
+    bucket: Optional[TokenBucket] = None,
+) -> int:
+    """ One attempt: edit, upload, track, commit. Returns the versionCode. Raises UploadAttemptError so run_with_retries can retry it. """
+    deadline = clock() + timeout if timeout else float("inf")
+    edits_path = f"/androidpublisher/v3/applications/{package_name}/edits"
+    release = {"status": "completed"}
+    if release_notes:
+        release["releaseNotes"] = [{"language": release_notes_language, "text": release_notes[:RELEASE_NOTES_MAX_LENGTH]}]
+    try:
+        edit_id = client.request("POST", edits_path, {})["id"]
+        version_code = upload_bundle(client, package_name, edit_id, aab_path, chunk_size, deadline, clock, bucket)
+        client.request("PUT", f"{edits_path}/{edit_id}/tracks/{track}", {
+            "track": track,
+            "releases": [{**release, "versionCodes": [str(version_code)]}],
+        })
+        client.request("POST", f"{edits_path}/{edit_id}:commit")
+    except GooglePlayError as error:
+        raise UploadAttemptError(str(error), output=str(error)) from error
+    except OSError as error:
+        raise UploadAttemptError(f"Google Play upload failed: {error}", output=str(error)) from error
+    return version_code
+
+
+def upload_to_google_play(
+    service_account_json: str,
+    package_name: str,
+    output_directory: Path,
+    release_notes: str = "",
+    track: str = "internal",
+    release_notes_language: str = "en-US",
+    retry_policy: Optional[RetryPolicy] = None,
+    api_url: str = GOOGLE_PLAY_API_URL,
+    search_recursively: bool = False,
+    max_search_depth: int = 4,
+    chunk_size: int = RESUMABLE_CHUNK_SIZE,
+    max_mb_per_second: float = 0,
+) -> int:
+    """
+    Find the .aab in output_directory and upload it to track, retrying as retry_policy says. Returns its versionCode.
+    max_mb_per_second caps the upload's bandwidth (0 for no limit).
+    """
+    if not service_account_json:
+        raise ValueError("GOOGLE_PLAY_SERVICE_ACCOUNT_JSON is needed to upload to Google Play.")
+    retry_policy = retry_policy or RetryPolicy()
+    aab_path = BuildFileFinder(output_directory, ".aab", search_recursively, max_search_depth).file_path
+    aab_size = aab_path.stat().st_size
+
+    client = GooglePlayClient(service_account_json, api_url)
+    bucket = upload_bucket(max_mb_per_second)
+    try:
+        with span("google_play.upload", **{"aab.name": aab_path.name, "aab.size_bytes": aab_size, "google_play.track": track}):
+            def attempt_upload(attempt: int, timeout: float) -> int:
+                print(f"Google Play upload attempt {attempt}/{retry_policy.max_attempts} ({aab_path.name})")
+                return upload_aab_attempt(client, package_name, aab_path, track, release_notes, release_notes_language, chunk_size, timeout, bucket=bucket)
+
+            version_code = run_with_retries(attempt_upload, retry_policy)
+    finally:
+        client.close()
+    print(f"Uploaded {aab_path.name} (version code {version_code}) to the {track} track of {package_name}")
+    return version_code
+
+
+def _error_message(response: HttpResponse) -> str:
+    try:
+        document = response.json() or {}
+    except ValueError:
+        return ""
+    error = document.get("error")
+    if isinstance(error, dict):
+        return error.get("message", "")
+    return str(error or "")
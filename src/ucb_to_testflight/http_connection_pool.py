@@ -0,0 +1,118 @@
+"""
+Keep-alive HTTP(S) connections shared between threads, so parallel requests (eg. upload chunks) don't each pay for a TCP/TLS handshake.
+
+Connections are pooled per scheme/host/port. A request takes an idle connection (or opens one) and hands it back once
+the response has been read. A connection the server closed while it sat idle is replaced and the request sent again.
+"""
+import http.client
+import threading
+import urllib.parse
+from typing import Optional
+
+DEFAULT_TIMEOUT_SECONDS = 60
+DEFAULT_MAX_IDLE_PER_HOST = 16
+
+# What a stale keep-alive connection looks like when it's reused
+_STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, http.client.CannotSendRequest, BrokenPipeError, ConnectionResetError)
+
+
+class HttpResponse:
+    status: int
+    headers: dict       # lowercase names
+    body: bytes
+
+    def __init__(self, status: int, headers: dict, body: bytes) -> None:
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.status < 300
+
+    def json(self):
+        import json
+        return json.loads(self.body) if self.body else None
+
+
+class HttpConnectionPool:
+    timeout: float
+    max_idle_per_host: int
+    connections_opened: int
+
+    def __init__(self, timeout: float = DEFAULT_TIMEOUT_SECONDS, max_idle_per_host: int = DEFAULT_MAX_IDLE_PER_HOST) -> None:
+        self.timeout = timeout
+        self.max_idle_per_host = max_idle_per_host
+        self.connections_opened = 0
+        self._idle = {}     # (scheme, host, port) -> [HTTPConnection]
+        self._lock = threading.Lock()
+
+    def request(self, method: str, url: str, body=None, headers: Optional[dict] = None) -> HttpResponse:
+        """ body can be anything http.client accepts, including a memoryview (sent without copying). """
+        parsed = urllib.parse.urlsplit(url)
+        key = (parsed.scheme, parsed.hostname, parsed.port)
+        target = urllib.parse.urlunsplit(("", "", parsed.path or "/", parsed.query, ""))
+
+        connection, reused = self._take(key)
+        try:
+            try:
+                response = self._send(connection, method, target, body, headers or {})
+            except _STALE_CONNECTION_ERRORS:
+                if not reused:
+                    raise
+                connection.close()
+                connection, reused = self._open(key), False
+                response = self._send(connection, method, target, body, headers or {})
+        except BaseException:
+            connection.close()
+            raise
+
+        if response.headers.get("connection", "").lower() == "close":
+            connection.close()
+        else:
+            self._give_back(key, connection)
+        return response
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+    def __enter__(self) -> "HttpConnectionPool":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _send(self, connection: http.client.HTTPConnection, method: str, target: str, body, headers: dict) -> HttpResponse:
+        connection.request(method, target, body=body, headers=headers)
+        response = connection.getresponse()
+        body = response.read()     # Has to be read in full before the connection can be reused
+        return HttpResponse(response.status, {name.lower(): value for name, value in response.getheaders()}, body)
+
+    def _take(self, key: tuple) -> tuple:
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+        return self._open(key), False
+
+    def _give_back(self, key: tuple, connection: http.client.HTTPConnection) -> None:
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def _open(self, key: tuple) -> http.client.HTTPConnection:
+        scheme, host, port = key
+        with self._lock:
+            self.connections_opened += 1
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port, timeout=self.timeout)
+        if scheme == "http":
+            return http.client.HTTPConnection(host, port, timeout=self.timeout)
+        raise ValueError(f"Unsupported URL scheme: {scheme}")
@@ -0,0 +1,122 @@
+"""
+Packages an .xcarchive into an .ipa, for pipelines where only the archive lands in OUTPUT_DIRECTORY.
+
+For an archive that's already signed for the App Store, exporting from Xcode comes down to zipping Products/Applications/*.app
+under Payload/ (plus SwiftSupport/ if the archive has one). The app is streamed straight into the .ipa by ParallelZipWriter,
+so nothing is copied first and the deflating is spread over every core.
+
+Packaging is the most expensive step for an archive, so PackagedIpa only does it when it has to: the .ipa is reused while it's
+newer than everything in the archive, and once it's uploaded it's deleted and just its fingerprint is kept, so running again for
+an archive that's already been uploaded is skipped without packaging it again.
+"""
+import json
+import os
+import time
+from pathlib import Path
+from typing import Optional
+
+from .ipa_validation import IpaValidationError
+from .parallel_zip import DEFAULT_COMPRESS_LEVEL, ParallelZipWriter
+from .tracing import span
+from .upload_ledger import UploadLedger, is_upload_skipped
+
+PACKAGED_IPA_DIRECTORY_NAME = "packaged_ipas"   # In CACHE_DIRECTORY
+
+
+def find_archived_app(xcarchive: Path) -> Path:
+    """ The one .app in the archive's Products/Applications. """
+    applications = xcarchive / "Products" / "Applications"
+    apps = sorted(applications.glob("*.app")) if applications.is_dir() else []
+    if len(apps) != 1:
+        raise IpaValidationError(f"{xcarchive.name} should have one app in Products/Applications, found {len(apps)}.")
+    return apps[0]
+
+
+def packaged_ipa_path(cache_directory: Path, xcarchive: Path) -> Path:
+    return cache_directory / PACKAGED_IPA_DIRECTORY_NAME / (xcarchive.stem + ".ipa")
+
+
+def package_xcarchive(xcarchive: Path, ipa_path: Path, max_workers: Optional[int] = None, compress_level: int = DEFAULT_COMPRESS_LEVEL) -> Path:
+    """ Write the archive's app to ipa_path as an .ipa. Returns ipa_path. """
+    app = find_archived_app(xcarchive)
+    ipa_path.parent.mkdir(parents=True, exist_ok=True)
+    partial_path = ipa_path.with_name(ipa_path.name + ".partial")
+    start = time.monotonic()
+
+    with span("ipa.package", **{"xcarchive.name": xcarchive.name}) as current:
+        with ParallelZipWriter(partial_path, max_workers, compress_level) as writer:
+            writer.add_directory("Payload/", app.parent.stat().st_mtime)
+            writer.add_tree(app, f"Payload/{app.name}")
+            swift_support = xcarchive / "SwiftSupport"
+            if swift_support.is_dir():
+                writer.add_tree(swift_support, "SwiftSupport")
+        os.replace(partial_path, ipa_path)
+        size = ipa_path.stat().st_size
+        current.set_attribute("ipa.size_bytes", size)
+        current.set_attribute("zip.entries", len(writer.entries))
+
+    print(f"Packaged {xcarchive.name} into {ipa_path.name} ({size} bytes, {len(writer.entries)} entries) in {time.monotonic() - start:.1f}s")
+    return ipa_path
+
+
+class PackagedIpa:
+    """ The .ipa packaged from an .xcarchive into CACHE_DIRECTORY/packaged_ipas. """
+    xcarchive: Path
+    path: Path
+    record_path: Path   # Once uploaded: {"archive_modified": ..., "fingerprint": ...}
+
+    def __init__(self, cache_directory: Path, xcarchive: Path) -> None:
+        self.xcarchive = xcarchive
+        self.path = packaged_ipa_path(cache_directory, xcarchive)
+        self.record_path = self.path.with_name(self.path.name + ".uploaded.json")
+        self._archive_modified = None
+
+    @property
+    def archive_modified(self) -> float:
+        """ Newest modification time of anything that goes into the .ipa. """
+        if self._archive_modified is None:
+            roots = [find_archived_app(self.xcarchive), self.xcarchive / "SwiftSupport"]
+            self._archive_modified = max(_newest_modification_time(root) for root in roots if root.exists())
+        return self._archive_modified
+
+    def info_plist_contents(self) -> tuple:
+        """ (name, contents) of the archived app's Info.plist, like ipa_validation.read_info_plist_contents. """
+        info_plist = find_archived_app(self.xcarchive) / "Info.plist"
+        if not info_plist.is_file():
+            raise IpaValidationError(f"{self.xcarchive.name}'s app has no Info.plist")
+        return f"{self.xcarchive.name}/{info_plist.relative_to(self.xcarchive)}", info_plist.read_bytes()
+
+    def is_upload_skipped(self, ledger: UploadLedger, force: bool) -> bool:
+        """ is_upload_skipped for the .ipa last uploaded from the archive, if the archive hasn't changed since. """
+        if force:
+            return False
+        try:
+            record = json.loads(self.record_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return False
+        if record.get("archive_modified") != self.archive_modified:
+            return False
+        return is_upload_skipped(ledger, record["fingerprint"], self.xcarchive, force)
+
+    def package(self, max_workers: Optional[int] = None) -> Path:
+        """ The .ipa, packaged again only if the archive has changed since it was last packaged. """
+        try:
+            if self.path.stat().st_mtime >= self.archive_modified:
+                print(f"Reusing {self.path.name}, packaged from {self.xcarchive.name} before")
+                return self.path
+        except FileNotFoundError:
+            pass
+        return package_xcarchive(self.xcarchive, self.path, max_workers)
+
+    def uploaded(self, fingerprint: str) -> None:
+        """ Call once the upload is in the ledger. Deletes the .ipa and keeps just its fingerprint. """
+        self.record_path.write_text(json.dumps({"archive_modified": self.archive_modified, "fingerprint": fingerprint}), encoding="utf-8")
+        self.path.unlink(missing_ok=True)
+
+
+def _newest_modification_time(root: Path) -> float:
+    newest = root.lstat().st_mtime
+    for directory, directory_names, file_names in os.walk(root):
+        for name in directory_names + file_names:
+            newest = max(newest, os.lstat(os.path.join(directory, name)).st_mtime)
+    return newest
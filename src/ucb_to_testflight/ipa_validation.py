@@ -0,0 +1,270 @@
+"""
+Quick sanity checks on the .ipa before spending minutes uploading it.
+
+Nothing is extracted. The file is memory mapped, the zip central directory is read from the end of the file,
+and only Payload/*.app/Info.plist is decompressed. So this takes milliseconds even for multi GB .ipa files.
+
+Checks:
+ - The zip isn't truncated/corrupt (central directory where it should be, member data inside the file).
+ - There is exactly one Payload/*.app with an Info.plist and the executable it names.
+ - The bundle id is the expected one (if EXPECTED_BUNDLE_ID is set).
+ - The version/build pair hasn't already been uploaded from here (according to the upload ledger).
+"""
+import contextlib
+import mmap
+import re
+import struct
+import time
+import zlib
+from pathlib import Path
+from typing import Iterator, Optional
+
+_END_OF_CENTRAL_DIRECTORY = b"PK\x05\x06"
+_ZIP64_END_OF_CENTRAL_DIRECTORY = b"PK\x06\x06"
+_ZIP64_END_OF_CENTRAL_DIRECTORY_LOCATOR = b"PK\x06\x07"
+_CENTRAL_DIRECTORY_HEADER = b"PK\x01\x02"
+_LOCAL_FILE_HEADER = b"PK\x03\x04"
+_MAX_COMMENT_LENGTH = 0xFFFF
+_ZIP64_EXTRA_ID = 0x0001
+
+_STORED = 0
+_DEFLATED = 8
+
+_APP_INFO_PLIST_PATTERN = re.compile(r"^Payload/([^/]+\.app)/Info\.plist$")
+_REQUIRED_INFO_PLIST_KEYS = ("CFBundleIdentifier", "CFBundleShortVersionString", "CFBundleVersion", "CFBundleExecutable")
+
+
+class IpaValidationError(ValueError):
+    pass
+
+
+class ZipMember:
+    name: str
+    compression: int
+    crc: int
+    compressed_size: int
+    uncompressed_size: int
+    local_header_offset: int
+
+    def __init__(self, name: str, compression: int, crc: int, compressed_size: int, uncompressed_size: int, local_header_offset: int) -> None:
+        self.name = name
+        self.compression = compression
+        self.crc = crc
+        self.compressed_size = compressed_size
+        self.uncompressed_size = uncompressed_size
+        self.local_header_offset = local_header_offset
+
+
+class IpaInfo:
+    path: Path
+    app_name: str       # Eg. "Game.app"
+    bundle_id: str
+    short_version: str  # CFBundleShortVersionString
+    build_version: str  # CFBundleVersion
+    member_count: int
+
+    def __init__(self, path: Path, app_name: str, info_plist: dict, member_count: int) -> None:
+        self.path = path
+        self.app_name = app_name
+        self.bundle_id = str(info_plist["CFBundleIdentifier"])
+        self.short_version = str(info_plist["CFBundleShortVersionString"])
+        self.build_version = str(info_plist["CFBundleVersion"])
+        self.member_count = member_count
+
+    def __str__(self) -> str:
+        return f"{self.bundle_id} {self.short_version} ({self.build_version})"
+
+    def ledger_columns(self) -> dict:
+        """ Extra UploadLedger.record_upload columns for this build. """
+        return {"bundle_id": self.bundle_id, "short_version": self.short_version, "build_version": self.build_version}
+
+
+def inspect_ipa(ipa_path: Path) -> IpaInfo:
+    """ Read and structurally check the .ipa. Raises IpaValidationError if it's broken. """
+    with _map_file(ipa_path) as mapped:
+        members = read_zip_members(mapped)
+        plist_members = [member for member in members.values() if _APP_INFO_PLIST_PATTERN.match(member.name)]
+        if len(plist_members) != 1:
+            raise IpaValidationError(f"{ipa_path.name} should contain exactly one Payload/*.app/Info.plist, found {len(plist_members)}.")
+
+        app_name = _APP_INFO_PLIST_PATTERN.match(plist_members[0].name).group(1)
+        info_plist = _parse_plist(read_zip_member(mapped, plist_members[0]), plist_members[0].name)
+
+    missing_keys = [key for key in _REQUIRED_INFO_PLIST_KEYS if key not in info_plist]
+    if missing_keys:
+        raise IpaValidationError(f"Payload/{app_name}/Info.plist is missing {', '.join(missing_keys)}")
+
+    executable = f"Payload/{app_name}/{info_plist['CFBundleExecutable']}"
+    if executable not in members:
+        raise IpaValidationError(f"{ipa_path.name} is missing the app executable ({executable}).")
+
+    return IpaInfo(ipa_path, app_name, info_plist, len(members))
+
+
+def read_info_plist(ipa_path: Path) -> dict:
+    """ Just Payload/*.app/Info.plist. Raises IpaValidationError (or OSError) if it can't be read. """
+    name, contents = read_info_plist_contents(ipa_path)
+    return _parse_plist(contents, name)
+
+
+def read_info_plist_contents(ipa_path: Path) -> tuple:
+    """ (member name, contents) of Payload/*.app/Info.plist, CRC checked but not parsed. Raises IpaValidationError (or OSError) if it can't be read. """
+    with _map_file(ipa_path) as mapped:
+        for member in read_zip_members(mapped).values():
+            if _APP_INFO_PLIST_PATTERN.match(member.name):
+                return member.name, read_zip_member(mapped, member)
+    raise IpaValidationError(f"{ipa_path.name} has no Payload/*.app/Info.plist")
+
+
+def check_info_plist_contents(name: str, contents: bytes, expected_bundle_id: str = "") -> None:
+    """
+    A dry run's check: the Info.plist could be read, so the zip is whole, and it has the expected bundle id (if EXPECTED_BUNDLE_ID is set).
+    It's only parsed (importing plistlib) when there is a bundle id to compare.
+    """
+    if not expected_bundle_id:
+        return
+    bundle_id = _parse_plist(contents, name).get("CFBundleIdentifier")
+    if bundle_id != expected_bundle_id:
+        raise IpaValidationError(f"{name} has bundle id {bundle_id}, expected {expected_bundle_id}.")
+
+
+def validate_ipa(ipa_path: Path, expected_bundle_id: str = "", ledger=None, fingerprint: Optional[str] = None) -> IpaInfo:
+    """ inspect_ipa then check_ipa_info. """
+    start = time.perf_counter()
+    info = inspect_ipa(ipa_path)
+    check_ipa_info(info, expected_bundle_id, ledger, fingerprint)
+    print(f"Validated {ipa_path.name}: {info} in {(time.perf_counter() - start) * 1000:.1f}ms")
+    return info
+
+
+def check_ipa_info(info: IpaInfo, expected_bundle_id: str = "", ledger=None, fingerprint: Optional[str] = None) -> None:
+    """
+    The checks that need outside information.
+    ledger (an UploadLedger) is used to catch version/build pairs that were already uploaded from a different file.
+    """
+    if expected_bundle_id and info.bundle_id != expected_bundle_id:
+        raise IpaValidationError(f"{info.path.name} has bundle id {info.bundle_id}, expected {expected_bundle_id}.")
+
+    if ledger is not None:
+        previous = ledger.find_build(info.bundle_id, info.short_version, info.build_version)
+        if previous is not None and previous["fingerprint"] != fingerprint:
+            raise IpaValidationError(
+                f"{info} was already uploaded (from {previous['file_name']}). Bump CFBundleVersion before uploading again."
+            )
+
+
+def read_zip_members(mapped: mmap.mmap) -> dict:
+    """ name -> ZipMember, straight from the central directory. """
+    file_size = len(mapped)
+    end_offset = mapped.rfind(_END_OF_CENTRAL_DIRECTORY, max(0, file_size - _MAX_COMMENT_LENGTH - 22))
+    if end_offset < 0 or end_offset + 22 > file_size:
+        raise IpaValidationError("Not a zip file (or truncated): end of central directory not found.")
+
+    (_, _, _, _, entry_count, directory_size, directory_offset, _) = struct.unpack_from("<4s4H2LH", mapped, end_offset)
+
+    if 0xFFFFFFFF in (directory_size, directory_offset) or entry_count == 0xFFFF:
+        entry_count, directory_size, directory_offset = _read_zip64_end(mapped, end_offset)
+
+    if directory_offset + directory_size > end_offset:
+        raise IpaValidationError("Zip is corrupt or truncated: central directory overlaps its end record.")
+
+    members = {}
+    position = directory_offset
+    for _ in range(entry_count):
+        if mapped[position:position + 4] != _CENTRAL_DIRECTORY_HEADER:
+            raise IpaValidationError(f"Zip is corrupt or truncated: bad central directory entry at {position}.")
+
+        (_, _, _, _, compression, _, _, crc, compressed_size, uncompressed_size,
+         name_length, extra_length, comment_length, _, _, _, local_header_offset) = struct.unpack_from("<4s6H3L5H2L", mapped, position)
+        name_start = position + 46
+        name = bytes(mapped[name_start:name_start + name_length]).decode("utf-8", errors="replace")
+        extra = bytes(mapped[name_start + name_length:name_start + name_length + extra_length])
+
+        if 0xFFFFFFFF in (compressed_size, uncompressed_size, local_header_offset):
+            uncompressed_size, compressed_size, local_header_offset = _read_zip64_extra(extra, uncompressed_size, compressed_size, local_header_offset)
+
+        if local_header_offset + compressed_size > directory_offset:
+            raise IpaValidationError(f"Zip is corrupt or truncated: {name} runs past the central directory.")
+
+        members[name] = ZipMember(name, compression, crc, compressed_size, uncompressed_size, local_header_offset)
+        position = name_start + name_length + extra_length + comment_length
+
+    return members
+
+
+def read_zip_member(mapped: mmap.mmap, member: ZipMember) -> bytes:
+    offset = member.local_header_offset
+    if mapped[offset:offset + 4] != _LOCAL_FILE_HEADER:
+        raise IpaValidationError(f"Zip is corrupt: bad local header for {member.name}.")
+
+    name_length, extra_length = struct.unpack_from("<2H", mapped, offset + 26)
+    data_start = offset + 30 + name_length + extra_length
+    data = mapped[data_start:data_start + member.compressed_size]
+
+    if member.compression == _STORED:
+        contents = data
+    elif member.compression == _DEFLATED:
+        try:
+            contents = zlib.decompress(data, -zlib.MAX_WBITS)
+        except zlib.error as error:
+            raise IpaValidationError(f"Zip is corrupt: can't inflate {member.name} ({error}).")
+    else:
+        raise IpaValidationError(f"{member.name} uses unsupported compression method {member.compression}.")
+
+    if zlib.crc32(contents) != member.crc:
+        raise IpaValidationError(f"Zip is corrupt: CRC mismatch for {member.name}.")
+    return contents
+
+
+@contextlib.contextmanager
+def _map_file(path: Path) -> Iterator[mmap.mmap]:
+    with open(path, "rb") as file:
+        try:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise IpaValidationError(f"{path.name} is empty.")
+        with mapped:
+            yield mapped
+
+
+def _parse_plist(contents: bytes, name: str) -> dict:
+    import plistlib
+
+    try:
+        plist = plistlib.loads(contents)
+    except (plistlib.InvalidFileException, ValueError) as error:
+        raise IpaValidationError(f"{name} can't be parsed: {error}")
+    if not isinstance(plist, dict):
+        raise IpaValidationError(f"{name} isn't a dictionary.")
+    return plist
+
+
+def _read_zip64_end(mapped: mmap.mmap, end_offset: int) -> tuple:
+    locator_offset = end_offset - 20
+    if locator_offset < 0 or mapped[locator_offset:locator_offset + 4] != _ZIP64_END_OF_CENTRAL_DIRECTORY_LOCATOR:
+        raise IpaValidationError("Zip is corrupt: zip64 end of central directory locator not found.")
+
+    (zip64_end_offset,) = struct.unpack_from("<Q", mapped, locator_offset + 8)
+    if mapped[zip64_end_offset:zip64_end_offset + 4] != _ZIP64_END_OF_CENTRAL_DIRECTORY:
+        raise IpaValidationError("Zip is corrupt: zip64 end of central directory not found.")
+
+    entry_count, directory_size, directory_offset = struct.unpack_from("<3Q", mapped, zip64_end_offset + 32)
+    return entry_count, directory_size, directory_offset
+
+
+def _read_zip64_extra(extra: bytes, uncompressed_size: int, compressed_size: int, local_header_offset: int) -> tuple:
+    position = 0
+    while position + 4 <= len(extra):
+        header_id, size = struct.unpack_from("<2H", extra, position)
+        if header_id == _ZIP64_EXTRA_ID:
+            values = list(struct.unpack_from(f"<{size // 8}Q", extra, position + 4))
+            # Only the fields that overflowed are present, in this order
+            if uncompressed_size == 0xFFFFFFFF:
+                uncompressed_size = values.pop(0)
+            if compressed_size == 0xFFFFFFFF:
+                compressed_size = values.pop(0)
+            if local_header_offset == 0xFFFFFFFF:
+                local_header_offset = values.pop(0)
+            break
+        position += 4 + size
+    return uncompressed_size, compressed_size, local_header_offset
@@ -0,0 +1,96 @@
+"""
+Uploads the iOS build to TestFlight, the Android build to Google Play (GOOGLE_PLAY_PACKAGE_NAME turns it on) and the dSYMs to
+SYMBOL_UPLOAD_URL (if set) at the same time, instead of running separate tools for them after this one.
+
+Both come from the same parameters and get the same retry settings (MAX_UPLOAD_ATTEMPTS, ATTEMPT_TIMEOUT, RETRY_*, MAX_TOTAL_UPLOAD_SECONDS).
+One failing doesn't stop the others, and the results (with how long each took) are reported together like a batch. Each takes its own host upload slot (MAX_HOST_UPLOADS).
+"""
+from typing import Callable, Optional
+
+from .batch_upload import BatchJob, BatchJobResult, run_timed_job
+from .context_threads import ContextThreadPoolExecutor
+from .upload_parameters import UploadParameters
+
+TESTFLIGHT_JOB_NAME = "testflight"
+GOOGLE_PLAY_JOB_NAME = "google-play"
+SYMBOLS_JOB_NAME = "symbols"
+
+
+def upload_all_platforms(
+    parameters: UploadParameters,
+    upload_ios: Optional[Callable] = None,
+    upload_android: Optional[Callable[[UploadParameters], object]] = None,
+    upload_dsyms: Optional[Callable[[UploadParameters], object]] = None,
+) -> list[BatchJobResult]:
+    """ Runs the uploads that are turned on concurrently and returns their results (TestFlight first). Never raises for a failed upload. """
+    if upload_ios is None:
+        from .upload_to_testflight import upload_to_testflight as upload_ios
+    upload_android = upload_android or upload_parameters_to_google_play
+    upload_dsyms = upload_dsyms or upload_parameters_symbols
+
+    jobs = [(BatchJob(TESTFLIGHT_JOB_NAME, {}), lambda: upload_ios(*parameters.get_values()))]
+    if parameters.google_play_package_name:
+        jobs.append((BatchJob(GOOGLE_PLAY_JOB_NAME, {}), lambda: upload_android(parameters)))
+    if parameters.symbol_upload_url:
+        jobs.append((BatchJob(SYMBOLS_JOB_NAME, {}), lambda: upload_dsyms(parameters)))
+    with ContextThreadPoolExecutor(max_workers=len(jobs), thread_name_prefix="platform-upload") as executor:
+        return list(executor.map(lambda job: run_timed_job(*job), jobs))
+
+
+def _retry_policy(parameters: UploadParameters) -> "RetryPolicy":
+    from .retry_policy import RetryPolicy
+
+    return RetryPolicy(
+        parameters.max_upload_attempts,
+        parameters.attempt_timeout,
+        parameters.retry_base_delay,
+        parameters.retry_max_delay,
+        parameters.retry_jitter,
+        parameters.max_total_upload_seconds,
+        parameters.min_attempt_timeout,
+    )
+
+
+def upload_parameters_to_google_play(parameters: UploadParameters) -> int:
+    from .google_play import upload_to_google_play
+    from .upload_throttling import host_upload_slot
+
+    release_notes = ""
+    if parameters.changelog_source == "file":
+        with open(parameters.changelog_path, "r") as file:
+            release_notes = file.read()
+    else:
+        print("Google Play release notes are only set from CHANGELOG_PATH (CHANGELOG_SOURCE=file)")
+
+    retry_policy = _retry_policy(parameters)
+    with host_upload_slot(parameters.cache_directory, parameters.max_host_uploads, parameters.upload_priority):
+        return upload_to_google_play(
+            parameters.google_play_service_account_json,
+            parameters.google_play_package_name,
+            parameters.output_directory,
+            release_notes,
+            parameters.google_play_track,
+            parameters.google_play_release_notes_language,
+            retry_policy,
+            parameters.google_play_api_url,
+            parameters.search_recursively,
+            parameters.max_search_depth,
+            max_mb_per_second=parameters.max_upload_mb_per_second,
+        )
+
+
+def upload_parameters_symbols(parameters: UploadParameters):
+    from .symbol_upload import upload_symbols
+    from .upload_throttling import host_upload_slot
+
+    retry_policy = _retry_policy(parameters)
+    with host_upload_slot(parameters.cache_directory, parameters.max_host_uploads, parameters.upload_priority):
+        return upload_symbols(
+            parameters.output_directory,
+            parameters.symbol_upload_url,
+            parameters.symbol_upload_token,
+            retry_policy,
+            parameters.search_recursively,
+            parameters.max_search_depth,
+            max_mb_per_second=parameters.max_upload_mb_per_second,
+        )
@@ -0,0 +1,296 @@
+"""
+Writes zip archives with the compression spread over several cores, for .ipa files (and dSYMs) that are gigabytes of compressible
+code next to assets that are already compressed.
+
+zipfile deflates on the thread that writes, one file after another. Here a pool of threads reads and deflates files (zlib lets go of
+the GIL) while entries are written out in the order they were added, so the archive is the same whatever the thread count.
+Files that are already compressed (STORED_SUFFIXES), or that don't get smaller, are stored as they are.
+
+Nothing is staged on disk: a deflated file is held (compressed) in memory until its turn, only a few files are in flight at once,
+and stored files are copied straight from the source. Timestamps come from the files, so packaging the same tree twice gives the
+same bytes. ZIP64 records are added only when the archive needs them.
+Every size is known before an entry is written, so nothing is ever sought back to: the archive can go to a stream (eg. an upload)
+instead of a file.
+"""
+import collections
+import os
+import stat
+import struct
+import time
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+# Already compressed (or not worth deflating). Lowercase.
+STORED_SUFFIXES: tuple = (
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".heic", ".car",
+    ".zip", ".gz", ".xz", ".lz4", ".bundle", ".unity3d", ".assetbundle",
+    ".mp3", ".m4a", ".aac", ".ogg", ".mp4", ".mov", ".ktx", ".astc", ".pvr",
+)
+DEFAULT_COMPRESS_LEVEL = 6
+READ_CHUNK_SIZE = 1024 * 1024
+IN_FLIGHT_PER_WORKER = 2    # Files read/deflated ahead of the writer, per worker
+
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+_ZIP64_LIMIT = 0xFFFFFFFF
+_ZIP64_COUNT_LIMIT = 0xFFFF
+_UTF8_FLAG = 0x800
+_LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+_CENTRAL_HEADER = struct.Struct("<4s4B4HL2L5H2L")
+_END_OF_CENTRAL_DIRECTORY = struct.Struct("<4s4H2LH")
+_ZIP64_END_OF_CENTRAL_DIRECTORY = struct.Struct("<4sQ2H2L4Q")
+_ZIP64_LOCATOR = struct.Struct("<4sLQL")
+
+
+class _Entry:
+    """ One member: everything the central directory needs. Data is either chunks (deflated, links) or copied from source. """
+    name: str
+    mode: int
+    dos_time: tuple     # (time, date)
+    method: int
+    crc: int
+    size: int
+    compressed_size: int
+    source: Optional[Path]
+    chunks: Optional[list]
+    offset: int
+
+    def __init__(self, name: str, mode: int, modified_time: float) -> None:
+        self.name = name
+        self.mode = mode
+        self.dos_time = _dos_time(modified_time)
+        self.method = ZIP_STORED
+        self.crc = 0
+        self.size = 0
+        self.compressed_size = 0
+        self.source = None
+        self.chunks = []
+        self.offset = 0
+
+    @property
+    def flags(self) -> int:
+        return 0 if self.name.isascii() else _UTF8_FLAG
+
+
+class ParallelZipWriter:
+    """
+    with ParallelZipWriter(path) as writer: writer.add_tree(directory, "Payload/Game.app")
+    With stream (anything with write()) the archive is written there instead of to path. The stream is left open.
+    """
+    path: Optional[Path]
+    max_workers: int
+    compress_level: int
+    stored_suffixes: tuple
+    entries: list
+
+    def __init__(
+        self,
+        path: Optional[Path],
+        max_workers: Optional[int] = None,
+        compress_level: int = DEFAULT_COMPRESS_LEVEL,
+        stored_suffixes: tuple = STORED_SUFFIXES,
+        stream: Optional[BinaryIO] = None,
+    ) -> None:
+        self.path = path
+        self.max_workers = max(1, max_workers or os.cpu_count() or 1)
+        self.compress_level = compress_level
+        self.stored_suffixes = stored_suffixes
+        self.entries = []
+        self._file = _PositionedStream(stream) if stream is not None else open(path, "wb")
+        self._owns_file = stream is None
+        self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="zip")
+        self._pending = collections.deque()     # Futures of _Entry, in the order they were added
+
+    def add_file(self, source: Path, name: str) -> None:
+        """ The file (or symlink) at source, as name. """
+        self._add(self._executor.submit(self._prepare, source, name))
+
+    def add_directory(self, name: str, modified_time: Optional[float] = None) -> None:
+        name = name.rstrip("/") + "/"
+        future = Future()
+        future.set_result(_Entry(name, stat.S_IFDIR | 0o755, time.time() if modified_time is None else modified_time))
+        self._add(future)
+
+    def add_tree(self, root: Path, prefix: str) -> None:
+        """ root and everything in it as prefix/..., in sorted order. Symlinks are kept as links. """
+        self.add_directory(prefix, root.stat().st_mtime)
+        for name, path, is_directory in _walk(root, prefix.rstrip("/")):
+            if is_directory:
+                self.add_directory(name, path.stat().st_mtime)
+            else:
+                self.add_file(path, name)
+
+    def close(self) -> None:
+        """ Write what's left and the central directory. """
+        try:
+            while self._pending:
+                self._write(self._pending.popleft().result())
+            self._write_central_directory()
+        finally:
+            self._executor.shutdown(cancel_futures=True)
+            if self._owns_file:
+                self._file.close()
+
+    def abort(self) -> None:
+        """ Stop and delete the partial archive (a stream is just left as it is). """
+        for future in self._pending:
+            future.cancel()
+        self._executor.shutdown(cancel_futures=True)
+        if self._owns_file:
+            self._file.close()
+            self.path.unlink(missing_ok=True)
+
+    def __enter__(self) -> "ParallelZipWriter":
+        return self
+
+    def __exit__(self, exc_type, *exc_info) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _add(self, future: Future) -> None:
+        self._pending.append(future)
+        while len(self._pending) > self.max_workers * IN_FLIGHT_PER_WORKER:
+            self._write(self._pending.popleft().result())
+
+    def _prepare(self, source: Path, name: str) -> _Entry:
+        """ Runs on a worker: checksum, and deflate unless the file is stored. """
+        status = os.lstat(source)
+        entry = _Entry(name, status.st_mode, status.st_mtime)
+        if stat.S_ISLNK(status.st_mode):
+            target = os.readlink(source).encode()
+            entry.chunks = [target]
+            entry.crc = zlib.crc32(target)
+            entry.size = entry.compressed_size = len(target)
+            return entry
+
+        crc = 0
+        size = 0
+        compressor = None
+        chunks = []
+        if not name.lower().endswith(self.stored_suffixes):
+            compressor = zlib.compressobj(self.compress_level, zlib.DEFLATED, -15)
+        with open(source, "rb") as file:
+            while True:
+                data = file.read(READ_CHUNK_SIZE)
+                if not data:
+                    break
+                crc = zlib.crc32(data, crc)
+                size += len(data)
+                if compressor is not None:
+                    compressed = compressor.compress(data)
+                    if compressed:
+                        chunks.append(compressed)
+        entry.crc = crc
+        entry.size = size
+
+        if compressor is not None:
+            chunks.append(compressor.flush())
+            compressed_size = sum(map(len, chunks))
+            if compressed_size < size:
+                entry.method = ZIP_DEFLATED
+                entry.chunks = chunks
+                entry.compressed_size = compressed_size
+                return entry
+        entry.source = source   # Copied when it's written, so big stored files are never held in memory
+        entry.chunks = None
+        entry.compressed_size = size
+        return entry
+
+    def _write(self, entry: _Entry) -> None:
+        entry.offset = self._file.tell()
+        name = entry.name.encode("utf-8")
+        zip64 = entry.size >= _ZIP64_LIMIT or entry.compressed_size >= _ZIP64_LIMIT
+        extra = struct.pack("<2H2Q", 1, 16, entry.size, entry.compressed_size) if zip64 else b""
+        self._file.write(_LOCAL_HEADER.pack(
+            b"PK\x03\x04", 45 if zip64 else 20, 0, entry.flags, entry.method, *entry.dos_time, entry.crc,
+            _ZIP64_LIMIT if zip64 else entry.compressed_size, _ZIP64_LIMIT if zip64 else entry.size, len(name), len(extra),
+        ))
+        self._file.write(name)
+        self._file.write(extra)
+
+        if entry.chunks is not None:
+            for chunk in entry.chunks:
+                self._file.write(chunk)
+            entry.chunks = None     # Free it, the central directory only needs the sizes
+        else:
+            copied = 0
+            with open(entry.source, "rb") as file:
+                while True:
+                    data = file.read(READ_CHUNK_SIZE)
+                    if not data:
+                        break
+                    self._file.write(data)
+                    copied += len(data)
+            if copied != entry.size:
+                raise OSError(f"{entry.source} changed while it was being zipped")
+        self.entries.append(entry)
+
+    def _write_central_directory(self) -> None:
+        start = self._file.tell()
+        for entry in self.entries:
+            name = entry.name.encode("utf-8")
+            zip64_fields = [value for value in (entry.size, entry.compressed_size, entry.offset) if value >= _ZIP64_LIMIT]
+            extra = struct.pack(f"<2H{len(zip64_fields)}Q", 1, 8 * len(zip64_fields), *zip64_fields) if zip64_fields else b""
+            version = 45 if zip64_fields else 20
+            external_attributes = (entry.mode & 0xFFFF) << 16 | (0x10 if stat.S_ISDIR(entry.mode) else 0)
+            self._file.write(_CENTRAL_HEADER.pack(
+                b"PK\x01\x02", version, 3, version, 0, entry.flags, entry.method, *entry.dos_time, entry.crc,
+                min(entry.compressed_size, _ZIP64_LIMIT), min(entry.size, _ZIP64_LIMIT), len(name), len(extra), 0, 0, 0,
+                external_attributes, min(entry.offset, _ZIP64_LIMIT),
+            ))
+            self._file.write(name)
+            self._file.write(extra)
+        size = self._file.tell() - start
+
+        count = len(self.entries)
+        if count >= _ZIP64_COUNT_LIMIT or start >= _ZIP64_LIMIT or size >= _ZIP64_LIMIT:
+            zip64_start = self._file.tell()
+            self._file.write(_ZIP64_END_OF_CENTRAL_DIRECTORY.pack(b"PK\x06\x06", 44, 45, 45, 0, 0, count, count, size, start))
+            self._file.write(_ZIP64_LOCATOR.pack(b"PK\x06\x07", 0, zip64_start, 1))
+        self._file.write(_END_OF_CENTRAL_DIRECTORY.pack(
+            b"PK\x05\x06", 0, 0, min(count, _ZIP64_COUNT_LIMIT), min(count, _ZIP64_COUNT_LIMIT),
+            min(size, _ZIP64_LIMIT), min(start, _ZIP64_LIMIT), 0,
+        ))
+
+
+class _PositionedStream:
+    """ Keeps count of what's been written, for streams that can't tell() """
+
+    def __init__(self, stream: BinaryIO) -> None:
+        self._stream = stream
+        self._position = 0
+
+    def write(self, data) -> int:
+        self._stream.write(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+
+def _walk(root: Path, prefix: str):
+    """ (archive name, path, is directory) for everything under root, sorted. Directory symlinks come back as files (links). """
+    with os.scandir(root) as scanned:
+        entries = sorted(scanned, key=lambda entry: entry.name)
+    for entry in entries:
+        name = f"{prefix}/{entry.name}"
+        if entry.is_dir(follow_symlinks=False):
+            yield name + "/", Path(entry.path), True
+            yield from _walk(Path(entry.path), name)
+        else:
+            yield name, Path(entry.path), False
+
+
+def _dos_time(timestamp: float) -> tuple:
+    local = time.localtime(timestamp)
+    if local.tm_year < 1980:
+        return 0, (0 << 9) | (1 << 5) | 1  # 1980-01-01, the earliest a zip can say
+    return (
+        local.tm_hour << 11 | local.tm_min << 5 | local.tm_sec // 2,
+        (local.tm_year - 1980) << 9 | local.tm_mon << 5 | local.tm_mday,
+    )
@@ -0,0 +1,140 @@
+"""
+Runs fastlane pilot as an asyncio subprocess.
+
+Output is handed over a line at a time as it arrives (nothing buffers the whole log) and attempt_timeout is a hard deadline:
+pilot runs in its own process group so when time is up the whole group (pilot, ruby, iTMSTransporter, java...) is killed, not just the parent.
+"""
+import asyncio
+import json
+import os
+import shlex
+import signal
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+DEFAULT_PILOT_COMMAND = "fastlane pilot upload"
+KILL_GRACE_SECONDS = 5
+STREAM_LIMIT = 16 * 1024 * 1024     # Longest line we'll accept from pilot
+
+
+class PilotAttemptResult:
+    attempt: int
+    return_code: Optional[int]
+    timed_out: bool
+    duration: float     # seconds
+    bytes_uploaded: Optional[int]       # From pilot's progress lines (see upload_log), if it printed any
+    bytes_per_second: Optional[float]
+
+    def __init__(self, attempt: int, return_code: Optional[int], timed_out: bool, duration: float) -> None:
+        self.attempt = attempt
+        self.return_code = return_code
+        self.timed_out = timed_out
+        self.duration = duration
+        self.bytes_uploaded = None
+        self.bytes_per_second = None
+
+    @property
+    def succeeded(self) -> bool:
+        return self.return_code == 0 and not self.timed_out
+
+
+def write_api_key_file(directory: Path, issuer_id: str, key_id: str, key_content: str) -> Path:
+    """ Write the key in fastlane's api_key_path JSON format. Only readable by us. """
+    path = directory / "app_store_connect_api_key.json"
+    file_descriptor = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(file_descriptor, "w") as file:
+        json.dump({"key_id": key_id, "issuer_id": issuer_id, "key": key_content, "in_house": False}, file)
+    return path
+
+
+def build_pilot_arguments(pilot_command: str, api_key_path: Path, ipa_path: Path, changelog: str, groups: list[str]) -> list[str]:
+    arguments = shlex.split(pilot_command) + [
+        "--api_key_path", str(api_key_path),
+        "--ipa", str(ipa_path),
+        "--changelog", changelog,
+    ]
+    if groups:
+        arguments += ["--groups", ",".join(groups), "--distribute_external", "true"]
+    return arguments
+
+
+async def run_pilot_attempt(arguments: list[str], timeout: float, on_line: Callable[[str, str], None], attempt: int = 1) -> PilotAttemptResult:
+    """
+    Run one pilot attempt. on_line(stream_name, line) is called for every stdout/stderr line as it arrives.
+    The process group is killed if it is still running after timeout seconds (or if we are cancelled).
+    """
+    start = time.monotonic()
+    process = await asyncio.create_subprocess_exec(
+        *arguments,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        start_new_session=True,
+        limit=STREAM_LIMIT,
+    )
+
+    async def run_to_completion() -> int:
+        await asyncio.gather(
+            _pump_lines(process.stdout, "stdout", on_line),
+            _pump_lines(process.stderr, "stderr", on_line),
+        )
+        return await process.wait()
+
+    try:
+        return_code = await asyncio.wait_for(run_to_completion(), timeout)
+    except asyncio.TimeoutError:
+        await kill_process_group(process)
+        await _read_to_end(process, on_line)
+        return PilotAttemptResult(attempt, process.returncode, True, time.monotonic() - start)
+    except BaseException:
+        await kill_process_group(process)
+        await _read_to_end(process, lambda stream_name, line: None)   # on_line may be what failed
+        raise
+
+    return PilotAttemptResult(attempt, return_code, False, time.monotonic() - start)
+
+
+async def kill_process_group(process: asyncio.subprocess.Process) -> None:
+    """ SIGTERM the group, then SIGKILL it if it hasn't gone after KILL_GRACE_SECONDS. """
+    if not _signal_process_group(process, signal.SIGTERM):
+        await process.wait()
+        return
+
+    try:
+        await asyncio.wait_for(process.wait(), KILL_GRACE_SECONDS)
+    except asyncio.TimeoutError:
+        pass
+    # Children can outlive the parent, so the group gets killed either way
+    _signal_process_group(process, signal.SIGKILL)
+    await process.wait()
+
+
+def _signal_process_group(process: asyncio.subprocess.Process, signal_number: int) -> bool:
+    try:
+        os.killpg(process.pid, signal_number)
+    except (ProcessLookupError, PermissionError):
+        return False
+    return True
+
+
+async def _read_to_end(process: asyncio.subprocess.Process, on_line: Callable[[str, str], None]) -> None:
+    """
+    Hand over whatever the killed group printed last, up to EOF. asyncio only closes the pipes once they reach EOF, and on
+    Python 3.9 process.wait() can return before that, leaving them to be closed after the event loop is ("Event loop is closed").
+    """
+    try:
+        await asyncio.wait_for(asyncio.gather(
+            _pump_lines(process.stdout, "stdout", on_line),
+            _pump_lines(process.stderr, "stderr", on_line),
+        ), KILL_GRACE_SECONDS)
+    except asyncio.TimeoutError:
+        pass    # Something that left the process group still has them open
+
+
+async def _pump_lines(stream: asyncio.StreamReader, stream_name: str, on_line: Callable[[str, str], None]) -> None:
+    while True:
+        line = await stream.readline()
+        if not line:
+            return
+        on_line(stream_name, line.decode("utf-8", errors="replace").rstrip("\r\n"))
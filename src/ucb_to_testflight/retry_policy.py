@@ -0,0 +1,172 @@
+"""
+Decides if and when a failed upload attempt is retried.
+
+ - Exponential backoff with jitter between attempts, so we aren't hammering App Store Connect while it's rate limiting or having an outage.
+ - A total wall clock budget (MAX_TOTAL_UPLOAD_SECONDS) on top of max_upload_attempts. Attempts are cut short to fit inside it,
+   but never below min_attempt_timeout: when less than that is left there's no retry, rather than one that can only time out.
+ - Failures that will never succeed on retry (bad credentials, build number already used) stop straight away.
+"""
+import random
+import re
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from .tracing import span
+
+T = TypeVar("T")
+
+DEFAULT_MIN_ATTEMPT_TIMEOUT = 30    # seconds. Shorter attempts can't upload anything worth having
+
+# Output that means retrying is pointless. Matched case insensitively against the attempt's output/error.
+FATAL_FAILURE_PATTERNS: tuple = (
+    # Authentication
+    r"NOT_AUTHORIZED",
+    r"Authentication credentials are missing or invalid",
+    r"\b401\b.*unauthori[sz]ed",
+    r"invalid (?:api )?key",
+    r"Could not (?:find|load) (?:the )?(?:api )?key",
+    # Build number already used / redundant binary
+    r"ENTITY_ERROR\.ATTRIBUTE\.INVALID\.DUPLICATE",
+    r"Redundant Binary Upload",
+    r"ITMS-4238",
+    r"ITMS-90062",
+    r"bundle version must be higher than the previously uploaded version",
+    r"has already been (?:uploaded|used)",
+)
+_FATAL_FAILURE_REGEX = re.compile("|".join(f"(?:{pattern})" for pattern in FATAL_FAILURE_PATTERNS), re.IGNORECASE)
+
+
+class FatalUploadError(RuntimeError):
+    """ The upload failed in a way that retrying won't fix. """
+
+
+class UploadAttemptError(RuntimeError):
+    """ One attempt failed. output is what the attempt printed (used to classify the failure). """
+    output: str
+    timed_out: bool
+
+    def __init__(self, message: str, output: str = "", timed_out: bool = False) -> None:
+        super().__init__(message)
+        self.output = output
+        self.timed_out = timed_out
+
+
+def find_fatal_failure(output: str) -> Optional[str]:
+    """ The text that makes this failure fatal, or None if it's worth retrying. """
+    match = _FATAL_FAILURE_REGEX.search(output)
+    return match.group(0) if match else None
+
+
+class RetryPolicy:
+    max_attempts: int
+    attempt_timeout: float      # seconds
+    base_delay: float           # seconds before the first retry, doubling after that
+    max_delay: float            # seconds
+    jitter: float               # 0 to 1. Fraction of each delay that is randomised
+    total_budget: float         # seconds for all attempts and delays together. 0 for no limit
+    min_attempt_timeout: float  # seconds. The shortest attempt worth starting (capped at attempt_timeout)
+
+    def __init__(
+        self,
+        max_attempts: int = 10,
+        attempt_timeout: float = 600,
+        base_delay: float = 10,
+        max_delay: float = 300,
+        jitter: float = 0.5,
+        total_budget: float = 0,
+        min_attempt_timeout: float = DEFAULT_MIN_ATTEMPT_TIMEOUT,
+        random_source: Callable[[], float] = random.random,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_attempts = max_attempts
+        self.attempt_timeout = attempt_timeout
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = min(max(jitter, 0), 1)
+        self.total_budget = total_budget
+        self.min_attempt_timeout = min(min_attempt_timeout, attempt_timeout)
+        self._random = random_source
+        self._clock = clock
+        self._start = clock()
+
+    def delay_before(self, attempt: int) -> float:
+        """ Seconds to wait before attempt (2 is the first retry). """
+        if attempt <= 1:
+            return 0
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 2))
+        return delay * (1 - self.jitter * self._random())
+
+    def remaining_budget(self) -> float:
+        if self.total_budget <= 0:
+            return float("inf")
+        return self.total_budget - (self._clock() - self._start)
+
+    def timeout_for_attempt(self) -> float:
+        return max(self.min_attempt_timeout, min(self.attempt_timeout, self.remaining_budget()))
+
+    def next_delay(self, failed_attempt: int, error: BaseException) -> float:
+        """ Seconds to wait before retrying. Raises if we should give up instead. """
+        output = error.output if isinstance(error, UploadAttemptError) else ""
+        fatal_reason = find_fatal_failure(f"{error}\n{output}")
+        if fatal_reason:
+            raise FatalUploadError(f"Not retrying, attempt {failed_attempt} failed with a non retryable error: {fatal_reason}") from error
+
+        if failed_attempt >= self.max_attempts:
+            raise RuntimeError(f"Upload failed after {failed_attempt} attempts.") from error
+
+        delay = self.delay_before(failed_attempt + 1)
+        if delay + self.min_attempt_timeout > self.remaining_budget():
+            raise RuntimeError(f"Upload failed after {failed_attempt} attempts, out of time (MAX_TOTAL_UPLOAD_SECONDS={self.total_budget:g}).") from error
+        return delay
+
+
+def run_with_retries(attempt_function: Callable[[int, float], T], policy: RetryPolicy, sleep: Callable[[float], None] = time.sleep) -> T:
+    """ Call attempt_function(attempt_number, timeout_seconds) until it returns. """
+    attempt = 1
+    while True:
+        timeout = policy.timeout_for_attempt()
+        with span("upload.attempt", **{"attempt.number": attempt, "attempt.timeout_seconds": timeout}) as current:
+            try:
+                result = attempt_function(attempt, timeout)
+            except Exception as error:
+                delay = _next_delay(policy, attempt, error, current)
+            else:
+                current.set_attribute("attempt.outcome", "succeeded")
+                return result
+        _print_retry(attempt, delay)
+        sleep(delay)
+        attempt += 1
+
+
+async def run_with_retries_async(attempt_function: Callable[[int, float], Awaitable[T]], policy: RetryPolicy) -> T:
+    """ run_with_retries for coroutines. """
+    import asyncio
+
+    attempt = 1
+    while True:
+        timeout = policy.timeout_for_attempt()
+        with span("upload.attempt", **{"attempt.number": attempt, "attempt.timeout_seconds": timeout}) as current:
+            try:
+                result = await attempt_function(attempt, timeout)
+            except Exception as error:
+                delay = _next_delay(policy, attempt, error, current)
+            else:
+                current.set_attribute("attempt.outcome", "succeeded")
+                return result
+        _print_retry(attempt, delay)
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+def _next_delay(policy: RetryPolicy, attempt: int, error: Exception, current_span) -> float:
+    """ policy.next_delay, noting the failure on the attempt's span. """
+    timed_out = isinstance(error, UploadAttemptError) and error.timed_out
+    current_span.set_attribute("attempt.outcome", "timed_out" if timed_out else "failed")
+    current_span.set_error(f"{type(error).__name__}: {error}")
+    delay = policy.next_delay(attempt, error)
+    current_span.set_attribute("retry.delay_seconds", round(delay, 3))
+    return delay
+
+
+def _print_retry(failed_attempt: int, delay: float) -> None:
+    print(f"Attempt {failed_attempt} failed. Retrying in {delay:.1f}s")
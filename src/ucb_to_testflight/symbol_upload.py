@@ -0,0 +1,193 @@
+"""
+Uploads the .dSYM bundles that come with the build to SYMBOL_UPLOAD_URL, at the same time as the .ipa goes to TestFlight
+(see multi_platform_upload), instead of a separate zip-then-upload step afterwards.
+
+dSYMs are found with the same scan as the build (build_file_finder): every .dSYM in OUTPUT_DIRECTORY, and those in an .xcarchive's
+dSYMs directory. They're zipped by ParallelZipWriter straight into the request body: the zip is written (compressed over every core)
+on one thread while it's being sent on another, with a few blocks buffered in between, so zipping and uploading overlap and the zip
+never touches the disk. The body is sent with chunked transfer encoding since its size isn't known up front.
+
+The output is deterministic, so a retry zips again and sends the same bytes. Like the other uploads it takes a host upload slot
+(MAX_HOST_UPLOADS) and keeps to MAX_UPLOAD_MB_PER_SECOND; the endpoint has to accept chunked transfer encoding.
+"""
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+from .build_file_finder import DEFAULT_MAX_DEPTH, iter_build_candidates
+from .context_threads import context_thread
+from .http_connection_pool import HttpConnectionPool
+from .parallel_zip import ParallelZipWriter
+from .retry_policy import RetryPolicy, UploadAttemptError, run_with_retries
+from .tracing import span
+from .upload_throttling import TokenBucket, upload_bucket
+
+STREAM_BLOCK_SIZE = 1024 * 1024     # Bytes handed from the zip writer to the request at a time
+STREAM_BUFFERED_BLOCKS = 8  # The zip writer waits once this many blocks haven't been sent yet
+_END = object()     # Put after the last block
+
+
+class SymbolUploadResult:
+    dsym_paths: list
+    zipped_bytes: int
+    duration: float     # seconds, of the attempt that succeeded
+
+    def __init__(self, dsym_paths: list, zipped_bytes: int, duration: float) -> None:
+        self.dsym_paths = dsym_paths
+        self.zipped_bytes = zipped_bytes
+        self.duration = duration
+
+
+def find_dsyms(output_directory: Path, recursive: bool = False, max_depth: int = DEFAULT_MAX_DEPTH) -> list[Path]:
+    """ Every .dSYM next to the build, and in the dSYMs directory of any .xcarchive. Sorted by path. """
+    dsym_paths = []
+    for candidate in iter_build_candidates(output_directory, (".dsym", ".xcarchive"), recursive, max_depth):
+        if candidate.path.suffix.lower() == ".dsym":
+            dsym_paths.append(candidate.path)
+        elif (candidate.path / "dSYMs").is_dir():
+            dsym_paths += [path for path in (candidate.path / "dSYMs").iterdir() if path.suffix.lower() == ".dsym" and path.is_dir()]
+    return sorted(dsym_paths)
+
+
+class ZipStream:
+    """
+    What the zip writer writes into (on its own thread) and the request body is read from (iterating), a block at a time.
+    The writer is held back once STREAM_BUFFERED_BLOCKS are waiting, and stopped (OSError) if the reading side gives up.
+    """
+    bytes_written: int
+
+    def __init__(self, buffered_blocks: int = STREAM_BUFFERED_BLOCKS, block_size: int = STREAM_BLOCK_SIZE) -> None:
+        self.bytes_written = 0
+        self._block_size = block_size
+        self._buffer = bytearray()
+        self._blocks = queue.Queue(buffered_blocks)
+        self._cancelled = threading.Event()
+
+    def write(self, data) -> int:
+        self._buffer += data
+        self.bytes_written += len(data)
+        if len(self._buffer) >= self._block_size:
+            self._put(bytes(self._buffer))
+            self._buffer.clear()
+        return len(data)
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        """ Called by the writer when it's done: the reader gets what's left, then stops (raising error if given). """
+        try:
+            if error is None and self._buffer:
+                self._put(bytes(self._buffer))
+                self._buffer.clear()
+            self._put(error or _END)
+        except OSError:
+            pass    # Nobody is reading any more
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    def __iter__(self):
+        try:
+            while True:
+                block = self._blocks.get()
+                if block is _END:
+                    return
+                if isinstance(block, BaseException):
+                    raise block
+                yield block
+        finally:
+            self._cancelled.set()
+
+    def _put(self, block) -> None:
+        while not self._cancelled.is_set():
+            try:
+                self._blocks.put(block, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+        raise OSError("The symbol upload stopped reading")
+
+
+def _zip_dsyms_into(stream: ZipStream, dsym_paths: list, max_workers: Optional[int]) -> None:
+    """ Runs on its own thread. """
+    try:
+        with ParallelZipWriter(None, max_workers, stream=stream) as writer:
+            for dsym_path in dsym_paths:
+                writer.add_tree(dsym_path, dsym_path.name)
+    except BaseException as error:
+        stream.finish(error)
+    else:
+        stream.finish()
+
+
+def upload_symbols_attempt(
+    upload_url: str,
+    dsym_paths: list,
+    headers: Optional[dict] = None,
+    timeout: Optional[float] = None,
+    max_workers: Optional[int] = None,
+    bucket: Optional[TokenBucket] = None,
+    clock: Callable[[], float] = time.monotonic,
+) -> SymbolUploadResult:
+    """ Zip dsym_paths into one POST to upload_url. Raises UploadAttemptError so run_with_retries can retry it. """
+    start = clock()
+    deadline = start + timeout if timeout else float("inf")
+    stream = ZipStream()
+    zipper = context_thread(_zip_dsyms_into, (stream, dsym_paths, max_workers), name="symbol-zip", daemon=True)
+
+    def body():
+        for block in stream:
+            if clock() >= deadline:
+                raise UploadAttemptError(f"Symbol upload timed out after {stream.bytes_written} bytes.", timed_out=True)
+            if bucket is not None:
+                bucket.consume(len(block))
+            yield block
+
+    zipper.start()
+    # A pool of its own: the body can only be sent once, so a stale pooled connection mustn't get it resent
+    pool = HttpConnectionPool(timeout=min(timeout, 60) if timeout else 60)
+    try:
+        response = pool.request("POST", upload_url, body=body(), headers={"Content-Type": "application/zip", **(headers or {})})
+    except OSError as error:
+        raise UploadAttemptError(f"Symbol upload failed: {error}", output=str(error)) from error
+    finally:
+        stream.cancel()
+        zipper.join()
+        pool.close()
+
+    if not response.ok:
+        output = response.body[:4096].decode("utf-8", "replace")
+        raise UploadAttemptError(f"Symbol upload failed with HTTP {response.status}", output=output)
+    return SymbolUploadResult(dsym_paths, stream.bytes_written, clock() - start)
+
+
+def upload_symbols(
+    output_directory: Path,
+    upload_url: str,
+    token: str = "",
+    retry_policy: Optional[RetryPolicy] = None,
+    search_recursively: bool = False,
+    max_search_depth: int = DEFAULT_MAX_DEPTH,
+    max_workers: Optional[int] = None,
+    max_mb_per_second: float = 0,
+) -> Optional[SymbolUploadResult]:
+    """ Find the build's dSYMs and upload them, retrying as retry_policy says. None if there weren't any. """
+    retry_policy = retry_policy or RetryPolicy()
+    with span("symbols.find"):
+        dsym_paths = find_dsyms(output_directory, search_recursively, max_search_depth)
+    if not dsym_paths:
+        print(f"No .dSYM found in {output_directory}, no symbols to upload")
+        return None
+    print(f"Uploading symbols: {', '.join(path.name for path in dsym_paths)}")
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    bucket = upload_bucket(max_mb_per_second)
+
+    with span("symbols.upload", **{"symbols.dsym_count": len(dsym_paths)}) as current:
+        def attempt_upload(attempt: int, timeout: float) -> SymbolUploadResult:
+            print(f"Symbol upload attempt {attempt}/{retry_policy.max_attempts}")
+            return upload_symbols_attempt(upload_url, dsym_paths, headers, timeout, max_workers, bucket)
+
+        result = run_with_retries(attempt_upload, retry_policy)
+        current.set_attribute("symbols.zipped_bytes", result.zipped_bytes)
+    print(f"Uploaded {len(dsym_paths)} dSYMs ({result.zipped_bytes / 1000 ** 2:.1f} MB zipped) in {result.duration:.1f}s")
+    return result
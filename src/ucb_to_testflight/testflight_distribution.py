@@ -0,0 +1,93 @@
+"""
+Adds a processed build (see build_processing) to TestFlight groups through the App Store Connect API (GROUP_ASSIGNMENT=api, and always for the direct backend).
+
+pilot/pyliot add the build to one group after another, signing a new token for each request.
+Here the groups are looked up in one request and the build is added to all of them at once (MAX_PARALLEL_REQUESTS at a time),
+over one pool of keep-alive connections with one cached token.
+
+The direct backend has no pilot to set the changelog either, so set_build_changelog sets the build's "What to Test" once it is processed.
+"""
+import time
+
+from .app_store_connect import AppStoreConnectClient
+from .context_threads import ContextThreadPoolExecutor
+from .tracing import span
+
+GROUP_ASSIGNMENTS = ("backend", "api")
+DEFAULT_MAX_PARALLEL_REQUESTS = 8
+DEFAULT_CHANGELOG_LOCALE = "en-US"  # pilot's default language
+
+
+class GroupAssignmentError(RuntimeError):
+    """ The build couldn't be added to some of the groups. failures is {group name: reason}. """
+    failures: dict
+
+    def __init__(self, failures: dict) -> None:
+        super().__init__("Couldn't add the build to: " + "; ".join(f"{name} ({reason})" for name, reason in failures.items()))
+        self.failures = failures
+
+
+def check_group_assignment(group_assignment: str) -> None:
+    if group_assignment not in GROUP_ASSIGNMENTS:
+        raise ValueError(f"Unknown group assignment \"{group_assignment}\". Expected one of: {', '.join(GROUP_ASSIGNMENTS)}")
+
+
+def find_beta_groups(client: AppStoreConnectClient, app_id: str, group_names: list[str]) -> dict:
+    """ {name: id} of the app's beta groups with these names (one request). Raises GroupAssignmentError for names that don't exist. """
+    groups = client.request("GET", "/v1/betaGroups", query={
+        "filter[app]": app_id,
+        "filter[name]": ",".join(group_names),
+        "fields[betaGroups]": "name",
+        "limit": 200,
+    })["data"]
+    ids = {group["attributes"]["name"]: group["id"] for group in groups}
+    missing = [name for name in group_names if name not in ids]
+    if missing:
+        raise GroupAssignmentError({name: "no beta group with that name" for name in missing})
+    return ids
+
+
+def assign_build_to_groups(client: AppStoreConnectClient, build_id: str, group_ids: dict, max_parallel_requests: int = DEFAULT_MAX_PARALLEL_REQUESTS) -> None:
+    """ Add the build to every group ({name: id}) concurrently. Raises GroupAssignmentError naming every group that failed. """
+    def assign(group_id: str) -> None:
+        client.request("POST", f"/v1/betaGroups/{group_id}/relationships/builds", {"data": [{"type": "builds", "id": build_id}]})
+
+    failures = {}
+    with span("testflight.assign_groups", **{"groups.count": len(group_ids), "requests.max_parallel": max_parallel_requests}), \
+            ContextThreadPoolExecutor(max(1, min(max_parallel_requests, len(group_ids))), thread_name_prefix="assign-group") as executor:
+        futures = {name: executor.submit(assign, group_id) for name, group_id in group_ids.items()}
+        for name, future in futures.items():
+            error = future.exception()
+            if error is not None:
+                failures[name] = str(error)
+    if failures:
+        raise GroupAssignmentError(failures)
+
+
+def distribute_build(client: AppStoreConnectClient, app_id: str, build_id: str, group_names: list[str], max_parallel_requests: int = DEFAULT_MAX_PARALLEL_REQUESTS) -> None:
+    """ Add the (processed) build to every group in group_names. """
+    if not group_names:
+        return
+    start = time.monotonic()
+    assign_build_to_groups(client, build_id, find_beta_groups(client, app_id, group_names), max_parallel_requests)
+    print(f"Added the build to {', '.join(group_names)} in {time.monotonic() - start:.1f}s")
+
+
+def set_build_changelog(client: AppStoreConnectClient, build_id: str, changelog: str, locale: str = DEFAULT_CHANGELOG_LOCALE) -> None:
+    """ Set the (processed) build's "What to Test" for locale, updating its localization if it has one. """
+    with span("testflight.changelog", **{"changelog.length": len(changelog)}):
+        localizations = client.request("GET", f"/v1/builds/{build_id}/betaBuildLocalizations", query={"fields[betaBuildLocalizations]": "locale"})["data"]
+        existing = [localization["id"] for localization in localizations if localization["attributes"]["locale"] == locale]
+        if existing:
+            client.request("PATCH", f"/v1/betaBuildLocalizations/{existing[0]}", {"data": {
+                "type": "betaBuildLocalizations",
+                "id": existing[0],
+                "attributes": {"whatsNew": changelog},
+            }})
+        else:
+            client.request("POST", "/v1/betaBuildLocalizations", {"data": {
+                "type": "betaBuildLocalizations",
+                "attributes": {"locale": locale, "whatsNew": changelog},
+                "relationships": {"build": {"data": {"type": "builds", "id": build_id}}},
+            }})
+    print(f"Set the build's changelog ({locale})")
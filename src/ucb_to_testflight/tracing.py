@@ -0,0 +1,218 @@
+"""
+Named timing spans around the phases of a run (parameter loading, the build file search, the changelog, each upload attempt, ...).
+
+Finished spans are written as JSON lines to TRACE_PATH using OpenTelemetry's span field names
+(trace_id, span_id, parent_span_id, start/end_time_unix_nano, attributes, status), so they can be loaded into
+anything that reads OTLP JSON spans. --timings prints a breakdown of the run at the end.
+
+Tracing is off unless a command entry turns it on. While it's off span() hands back one shared do-nothing span,
+so instrumented code costs a function call and an attribute check.
+
+Command entries call begin() before loading parameters (spans are kept in memory until we know where they go),
+then configure() once TRACE_PATH/TIMINGS are known.
+"""
+import contextvars
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+SERVICE_NAME = "ucb-to-testflight"
+
+_current_span = contextvars.ContextVar("ucb_to_testflight_current_span", default=None)
+
+
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_span_id: str
+    attributes: dict
+    start_time: int     # unix nanoseconds
+    end_time: int       # unix nanoseconds, 0 until ended
+    error: Optional[str]
+
+    def __init__(self, name: str, trace_id: str, parent: Optional["Span"], attributes: dict) -> None:
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_span_id = parent.span_id if parent else ""
+        self.attributes = attributes
+        self.start_time = time.time_ns()
+        self.end_time = 0
+        self.error = None
+        self._token = None
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def set_error(self, message: str) -> None:
+        self.error = message
+
+    @property
+    def duration(self) -> float:
+        """ seconds """
+        return ((self.end_time or time.time_ns()) - self.start_time) / 1e9
+
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exception_type, exception, traceback) -> None:
+        if exception is not None and self.error is None:
+            self.set_error(f"{exception_type.__name__}: {exception}")
+        self.end_time = time.time_ns()
+        _current_span.reset(self._token)
+        _tracer.finish(self)
+
+    def to_json(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_span_id,
+            "kind": "SPAN_KIND_INTERNAL",
+            "start_time_unix_nano": self.start_time,
+            "end_time_unix_nano": self.end_time,
+            "attributes": self.attributes,
+            "status": {"code": "STATUS_CODE_ERROR", "message": self.error} if self.error else {"code": "STATUS_CODE_OK"},
+            "resource": {"service.name": SERVICE_NAME},
+        }
+
+
+class _NoOpSpan:
+    """ What span() returns while tracing is off. """
+
+    def set_attribute(self, key: str, value) -> None:
+        pass
+
+    def set_error(self, message: str) -> None:
+        pass
+
+    def __enter__(self) -> "_NoOpSpan":
+        return self
+
+    def __exit__(self, exception_type, exception, traceback) -> None:
+        pass
+
+
+_NO_OP_SPAN = _NoOpSpan()
+
+
+class _Tracer:
+    enabled: bool
+    trace_id: str
+    trace_path: Optional[Path]
+    keep_spans: bool        # For --timings (and while begin() is waiting for configure())
+    spans: list             # Finished spans, if kept
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.enabled = False
+        self.trace_id = os.urandom(16).hex()
+        self.trace_path = None
+        self.keep_spans = False
+        self.spans = []
+        self.started_at = time.time_ns()
+
+    def finish(self, span: Span) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            if self.keep_spans:
+                self.spans.append(span)
+            if self.trace_path is not None:
+                self._write([span])
+
+    def _write(self, spans: list) -> None:
+        import json
+
+        self.trace_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.trace_path, "a", encoding="utf-8") as file:
+            for span in spans:
+                file.write(json.dumps(span.to_json(), default=str) + "\n")
+
+
+_tracer = _Tracer()
+
+
+def span(name: str, **attributes):
+    """ with span("phase", key=value) as current: ... current.set_attribute(...) """
+    if not _tracer.enabled:
+        return _NO_OP_SPAN
+    return Span(name, _tracer.trace_id, _current_span.get(), attributes)
+
+
+def current_span():
+    """ The innermost open span (for adding attributes to it). A do-nothing span if there isn't one. """
+    return _current_span.get() or _NO_OP_SPAN
+
+
+def begin() -> None:
+    """ Start recording (in memory) before we know if/where spans should go. configure() decides. """
+    _tracer.reset()
+    _tracer.enabled = True
+    _tracer.keep_spans = True
+
+
+def configure(trace_path: Optional[Path] = None, timings: bool = False) -> None:
+    """ Where spans go from now on. Spans recorded since begin() are written out now (or dropped if neither is wanted). """
+    with _tracer._lock:
+        if not trace_path and not timings:
+            _tracer.reset()
+            return
+        if not _tracer.enabled:
+            _tracer.reset()
+            _tracer.enabled = True
+        _tracer.trace_path = Path(trace_path) if trace_path else None
+        _tracer.keep_spans = timings
+        if _tracer.trace_path is not None and _tracer.spans:
+            _tracer._write(_tracer.spans)
+        if not timings:
+            _tracer.spans = []
+
+
+def is_enabled() -> bool:
+    return _tracer.enabled
+
+
+def finished_spans() -> list:
+    with _tracer._lock:
+        return list(_tracer.spans)
+
+
+def print_timings() -> None:
+    """ The phase breakdown for --timings: every span (children indented under their parent) with its share of the run. """
+    spans = sorted(finished_spans(), key=lambda span: span.start_time)
+    if not spans:
+        return
+    total = max((time.time_ns() - _tracer.started_at) / 1e9, 1e-9)
+    children = {}
+    for span in spans:
+        children.setdefault(span.parent_span_id, []).append(span)
+    span_ids = {span.span_id for span in spans}
+
+    rows = []
+
+    def add_rows(span: Span, depth: int) -> None:
+        details = " ".join(f"{key}={value}" for key, value in span.attributes.items())
+        if span.error:
+            details = f"{details} error={span.error}".strip()
+        rows.append((f"{'  ' * depth}{span.name}", span.duration, details))
+        for child in children.get(span.span_id, []):
+            add_rows(child, depth + 1)
+
+    for span in spans:
+        if span.parent_span_id not in span_ids:
+            add_rows(span, 0)
+
+    name_width = max(len(row[0]) for row in rows)
+    print("\nTimings ".ljust(32, "="))
+    for name, duration, details in rows:
+        print(f"  {name:<{name_width}}  {duration * 1000:10.1f} ms  {duration / total * 100:5.1f}%  {details}".rstrip())
+    print(f"  {'total':<{name_width}}  {total * 1000:10.1f} ms")
+    print("=" * 32)
@@ -0,0 +1,305 @@
+"""
+A long lived upload process (`ucb-to-testflight serve`) so builds don't pay for a cold start every time.
+
+The daemon imports the upload stack once and listens on a Unix domain socket (DAEMON_SOCKET).
+The command entry point becomes a thin client when the socket is reachable: it sends its parameters,
+the daemon queues the job (first come first served, MAX_CONCURRENT_UPLOADS at a time) and streams
+the job's output back line by line. If nothing is listening the entry point just uploads in-process.
+
+Output is routed by job with a context variable, so it follows the job into the threads it starts (context_threads) and its
+asyncio tasks, and pilot's output is piped back through it too. pyliot runs fastlane with the daemon's own stdout, which can't
+be told apart between jobs, so pyliot jobs with SHOW_FASTLANE_LOGS are turned down and run in-process instead.
+
+A daemon outlives `git pull`s and dependency changes, so each job carries a fingerprint of the client's code (the package's
+source and the venv's bootstrap stamp, see code_fingerprint). A daemon started from different code turns the job down and the
+client uploads in-process instead, until the daemon is restarted.
+
+Protocol: one JSON object per line.
+  client -> daemon  {"type": "upload", "code": "<code fingerprint>", "values": {parameter_name: value, ...}}
+  daemon -> client  {"type": "rejected", "reason": "..."}   (instead of everything below; upload in-process)
+                    {"type": "queued", "position": 2}
+                    {"type": "started"}
+                    {"type": "output", "text": "..."}
+                    {"type": "finished", "succeeded": true, "error": null, "duration": 12.3}
+"""
+import collections
+import contextvars
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+import traceback
+from pathlib import Path
+from typing import Callable, Optional
+
+from .upload_parameters import UploadParameters
+
+CONNECT_TIMEOUT_SECONDS = 0.5
+
+_job_output = contextvars.ContextVar("upload_daemon_job_output", default=None)
+
+
+class DaemonParameters(UploadParameters):
+    """ The parameters `serve` needs. None are required (credentials etc. come with each job). """
+    max_concurrent_uploads: int = 2
+
+    _parameter_names: tuple = ()
+    _entry_parameter_names: tuple = (
+        "daemon_socket",
+        "max_concurrent_uploads",
+    )
+
+
+class FifoSlots:
+    """ A semaphore that hands out slots in the order they were asked for. """
+
+    def __init__(self, count: int) -> None:
+        self._free = max(1, count)
+        self._waiting = collections.deque()
+        self._condition = threading.Condition()
+
+    def waiting_ahead_of_new_ticket(self) -> int:
+        with self._condition:
+            return len(self._waiting)
+
+    def acquire(self) -> None:
+        ticket = object()
+        with self._condition:
+            self._waiting.append(ticket)
+            self._condition.wait_for(lambda: self._waiting[0] is ticket and self._free > 0)
+            self._waiting.popleft()
+            self._free -= 1
+            self._condition.notify_all()
+
+    def release(self) -> None:
+        with self._condition:
+            self._free += 1
+            self._condition.notify_all()
+
+
+class _JobOutput:
+    """
+    Stands in for sys.stdout/sys.stderr while serving. Writes made in a job's context go to that job's client,
+    everything else goes to the daemon's own output.
+    """
+
+    def __init__(self, fallback) -> None:
+        self._fallback = fallback
+
+    def write(self, text: str) -> int:
+        sink = _job_output.get()
+        if sink is None:
+            return self._fallback.write(text)
+        sink(text)
+        return len(text)
+
+    def flush(self) -> None:
+        self._fallback.flush()
+
+    def __getattr__(self, name: str):
+        return getattr(self._fallback, name)
+
+
+class UploadDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: Path, max_concurrent_uploads: int, upload: Optional[Callable] = None) -> None:
+        if upload is None:
+            from .upload_to_testflight import upload_to_testflight as upload
+        self.socket_path = socket_path
+        self.upload = upload
+        self.code_fingerprint = code_fingerprint()
+        self.slots = FifoSlots(max_concurrent_uploads)
+        self.stdout = _JobOutput(sys.stdout)
+        self.stderr = _JobOutput(sys.stderr)
+
+        _remove_stale_socket(socket_path)
+        socket_path.parent.mkdir(parents=True, exist_ok=True)
+        old_umask = os.umask(0o177)     # Jobs carry credentials, only we get to connect
+        try:
+            super().__init__(str(socket_path), _UploadJobHandler)
+        finally:
+            os.umask(old_umask)
+
+    def serve(self) -> None:
+        sys.stdout, sys.stderr = self.stdout, self.stderr
+        print(f"Upload daemon listening on {self.socket_path} ({self.slots._free} uploads at a time)")
+        try:
+            self.serve_forever()
+        finally:
+            sys.stdout, sys.stderr = self.stdout._fallback, self.stderr._fallback
+            self.server_close()
+
+    def server_close(self) -> None:
+        super().server_close()
+        try:
+            self.socket_path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class _UploadJobHandler(socketserver.StreamRequestHandler):
+    server: UploadDaemon
+
+    def setup(self) -> None:
+        super().setup()
+        self._send_lock = threading.Lock()     # The job's threads all send output
+
+    def handle(self) -> None:
+        line = self.rfile.readline()
+        if not line:
+            return  # Someone checking the daemon is up (see _remove_stale_socket)
+        request = json.loads(line)
+        if request.get("type") != "upload":
+            self._send({"type": "finished", "succeeded": False, "error": f"Unknown request {request.get('type')}", "duration": 0})
+            return
+
+        if request.get("code") != self.server.code_fingerprint:
+            self._send({"type": "rejected", "reason": "it was started from different code (restart it with `ucb-to-testflight serve`)"})
+            return
+
+        if request["values"].get("upload_backend", "pyliot") == "pyliot" and request["values"].get("show_fastlane_logs"):
+            self._send({"type": "rejected", "reason": "pyliot's fastlane logs (SHOW_FASTLANE_LOGS) can't be sent back from it"})
+            return
+
+        values = _decode_values(request["values"])
+        self._send({"type": "queued", "position": self.server.slots.waiting_ahead_of_new_ticket()})
+        self.server.slots.acquire()
+        try:
+            self._send({"type": "started"})
+            self._run(values)
+        finally:
+            self.server.slots.release()
+
+    def _run(self, values: list) -> None:
+        start = time.monotonic()
+        token = _job_output.set(lambda text: self._send({"type": "output", "text": text}))
+        error = None
+        try:
+            self.server.upload(*values)
+        except Exception as exception:
+            traceback.print_exc(file=sys.stdout)
+            error = f"{type(exception).__name__}: {exception}"
+        finally:
+            _job_output.reset(token)
+        self._send({"type": "finished", "succeeded": error is None, "error": error, "duration": time.monotonic() - start})
+
+    def _send(self, message: dict) -> None:
+        try:
+            with self._send_lock:
+                self.wfile.write((json.dumps(message) + "\n").encode("utf-8"))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass    # Client went away. The upload carries on regardless.
+
+
+def upload_via_daemon(socket_path: Path, parameters: UploadParameters) -> Optional[bool]:
+    """
+    Hand the upload to a running daemon and stream its output here.
+    Returns None if no daemon is reachable (so the caller should upload in-process), otherwise whether the upload succeeded.
+    """
+    connection = _connect(socket_path)
+    if connection is None:
+        return None
+
+    request = {"type": "upload", "code": code_fingerprint(), "values": _encode_values(parameters)}
+    with connection, connection.makefile("rwb") as stream:
+        stream.write((json.dumps(request) + "\n").encode("utf-8"))
+        stream.flush()
+
+        for line in stream:
+            message = json.loads(line)
+            if message["type"] == "rejected":
+                print(f"Not using the upload daemon at {socket_path}: {message['reason']}. Uploading in-process.")
+                return None
+            if message["type"] == "queued":
+                print(f"Handing upload to daemon at {socket_path}")
+                if message["position"] > 0:
+                    print(f"Queued behind {message['position']} other upload(s)")
+            elif message["type"] == "output":
+                sys.stdout.write(message["text"])
+            elif message["type"] == "finished":
+                if message["error"]:
+                    print(f"Daemon upload failed: {message['error']}")
+                return bool(message["succeeded"])
+
+    raise ConnectionError("Upload daemon closed the connection before the upload finished.")
+
+
+def code_fingerprint() -> str:
+    """ Hash of the package's source files and the venv's bootstrap stamp (what its dependencies were installed from). """
+    import hashlib
+    from .bootstrap import STAMP_FILE_NAME
+
+    digest = hashlib.sha256()
+    package_directory = Path(__file__).resolve().parent
+    for path in sorted(package_directory.rglob("*.py")):
+        digest.update(f"{path.relative_to(package_directory)}\0".encode("utf-8"))
+        digest.update(path.read_bytes())
+    stamp_path = Path(sys.prefix) / STAMP_FILE_NAME
+    if stamp_path.exists():
+        digest.update(b"\0bootstrap:" + stamp_path.read_bytes())
+    return digest.hexdigest()
+
+
+def serve(socket_path: Path, max_concurrent_uploads: int) -> None:
+    _warm_up()
+    UploadDaemon(socket_path, max_concurrent_uploads).serve()
+
+
+def _warm_up() -> None:
+    """ Pay for the heavy imports once, up front. """
+    from . import upload_to_testflight  # noqa: F401
+    from . import upload_to_testflight_async  # noqa: F401
+    try:
+        import pyliot.upload_to_testflight  # noqa: F401
+    except ImportError:
+        pass
+
+
+def _connect(socket_path: Path) -> Optional[socket.socket]:
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    connection.settimeout(CONNECT_TIMEOUT_SECONDS)
+    try:
+        connection.connect(str(socket_path))
+    except OSError:
+        connection.close()
+        return None
+    connection.settimeout(None)     # Uploads take as long as they take
+    return connection
+
+
+def _remove_stale_socket(socket_path: Path) -> None:
+    if not socket_path.exists():
+        return
+    connection = _connect(socket_path)
+    if connection is not None:
+        connection.close()
+        raise RuntimeError(f"An upload daemon is already listening on {socket_path}")
+    socket_path.unlink()
+
+
+def _encode_values(parameters: UploadParameters) -> dict:
+    """ upload_to_testflight arguments by name, with paths made absolute (the daemon has its own working directory). """
+    values = {}
+    for name, value in zip(parameters._parameter_names, parameters.get_values()):
+        values[name] = str(Path(value).resolve()) if isinstance(value, Path) else value
+    return values
+
+
+def _decode_values(values: dict) -> list:
+    from typing import get_type_hints
+
+    type_hints = get_type_hints(UploadParameters)
+    decoded = []
+    for name in UploadParameters._parameter_names:
+        value = values.get(name, getattr(UploadParameters, name, None))
+        if type_hints[name] is Path and value is not None:
+            value = Path(value)
+        decoded.append(value)
+    return decoded
@@ -0,0 +1,246 @@
+"""
+Keeps every upload attempt (size, duration, throughput, outcome, agent) in sqlite next to the upload ledger, and uses it to size
+attempt timeouts.
+
+A fixed ATTEMPT_TIMEOUT is too long for a small build that hung and too short for a big one on a slow agent. With
+ADAPTIVE_ATTEMPT_TIMEOUT each attempt gets TIMEOUT_MARGIN times what the .ipa would take at the throughput 95% of this agent's
+recent successful uploads managed, kept between MIN_ATTEMPT_TIMEOUT and MAX_ATTEMPT_TIMEOUT. Throughput is the whole attempt
+(size / duration), so it includes pilot's startup and App Store Connect's checks, not just the transfer.
+Until there are MIN_SAMPLES uploads to go on (from this agent, or failing that any agent) ATTEMPT_TIMEOUT is used as it is.
+
+`ucb-to-testflight history` prints p50/p95 upload durations and failure rates per agent.
+"""
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from .upload_parameters import UploadParameters
+
+T = TypeVar("T")
+
+HISTORY_FILE_NAME = "upload_history.sqlite3"
+MIN_SAMPLES = 5
+RECENT_SAMPLES = 50     # Successful uploads the throughput is taken from
+TIMEOUT_MARGIN = 2.0
+
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+TIMED_OUT = "timed_out"
+
+
+def default_agent_name() -> str:
+    import socket
+    return socket.gethostname()
+
+
+def percentile(values: list, fraction: float) -> Optional[float]:
+    """ Linear interpolation between the closest ranks. None for no values. """
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * min(max(fraction, 0), 1)
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+class AgentSummary:
+    agent: str
+    attempts: int
+    failures: int       # Including timeouts
+    timeouts: int
+    p50_duration: Optional[float]   # seconds, successful attempts
+    p95_duration: Optional[float]
+    p50_bytes_per_second: Optional[float]
+
+    def __init__(self, agent: str, attempts: int, failures: int, timeouts: int, durations: list, throughputs: list) -> None:
+        self.agent = agent
+        self.attempts = attempts
+        self.failures = failures
+        self.timeouts = timeouts
+        self.p50_duration = percentile(durations, 0.5)
+        self.p95_duration = percentile(durations, 0.95)
+        self.p50_bytes_per_second = percentile(throughputs, 0.5)
+
+    @property
+    def failure_rate(self) -> float:
+        return self.failures / self.attempts if self.attempts else 0
+
+
+class UploadHistory:
+    path: Path
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS attempts ("
+                "started_at REAL, agent TEXT, backend TEXT, file_name TEXT, size INTEGER, attempt INTEGER, "
+                "timeout REAL, duration REAL, outcome TEXT, bytes_per_second REAL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS attempts_by_agent ON attempts (agent, outcome, started_at)")
+
+    def record_attempt(
+        self, agent: str, backend: str, file_name: str, size: int, attempt: int, timeout: float, duration: float, outcome: str,
+    ) -> None:
+        bytes_per_second = size / duration if outcome == SUCCEEDED and duration > 0 else None
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT INTO attempts (started_at, agent, backend, file_name, size, attempt, timeout, duration, outcome, bytes_per_second) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (time.time() - duration, agent, backend, file_name, size, attempt, timeout, duration, outcome, bytes_per_second),
+            )
+
+    def recent_throughputs(self, agent: Optional[str] = None, limit: int = RECENT_SAMPLES) -> list[float]:
+        """ bytes/s of the latest successful attempts (of agent, if given), newest first. """
+        query = "SELECT bytes_per_second FROM attempts WHERE outcome = ? AND bytes_per_second IS NOT NULL"
+        parameters = [SUCCEEDED]
+        if agent:
+            query += " AND agent = ?"
+            parameters.append(agent)
+        with self._connect() as connection:
+            rows = connection.execute(query + " ORDER BY started_at DESC LIMIT ?", (*parameters, limit)).fetchall()
+        return [row["bytes_per_second"] for row in rows]
+
+    def summarize(self, since: float = 0) -> list[AgentSummary]:
+        """ One summary per agent, for attempts started after since (a unix time). """
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT agent, outcome, duration, bytes_per_second FROM attempts WHERE started_at >= ? ORDER BY agent", (since,)
+            ).fetchall()
+
+        by_agent = {}
+        for row in rows:
+            by_agent.setdefault(row["agent"], []).append(row)
+        summaries = []
+        for agent, agent_rows in by_agent.items():
+            succeeded = [row for row in agent_rows if row["outcome"] == SUCCEEDED]
+            summaries.append(AgentSummary(
+                agent,
+                len(agent_rows),
+                len(agent_rows) - len(succeeded),
+                sum(1 for row in agent_rows if row["outcome"] == TIMED_OUT),
+                [row["duration"] for row in succeeded],
+                [row["bytes_per_second"] for row in succeeded if row["bytes_per_second"] is not None],
+            ))
+        return summaries
+
+    def _connect(self):
+        import sqlite3
+        from .upload_ledger import _ClosingConnection
+
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        return _ClosingConnection(connection)
+
+
+def adaptive_attempt_timeout(
+    size: int, throughputs: list[float], floor: float, ceiling: float, margin: float = TIMEOUT_MARGIN,
+) -> Optional[float]:
+    """ margin times how long size bytes take at the throughput 95% of throughputs beat, within floor and ceiling. None without enough samples. """
+    if len(throughputs) < MIN_SAMPLES:
+        return None
+    slow_throughput = percentile(throughputs, 0.05)
+    if not slow_throughput:
+        return None
+    return min(max(margin * size / slow_throughput, floor), max(floor, ceiling))
+
+
+def plan_attempt_timeout(history: UploadHistory, size: int, agent: str, attempt_timeout: float, floor: float, ceiling: float) -> float:
+    """ The timeout for each attempt at uploading size bytes from agent: adaptive if the history allows it, attempt_timeout if not. """
+    for source, throughputs in (("this agent", history.recent_throughputs(agent)), ("all agents", history.recent_throughputs())):
+        timeout = adaptive_attempt_timeout(size, throughputs, floor, ceiling)
+        if timeout is not None:
+            print(
+                f"Attempt timeout {timeout:.0f}s: {size / 1000 ** 2:.0f} MB at {percentile(throughputs, 0.05) / 1000 ** 2:.2f} MB/s"
+                f" (the slowest 5% of the last {len(throughputs)} uploads from {source})"
+            )
+            return timeout
+    print(f"Attempt timeout {attempt_timeout:.0f}s (ATTEMPT_TIMEOUT, fewer than {MIN_SAMPLES} uploads in the history to go on)")
+    return attempt_timeout
+
+
+class AttemptRecorder:
+    """ Wraps attempt functions (see run_with_retries) so every attempt of one upload lands in the history. """
+    history: UploadHistory
+    agent: str
+    backend: str
+    file_name: str
+    size: int
+
+    def __init__(self, history: UploadHistory, agent: str, backend: str, file_path: Path, clock: Callable[[], float] = time.monotonic) -> None:
+        self.history = history
+        self.agent = agent
+        self.backend = backend
+        self.file_name = file_path.name
+        self.size = file_path.stat().st_size
+        self._clock = clock
+
+    def record(self, attempt: int, timeout: float, duration: float, outcome: str) -> None:
+        self.history.record_attempt(self.agent, self.backend, self.file_name, self.size, attempt, timeout, duration, outcome)
+
+    def wrap(self, attempt_function: Callable[[int, float], T]) -> Callable[[int, float], T]:
+        def recorded_attempt(attempt: int, timeout: float) -> T:
+            start = self._clock()
+            try:
+                result = attempt_function(attempt, timeout)
+            except Exception as error:
+                self.record(attempt, timeout, self._clock() - start, _outcome_of(error))
+                raise
+            self.record(attempt, timeout, self._clock() - start, SUCCEEDED)
+            return result
+        return recorded_attempt
+
+    def wrap_async(self, attempt_function: Callable[[int, float], Awaitable[T]]) -> Callable[[int, float], Awaitable[T]]:
+        async def recorded_attempt(attempt: int, timeout: float) -> T:
+            start = self._clock()
+            try:
+                result = await attempt_function(attempt, timeout)
+            except Exception as error:
+                self.record(attempt, timeout, self._clock() - start, _outcome_of(error))
+                raise
+            self.record(attempt, timeout, self._clock() - start, SUCCEEDED)
+            return result
+        return recorded_attempt
+
+
+def _outcome_of(error: Exception) -> str:
+    from .retry_policy import UploadAttemptError
+    return TIMED_OUT if isinstance(error, UploadAttemptError) and error.timed_out else FAILED
+
+
+class HistoryParameters(UploadParameters):
+    """ The parameters `history` needs. """
+    history_days: int = 30  # How far back to look. 0 for everything
+
+    _parameter_names: tuple = ()
+    _entry_parameter_names: tuple = (
+        "cache_directory",
+        "history_days",
+    )
+
+
+def print_history_summary(summaries: list[AgentSummary]) -> None:
+    if not summaries:
+        print("No uploads in the history yet.")
+        return
+
+    def seconds(value: Optional[float]) -> str:
+        return "-" if value is None else f"{value:.0f}s"
+
+    headers = ("Agent", "Attempts", "Failed", "Timed out", "Failure rate", "p50", "p95", "p50 MB/s")
+    rows = [(
+        summary.agent,
+        str(summary.attempts),
+        str(summary.failures),
+        str(summary.timeouts),
+        f"{summary.failure_rate:.0%}",
+        seconds(summary.p50_duration),
+        seconds(summary.p95_duration),
+        "-" if summary.p50_bytes_per_second is None else f"{summary.p50_bytes_per_second / 1000 ** 2:.2f}",
+    ) for summary in summaries]
+    widths = [max(len(row[column]) for row in (headers, *rows)) for column in range(len(headers))]
+    for row in (headers, *rows):
+        print("  ".join(value.ljust(width) if column == 0 else value.rjust(width) for column, (value, width) in enumerate(zip(row, widths))))
+
@@ -0,0 +1,150 @@
+"""
+Remembers which builds already made it to TestFlight so re-running the post build step doesn't upload them again.
+
+Builds are keyed by a sha256 of the file contents (not the name, UCB reuses names).
+The file is memory mapped and hashed a chunk at a time so multi GB .ipa files are never read into memory at once.
+
+hashlib/mmap/sqlite3 are imported when first used, so paths that never get as far as uploading don't pay for them.
+"""
+import os
+import time
+from pathlib import Path
+from typing import Optional
+
+LEDGER_FILE_NAME = "upload_ledger.sqlite3"
+FINGERPRINT_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def fingerprint_file(path: Path, chunk_size: int = FINGERPRINT_CHUNK_SIZE) -> str:
+    import hashlib
+    import mmap
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        if size == 0:
+            return digest.hexdigest()   # Can't mmap an empty file
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                for offset in range(0, size, chunk_size):
+                    digest.update(view[offset:offset + chunk_size])    # Slicing a memoryview doesn't copy
+            finally:
+                view.release()
+    return digest.hexdigest()
+
+
+class UploadLedger:
+    path: Path
+
+    # column name -> sqlite type. New columns are added to existing ledgers when opened.
+    _columns: dict = {
+        "fingerprint": "TEXT PRIMARY KEY",
+        "file_name": "TEXT",
+        "size": "INTEGER",
+        "uploaded_at": "REAL",
+        "bundle_id": "TEXT",
+        "short_version": "TEXT",
+        "build_version": "TEXT",
+        "git_commit": "TEXT",
+        "processing_state": "TEXT",     # App Store Connect's processingState when we stopped waiting
+        "processing_seconds": "REAL",   # How long we waited for it
+    }
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._create_table()
+
+    def get(self, fingerprint: str) -> Optional[dict]:
+        with self._connect() as connection:
+            row = connection.execute("SELECT * FROM uploads WHERE fingerprint = ?", (fingerprint,)).fetchone()
+        return dict(row) if row else None
+
+    def find_build(self, bundle_id: str, short_version: str, build_version: str) -> Optional[dict]:
+        """ The most recent upload of this version/build pair, if any. """
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT * FROM uploads WHERE bundle_id = ? AND short_version = ? AND build_version = ? ORDER BY uploaded_at DESC",
+                (bundle_id, short_version, build_version),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def last_git_commit(self, bundle_id: Optional[str] = None) -> Optional[str]:
+        """ The commit the most recent upload (of bundle_id, if given) was built from. """
+        query = "SELECT git_commit FROM uploads WHERE git_commit IS NOT NULL"
+        parameters = ()
+        if bundle_id:
+            query += " AND bundle_id = ?"
+            parameters = (bundle_id,)
+        with self._connect() as connection:
+            row = connection.execute(query + " ORDER BY uploaded_at DESC", parameters).fetchone()
+        return row["git_commit"] if row else None
+
+    def is_uploaded(self, fingerprint: str) -> bool:
+        return self.get(fingerprint) is not None
+
+    def record_upload(self, fingerprint: str, file_path: Path, **columns) -> None:
+        values = {
+            "fingerprint": fingerprint,
+            "file_name": file_path.name,
+            "size": file_path.stat().st_size,
+            "uploaded_at": time.time(),
+            **columns,
+        }
+        names = ", ".join(values)
+        placeholders = ", ".join("?" for _ in values)
+        with self._connect() as connection:
+            connection.execute(f"INSERT OR REPLACE INTO uploads ({names}) VALUES ({placeholders})", tuple(values.values()))
+
+    def record_processing(self, fingerprint: str, state: Optional[str], seconds: float) -> None:
+        with self._connect() as connection:
+            connection.execute("UPDATE uploads SET processing_state = ?, processing_seconds = ? WHERE fingerprint = ?", (state, seconds, fingerprint))
+
+    def _connect(self) -> "_ClosingConnection":
+        import sqlite3
+
+        # A connection per operation keeps the ledger safe to share between threads and processes.
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        return _ClosingConnection(connection)
+
+    def _create_table(self) -> None:
+        columns = ", ".join(f"{name} {kind}" for name, kind in self._columns.items())
+        with self._connect() as connection:
+            connection.execute(f"CREATE TABLE IF NOT EXISTS uploads ({columns})")
+            existing = {row["name"] for row in connection.execute("PRAGMA table_info(uploads)")}
+            for name, kind in self._columns.items():
+                if name not in existing:
+                    connection.execute(f"ALTER TABLE uploads ADD COLUMN {name} {kind}")
+            connection.execute("CREATE INDEX IF NOT EXISTS uploads_by_build ON uploads (bundle_id, short_version, build_version)")
+
+
+def is_upload_skipped(ledger: UploadLedger, fingerprint: str, file_path: Path, force: bool) -> bool:
+    """ True (and says why) if the build is already in the ledger and we aren't forcing the upload. """
+    if not ledger.is_uploaded(fingerprint):
+        return False
+
+    if not force:
+        print(f"{file_path.name} (sha256 {fingerprint[:12]}) has already been uploaded. Skipping. (use --force to upload anyway)")
+        return True
+
+    print(f"{file_path.name} (sha256 {fingerprint[:12]}) has already been uploaded. Uploading again because of --force.")
+    return False
+
+
+class _ClosingConnection:
+    """ sqlite3.Connection's context manager commits but doesn't close. This one does both. """
+
+    def __init__(self, connection: "sqlite3.Connection") -> None:
+        self._connection = connection
+
+    def __enter__(self) -> "sqlite3.Connection":
+        return self._connection.__enter__()
+
+    def __exit__(self, *exc_info) -> None:
+        try:
+            self._connection.__exit__(*exc_info)
+        finally:
+            self._connection.close()
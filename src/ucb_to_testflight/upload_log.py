@@ -0,0 +1,138 @@
+"""
+Captures the output of one upload attempt without keeping all of it.
+
+pilot/Transporter can print megabytes over a long upload. Only the last FAILURE_LOG_KB are kept, in a fixed size ring buffer
+(so memory stays flat however long the run is, and however long a line is), and that tail is shown only if the attempt fails.
+Progress lines ("... 45%", "12.3 MB of 120 MB") are turned into bytes uploaded and MB/s, printed at most every PROGRESS_INTERVAL
+seconds and kept on the attempt's result.
+"""
+import re
+import time
+from typing import Callable, Optional
+
+DEFAULT_FAILURE_LOG_KB = 64
+DEFAULT_PROGRESS_INTERVAL = 10  # seconds
+
+_UNITS = {"": 1, "b": 1, "bytes": 1, "kb": 1000, "mb": 1000 ** 2, "gb": 1000 ** 3, "kib": 1024, "mib": 1024 ** 2, "gib": 1024 ** 3}
+_AMOUNT_OF_TOTAL = re.compile(
+    r"(?P<done>\d[\d,]*(?:\.\d+)?)\s*(?P<done_unit>bytes|[kmg]i?b|b)?\s*(?:of|/)\s*(?P<total>\d[\d,]*(?:\.\d+)?)\s*(?P<total_unit>bytes|[kmg]i?b|b)\b",
+    re.IGNORECASE,
+)
+_PERCENT = re.compile(r"(?P<percent>\d{1,3}(?:\.\d+)?)\s*%")
+_PROGRESS_WORDS = re.compile(r"upload|transfer|sent|progress", re.IGNORECASE)
+
+
+class RingBuffer:
+    """ The last capacity bytes written to it. """
+    capacity: int
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = max(1, capacity)
+        self._buffer = bytearray(self.capacity)
+        self._end = 0           # Where the next byte goes
+        self._wrapped = False   # Whether anything has been overwritten
+
+    def write(self, data: bytes) -> None:
+        if len(data) >= self.capacity:
+            self._buffer[:] = data[-self.capacity:]
+            self._end = 0
+            self._wrapped = True
+            return
+        first = min(len(data), self.capacity - self._end)
+        self._buffer[self._end:self._end + first] = data[:first]
+        self._buffer[:len(data) - first] = data[first:]
+        if self._end + len(data) >= self.capacity:
+            self._wrapped = True
+        self._end = (self._end + len(data)) % self.capacity
+
+    @property
+    def wrapped(self) -> bool:
+        """ Whether older data has been overwritten. """
+        return self._wrapped
+
+    def getvalue(self) -> bytes:
+        if not self._wrapped:
+            return bytes(self._buffer[:self._end])
+        return bytes(self._buffer[self._end:] + self._buffer[:self._end])
+
+
+def parse_progress(line: str, total_bytes: Optional[int] = None) -> Optional[int]:
+    """ Bytes uploaded according to a progress line, or None if it isn't one. Percentages need total_bytes. """
+    amount = _AMOUNT_OF_TOTAL.search(line)
+    if amount:
+        total_unit = amount["total_unit"].lower()
+        return int(float(amount["done"].replace(",", "")) * _UNITS[(amount["done_unit"] or total_unit).lower()])
+    if total_bytes and _PROGRESS_WORDS.search(line):
+        percent = _PERCENT.search(line)
+        if percent and float(percent["percent"]) <= 100:
+            return int(total_bytes * float(percent["percent"]) / 100)
+    return None
+
+
+class UploadLogCapture:
+    """ Follows one attempt's output. Give handle_line to whatever reads the output. """
+    total_bytes: Optional[int]
+    echo_lines: bool            # Print every line as well (show_fastlane_logs)
+    progress_interval: float    # seconds between progress reports
+    bytes_uploaded: Optional[int]       # None until a progress line is seen
+    bytes_per_second: Optional[float]   # Average since the first progress line
+
+    def __init__(
+        self,
+        failure_log_kb: int = DEFAULT_FAILURE_LOG_KB,
+        total_bytes: Optional[int] = None,
+        echo_lines: bool = False,
+        progress_interval: float = DEFAULT_PROGRESS_INTERVAL,
+        clock: Callable[[], float] = time.monotonic,
+        output: Callable[[str], None] = print,
+    ) -> None:
+        self.total_bytes = total_bytes
+        self.echo_lines = echo_lines
+        self.progress_interval = progress_interval
+        self.bytes_uploaded = None
+        self.bytes_per_second = None
+        self._tail = RingBuffer(failure_log_kb * 1024)
+        self._clock = clock
+        self._output = output
+        self._first_progress = None     # (time, bytes)
+        self._last_report = None
+
+    def handle_line(self, stream_name: str, line: str) -> None:
+        self._tail.write(line.encode("utf-8", errors="replace") + b"\n")
+        if self.echo_lines:
+            self._output(line)
+        uploaded = parse_progress(line, self.total_bytes)
+        if uploaded is not None:
+            self._record_progress(uploaded)
+
+    def tail(self) -> str:
+        """ The last FAILURE_LOG_KB of output. A line cut in half by the buffer wrapping is left out. """
+        data = self._tail.getvalue()
+        if self._tail.wrapped and b"\n" in data:
+            data = data[data.index(b"\n") + 1:]
+        return data.decode("utf-8", errors="replace").rstrip("\n")
+
+    def _record_progress(self, uploaded: int) -> None:
+        now = self._clock()
+        if self._first_progress is None:
+            self._first_progress = (now, uploaded)
+        self.bytes_uploaded = max(uploaded, self.bytes_uploaded or 0)
+        first_time, first_bytes = self._first_progress
+        if now > first_time:
+            self.bytes_per_second = (self.bytes_uploaded - first_bytes) / (now - first_time)
+
+        if self._last_report is None or now - self._last_report >= self.progress_interval:
+            self._last_report = now
+            self._output(self.describe())
+
+    def describe(self) -> str:
+        text = f"Uploaded {_megabytes(self.bytes_uploaded or 0)}"
+        if self.total_bytes:
+            text += f" of {_megabytes(self.total_bytes)} ({100 * (self.bytes_uploaded or 0) / self.total_bytes:.0f}%)"
+        if self.bytes_per_second is not None:
+            text += f", {self.bytes_per_second / 1000 ** 2:.1f} MB/s"
+        return text
+
+
+def _megabytes(size: int) -> str:
+    return f"{size / 1000 ** 2:.1f} MB"
@@ -6,17 +6,18 @@ In order of priority
  - Defaults (if they exist)
 
 raises ??? if required parameters do not exist.
+
+dotenv, python_command_line_helpers and python_pretty_print are imported when first needed
+so --help (and anything else that exits early) stays fast.
 """
 
 import argparse
 from enum import Enum
 import os
 from pathlib import Path
-import dotenv
 from typing import get_type_hints
-from python_command_line_helpers.arg_casting import cast_cli_arg
-from python_command_line_helpers import input_cleaning
-from python_pretty_print import pretty_print
+from .cache_directory import default_cache_directory
+from .tracing import span
 
 
 class ParameterSource(Enum):
@@ -36,6 +37,54 @@ class UploadParameters:
     max_upload_attempts: int = 10
     attempt_timeout: int = 600  # seconds
     show_fastlane_logs: bool = False
+    search_recursively: bool = False
+    max_search_depth: int = 4
+    force: bool = False
+    cache_directory: Path = default_cache_directory()
+    retry_base_delay: float = 10    # seconds
+    retry_max_delay: float = 300    # seconds
+    retry_jitter: float = 0.5
+    max_total_upload_seconds: int = 0   # 0 for no limit
+    upload_backend: str = "pyliot"
+    pilot_command: str = "fastlane pilot upload"
+    expected_bundle_id: str = ""
+    skip_ipa_validation: bool = False
+    dry_run: bool = False
+    changelog_source: str = "file"     # "file" (CHANGELOG_PATH) or "git"
+    changelog_repository: Path = Path(".")
+    changelog_commit_types: list[str] = ["feat", "fix", "perf"]
+    changelog_max_length: int = 4000    # TestFlight's "What to Test" limit
+    max_parallel_chunks: int = 4    # UPLOAD_BACKEND=direct
+    app_store_connect_api_url: str = "https://api.appstoreconnect.apple.com"
+    group_assignment: str = "backend"   # "backend" (pyliot/pilot add the groups) or "api" (we add them, in parallel)
+    max_parallel_requests: int = 8
+    wait_for_processing: bool = False   # Wait for App Store Connect to finish processing the build
+    max_processing_wait: int = 1800     # seconds
+    failure_log_kb: int = 64    # Tail of pilot's output kept to show when an attempt fails
+    progress_interval: float = 10   # seconds between upload progress reports
+    adaptive_attempt_timeout: bool = True   # Size each attempt's timeout from the upload history (ATTEMPT_TIMEOUT until there is one)
+    min_attempt_timeout: int = 120  # seconds
+    max_attempt_timeout: int = 3600     # seconds
+    agent_name: str = ""    # What uploads are recorded under in the history. Empty for the host name
+    max_host_uploads: int = 0   # Uploads at once from this host, across processes. 0 for no limit
+    upload_priority: int = 0    # 0 to 999. Higher gets a host upload slot first
+    max_upload_mb_per_second: float = 0     # Per upload (direct backend, Google Play). 0 for no limit
+    duplicate_build_check: str = "fail"     # "fail", "skip" or "off": what to do if App Store Connect already has the build's version pair
+    use_daemon: bool = True
+    daemon_socket: Path = default_cache_directory() / "daemon.sock"
+    trace_path: str = ""    # JSON lines trace output. Empty for none
+    timings: bool = False
+    watch: bool = False     # Upload builds as they're written to OUTPUT_DIRECTORY
+    watch_max_uploads: int = 1  # 0 for no limit
+    watch_idle_timeout: int = 3600  # seconds without a new build before watching stops. 0 for never
+    watch_settle_seconds: float = 2     # How long a build's size/mtime must hold still (when inotify can't say it was closed)
+    google_play_package_name: str = ""  # Also upload the .aab in OUTPUT_DIRECTORY to Google Play when set
+    google_play_service_account_json: str = ""  # The service account key file's contents
+    google_play_track: str = "internal"
+    google_play_release_notes_language: str = "en-US"
+    google_play_api_url: str = "https://androidpublisher.googleapis.com"
+    symbol_upload_url: str = ""     # Also upload the .dSYMs in OUTPUT_DIRECTORY (zipped) here when set
+    symbol_upload_token: str = ""   # Sent as a bearer token with the symbols, if set
 
     meta_data: dict
 
@@ -48,65 +97,141 @@ class UploadParameters:
         "groups",
         "max_upload_attempts",
         "attempt_timeout",
-        "show_fastlane_logs"
+        "show_fastlane_logs",
+        "search_recursively",
+        "max_search_depth",
+        "force",
+        "cache_directory",
+        "retry_base_delay",
+        "retry_max_delay",
+        "retry_jitter",
+        "max_total_upload_seconds",
+        "upload_backend",
+        "pilot_command",
+        "expected_bundle_id",
+        "skip_ipa_validation",
+        "dry_run",
+        "changelog_source",
+        "changelog_repository",
+        "changelog_commit_types",
+        "changelog_max_length",
+        "max_parallel_chunks",
+        "app_store_connect_api_url",
+        "group_assignment",
+        "max_parallel_requests",
+        "wait_for_processing",
+        "max_processing_wait",
+        "failure_log_kb",
+        "progress_interval",
+        "adaptive_attempt_timeout",
+        "min_attempt_timeout",
+        "max_attempt_timeout",
+        "agent_name",
+        "max_host_uploads",
+        "upload_priority",
+        "max_upload_mb_per_second",
+        "duplicate_build_check",
+    )
+    # Loaded the same way but not passed to upload_to_testflight (they're about how the command runs).
+    _entry_parameter_names: tuple = (
+        "use_daemon",
+        "daemon_socket",
+        "trace_path",
+        "timings",
+        "watch",
+        "watch_max_uploads",
+        "watch_idle_timeout",
+        "watch_settle_seconds",
+        "google_play_package_name",
+        "google_play_service_account_json",
+        "google_play_track",
+        "google_play_release_notes_language",
+        "google_play_api_url",
+        "symbol_upload_url",
+        "symbol_upload_token",
     )
 
-    def get_values(self) -> list:
-        return [getattr(self, name) for name in self._parameter_names]
+    def _get_all_parameter_names(self) -> tuple:
+        return self._parameter_names + self._entry_parameter_names
+
+    def get_values(self, **overrides) -> list:
+        """ Values in upload_to_testflight argument order. overrides replace single values (eg. for one batch job). """
+        return [overrides[name] if name in overrides else getattr(self, name, None) for name in self._parameter_names]
 
     def __init__(self) -> None:
         self.meta_data = {}
-        type_hints = get_type_hints(UploadParameters)
-        for name in self._parameter_names:
+        type_hints = get_type_hints(type(self))
+        for name in self._get_all_parameter_names():
             self.meta_data[name] = {
                 "source": ParameterSource.NONE,
                 "type": type_hints[name]
             }
 
     def load(self) -> None:
-        self._load_parameters_from_defaults()
-        self._load_parameters_from_env()
-        self._load_parameters_from_cli()
+        cli_arguments = self._parse_cli_arguments()    # First, so --help exits before anything else is done
+        with span("parameters.load", **{"parameters.count": len(self._get_all_parameter_names())}):
+            self._load_parameters_from_defaults()
+            self._load_parameters_from_env()
+            self._load_parameters_from_cli(cli_arguments)
 
         unset_parameters = set(self._get_unset_parameter_names())
-        set_parameters = set(self._parameter_names) - unset_parameters
+        set_parameters = set(self._get_all_parameter_names()) - unset_parameters
         max_name_length = max(map(lambda s: len(s), set_parameters))
         print("Parameters found:")
         for name in set_parameters:
             print(f"  * {name:<{max_name_length}} (found in {self.meta_data[name]['source'].name})")
 
         if len(unset_parameters) > 0:
+            from python_pretty_print import pretty_print
             message = f"Missing parameters: {', '.join(unset_parameters)}"
             pretty_print(f"<error>{message}</error>")
             raise KeyError(message)
 
     def _load_parameters_from_defaults(self) -> None:
-        for parameter_name in self._parameter_names:
+        for parameter_name in self._get_all_parameter_names():
             if hasattr(self, parameter_name):
                 self.meta_data[parameter_name]["source"] = ParameterSource.DEFAULTS
 
     def _load_parameters_from_env(self) -> None:
+        import dotenv
+        from python_command_line_helpers import input_cleaning
+
         dotenv.load_dotenv()
-        for parameter_name in self._parameter_names:
+        for parameter_name in self._get_all_parameter_names():
             env_name = parameter_name.upper()
             if env_name in os.environ:
                 self._try_set_parameter(parameter_name, input_cleaning.unescape(os.environ[env_name]), ParameterSource.ENV)
 
-    def _load_parameters_from_cli(self) -> None:
+    def _parse_cli_arguments(self) -> argparse.Namespace:
         parser = argparse.ArgumentParser()
-        for parameter_name in self._parameter_names:
-            parser.add_argument("--" + parameter_name.replace("_", "-"))
+        for parameter_name in self._get_all_parameter_names():
+            flag = "--" + parameter_name.replace("_", "-")
+            help_text = f"(or ${parameter_name.upper()})"
+            if hasattr(self, parameter_name):
+                help_text += f" default: {getattr(self, parameter_name)}"
+            help_text = help_text.replace("%", "%%")
+            if self.meta_data[parameter_name]["type"] is bool:
+                parser.add_argument(flag, nargs="?", const="true", help=help_text)  # "--force" works as well as "--force false"
+            else:
+                parser.add_argument(flag, help=help_text)
         known, unknown = parser.parse_known_args()
 
         if len(unknown) > 0:
+            from python_pretty_print import pretty_print
             pretty_print(f"<warning>Got unknown command line args: {', '.join(unknown)}</warning>")
+        return known
+
+    def _load_parameters_from_cli(self, known: argparse.Namespace) -> None:
+        from python_command_line_helpers import input_cleaning
 
         input_cleaning.replace_hypens_with_underscore(known)
-        for parameter_name in self._parameter_names:
+        for parameter_name in self._get_all_parameter_names():
             if parameter_name in known:
                 self._try_set_parameter(parameter_name, getattr(known, parameter_name), ParameterSource.CLI)
 
     def _try_set_parameter(self, name: str, value, source: ParameterSource) -> bool:
+        from python_command_line_helpers.arg_casting import cast_cli_arg
+
         if value == None: return False
 
         try:
@@ -121,7 +246,9 @@ class UploadParameters:
     
     def _get_unset_parameter_names(self) -> list[str]:
         names = []
-        for parameter_name in self._parameter_names:
+        for parameter_name in self._get_all_parameter_names():
             if self.meta_data[parameter_name]["source"] == ParameterSource.NONE:
                 names.append(parameter_name)
+        if getattr(self, "changelog_source", "file") != "file" and "changelog_path" in names:
+            names.remove("changelog_path")  # The changelog is generated
         return names
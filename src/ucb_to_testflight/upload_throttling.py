@@ -0,0 +1,220 @@
+"""
+Keeps uploads on a shared build agent from starving each other.
+
+Host upload slots (MAX_HOST_UPLOADS): every process uploading from this host (separate `upload-to-testflight.sh` runs, the daemon,
+batches...) takes one of a fixed number of slots before uploading. Slots are flock()ed files in CACHE_DIRECTORY/upload_slots, so a
+process that dies gives its slot back with it. Waiters queue with a ticket (also flock()ed, so tickets of dead processes are ignored)
+named by priority then arrival, and only the one at the front of the queue takes a free slot: higher UPLOAD_PRIORITY first, then
+first come first served. Time spent queueing is reported (and traced, "upload.queue") apart from the upload itself.
+
+Bandwidth (MAX_UPLOAD_MB_PER_SECOND): a token bucket per upload, shared by its parallel chunks. Bodies are sent a slice at a time,
+each slice waiting for its tokens. This only covers bytes we send ourselves (UPLOAD_BACKEND=direct, Google Play); pilot/pyliot hand
+the file to Transporter, which can only be limited by the host slots.
+"""
+import contextlib
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+from .tracing import span
+
+UPLOAD_SLOTS_DIRECTORY_NAME = "upload_slots"    # In CACHE_DIRECTORY
+POLL_INTERVAL = 0.5     # seconds between looks at the queue while waiting
+MAX_PRIORITY = 999
+THROTTLED_SLICE_SIZE = 64 * 1024
+
+
+class HostUploadSlots:
+    """ with HostUploadSlots(directory, 2): ... Limits uploads across every process using directory. count <= 0 for no limit. """
+    directory: Path
+    count: int
+    priority: int   # 0 to MAX_PRIORITY, higher goes first
+    waited: float   # seconds the last acquire() waited
+
+    def __init__(
+        self,
+        directory: Path,
+        count: int,
+        priority: int = 0,
+        poll_interval: float = POLL_INTERVAL,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.directory = directory
+        self.count = count
+        self.priority = min(max(priority, 0), MAX_PRIORITY)
+        self.waited = 0
+        self._poll_interval = poll_interval
+        self._clock = clock
+        self._sleep = sleep
+        self._slot_file = None
+
+    def acquire(self) -> float:
+        """ Blocks until this process has a slot. Returns how many seconds that took. """
+        if self.count <= 0:
+            return 0
+        import fcntl
+
+        queue_directory = self.directory / "queue"
+        queue_directory.mkdir(parents=True, exist_ok=True)
+        start = self._clock()
+        ticket_path, ticket_file = self._take_ticket(queue_directory)
+        try:
+            while True:
+                if self._is_first_in_queue(queue_directory, ticket_path.name):
+                    for index in range(self.count):
+                        slot_file = open(self.directory / f"slot-{index}.lock", "a+")
+                        try:
+                            fcntl.flock(slot_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        except BlockingIOError:
+                            slot_file.close()
+                            continue
+                        self._slot_file = slot_file
+                        self.waited = self._clock() - start
+                        return self.waited
+                self._sleep(self._poll_interval)
+        finally:
+            ticket_path.unlink(missing_ok=True)
+            ticket_file.close()
+
+    def release(self) -> None:
+        if self._slot_file is not None:
+            self._slot_file.close()     # Closing lets go of the lock
+            self._slot_file = None
+
+    def __enter__(self) -> "HostUploadSlots":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
+
+    def _take_ticket(self, queue_directory: Path) -> tuple:
+        """ A locked ticket file. It's locked before it's moved into the queue, so nobody sees it unlocked and takes it for stale. """
+        import fcntl
+
+        name = f"{MAX_PRIORITY - self.priority:03d}-{time.time_ns():020d}-{os.getpid()}-{threading.get_ident()}.ticket"
+        pending_path = self.directory / f"{name}.new"
+        ticket_file = open(pending_path, "w")
+        fcntl.flock(ticket_file, fcntl.LOCK_EX)
+        ticket_path = queue_directory / name
+        os.replace(pending_path, ticket_path)
+        return ticket_path, ticket_file
+
+    def _is_first_in_queue(self, queue_directory: Path, ticket_name: str) -> bool:
+        """ True if no live ticket sorts before ours. Tickets nobody holds any more (their process died) are removed. """
+        import fcntl
+
+        for name in sorted(os.listdir(queue_directory)):
+            if name >= ticket_name:
+                return True
+            try:
+                other = open(queue_directory / name, "r")
+            except FileNotFoundError:
+                continue    # Its owner got a slot and left the queue
+            with other:
+                try:
+                    fcntl.flock(other, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return False
+                (queue_directory / name).unlink(missing_ok=True)
+        return True
+
+
+@contextlib.contextmanager
+def host_upload_slot(cache_directory: Path, count: int, priority: int = 0):
+    """ Hold one of this host's count upload slots for the with block, reporting the wait. Does nothing if count <= 0. """
+    if count <= 0:
+        yield
+        return
+    slots = HostUploadSlots(cache_directory / UPLOAD_SLOTS_DIRECTORY_NAME, count, priority)
+    with span("upload.queue", **{"queue.slots": count, "queue.priority": slots.priority}) as current:
+        waited = slots.acquire()
+        current.set_attribute("queue.wait_seconds", round(waited, 3))
+    if waited >= 1:
+        print(f"Waited {waited:.0f}s for one of this host's {count} upload slots (MAX_HOST_UPLOADS)")
+    try:
+        yield
+    finally:
+        slots.release()
+
+
+@contextlib.asynccontextmanager
+async def host_upload_slot_async(cache_directory: Path, count: int, priority: int = 0):
+    """ host_upload_slot, waiting on a thread so the event loop carries on meanwhile. """
+    import asyncio
+
+    slot = host_upload_slot(cache_directory, count, priority)
+    await asyncio.to_thread(slot.__enter__)
+    try:
+        yield
+    finally:
+        slot.__exit__(None, None, None)
+
+
+class TokenBucket:
+    """ consume(n) blocks until n bytes fit under rate bytes/s (bursts of up to capacity). Safe to share between threads. """
+    rate: float
+    capacity: float
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def consume(self, amount: int) -> None:
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount  # Going into debt reserves our place: whoever comes next waits for it to be paid off too
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            self._sleep(wait)
+
+
+def upload_bucket(megabytes_per_second: float) -> Optional[TokenBucket]:
+    """ The bucket for one upload, or None for no limit. """
+    return TokenBucket(megabytes_per_second * 1000 ** 2) if megabytes_per_second > 0 else None
+
+
+class ThrottledBody:
+    """
+    A request body sent THROTTLED_SLICE_SIZE at a time, each slice waiting on bucket.
+    Iterable more than once, so a request that is sent again (stale keep-alive connection) sends all of it again.
+    Needs an explicit Content-Length header (throttled() adds it) or http.client falls back to chunked encoding.
+    """
+    data: memoryview
+    bucket: TokenBucket
+
+    def __init__(self, data, bucket: TokenBucket, slice_size: int = THROTTLED_SLICE_SIZE) -> None:
+        self.data = memoryview(data)
+        self.bucket = bucket
+        self.slice_size = slice_size
+
+    def __iter__(self):
+        for offset in range(0, len(self.data), self.slice_size):
+            piece = self.data[offset:offset + self.slice_size]
+            self.bucket.consume(len(piece))
+            yield piece
+
+
+def throttled(data, headers: dict, bucket: Optional[TokenBucket]) -> tuple:
+    """ (body, headers) to send data with, going no faster than bucket allows. data and headers unchanged if bucket is None. """
+    if bucket is None:
+        return data, headers
+    if not any(name.lower() == "content-length" for name in headers):
+        headers = {**headers, "Content-Length": str(memoryview(data).nbytes)}
+    return ThrottledBody(data, bucket), headers
@@ -1,8 +1,19 @@
-"""UCB adapter that delegates TestFlight upload execution to pyliot."""
+"""
+UCB adapter that delegates TestFlight upload execution to pyliot (or to our own pilot orchestrator, or straight to App Store Connect, see UPLOAD_BACKEND).
+Retries are ours either way (see retry_policy).
+
+The upload stack (pyliot/asyncio) is only imported once we know there is something to upload.
+"""
 from pathlib import Path
 
-from pyliot.upload_to_testflight import upload_to_testflight as pyliot_upload_to_testflight
 from .build_file_finder import BuildFileFinder
+from .cache_directory import default_cache_directory
+from .changelog import check_changelog_source, read_changelog_file
+from .ipa_validation import check_info_plist_contents, read_info_plist_contents, validate_ipa
+from .tracing import span
+from .upload_ledger import LEDGER_FILE_NAME, UploadLedger, fingerprint_file, is_upload_skipped
+
+UPLOAD_BACKENDS = ("pyliot", "pilot", "direct")
 
 
 def upload_to_testflight(
@@ -14,25 +25,214 @@ def upload_to_testflight(
 	groups: list[str] = [],
 	max_upload_attempts: int = 10,
 	attempt_timeout_seconds: int = 600,
-	show_fastlane_logs: bool = False
+	show_fastlane_logs: bool = False,
+	search_recursively: bool = False,
+	max_search_depth: int = 4,
+	force: bool = False,
+	cache_directory: Path = default_cache_directory(),
+	retry_base_delay: float = 10,
+	retry_max_delay: float = 300,
+	retry_jitter: float = 0.5,
+	max_total_upload_seconds: int = 0,
+	upload_backend: str = "pyliot",
+	pilot_command: str = "fastlane pilot upload",
+	expected_bundle_id: str = "",
+	skip_ipa_validation: bool = False,
+	dry_run: bool = False,
+	changelog_source: str = "file",
+	changelog_repository: Path = Path("."),
+	changelog_commit_types: list[str] = ["feat", "fix", "perf"],
+	changelog_max_length: int = 4000,
+	max_parallel_chunks: int = 4,
+	app_store_connect_api_url: str = "https://api.appstoreconnect.apple.com",
+	group_assignment: str = "backend",
+	max_parallel_requests: int = 8,
+	wait_for_processing: bool = False,
+	max_processing_wait: int = 1800,
+	failure_log_kb: int = 64,
+	progress_interval: float = 10,
+	adaptive_attempt_timeout: bool = True,
+	min_attempt_timeout: int = 120,
+	max_attempt_timeout: int = 3600,
+	agent_name: str = "",
+	max_host_uploads: int = 0,
+	upload_priority: int = 0,
+	max_upload_mb_per_second: float = 0,
+	duplicate_build_check: str = "fail"
 ):
-	with open(changelog_path, "r") as file:
-		changelog = file.read()
-
-	print("\nFound Changelog ".ljust(32, "="))
-	print(changelog)
-	print("=" * 32)
-
-	ipa_path = BuildFileFinder(output_directory, ".ipa").file_path
-
-	pyliot_upload_to_testflight(
-		app_store_connect_api_key_issuer_id=app_store_connect_api_key_issuer_id,
-		app_store_connect_api_key_id=app_store_connect_api_key_id,
-		app_store_connect_api_key_content=app_store_connect_api_key_content,
-		ipa_path=ipa_path,
-		changelog=changelog,
-		groups=groups,
-		max_upload_attempts=max_upload_attempts,
-		attempt_timeout_seconds=attempt_timeout_seconds,
-		show_fastlane_logs=show_fastlane_logs
-	)
+	if upload_backend not in UPLOAD_BACKENDS:
+		raise ValueError(f"Unknown upload backend \"{upload_backend}\". Expected one of: {', '.join(UPLOAD_BACKENDS)}")
+	from .testflight_distribution import check_group_assignment
+	check_group_assignment(group_assignment)
+	from .duplicate_build_check import check_duplicate_build_option
+	check_duplicate_build_option(duplicate_build_check)
+	# With the API, groups are added once the upload is done (all at once) instead of by pyliot/pilot (one at a time)
+	assign_groups_with_api = bool(groups) and (group_assignment == "api" or upload_backend == "direct")
+	backend_groups = [] if assign_groups_with_api else groups
+	wait_for_processing = wait_for_processing or assign_groups_with_api	# Only processed builds can be added to groups
+
+	check_changelog_source(changelog_source)
+
+	changelog = None
+	if changelog_source == "file":
+		with span("changelog.read", **{"changelog.source": changelog_source}) as current:
+			changelog = read_changelog_file(changelog_path)
+			current.set_attribute("changelog.length", len(changelog))
+
+	ipa_path = BuildFileFinder(output_directory, ".ipa", search_recursively, max_search_depth).file_path
+	packaged_ipa = None
+	if ipa_path.suffix.lower() == ".xcarchive":
+		from .ipa_packager import PackagedIpa
+		packaged_ipa = PackagedIpa(cache_directory, ipa_path)
+
+	if dry_run:
+		# Only the Info.plist is read: no packaging, no ledger, no fingerprint and none of the upload stack
+		if not skip_ipa_validation:
+			info_plist = packaged_ipa.info_plist_contents() if packaged_ipa else read_info_plist_contents(ipa_path)
+			check_info_plist_contents(*info_plist, expected_bundle_id)
+		print(f"Dry run: would upload {ipa_path} with the {upload_backend} backend{f' to groups {groups}' if groups else ''}. Stopping here.")
+		return
+
+	ledger = UploadLedger(cache_directory / LEDGER_FILE_NAME)
+	if packaged_ipa is not None:
+		if packaged_ipa.is_upload_skipped(ledger, force):
+			return
+		ipa_path = packaged_ipa.package()
+	ipa_size = ipa_path.stat().st_size
+	with span("ipa.fingerprint", **{"ipa.size_bytes": ipa_size}):
+		fingerprint = fingerprint_file(ipa_path)
+	if is_upload_skipped(ledger, fingerprint, ipa_path, force):
+		return
+
+	ipa_info = None
+	if not skip_ipa_validation:
+		with span("ipa.validate", **{"ipa.size_bytes": ipa_size}):
+			ipa_info = validate_ipa(ipa_path, expected_bundle_id, ledger, fingerprint)
+
+	git_commit = None
+	if changelog_source == "git":
+		from .git_changelog import changelog_since_last_upload
+		with span("changelog.read", **{"changelog.source": changelog_source}) as current:
+			changelog, git_commit = changelog_since_last_upload(
+				changelog_repository, ledger, ipa_info.bundle_id if ipa_info else None, cache_directory, changelog_commit_types, changelog_max_length
+			)
+			current.set_attribute("changelog.length", len(changelog))
+	# The direct backend sets the changelog through the API as well, and that also needs the build processed
+	set_changelog_with_api = upload_backend == "direct" and bool(changelog)
+	wait_for_processing = wait_for_processing or set_changelog_with_api
+
+	from .retry_policy import RetryPolicy, run_with_retries
+	from .upload_history import HISTORY_FILE_NAME, AttemptRecorder, UploadHistory, default_agent_name, plan_attempt_timeout
+	from .upload_throttling import host_upload_slot
+
+	history = UploadHistory(cache_directory / HISTORY_FILE_NAME)
+	agent_name = agent_name or default_agent_name()
+	if adaptive_attempt_timeout:
+		attempt_timeout_seconds = plan_attempt_timeout(history, ipa_size, agent_name, attempt_timeout_seconds, min_attempt_timeout, max_attempt_timeout)
+	recorder = AttemptRecorder(history, agent_name, upload_backend, ipa_path)
+
+	api_client = None
+	if upload_backend == "direct" or wait_for_processing or duplicate_build_check != "off":
+		from .app_store_connect import AppStoreConnectClient
+		from .ipa_validation import inspect_ipa
+
+		# One client (connection pool and cached token) for the duplicate check, the direct upload, the processing wait and adding the build to groups
+		api_client = AppStoreConnectClient(app_store_connect_api_key_issuer_id, app_store_connect_api_key_id, app_store_connect_api_key_content, app_store_connect_api_url)
+		if ipa_info is None:
+			ipa_info = inspect_ipa(ipa_path)	# The API needs the bundle id and versions
+
+	try:
+		from .duplicate_build_check import is_duplicate_build_skipped
+		if api_client is not None and is_duplicate_build_skipped(api_client, ipa_info, duplicate_build_check):
+			return
+
+		with host_upload_slot(cache_directory, max_host_uploads, upload_priority), \
+				span("upload", **{"upload.backend": upload_backend, "ipa.name": ipa_path.name, "ipa.size_bytes": ipa_size}):
+			# Made once we have a host upload slot, so time spent queueing doesn't count against MAX_TOTAL_UPLOAD_SECONDS
+			retry_policy = RetryPolicy(max_upload_attempts, attempt_timeout_seconds, retry_base_delay, retry_max_delay, retry_jitter, max_total_upload_seconds, min_attempt_timeout)
+			if upload_backend == "pyliot":
+				from pyliot.upload_to_testflight import upload_to_testflight as pyliot_upload_to_testflight
+
+				def attempt_upload(attempt: int, timeout: float) -> None:
+					print(f"Upload attempt {attempt}/{max_upload_attempts} ({ipa_path.name})")
+					pyliot_upload_to_testflight(
+						app_store_connect_api_key_issuer_id=app_store_connect_api_key_issuer_id,
+						app_store_connect_api_key_id=app_store_connect_api_key_id,
+						app_store_connect_api_key_content=app_store_connect_api_key_content,
+						ipa_path=ipa_path,
+						changelog=changelog,
+						groups=backend_groups,
+						max_upload_attempts=1,	# Retrying (with backoff) is done by run_with_retries
+						attempt_timeout_seconds=int(timeout),
+						show_fastlane_logs=show_fastlane_logs
+					)
+
+				run_with_retries(recorder.wrap(attempt_upload), retry_policy)
+			elif upload_backend == "pilot":
+				import asyncio
+				from .upload_to_testflight_async import upload_ipa_async
+
+				asyncio.run(upload_ipa_async(
+					app_store_connect_api_key_issuer_id,
+					app_store_connect_api_key_id,
+					app_store_connect_api_key_content,
+					ipa_path,
+					changelog,
+					backend_groups,
+					retry_policy,
+					show_fastlane_logs,
+					pilot_command,
+					failure_log_kb=failure_log_kb,
+					progress_interval=progress_interval,
+					attempt_recorder=recorder
+				))
+			elif upload_backend == "direct":
+				from .direct_upload import direct_upload_state_path, upload_ipa_direct
+				from .upload_throttling import upload_bucket
+
+				state_path = direct_upload_state_path(cache_directory, fingerprint)
+				bucket = upload_bucket(max_upload_mb_per_second)
+
+				def attempt_direct_upload(attempt: int, timeout: float) -> None:
+					print(f"Upload attempt {attempt}/{max_upload_attempts} ({ipa_path.name})")
+					upload_ipa_direct(api_client, ipa_path, ipa_info, state_path, max_parallel_chunks, timeout, bucket=bucket)
+
+				run_with_retries(recorder.wrap(attempt_direct_upload), retry_policy)
+
+		ledger.record_upload(fingerprint, ipa_path, git_commit=git_commit, **(ipa_info.ledger_columns() if ipa_info else {}))
+		if packaged_ipa is not None:
+			packaged_ipa.uploaded(fingerprint)
+
+		if wait_for_processing:
+			from .build_processing import wait_for_build_processing
+
+			# The upload is done and recorded, so App Store Connect being briefly unreachable here doesn't fail the run (see build_processing)
+			processing = wait_for_build_processing(
+				api_client, None, ipa_info.short_version, ipa_info.build_version, max_processing_wait, bundle_id=ipa_info.bundle_id
+			)
+			ledger.record_processing(fingerprint, processing.state, processing.duration)
+			if processing.failed:
+				raise RuntimeError(f"App Store Connect couldn't process {ipa_info}: {processing.state}")
+			if processing.processed:
+				print(f"{ipa_info} finished processing in {processing.duration:.0f}s")
+			else:
+				message = f"{ipa_info} still isn't processed ({processing.state or 'not listed yet'}) after {processing.duration:.0f}s"
+				if assign_groups_with_api:
+					raise TimeoutError(f"{message}, so it hasn't been added to {', '.join(groups)}")
+				if set_changelog_with_api:
+					raise TimeoutError(f"{message}, so its changelog hasn't been set")
+				print(f"{message}, not waiting any longer (MAX_PROCESSING_WAIT={max_processing_wait})")
+
+		if set_changelog_with_api:
+			from .testflight_distribution import set_build_changelog
+
+			set_build_changelog(api_client, processing.build_id, changelog)	# Before the groups, so testers are told what's new
+
+		if assign_groups_with_api:
+			from .testflight_distribution import distribute_build
+
+			with span("testflight.distribute", **{"groups.count": len(groups)}):
+				distribute_build(api_client, processing.app_id, processing.build_id, groups, max_parallel_requests)
+	finally:
+		if api_client is not None:
+			api_client.close()
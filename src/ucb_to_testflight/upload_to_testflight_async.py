@@ -0,0 +1,215 @@
+"""
+asyncio version of upload_to_testflight that drives fastlane pilot itself instead of going through pyliot.
+
+Each attempt is visible (PilotAttemptResult), output streams a line at a time into an UploadLogCapture (only the tail is kept,
+progress becomes MB/s), attempt_timeout kills the whole pilot process group, and the caller's event loop stays free so other work (changelog prep, .ipa validation, ...) can overlap with the upload.
+"""
+import asyncio
+import tempfile
+from pathlib import Path
+from typing import Callable, Optional
+
+from .build_file_finder import BuildFileFinder
+from .cache_directory import default_cache_directory
+from .changelog import check_changelog_source, read_changelog_file
+from .ipa_validation import IpaInfo, check_ipa_info, inspect_ipa
+from .pilot import DEFAULT_PILOT_COMMAND, PilotAttemptResult, build_pilot_arguments, run_pilot_attempt, write_api_key_file
+from .retry_policy import RetryPolicy, UploadAttemptError, run_with_retries_async
+from .tracing import current_span, span
+from .upload_history import HISTORY_FILE_NAME, AttemptRecorder, UploadHistory, default_agent_name, plan_attempt_timeout
+from .upload_ledger import LEDGER_FILE_NAME, UploadLedger, fingerprint_file, is_upload_skipped
+from .upload_log import DEFAULT_FAILURE_LOG_KB, DEFAULT_PROGRESS_INTERVAL, UploadLogCapture
+from .upload_throttling import host_upload_slot_async
+
+
+async def upload_to_testflight_async(
+    app_store_connect_api_key_issuer_id: str,
+    app_store_connect_api_key_id: str,
+    app_store_connect_api_key_content: str,
+    output_directory: Path,
+    changelog_path: Path,
+    groups: list[str] = [],
+    max_upload_attempts: int = 10,
+    attempt_timeout_seconds: int = 600,
+    show_fastlane_logs: bool = False,
+    search_recursively: bool = False,
+    max_search_depth: int = 4,
+    force: bool = False,
+    cache_directory: Path = default_cache_directory(),
+    retry_base_delay: float = 10,
+    retry_max_delay: float = 300,
+    retry_jitter: float = 0.5,
+    max_total_upload_seconds: int = 0,
+    pilot_command: str = DEFAULT_PILOT_COMMAND,
+    expected_bundle_id: str = "",
+    skip_ipa_validation: bool = False,
+    changelog_source: str = "file",
+    changelog_repository: Path = Path("."),
+    changelog_commit_types: list[str] = ["feat", "fix", "perf"],
+    changelog_max_length: int = 4000,
+    failure_log_kb: int = DEFAULT_FAILURE_LOG_KB,
+    progress_interval: float = DEFAULT_PROGRESS_INTERVAL,
+    adaptive_attempt_timeout: bool = True,
+    min_attempt_timeout: int = 120,
+    max_attempt_timeout: int = 3600,
+    agent_name: str = "",
+    max_host_uploads: int = 0,
+    upload_priority: int = 0,
+) -> list[PilotAttemptResult]:
+    """
+    upload_to_testflight's arguments for the pilot backend, which this always uses. It doesn't do the rest of what
+    upload_to_testflight can: dry_run, the duplicate build check, waiting for processing, adding groups with the API
+    (pilot adds them) and the direct backend's arguments (max_parallel_chunks, app_store_connect_api_url, max_upload_mb_per_second...).
+    Returns the attempts made (empty if the upload was skipped).
+    """
+    check_changelog_source(changelog_source)
+
+    # Reading the changelog and scanning for the .ipa don't depend on each other
+    changelog, ipa_path = await asyncio.gather(
+        asyncio.to_thread(lambda: _read_changelog_file_traced(changelog_path) if changelog_source == "file" else None),
+        asyncio.to_thread(lambda: BuildFileFinder(output_directory, ".ipa", search_recursively, max_search_depth).file_path),
+    )
+
+    ledger = UploadLedger(cache_directory / LEDGER_FILE_NAME)
+    packaged_ipa = None
+    if ipa_path.suffix.lower() == ".xcarchive":
+        from .ipa_packager import PackagedIpa
+        packaged_ipa = PackagedIpa(cache_directory, ipa_path)
+        if await asyncio.to_thread(packaged_ipa.is_upload_skipped, ledger, force):
+            return []
+        ipa_path = await asyncio.to_thread(packaged_ipa.package)
+
+    # Validation only touches the zip's central directory so it's done long before the fingerprint (which reads everything)
+    ipa_size = ipa_path.stat().st_size
+
+    def inspect() -> Optional[IpaInfo]:
+        if skip_ipa_validation:
+            return None
+        with span("ipa.validate", **{"ipa.size_bytes": ipa_size}):
+            return inspect_ipa(ipa_path)
+
+    def fingerprint_ipa() -> str:
+        with span("ipa.fingerprint", **{"ipa.size_bytes": ipa_size}):
+            return fingerprint_file(ipa_path)
+
+    ipa_info, fingerprint = await asyncio.gather(asyncio.to_thread(inspect), asyncio.to_thread(fingerprint_ipa))
+    if is_upload_skipped(ledger, fingerprint, ipa_path, force):
+        return []
+    if ipa_info:
+        check_ipa_info(ipa_info, expected_bundle_id, ledger, fingerprint)
+        print(f"Validated {ipa_path.name}: {ipa_info}")
+
+    git_commit = None
+    if changelog_source == "git":
+        from .git_changelog import changelog_since_last_upload
+        with span("changelog.read", **{"changelog.source": changelog_source}) as current:
+            changelog, git_commit = await asyncio.to_thread(
+                changelog_since_last_upload,
+                changelog_repository, ledger, ipa_info.bundle_id if ipa_info else None, cache_directory, changelog_commit_types, changelog_max_length,
+            )
+            current.set_attribute("changelog.length", len(changelog))
+
+    history = UploadHistory(cache_directory / HISTORY_FILE_NAME)
+    agent_name = agent_name or default_agent_name()
+    if adaptive_attempt_timeout:
+        attempt_timeout_seconds = plan_attempt_timeout(history, ipa_size, agent_name, attempt_timeout_seconds, min_attempt_timeout, max_attempt_timeout)
+    async with host_upload_slot_async(cache_directory, max_host_uploads, upload_priority):
+        retry_policy = RetryPolicy(max_upload_attempts, attempt_timeout_seconds, retry_base_delay, retry_max_delay, retry_jitter, max_total_upload_seconds, min_attempt_timeout)
+        with span("upload", **{"upload.backend": "pilot", "ipa.name": ipa_path.name, "ipa.size_bytes": ipa_size}) as current:
+            attempts = await upload_ipa_async(
+                app_store_connect_api_key_issuer_id,
+                app_store_connect_api_key_id,
+                app_store_connect_api_key_content,
+                ipa_path,
+                changelog,
+                groups,
+                retry_policy,
+                show_fastlane_logs,
+                pilot_command,
+                failure_log_kb=failure_log_kb,
+                progress_interval=progress_interval,
+                attempt_recorder=AttemptRecorder(history, agent_name, "pilot", ipa_path),
+            )
+            current.set_attribute("upload.attempts", len(attempts))
+
+    ledger.record_upload(fingerprint, ipa_path, git_commit=git_commit, **(ipa_info.ledger_columns() if ipa_info else {}))
+    if packaged_ipa is not None:
+        packaged_ipa.uploaded(fingerprint)
+    return attempts
+
+
+def _read_changelog_file_traced(changelog_path: Path) -> str:
+    with span("changelog.read", **{"changelog.source": "file"}) as current:
+        changelog = read_changelog_file(changelog_path)
+        current.set_attribute("changelog.length", len(changelog))
+    return changelog
+
+
+async def upload_ipa_async(
+    app_store_connect_api_key_issuer_id: str,
+    app_store_connect_api_key_id: str,
+    app_store_connect_api_key_content: str,
+    ipa_path: Path,
+    changelog: str,
+    groups: list[str] = [],
+    retry_policy: Optional[RetryPolicy] = None,
+    show_fastlane_logs: bool = False,
+    pilot_command: str = DEFAULT_PILOT_COMMAND,
+    on_line: Optional[Callable[[str, str], None]] = None,
+    failure_log_kb: int = DEFAULT_FAILURE_LOG_KB,
+    progress_interval: float = DEFAULT_PROGRESS_INTERVAL,
+    attempt_recorder: Optional[AttemptRecorder] = None,
+) -> list[PilotAttemptResult]:
+    """
+    Upload an already found .ipa, retrying as retry_policy says.
+    on_line(stream_name, line) gets every line of pilot output.
+    The last failure_log_kb of a failed attempt's output is printed (all of it is with show_fastlane_logs).
+    Every attempt is recorded by attempt_recorder, if given.
+    Raises FatalUploadError for failures that retrying won't fix, RuntimeError when out of attempts/time.
+    """
+    retry_policy = retry_policy or RetryPolicy()
+    attempts = []
+    with tempfile.TemporaryDirectory(prefix="ucb-to-testflight-") as key_directory:
+        api_key_path = write_api_key_file(
+            Path(key_directory),
+            app_store_connect_api_key_issuer_id,
+            app_store_connect_api_key_id,
+            app_store_connect_api_key_content,
+        )
+        arguments = build_pilot_arguments(pilot_command, api_key_path, ipa_path, changelog, groups)
+        ipa_size = ipa_path.stat().st_size
+
+        async def attempt_upload(attempt: int, timeout: float) -> None:
+            print(f"Upload attempt {attempt}/{retry_policy.max_attempts} ({ipa_path.name})")
+            capture = UploadLogCapture(failure_log_kb, ipa_size, show_fastlane_logs, progress_interval)
+
+            def handle_line(stream_name: str, line: str) -> None:
+                capture.handle_line(stream_name, line)
+                if on_line:
+                    on_line(stream_name, line)
+
+            result = await run_pilot_attempt(arguments, timeout, handle_line, attempt)
+            result.bytes_uploaded = capture.bytes_uploaded
+            result.bytes_per_second = capture.bytes_per_second
+            attempts.append(result)
+            current = current_span()
+            current.set_attribute("pilot.return_code", result.return_code)
+            if result.bytes_uploaded is not None:
+                current.set_attribute("upload.bytes_uploaded", result.bytes_uploaded)
+            if result.bytes_per_second is not None:
+                current.set_attribute("upload.bytes_per_second", round(result.bytes_per_second))
+            if result.succeeded:
+                throughput = f" ({result.bytes_per_second / 1000 ** 2:.1f} MB/s)" if result.bytes_per_second else ""
+                print(f"Upload attempt {attempt} succeeded in {result.duration:.1f}s{throughput}")
+                return
+
+            reason = f"timed out after {timeout:.0f}s" if result.timed_out else f"exited with {result.return_code}"
+            print(f"Upload attempt {attempt} {reason}")
+            output = capture.tail()
+            if not show_fastlane_logs and output:
+                print(output)
+            raise UploadAttemptError(f"pilot {reason}", output, result.timed_out)
+
+        await run_with_retries_async(attempt_recorder.wrap_async(attempt_upload) if attempt_recorder else attempt_upload, retry_policy)
+
+    return attempts
@@ -1,12 +1,93 @@
+import sys
+
+from . import tracing
 from .upload_parameters import UploadParameters
 from .upload_to_testflight import upload_to_testflight
 
 
 def upload_to_testflight_cmd_entry():
+    tracing.begin()
     parameters = UploadParameters()
     parameters.load()
-    upload_to_testflight(*parameters.get_values())
+    tracing.configure(parameters.trace_path, parameters.timings)
+
+    try:
+        if parameters.watch:
+            return _watch(parameters)
+        if parameters.google_play_package_name or parameters.symbol_upload_url:
+            return _upload_all_platforms(parameters)
+
+        if parameters.use_daemon:
+            from .upload_daemon import upload_via_daemon
+            with tracing.span("daemon.upload") as current:
+                succeeded = upload_via_daemon(parameters.daemon_socket, parameters)
+                current.set_attribute("daemon.reachable", succeeded is not None)
+            if succeeded is not None:
+                if not succeeded:
+                    raise SystemExit(1)
+                return
+
+        upload_to_testflight(*parameters.get_values())
+    finally:
+        if parameters.timings:
+            tracing.print_timings()
+
+
+def _watch(parameters: UploadParameters) -> None:
+    import time
+    from .batch_upload import print_batch_summary
+    from .build_watcher import watch_and_upload
+
+    start = time.monotonic()
+    results = watch_and_upload(parameters)
+    if results:
+        print_batch_summary(results, time.monotonic() - start)
+    if not all(result.succeeded for result in results):
+        raise SystemExit(1)
+
+
+def _upload_all_platforms(parameters: UploadParameters) -> None:
+    import time
+    from .batch_upload import print_batch_summary
+    from .multi_platform_upload import upload_all_platforms
+
+    start = time.monotonic()
+    results = upload_all_platforms(parameters)
+    print_batch_summary(results, time.monotonic() - start)
+    if not all(result.succeeded for result in results):
+        raise SystemExit(1)
+
+
+def serve_cmd_entry():
+    from .upload_daemon import DaemonParameters, serve
+
+    parameters = DaemonParameters()
+    parameters.load()
+    serve(parameters.daemon_socket, parameters.max_concurrent_uploads)
+
+
+def history_cmd_entry():
+    import time
+    from .upload_history import HISTORY_FILE_NAME, HistoryParameters, UploadHistory, print_history_summary
+
+    parameters = HistoryParameters()
+    parameters.load()
+    history = UploadHistory(parameters.cache_directory / HISTORY_FILE_NAME)
+    since = time.time() - parameters.history_days * 24 * 60 * 60 if parameters.history_days > 0 else 0
+    print_history_summary(history.summarize(since))
+
+
+def main():
+    """ `ucb-to-testflight serve [...]` starts the upload daemon, `history [...]` prints upload stats, anything else is an upload. """
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        sys.argv.pop(1)
+        serve_cmd_entry()
+    elif len(sys.argv) > 1 and sys.argv[1] == "history":
+        sys.argv.pop(1)
+        history_cmd_entry()
+    else:
+        upload_to_testflight_cmd_entry()
 
 
 if __name__ == "__main__":
-    upload_to_testflight_cmd_entry()
+    main()
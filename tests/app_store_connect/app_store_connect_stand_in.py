@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+A local stand-in for the parts of the App Store Connect API our backends use, so they can be exercised offline.
+
+It checks the bearer token (ES256 signature, audience, expiry) the way App Store Connect does, hands out upload
+operations that point back at itself, and records what it was sent. Chunk failures and latency can be injected.
+Committed uploads become builds that finish processing after processing_seconds; builds can be added to beta groups and given a changelog.
+
+Run it directly to point a real upload at it:
+    python3 -m tests.app_store_connect.app_store_connect_stand_in --bundle-id com.example.game
+prints the APP_STORE_CONNECT_API_URL and writes a matching API key.
+"""
+
+from __future__ import annotations
+
+import base64
+from http.server import BaseHTTPRequestHandler
+import json
+import threading
+import time
+import urllib.parse
+
+from ..http_stand_in import HttpStandIn
+
+
+def generate_api_key() -> tuple:
+    """ (private key PEM text, public key) for a throwaway P-256 API key. """
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    pem = private_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()).decode()
+    return pem, private_key.public_key()
+
+
+def _base64url_decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class AppStoreConnectStandIn(HttpStandIn):
+    """ with AppStoreConnectStandIn(public_key, {"com.example.game": "app-1"}) as server: ... server.base_url ... """
+
+    def __init__(self, public_key, apps: dict, chunk_size: int = 64 * 1024, key_id: str = "KEY123", issuer_id: str = "issuer") -> None:
+        super().__init__()
+        self.public_key = public_key
+        self.apps = dict(apps)
+        self.chunk_size = chunk_size
+        self.key_id = key_id
+        self.issuer_id = issuer_id
+        self.chunk_latency = 0.0
+        self.fail_chunks = {}       # offset -> how many more PUTs of it fail with fail_status
+        self.fail_status = 500
+        self.fail_build_lists = 0   # How many more build list GETs fail with 503
+        self.processing_seconds = 0.0
+        self.request_latency = 0.0  # Added to every API request
+        self.supports_etags = True  # Build lists get an ETag and honour If-None-Match
+        self.not_modified = 0       # 304s sent
+
+        self.requests = []          # (method, path) of API calls
+        self.tokens = []            # Every bearer token seen
+        self.build_uploads = {}     # id -> attributes
+        self.files = {}             # id -> {"size", "chunks": {offset: bytes}, "committed": attributes or None, "build_upload"}
+        self.chunk_puts = []        # (file id, offset) of every chunk PUT, including failed ones
+        self.builds = {}            # id -> {"app", "short_version", "version", "ready_at", "state"}
+        self.beta_groups = {}       # id -> {"app", "name", "builds": [build ids]}
+        self.beta_build_localizations = {}  # id -> {"build", "locale", "whatsNew"}
+        self.active_requests = 0
+        self.max_active_requests = 0
+        self.connections = 0
+        self._sockets = []
+        self.active_chunk_puts = 0
+        self.max_active_chunk_puts = 0
+
+    def add_build(self, app_id: str, short_version: str, version: str, processing_seconds: float = 0.0, state: str = "") -> str:
+        """ A build as if it had been uploaded. It's PROCESSING for processing_seconds, then state (VALID by default). """
+        with self.lock:
+            build_id = f"build-{len(self.builds) + 1}"
+            self.builds[build_id] = {
+                "app": app_id, "short_version": short_version, "version": version,
+                "ready_at": time.time() + processing_seconds, "state": state or "VALID",
+            }
+        return build_id
+
+    def add_beta_group(self, app_id: str, name: str) -> str:
+        with self.lock:
+            group_id = f"group-{len(self.beta_groups) + 1}"
+            self.beta_groups[group_id] = {"app": app_id, "name": name, "builds": []}
+        return group_id
+
+    def drop_connections(self) -> None:
+        """ Close every connection from this end, like a server side keep-alive timeout. """
+        import socket
+
+        with self.lock:
+            sockets, self._sockets = self._sockets, []
+        for connection in sockets:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def uploaded_bytes(self, file_id: str) -> bytes:
+        chunks = self.files[file_id]["chunks"]
+        return b"".join(chunks[offset] for offset in sorted(chunks))
+
+    # --- Request handling ---
+
+    def _connected(self, handler: BaseHTTPRequestHandler) -> None:
+        with self.lock:
+            self.connections += 1
+            self._sockets.append(handler.connection)
+
+    def _handle(self, handler: BaseHTTPRequestHandler, method: str) -> None:
+        body = handler.rfile.read(int(handler.headers.get("Content-Length") or 0))
+        url = urllib.parse.urlsplit(handler.path)
+        parts = url.path.strip("/").split("/")
+
+        if parts[0] == "upload":
+            return self._put_chunk(handler, parts[1], int(parts[2]), body)
+
+        with self.lock:
+            self.requests.append((method, url.path))
+            self.active_requests += 1
+            self.max_active_requests = max(self.max_active_requests, self.active_requests)
+        try:
+            time.sleep(self.request_latency)
+            self._handle_api(handler, method, url, parts, body)
+        finally:
+            with self.lock:
+                self.active_requests -= 1
+
+    def _handle_api(self, handler: BaseHTTPRequestHandler, method: str, url, parts: list, body: bytes) -> None:
+        if not self._authorized(handler.headers.get("Authorization", "")):
+            return self._respond(handler, 401, {"errors": [{"status": "401", "code": "NOT_AUTHORIZED", "detail": "Authentication credentials are missing or invalid."}]})
+
+        document = json.loads(body) if body else None
+        query = dict(urllib.parse.parse_qsl(url.query))
+        route = (method, "/".join(parts[:2]))
+        if route == ("GET", "v1/apps"):
+            bundle_id = query.get("filter[bundleId]")
+            apps = [{"type": "apps", "id": app_id, "attributes": {"bundleId": bundle_id}} for known, app_id in self.apps.items() if known == bundle_id]
+            return self._respond(handler, 200, {"data": apps})
+        if route == ("POST", "v1/buildUploads"):
+            return self._create_build_upload(handler, document["data"])
+        if route == ("POST", "v1/buildUploadFiles"):
+            return self._create_file(handler, document["data"])
+        if route == ("PATCH", "v1/buildUploadFiles") and len(parts) == 3:
+            return self._commit_file(handler, parts[2], document["data"])
+        if route == ("GET", "v1/builds") and parts[3:] == ["betaBuildLocalizations"]:
+            return self._list_localizations(handler, parts[2])
+        if route == ("GET", "v1/builds"):
+            return self._list_builds(handler, query)
+        if route == ("GET", "v1/betaGroups"):
+            names = query.get("filter[name]", "").split(",")
+            groups = [
+                {"type": "betaGroups", "id": group_id, "attributes": {"name": group["name"]}}
+                for group_id, group in self.beta_groups.items() if group["app"] == query.get("filter[app]") and group["name"] in names
+            ]
+            return self._respond(handler, 200, {"data": groups})
+        if route == ("POST", "v1/betaGroups") and parts[3:] == ["relationships", "builds"]:
+            return self._add_builds_to_group(handler, parts[2], document["data"])
+        if route == ("POST", "v1/betaBuildLocalizations"):
+            return self._create_localization(handler, document["data"])
+        if route == ("PATCH", "v1/betaBuildLocalizations") and len(parts) == 3:
+            return self._update_localization(handler, parts[2], document["data"])
+        return self._respond(handler, 404, {"errors": [{"status": "404", "code": "NOT_FOUND", "detail": f"No route for {method} {url.path}"}]})
+
+    def _authorized(self, authorization: str) -> bool:
+        from cryptography.exceptions import InvalidSignature
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.asymmetric import ec
+        from cryptography.hazmat.primitives.asymmetric.utils import encode_dss_signature
+
+        if not authorization.startswith("Bearer "):
+            return False
+        token = authorization[len("Bearer "):]
+        try:
+            header_text, payload_text, signature_text = token.split(".")
+            header = json.loads(_base64url_decode(header_text))
+            payload = json.loads(_base64url_decode(payload_text))
+            signature = _base64url_decode(signature_text)
+            der = encode_dss_signature(int.from_bytes(signature[:32], "big"), int.from_bytes(signature[32:], "big"))
+            self.public_key.verify(der, f"{header_text}.{payload_text}".encode(), ec.ECDSA(hashes.SHA256()))
+        except (ValueError, InvalidSignature):
+            return False
+        with self.lock:
+            self.tokens.append(token)
+        now = time.time()
+        return (
+            header.get("alg") == "ES256" and header.get("kid") == self.key_id
+            and payload.get("iss") == self.issuer_id and payload.get("aud") == "appstoreconnect-v1"
+            and payload["iat"] <= now + 60 and now < payload["exp"] and payload["exp"] - payload["iat"] <= 1200
+        )
+
+    def _create_build_upload(self, handler: BaseHTTPRequestHandler, data: dict) -> None:
+        with self.lock:
+            build_upload_id = f"build-upload-{len(self.build_uploads) + 1}"
+            self.build_uploads[build_upload_id] = dict(data["attributes"], app=data["relationships"]["app"]["data"]["id"])
+        self._respond(handler, 201, {"data": {"type": "buildUploads", "id": build_upload_id, "attributes": data["attributes"]}})
+
+    def _create_file(self, handler: BaseHTTPRequestHandler, data: dict) -> None:
+        size = data["attributes"]["fileSize"]
+        with self.lock:
+            file_id = f"file-{len(self.files) + 1}"
+            self.files[file_id] = {"size": size, "chunks": {}, "committed": None, "build_upload": data["relationships"]["buildUpload"]["data"]["id"]}
+        operations = [
+            {
+                "method": "PUT",
+                "url": f"{self.base_url}/upload/{file_id}/{offset}",
+                "offset": offset,
+                "length": min(self.chunk_size, size - offset),
+                "requestHeaders": [{"name": "Content-Type", "value": "application/octet-stream"}],
+            }
+            for offset in range(0, size, self.chunk_size)
+        ]
+        attributes = dict(data["attributes"], uploadOperations=operations)
+        self._respond(handler, 201, {"data": {"type": "buildUploadFiles", "id": file_id, "attributes": attributes}})
+
+    def _put_chunk(self, handler: BaseHTTPRequestHandler, file_id: str, offset: int, body: bytes) -> None:
+        with self.lock:
+            self.chunk_puts.append((file_id, offset))
+            self.active_chunk_puts += 1
+            self.max_active_chunk_puts = max(self.max_active_chunk_puts, self.active_chunk_puts)
+            failing = self.fail_chunks.get(offset, 0) > 0
+            if failing:
+                self.fail_chunks[offset] -= 1
+        try:
+            time.sleep(self.chunk_latency)
+        finally:
+            with self.lock:
+                self.active_chunk_puts -= 1
+        if failing:
+            return self._respond(handler, self.fail_status, None)
+        with self.lock:
+            self.files[file_id]["chunks"][offset] = body
+        self._respond(handler, 200, None)
+
+    def _list_builds(self, handler: BaseHTTPRequestHandler, query: dict) -> None:
+        with self.lock:
+            failing = self.fail_build_lists > 0
+            self.fail_build_lists -= failing
+        if failing:
+            return self._respond(handler, 503, {"errors": [{"status": "503", "code": "UNAVAILABLE", "detail": "Try again later."}]})
+        now = time.time()
+        builds = []
+        for build_id, build in self.builds.items():
+            if build["app"] != query.get("filter[app]") or build["version"] != query.get("filter[version]"):
+                continue
+            if "filter[preReleaseVersion.version]" in query and build["short_version"] != query["filter[preReleaseVersion.version]"]:
+                continue
+            state = build["state"] if now >= build["ready_at"] else "PROCESSING"
+            builds.append({"type": "builds", "id": build_id, "attributes": {"version": build["version"], "processingState": state}})
+        document = {"data": builds}
+        if not self.supports_etags:
+            return self._respond(handler, 200, document)
+
+        import hashlib
+        etag = '"' + hashlib.sha1(json.dumps(document, sort_keys=True).encode()).hexdigest() + '"'
+        if handler.headers.get("If-None-Match") == etag:
+            with self.lock:
+                self.not_modified += 1
+            return self._respond(handler, 304, None, {"ETag": etag})
+        self._respond(handler, 200, document, {"ETag": etag})
+
+    def _add_builds_to_group(self, handler: BaseHTTPRequestHandler, group_id: str, data: list) -> None:
+        group = self.beta_groups.get(group_id)
+        if group is None:
+            return self._respond(handler, 404, {"errors": [{"status": "404", "code": "NOT_FOUND", "detail": group_id}]})
+        for build in data:
+            if build["id"] not in self.builds:
+                return self._respond(handler, 409, {"errors": [{"status": "409", "code": "ENTITY_ERROR", "detail": f"No build {build['id']}"}]})
+        with self.lock:
+            group["builds"].extend(build["id"] for build in data)
+        self._respond(handler, 204, None)
+
+    def _list_localizations(self, handler: BaseHTTPRequestHandler, build_id: str) -> None:
+        if build_id not in self.builds:
+            return self._respond(handler, 404, {"errors": [{"status": "404", "code": "NOT_FOUND", "detail": build_id}]})
+        localizations = [
+            {"type": "betaBuildLocalizations", "id": localization_id, "attributes": {"locale": localization["locale"]}}
+            for localization_id, localization in self.beta_build_localizations.items() if localization["build"] == build_id
+        ]
+        self._respond(handler, 200, {"data": localizations})
+
+    def _create_localization(self, handler: BaseHTTPRequestHandler, data: dict) -> None:
+        build_id = data["relationships"]["build"]["data"]["id"]
+        locale = data["attributes"]["locale"]
+        with self.lock:
+            if build_id not in self.builds or any(known["build"] == build_id and known["locale"] == locale for known in self.beta_build_localizations.values()):
+                return self._respond(handler, 409, {"errors": [{"status": "409", "code": "ENTITY_ERROR", "detail": f"Can't add {locale} to {build_id}"}]})
+            localization_id = f"localization-{len(self.beta_build_localizations) + 1}"
+            self.beta_build_localizations[localization_id] = dict(data["attributes"], build=build_id)
+        self._respond(handler, 201, {"data": {"type": "betaBuildLocalizations", "id": localization_id, "attributes": data["attributes"]}})
+
+    def _update_localization(self, handler: BaseHTTPRequestHandler, localization_id: str, data: dict) -> None:
+        localization = self.beta_build_localizations.get(localization_id)
+        if localization is None:
+            return self._respond(handler, 404, {"errors": [{"status": "404", "code": "NOT_FOUND", "detail": localization_id}]})
+        with self.lock:
+            localization.update(data["attributes"])
+        self._respond(handler, 200, {"data": {"type": "betaBuildLocalizations", "id": localization_id, "attributes": localization}})
+
+    def _commit_file(self, handler: BaseHTTPRequestHandler, file_id: str, data: dict) -> None:
+        import hashlib
+
+        upload_file = self.files.get(file_id)
+        if upload_file is None:
+            return self._respond(handler, 404, {"errors": [{"status": "404", "code": "NOT_FOUND", "detail": file_id}]})
+        contents = self.uploaded_bytes(file_id)
+        checksum = data["attributes"]["sourceFileChecksums"]["file"]["hash"]
+        if len(contents) != upload_file["size"] or hashlib.md5(contents).hexdigest() != checksum:
+            return self._respond(handler, 409, {"errors": [{"status": "409", "code": "ENTITY_ERROR", "detail": "Checksum mismatch"}]})
+        upload_file["committed"] = data["attributes"]
+        build_upload = self.build_uploads[upload_file["build_upload"]]
+        self.add_build(build_upload["app"], build_upload["cfBundleShortVersionString"], build_upload["cfBundleVersion"], self.processing_seconds)
+        self._respond(handler, 200, {"data": {"type": "buildUploadFiles", "id": file_id, "attributes": data["attributes"]}})
+
+def main() -> None:
+    import argparse
+    from pathlib import Path
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bundle-id", required=True)
+    parser.add_argument("--key-path", default="stand_in_api_key.p8")
+    arguments = parser.parse_args()
+
+    pem, public_key = generate_api_key()
+    Path(arguments.key_path).write_text(pem)
+    with AppStoreConnectStandIn(public_key, {arguments.bundle_id: "app-1"}) as server:
+        print(f"APP_STORE_CONNECT_API_URL={server.base_url}")
+        print(f"APP_STORE_CONNECT_API_KEY_ID={server.key_id} APP_STORE_CONNECT_API_KEY_ISSUER_ID={server.issuer_id}")
+        print(f"APP_STORE_CONNECT_API_KEY_CONTENT is in {arguments.key_path}. Ctrl+C to stop.")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
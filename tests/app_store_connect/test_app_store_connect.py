@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import unittest
+
+from ucb_to_testflight.app_store_connect import AppStoreConnectClient, AppStoreConnectError
+from ucb_to_testflight.http_connection_pool import HttpConnectionPool
+from ucb_to_testflight.retry_policy import find_fatal_failure
+
+from .app_store_connect_stand_in import AppStoreConnectStandIn, generate_api_key
+
+
+class AppStoreConnectClientTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.key_content, public_key = generate_api_key()
+        self.server = AppStoreConnectStandIn(public_key, {"com.example.game": "app-1"}).start()
+        self.addCleanup(self.server.stop)
+
+    def test_signed_token_is_accepted(self) -> None:
+        client = AppStoreConnectClient("issuer", "KEY123", self.key_content, self.server.base_url)
+        self.addCleanup(client.close)
+
+        self.assertEqual(client.find_app_id("com.example.game"), "app-1")
+
+    def test_token_signed_with_another_key_is_rejected_as_fatal(self) -> None:
+        other_key, _ = generate_api_key()
+        client = AppStoreConnectClient("issuer", "KEY123", other_key, self.server.base_url)
+        self.addCleanup(client.close)
+
+        with self.assertRaises(AppStoreConnectError) as raised:
+            client.find_app_id("com.example.game")
+
+        self.assertEqual(raised.exception.status, 401)
+        self.assertIsNotNone(find_fatal_failure(str(raised.exception)))
+
+    def test_unknown_bundle_id(self) -> None:
+        client = AppStoreConnectClient("issuer", "KEY123", self.key_content, self.server.base_url)
+        self.addCleanup(client.close)
+
+        with self.assertRaises(AppStoreConnectError) as raised:
+            client.find_app_id("com.example.other")
+        self.assertIn("com.example.other", str(raised.exception))
+
+    def test_pool_reuses_keep_alive_connections(self) -> None:
+        with HttpConnectionPool() as pool:
+            client = AppStoreConnectClient("issuer", "KEY123", self.key_content, self.server.base_url, pool)
+            for _ in range(5):
+                client.find_app_id("com.example.game")
+
+        self.assertEqual(pool.connections_opened, 1)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_pool_replaces_connections_the_server_closed(self) -> None:
+        with HttpConnectionPool() as pool:
+            client = AppStoreConnectClient("issuer", "KEY123", self.key_content, self.server.base_url, pool)
+            client.find_app_id("com.example.game")
+            self.server.drop_connections()
+
+            self.assertEqual(client.find_app_id("com.example.game"), "app-1")
+        self.assertEqual(pool.connections_opened, 2)
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import io
+from contextlib import redirect_stdout
+from pathlib import Path
+import tempfile
+import unittest
+
+from ucb_to_testflight.app_store_connect import AppStoreConnectClient, AppStoreConnectError, TokenCache
+from ucb_to_testflight.build_processing import ProcessingPollSchedule, wait_for_build_processing
+from ucb_to_testflight.upload_ledger import UploadLedger
+from ucb_to_testflight.upload_to_testflight import LEDGER_FILE_NAME, upload_to_testflight
+
+from ..support import FakeClock, write_ipa
+from .app_store_connect_stand_in import AppStoreConnectStandIn, generate_api_key
+
+
+class ProcessingPollScheduleTests(unittest.TestCase):
+    def test_intervals_grow_up_to_the_maximum(self) -> None:
+        schedule = ProcessingPollSchedule(initial_interval=5, backoff=2, max_interval=30, jitter=0)
+
+        self.assertEqual([schedule.interval_after(poll) for poll in range(1, 6)], [5, 10, 20, 30, 30])
+
+    def test_jitter_only_shortens_intervals(self) -> None:
+        schedule = ProcessingPollSchedule(initial_interval=10, backoff=1, jitter=0.2, random_source=lambda: 1.0)
+
+        self.assertAlmostEqual(schedule.interval_after(1), 8)
+
+
+class WaitForBuildProcessingTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.key_content, public_key = generate_api_key()
+        self.server = AppStoreConnectStandIn(public_key, {"com.example.game": "app-1"}).start()
+        self.addCleanup(self.server.stop)
+        self.client = AppStoreConnectClient("issuer", "KEY123", self.key_content, self.server.base_url, token_cache=TokenCache())
+        self.addCleanup(self.client.close)
+        self.time = FakeClock()
+
+    def _wait(self, **kwargs):
+        with redirect_stdout(io.StringIO()):
+            return wait_for_build_processing(
+                self.client, kwargs.pop("app_id", "app-1"), "1.0", "7",
+                **{"schedule": ProcessingPollSchedule(jitter=0), "clock": self.time, "sleep": self.time.sleep, **kwargs},
+            )
+
+    def test_returns_as_soon_as_the_build_is_valid(self) -> None:
+        build_id = self.server.add_build("app-1", "1.0", "7", state="VALID")
+
+        result = self._wait()
+
+        self.assertTrue(result.processed)
+        self.assertEqual(result.build_id, build_id)
+        self.assertEqual((result.polls, self.time.sleeps), (1, []))
+
+    def test_unchanged_polls_are_not_modified_responses(self) -> None:
+        self.server.add_build("app-1", "1.0", "7", processing_seconds=3600)
+
+        result = self._wait(max_wait=120)
+
+        self.assertEqual(result.state, "PROCESSING")
+        self.assertFalse(result.processed)
+        self.assertEqual(result.not_modified, result.polls - 1)
+        self.assertEqual(self.server.not_modified, result.not_modified)
+
+    def test_stops_at_max_wait_with_backed_off_polls(self) -> None:
+        self.server.add_build("app-1", "1.0", "7", processing_seconds=3600)
+
+        result = self._wait(max_wait=100)
+
+        self.assertEqual(self.time.sleeps, [5, 7.5, 11.25, 16.875, 25.3125, 34.0625])
+        self.assertEqual(result.duration, 100)
+        self.assertEqual(result.polls, 7)   # The last one right at max_wait
+
+    def test_failed_processing_stops_the_wait(self) -> None:
+        self.server.add_build("app-1", "1.0", "7", state="INVALID")
+
+        result = self._wait()
+
+        self.assertTrue(result.failed)
+        self.assertEqual(result.polls, 1)
+
+    def test_unavailable_api_mid_wait_is_polled_again_on_schedule(self) -> None:
+        build_id = self.server.add_build("app-1", "1.0", "7", processing_seconds=3600)
+        self._wait(max_wait=10)   # Seen processing once, so the next polls are conditional
+        self.server.fail_build_lists = 3
+        self.server.builds[build_id]["ready_at"] = 0
+        self.time.sleeps.clear()
+
+        result = self._wait(schedule=ProcessingPollSchedule(initial_interval=5, backoff=2, jitter=0))
+
+        self.assertTrue(result.processed)
+        self.assertEqual((result.polls, result.failed_polls), (4, 3))
+        self.assertEqual(self.time.sleeps, [5, 10, 20])
+
+    def test_non_retryable_error_is_raised(self) -> None:
+        with self.assertRaisesRegex(AppStoreConnectError, "404"):
+            self._wait(app_id=None, bundle_id="com.example.unknown")
+
+    def test_build_that_is_not_listed_yet_is_waited_for(self) -> None:
+        self.server.supports_etags = False
+
+        result = self._wait(max_wait=10)
+
+        self.assertIsNone(result.state)
+        self.assertIsNone(result.build_id)
+        self.assertEqual(result.not_modified, 0)
+
+    def test_upload_records_processing_in_the_ledger(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            write_ipa(root / "build.ipa")
+            (root / "CHANGELOG.txt").write_text("notes")
+
+            with redirect_stdout(io.StringIO()):
+                upload_to_testflight(
+                    "issuer", "KEY123", self.key_content, root, root / "CHANGELOG.txt",
+                    cache_directory=root / "cache",
+                    upload_backend="direct",
+                    wait_for_processing=True,
+                    app_store_connect_api_url=self.server.base_url,
+                )
+
+            upload = UploadLedger(root / "cache" / LEDGER_FILE_NAME).find_build("com.example.game", "1.0", "1")
+
+        self.assertEqual(upload["processing_state"], "VALID")
+        self.assertGreaterEqual(upload["processing_seconds"], 0)
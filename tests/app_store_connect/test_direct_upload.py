@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import hashlib
+import io
+import os
+from contextlib import redirect_stdout
+from pathlib import Path
+import tempfile
+import unittest
+
+from ucb_to_testflight.app_store_connect import AppStoreConnectClient
+from ucb_to_testflight.direct_upload import DirectUploadState, direct_upload_state_path, upload_ipa_direct
+from ucb_to_testflight.ipa_validation import inspect_ipa
+from ucb_to_testflight.retry_policy import UploadAttemptError
+from ucb_to_testflight.upload_ledger import LEDGER_FILE_NAME, UploadLedger, fingerprint_file
+from ucb_to_testflight.upload_to_testflight import upload_to_testflight
+
+from ..support import write_ipa
+from .app_store_connect_stand_in import AppStoreConnectStandIn, generate_api_key
+
+CHUNK_SIZE = 16 * 1024
+
+
+class DirectUploadTests(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+        self.ipa_path = write_ipa(self.root / "build.ipa", executable=os.urandom(10 * CHUNK_SIZE + 123))  # Random, so it's stored at full size
+        self.state_path = direct_upload_state_path(self.root / "cache", fingerprint_file(self.ipa_path))
+
+        self.key_content, public_key = generate_api_key()
+        self.server = AppStoreConnectStandIn(public_key, {"com.example.game": "app-1"}, chunk_size=CHUNK_SIZE).start()
+        self.addCleanup(self.server.stop)
+
+    def _upload(self, **kwargs) -> str:
+        client = AppStoreConnectClient("issuer", "KEY123", self.key_content, self.server.base_url)
+        self.addCleanup(client.close)
+        with redirect_stdout(io.StringIO()):
+            return upload_ipa_direct(client, self.ipa_path, inspect_ipa(self.ipa_path), self.state_path, **kwargs)
+
+    def _chunk_offsets(self) -> list:
+        return list(range(0, self.ipa_path.stat().st_size, CHUNK_SIZE))
+
+    def test_chunks_go_up_in_parallel_over_pooled_connections_and_are_committed(self) -> None:
+        self.server.chunk_latency = 0.05
+
+        build_upload_id = self._upload(max_parallel_chunks=4)
+
+        contents = self.ipa_path.read_bytes()
+        self.assertEqual(self.server.build_uploads[build_upload_id]["cfBundleVersion"], "1")
+        self.assertEqual(self.server.uploaded_bytes("file-1"), contents)
+        self.assertEqual(self.server.files["file-1"]["committed"]["sourceFileChecksums"]["file"]["hash"], hashlib.md5(contents).hexdigest())
+        self.assertEqual(self.server.max_active_chunk_puts, 4)
+        self.assertLessEqual(self.server.connections, 5)   # 4 chunk connections (one reused for the API calls) at most
+        self.assertFalse(self.state_path.exists())
+
+    def test_failed_chunk_leaves_state_that_the_next_attempt_resumes_from(self) -> None:
+        failing_offset = 3 * CHUNK_SIZE
+        self.server.fail_chunks[failing_offset] = 1
+
+        with self.assertRaises(UploadAttemptError):
+            self._upload(max_parallel_chunks=2)
+        state = DirectUploadState.load(self.state_path)
+        self.assertNotIn(3, state.completed)
+        self.assertTrue(state.completed)
+
+        self._upload(max_parallel_chunks=2)
+
+        self.assertEqual(len(self.server.build_uploads), 1)    # Same reservation
+        put_counts = {offset: self.server.chunk_puts.count(("file-1", offset)) for offset in self._chunk_offsets()}
+        self.assertEqual(put_counts, {offset: 2 if offset == failing_offset else 1 for offset in self._chunk_offsets()})
+        self.assertEqual(self.server.uploaded_bytes("file-1"), self.ipa_path.read_bytes())
+        self.assertFalse(self.state_path.exists())
+
+    def test_rejected_reservation_is_dropped_and_made_again(self) -> None:
+        self.server.fail_chunks[0] = 1
+        self.server.fail_status = 403
+
+        with self.assertRaises(UploadAttemptError):
+            self._upload()
+        self.assertFalse(self.state_path.exists())
+
+        self._upload()
+        self.assertEqual(len(self.server.build_uploads), 2)
+        self.assertEqual(self.server.uploaded_bytes("file-2"), self.ipa_path.read_bytes())
+
+    def test_attempt_timeout_keeps_finished_chunks(self) -> None:
+        self.server.chunk_latency = 0.2
+
+        with self.assertRaises(UploadAttemptError) as raised:
+            self._upload(max_parallel_chunks=2, timeout=0.1)
+
+        self.assertTrue(raised.exception.timed_out)
+        self.assertEqual(len(DirectUploadState.load(self.state_path).completed), 2)   # The two in flight when time ran out
+
+    def test_upload_to_testflight_with_direct_backend_retries_and_records_the_upload(self) -> None:
+        self.server.fail_chunks[CHUNK_SIZE] = 2
+        changelog_path = self.root / "CHANGELOG.txt"
+        changelog_path.write_text("notes")
+
+        with redirect_stdout(io.StringIO()):
+            upload_to_testflight(
+                "issuer", "KEY123", self.key_content, self.root, changelog_path,
+                cache_directory=self.root / "cache",
+                upload_backend="direct",
+                retry_base_delay=0,
+                app_store_connect_api_url=self.server.base_url,
+            )
+
+        self.assertEqual(self.server.uploaded_bytes("file-1"), self.ipa_path.read_bytes())
+        self.assertEqual(self.server.chunk_puts.count(("file-1", CHUNK_SIZE)), 3)
+        self.assertEqual(len(self.server.chunk_puts), len(self._chunk_offsets()) + 2)
+        self.assertTrue(UploadLedger(self.root / "cache" / LEDGER_FILE_NAME).is_uploaded(fingerprint_file(self.ipa_path)))
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import io
+from contextlib import redirect_stdout
+from pathlib import Path
+import tempfile
+import time
+import unittest
+
+from ucb_to_testflight.app_store_connect import TOKEN_LIFETIME_SECONDS, AppStoreConnectClient, TokenCache
+from ucb_to_testflight.testflight_distribution import GroupAssignmentError, distribute_build, set_build_changelog
+from ucb_to_testflight.upload_to_testflight import upload_to_testflight
+
+from ..support import write_ipa
+from .app_store_connect_stand_in import AppStoreConnectStandIn, generate_api_key
+
+GROUP_NAMES = [f"Group {index}" for index in range(12)]
+
+
+class TokenCacheTests(unittest.TestCase):
+    def test_token_is_reused_until_shortly_before_it_expires(self) -> None:
+        key_content, _ = generate_api_key()
+        now = [1_000_000.0]
+        cache = TokenCache(refresh_margin=60, clock=lambda: now[0])
+
+        first = cache.token("issuer", "KEY123", key_content)
+        now[0] += TOKEN_LIFETIME_SECONDS - 61
+        self.assertEqual(cache.token("issuer", "KEY123", key_content), first)
+        now[0] += 1
+        self.assertNotEqual(cache.token("issuer", "KEY123", key_content), first)
+        self.assertEqual(cache.signed_count, 2)
+
+    def test_tokens_are_per_key(self) -> None:
+        key_content, _ = generate_api_key()
+        cache = TokenCache()
+
+        self.assertNotEqual(cache.token("issuer", "KEY123", key_content), cache.token("issuer", "KEY456", key_content))
+
+
+class TestFlightDistributionTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.key_content, public_key = generate_api_key()
+        self.server = AppStoreConnectStandIn(public_key, {"com.example.game": "app-1"}).start()
+        self.addCleanup(self.server.stop)
+        self.token_cache = TokenCache()
+        self.client = AppStoreConnectClient("issuer", "KEY123", self.key_content, self.server.base_url, token_cache=self.token_cache)
+        self.addCleanup(self.client.close)
+        self.group_ids = [self.server.add_beta_group("app-1", name) for name in GROUP_NAMES]
+
+    def test_build_is_added_to_every_group_concurrently_with_one_token(self) -> None:
+        build_id = self.server.add_build("app-1", "1.0", "7")
+        self.server.request_latency = 0.1
+
+        start = time.monotonic()
+        with redirect_stdout(io.StringIO()):
+            distribute_build(self.client, "app-1", build_id, GROUP_NAMES, max_parallel_requests=8)
+        duration = time.monotonic() - start
+
+        for group_id in self.group_ids:
+            self.assertEqual(self.server.beta_groups[group_id]["builds"], [build_id])
+        self.assertEqual(self.server.max_active_requests, 8)
+        self.assertLess(duration, 0.1 * (len(GROUP_NAMES) + 1))     # Less than one request after another
+        self.assertEqual(self.token_cache.signed_count, 1)
+        self.assertLessEqual(self.server.connections, 8)
+
+    def test_unknown_groups_are_reported_before_anything_is_assigned(self) -> None:
+        build_id = self.server.add_build("app-1", "1.0", "7")
+
+        with self.assertRaises(GroupAssignmentError) as raised:
+            distribute_build(self.client, "app-1", build_id, ["Group 1", "Nobody"])
+
+        self.assertEqual(list(raised.exception.failures), ["Nobody"])
+        self.assertTrue(all(not group["builds"] for group in self.server.beta_groups.values()))
+
+    def test_changelog_updates_the_builds_localization(self) -> None:
+        build_id = self.server.add_build("app-1", "1.0", "7")
+
+        with redirect_stdout(io.StringIO()):
+            set_build_changelog(self.client, build_id, "first")
+            set_build_changelog(self.client, build_id, "second")
+
+        self.assertEqual(list(self.server.beta_build_localizations.values()), [{"build": build_id, "locale": "en-US", "whatsNew": "second"}])
+
+    def test_direct_upload_sets_the_changelog_and_adds_the_build_to_groups(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            write_ipa(root / "build.ipa")
+            (root / "CHANGELOG.txt").write_text("notes")
+
+            with redirect_stdout(io.StringIO()):
+                upload_to_testflight(
+                    "issuer", "KEY123", self.key_content, root, root / "CHANGELOG.txt",
+                    groups=GROUP_NAMES[:3],
+                    cache_directory=root / "cache",
+                    upload_backend="direct",
+                    app_store_connect_api_url=self.server.base_url,
+                )
+
+        self.assertEqual([group["builds"] for group in self.server.beta_groups.values()], [["build-1"]] * 3 + [[]] * 9)
+        self.assertEqual(list(self.server.beta_build_localizations.values()), [{"build": "build-1", "locale": "en-US", "whatsNew": "notes"}])
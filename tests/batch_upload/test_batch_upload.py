@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from ucb_to_testflight.batch_upload import BatchJob, BatchUploadParameters, load_batch_manifest, run_batch
+from ucb_to_testflight.upload_parameters import UploadParameters
+
+
+class LoadBatchManifestTests(unittest.TestCase):
+    def test_paths_are_relative_to_manifest_and_groups_are_split(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            manifest_path = root / "manifest.json"
+            manifest_path.write_text(json.dumps([
+                {"name": "prod", "output_directory": "prod", "changelog_path": "notes.txt", "groups": "a, b"},
+                {"output_directory": "/abs/staging", "changelog_path": "notes.txt", "max_upload_attempts": 2},
+            ]), encoding="utf-8")
+
+            jobs = load_batch_manifest(manifest_path)
+
+            self.assertEqual([job.name for job in jobs], ["prod", "job-2"])
+            self.assertEqual(jobs[0].overrides["output_directory"], root / "prod")
+            self.assertEqual(jobs[0].overrides["groups"], ["a", "b"])
+            self.assertEqual(jobs[1].overrides["output_directory"], Path("/abs/staging"))
+            self.assertEqual(jobs[1].overrides["max_upload_attempts"], 2)
+
+    def test_rejects_unknown_and_missing_keys(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            manifest_path = Path(tmp) / "manifest.json"
+
+            manifest_path.write_text(json.dumps([{"output_directory": "a", "changelog_path": "b", "colour": "red"}]), encoding="utf-8")
+            with self.assertRaises(ValueError):
+                load_batch_manifest(manifest_path)
+
+            manifest_path.write_text(json.dumps([{"output_directory": "a"}]), encoding="utf-8")
+            with self.assertRaises(ValueError):
+                load_batch_manifest(manifest_path)
+
+
+    def test_changelog_path_is_only_required_for_file_changelogs(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            manifest_path = Path(tmp) / "manifest.json"
+            manifest_path.write_text(json.dumps([{"name": "prod", "output_directory": "prod"}]), encoding="utf-8")
+
+            jobs = load_batch_manifest(manifest_path, changelog_source="git")
+
+            self.assertEqual(jobs[0].overrides, {"output_directory": Path(tmp) / "prod"})
+
+
+class RunBatchTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self._env_patch = patch.dict(os.environ, {
+            "APP_STORE_CONNECT_API_KEY_ISSUER_ID": "issuer",
+            "APP_STORE_CONNECT_API_KEY_ID": "key",
+            "APP_STORE_CONNECT_API_KEY_CONTENT": "content",
+            "BATCH_MANIFEST": "manifest.json",
+            "MAX_UPLOAD_ATTEMPTS": "4",
+        }, clear=True)
+        self._argv_patch = patch("sys.argv", ["test"])
+        self._env_patch.start()
+        self._argv_patch.start()
+        self.addCleanup(self._env_patch.stop)
+        self.addCleanup(self._argv_patch.stop)
+
+    def test_output_directory_and_changelog_are_not_required(self) -> None:
+        parameters = BatchUploadParameters()
+        parameters.load()
+
+        self.assertEqual(parameters.batch_manifest, Path("manifest.json"))
+        self.assertEqual(parameters.max_concurrent_uploads, 2)
+
+    def test_runs_jobs_concurrently_up_to_the_cap_and_keeps_per_job_values(self) -> None:
+        parameters = BatchUploadParameters()
+        parameters.load()
+        names = list(UploadParameters._parameter_names)
+        lock = threading.Lock()
+        running = []
+        peak = []
+        calls = []
+
+        def fake_upload(*values) -> None:
+            with lock:
+                running.append(1)
+                peak.append(len(running))
+                calls.append(values)
+            time.sleep(0.05)
+            with lock:
+                running.pop()
+            if values[names.index("output_directory")] == Path("bad"):
+                raise RuntimeError("upload failed")
+
+        jobs = [
+            BatchJob("a", {"output_directory": Path("a"), "changelog_path": Path("notes.txt")}),
+            BatchJob("b", {"output_directory": Path("bad"), "changelog_path": Path("notes.txt")}),
+            BatchJob("c", {"output_directory": Path("c"), "changelog_path": Path("notes.txt"), "max_upload_attempts": 1}),
+        ]
+
+        results = run_batch(jobs, parameters, max_concurrent_uploads=2, upload=fake_upload)
+
+        self.assertEqual(max(peak), 2)
+        self.assertEqual([result.succeeded for result in results], [True, False, True])
+        self.assertIsInstance(results[1].error, RuntimeError)
+        attempts = {values[names.index("output_directory")]: values[names.index("max_upload_attempts")] for values in calls}
+        self.assertEqual(attempts, {Path("a"): 4, Path("bad"): 4, Path("c"): 1})
+        self.assertTrue(all(len(values) == len(names) for values in calls))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Cold vs warm bootstrap of the upload-to-testflight.sh venv, run the way the script runs it (a fresh python3 process).
+
+ - cold: new venv, everything installed (needs network access, or a wheelhouse)
+ - warm: same venv again, fingerprints match so nothing is installed
+ - unconditional pip: what every run used to cost (pip/setuptools/wheel upgrade and reinstall on an up to date venv)
+
+Usage: python tests/benchmarks/bench_bootstrap.py [wheelhouse_directory]
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = Path(__file__).resolve().parents[2]
+BOOTSTRAP_SCRIPT = ROOT / "src" / "ucb_to_testflight" / "bootstrap.py"
+WARM_REPEATS = 5
+
+
+def timed(command: list[str]) -> float:
+    start = time.perf_counter()
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    wheelhouse = ["--wheelhouse", str(Path(sys.argv[1]).resolve())] if len(sys.argv) > 1 else []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        venv_directory = Path(tmp) / "venv"
+        bootstrap = [sys.executable, str(BOOTSTRAP_SCRIPT), str(venv_directory), *wheelhouse]
+
+        try:
+            cold = timed(bootstrap)
+        except subprocess.CalledProcessError:
+            raise SystemExit("Cold bootstrap failed (no network access? pass a wheelhouse directory)")
+        warm = min(timed(bootstrap) for _ in range(WARM_REPEATS))
+
+        python = str(venv_directory / "bin" / "python3")
+        pip = [python, "-m", "pip", "install", "--disable-pip-version-check", *(["--no-index", "--find-links", wheelhouse[1]] if wheelhouse else [])]
+        unconditional = timed([*pip, "--upgrade", "setuptools", "wheel"]) + timed([*pip, "--no-build-isolation", "-e", str(ROOT)])
+        if not wheelhouse:
+            unconditional += timed([*pip, "--upgrade", "pip"])
+
+    print(f"  cold bootstrap             {cold:8.2f} s")
+    print(f"  warm bootstrap (best of {WARM_REPEATS}) {warm * 1000:8.1f} ms")
+    print(f"  unconditional pip          {unconditional:8.2f} s  ({unconditional / warm:.0f}x warm)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Compares BuildFileFinder against the old listdir + Path.is_dir()/is_file() finder on a synthetic UCB output tree.
+
+Usage: python tests/benchmarks/bench_build_file_finder.py [entry_count]
+"""
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+import sys
+import tempfile
+import time
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT / "src"))
+
+from ucb_to_testflight.build_file_finder import BuildFileFinder  # noqa: E402
+
+DEFAULT_ENTRY_COUNT = 100_000
+REPEATS = 5
+
+
+def legacy_search_path(root: Path, file_extension: str, recursive: bool = False):
+    """ The finder as it was before the scandir rewrite. """
+    for file_name in os.listdir(root):
+        file_path = Path(os.path.join(root, file_name))
+
+        if file_path.is_dir() and recursive:
+            yield from legacy_search_path(file_path, file_extension, recursive)
+
+        if not file_path.is_file(): continue
+        if not file_path.suffix.lower() == file_extension: continue
+
+        yield file_path
+
+
+def build_tree(root: Path, entry_count: int) -> None:
+    """
+    Half the entries are loose files next to the .ipa (bundles, logs, stale build files),
+    the other half are inside dSYM bundles and an .xcarchive - the stuff a recursive search should skip.
+    """
+    loose_count = entry_count // 2
+    for index in range(loose_count):
+        (root / f"asset_{index}.bundle").touch()
+
+    per_dsym = 1000
+    nested_count = entry_count - loose_count
+    for dsym_index in range(max(1, nested_count // per_dsym)):
+        dsym = root / f"Plugin{dsym_index}.framework.dSYM" / "Contents" / "Resources"
+        dsym.mkdir(parents=True)
+        for index in range(per_dsym):
+            (dsym / f"symbols_{index}").touch()
+
+    (root / "build.ipa").write_bytes(b"ipa")
+
+
+def time_best_of(function) -> float:
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    entry_count = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ENTRY_COUNT
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        print(f"Building synthetic tree with {entry_count} entries in {root}...")
+        build_tree(root, entry_count)
+
+        results = {
+            "legacy (top level)": time_best_of(lambda: list(legacy_search_path(root, ".ipa"))),
+            "scandir (top level)": time_best_of(lambda: BuildFileFinder(root, ".ipa")),
+            "legacy (recursive)": time_best_of(lambda: list(legacy_search_path(root, ".ipa", recursive=True))),
+            "scandir (recursive, pruned)": time_best_of(lambda: BuildFileFinder(root, ".ipa", recursive=True)),
+        }
+
+    print(f"\nBest of {REPEATS} runs:")
+    for name, seconds in results.items():
+        print(f"  {name:<28} {seconds * 1000:9.2f} ms")
+    print(f"\nTop level speedup: {results['legacy (top level)'] / results['scandir (top level)']:.1f}x")
+    print(f"Recursive speedup: {results['legacy (recursive)'] / results['scandir (recursive, pruned)']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Startup time of the command entry point, measured with python -X importtime.
+
+Fails (exit code 1) if
+ - importing ucb_to_testflight for --help takes longer than the budget, or
+ - --help imports any part of the upload stack.
+
+Usage: python tests/benchmarks/bench_import_time.py [budget_milliseconds]
+"""
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+import subprocess
+import sys
+import time
+
+ROOT = Path(__file__).resolve().parents[2]
+SRC_ROOT = ROOT / "src"
+
+DEFAULT_BUDGET_MILLISECONDS = 100
+REPEATS = 7
+FORBIDDEN_MODULES = ("pyliot", "asyncio", "sqlite3", "hashlib", "plistlib", "dotenv", "python_command_line_helpers", "python_pretty_print")
+HELP_COMMAND = ["-m", "ucb_to_testflight.upload_to_testflight_cmd_entry", "--help"]
+
+
+def run_python(arguments: list[str]) -> subprocess.CompletedProcess:
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [str(SRC_ROOT), os.environ.get("PYTHONPATH")]))}
+    return subprocess.run([sys.executable, *arguments], capture_output=True, text=True, env=env)
+
+
+def parse_importtime(stderr: str) -> dict:
+    """ top level module name -> cumulative microseconds, for modules imported directly by __main__ or runpy. """
+    cumulative = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        try:
+            _, cumulative_text, name = line.split(":", 1)[1].split("|")
+            cumulative_microseconds = int(cumulative_text)
+        except ValueError:
+            continue    # Header line
+        if not name.startswith("  "):  # Indented names are nested imports, already counted by their parent
+            cumulative[name.strip()] = cumulative_microseconds
+    return cumulative
+
+
+def imported_module_roots(stderr: str) -> set:
+    roots = set()
+    for line in stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            roots.add(line.rsplit("|", 1)[1].strip().split(".")[0])
+    return roots
+
+
+def best_wall_time(arguments: list[str]) -> float:
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        run_python(arguments)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_BUDGET_MILLISECONDS
+
+    best_package_import = float("inf")
+    forbidden = set()
+    for _ in range(REPEATS):
+        process = run_python(["-X", "importtime", *HELP_COMMAND])
+        if process.returncode != 0:
+            print(process.stderr)
+            raise SystemExit("--help failed")
+        cumulative = parse_importtime(process.stderr)
+        package_import = sum(microseconds for name, microseconds in cumulative.items() if name.startswith("ucb_to_testflight"))
+        best_package_import = min(best_package_import, package_import / 1000)
+        forbidden |= imported_module_roots(process.stderr) & set(FORBIDDEN_MODULES)
+
+    interpreter = best_wall_time(["-c", "pass"])
+    help_wall = best_wall_time(HELP_COMMAND)
+
+    print(f"Best of {REPEATS} runs:")
+    print(f"  python -c pass            {interpreter * 1000:8.1f} ms")
+    print(f"  --help (wall)             {help_wall * 1000:8.1f} ms")
+    print(f"  --help over interpreter   {(help_wall - interpreter) * 1000:8.1f} ms")
+    print(f"  ucb_to_testflight imports {best_package_import:8.1f} ms (budget {budget:g} ms)")
+
+    failures = []
+    if forbidden:
+        failures.append(f"--help imported {', '.join(sorted(forbidden))}")
+    if best_package_import > budget:
+        failures.append(f"ucb_to_testflight imports took {best_package_import:.1f} ms, budget is {budget:g} ms")
+
+    if failures:
+        print("\nREGRESSION:\n  " + "\n  ".join(failures))
+        raise SystemExit(1)
+    print("\nOK")
+
+
+if __name__ == "__main__":
+    main()
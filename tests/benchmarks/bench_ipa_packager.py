@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Compares packaging an .xcarchive with package_xcarchive (ParallelZipWriter) against `zip -r` and a plain zipfile loop
+on a synthetic Unity-like app bundle: a big compressible binary, compressible data files, already-compressed assets
+and thousands of small files.
+
+Usage: python tests/benchmarks/bench_ipa_packager.py [app_megabytes]
+"""
+
+from __future__ import annotations
+
+import contextlib
+import io
+import os
+from pathlib import Path
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT / "src"))
+
+from ucb_to_testflight.ipa_packager import package_xcarchive  # noqa: E402
+
+DEFAULT_APP_MEGABYTES = 256
+SMALL_FILE_COUNT = 5_000
+
+
+def _compressible(size: int, seed: int) -> bytes:
+    """ Roughly as compressible as machine code: repeats, but not too neatly. """
+    generator = random.Random(seed)
+    words = [bytes(generator.getrandbits(8) for _ in range(generator.randint(2, 12))) for _ in range(4096)]
+    parts = []
+    length = 0
+    while length < size:
+        word = words[generator.randrange(len(words))]
+        parts.append(word)
+        length += len(word)
+    return b"".join(parts)[:size]
+
+
+def build_xcarchive(root: Path, app_megabytes: int) -> Path:
+    xcarchive = root / "Game.xcarchive"
+    app = xcarchive / "Products" / "Applications" / "Game.app"
+    (app / "Frameworks" / "UnityFramework.framework").mkdir(parents=True)
+    (app / "Data" / "Raw").mkdir(parents=True)
+    (app / "Data" / "Small").mkdir(parents=True)
+
+    total = app_megabytes * 1024 * 1024
+    block = _compressible(8 * 1024 * 1024, 1)
+
+    def write_compressible(path: Path, size: int) -> None:
+        with open(path, "wb") as file:
+            for offset in range(0, size, len(block)):
+                file.write(block[:min(len(block), size - offset)])
+
+    write_compressible(app / "Frameworks" / "UnityFramework.framework" / "UnityFramework", total * 3 // 10)
+    write_compressible(app / "Game", total // 20)
+    for index in range(8):
+        write_compressible(app / "Data" / f"level{index}", total * 3 // 80)
+    for index in range(8):
+        (app / "Data" / "Raw" / f"assets{index}.bundle").write_bytes(os.urandom(total * 3 // 80))
+    (app / "Assets.car").write_bytes(os.urandom(total // 20))
+    for index in range(SMALL_FILE_COUNT):
+        (app / "Data" / "Small" / f"file{index}.json").write_bytes(block[index * 97:index * 97 + 2048])
+    return xcarchive
+
+
+def time_zip_r(xcarchive: Path, output: Path) -> float:
+    staging = output.parent / "zip_staging"
+    (staging / "Payload").mkdir(parents=True)
+    app = next((xcarchive / "Products" / "Applications").glob("*.app"))
+    os.symlink(app, staging / "Payload" / app.name)     # zip follows links, so nothing is copied
+    start = time.perf_counter()
+    subprocess.run(["zip", "-q", "-r", str(output), "Payload"], cwd=staging, check=True)
+    return time.perf_counter() - start
+
+
+def time_zipfile(xcarchive: Path, output: Path) -> float:
+    app = next((xcarchive / "Products" / "Applications").glob("*.app"))
+    start = time.perf_counter()
+    with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as archive:
+        for directory, _, file_names in os.walk(app):
+            for file_name in sorted(file_names):
+                path = Path(directory) / file_name
+                archive.write(path, "Payload/" + str(path.relative_to(app.parent)))
+    return time.perf_counter() - start
+
+
+def time_packager(xcarchive: Path, output: Path, max_workers: int) -> float:
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        package_xcarchive(xcarchive, output, max_workers)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    app_megabytes = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_APP_MEGABYTES
+    cores = os.cpu_count() or 1
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        print(f"Building a {app_megabytes} MB synthetic .xcarchive in {root}...")
+        xcarchive = build_xcarchive(root, app_megabytes)
+
+        results = {}
+        if shutil.which("zip"):
+            results["zip -r"] = (time_zip_r(xcarchive, root / "zip.ipa"), root / "zip.ipa")
+        else:
+            print("zip isn't installed, skipping zip -r")
+        results["zipfile"] = (time_zipfile(xcarchive, root / "zipfile.ipa"), root / "zipfile.ipa")
+        results["package_xcarchive (1 thread)"] = (time_packager(xcarchive, root / "one.ipa", 1), root / "one.ipa")
+        if cores > 1:
+            results[f"package_xcarchive ({cores} threads)"] = (time_packager(xcarchive, root / "many.ipa", cores), root / "many.ipa")
+
+        print()
+        for name, (seconds, path) in results.items():
+            print(f"  {name:<32} {seconds:7.2f} s  {path.stat().st_size / 1024 ** 2:8.1f} MB")
+        baseline_name = "zip -r" if "zip -r" in results else "zipfile"
+        fastest = min(seconds for name, (seconds, _) in results.items() if name.startswith("package_xcarchive"))
+        print(f"\nSpeedup over {baseline_name}: {results[baseline_name][0] / fastest:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Stands in for `fastlane pilot upload` (PILOT_COMMAND="python3 tests/benchmarks/fake_pilot.py") so whole uploads can be timed offline.
+
+Behaviour comes from environment variables:
+  FAKE_PILOT_LATENCY         seconds each attempt takes (default 0)
+  FAKE_PILOT_LINES           lines of output per attempt, spread over the latency (default 20)
+  FAKE_PILOT_FAIL_ATTEMPTS   how many attempts fail before one succeeds (default 0)
+  FAKE_PILOT_FAILURE_OUTPUT  what a failing attempt prints last (default a retryable network error)
+  FAKE_PILOT_STATE           file counting attempts across invocations (required with FAKE_PILOT_FAIL_ATTEMPTS)
+"""
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+import sys
+import time
+
+
+def _argument(name: str) -> str:
+    arguments = sys.argv[1:]
+    if name not in arguments or arguments.index(name) + 1 >= len(arguments):
+        raise SystemExit(f"fake pilot: missing {name}")
+    return arguments[arguments.index(name) + 1]
+
+
+def _next_attempt(state_path: str) -> int:
+    if not state_path:
+        return 1
+    path = Path(state_path)
+    attempt = int(path.read_text() or 0) + 1 if path.exists() else 1
+    path.write_text(str(attempt))
+    return attempt
+
+
+def main() -> None:
+    ipa_path = Path(_argument("--ipa"))
+    if not Path(_argument("--api_key_path")).exists() or not ipa_path.exists():
+        raise SystemExit("fake pilot: api key or .ipa missing")
+
+    latency = float(os.environ.get("FAKE_PILOT_LATENCY", "0"))
+    line_count = max(1, int(os.environ.get("FAKE_PILOT_LINES", "20")))
+    fail_attempts = int(os.environ.get("FAKE_PILOT_FAIL_ATTEMPTS", "0"))
+    attempt = _next_attempt(os.environ.get("FAKE_PILOT_STATE", ""))
+
+    for index in range(line_count):
+        print(f"[fake pilot] uploading {ipa_path.name}: {(index + 1) * 100 // line_count}%", flush=True)
+        time.sleep(latency / line_count)
+
+    if attempt <= fail_attempts:
+        print(os.environ.get("FAKE_PILOT_FAILURE_OUTPUT", "[fake pilot] Connection reset by peer"), file=sys.stderr, flush=True)
+        raise SystemExit(1)
+    print("[fake pilot] Successfully uploaded the new binary to App Store Connect", flush=True)
+
+
+if __name__ == "__main__":
+    main()
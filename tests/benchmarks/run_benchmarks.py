@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Times the stages of an upload and compares them to a stored baseline.
+
+Cases:
+  parameters_load                 UploadParameters.load from env vars
+  build_file_finder_<n>           recursive BuildFileFinder on synthetic trees of n entries
+  changelog_file                  read_changelog_file
+  git_changelog_cold/warm         generate_git_changelog over a synthetic history, empty and filled commit cache
+  cmd_entry_upload*               upload_to_testflight_cmd_entry in a fresh process, uploading through fake_pilot.py
+                                  (the pilot backend). These report overhead: wall time minus the fake pilot's latency.
+
+Results (median seconds per case) are written as JSON. Each case is compared to baseline.json and
+counts as a regression when it is both `ratio` times slower and `min_delta_seconds` slower than its baseline.
+
+Usage: python tests/benchmarks/run_benchmarks.py [--quick] [--output FILE] [--baseline FILE] [--update-baseline]
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import os
+from pathlib import Path
+import platform
+import plistlib
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable
+from unittest.mock import patch
+import zipfile
+
+ROOT = Path(__file__).resolve().parents[2]
+SRC_ROOT = ROOT / "src"
+BENCHMARKS_ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(SRC_ROOT))
+sys.path.insert(0, str(BENCHMARKS_ROOT))
+
+from bench_build_file_finder import build_tree  # noqa: E402
+from ucb_to_testflight.build_file_finder import BuildFileFinder  # noqa: E402
+from ucb_to_testflight.changelog import read_changelog_file  # noqa: E402
+from ucb_to_testflight.git_changelog import CHANGELOG_CACHE_FILE_NAME, generate_git_changelog  # noqa: E402
+from ucb_to_testflight.upload_parameters import UploadParameters  # noqa: E402
+
+DEFAULT_BASELINE_PATH = BENCHMARKS_ROOT / "baseline.json"
+DEFAULT_OUTPUT_PATH = ROOT / "benchmark_results.json"
+DEFAULT_THRESHOLD = {"ratio": 1.5, "min_delta_seconds": 0.01}
+
+FINDER_SIZES = (1_000, 10_000, 100_000)
+QUICK_FINDER_SIZES = (1_000, 10_000)
+GIT_HISTORY_COMMITS = 2_000
+FAKE_PILOT_LATENCY = 0.5     # seconds per attempt
+REPEATS = 7
+QUICK_REPEATS = 3
+UPLOAD_REPEATS = 3
+
+CREDENTIALS = {
+    "APP_STORE_CONNECT_API_KEY_ISSUER_ID": "issuer",
+    "APP_STORE_CONNECT_API_KEY_ID": "key",
+    "APP_STORE_CONNECT_API_KEY_CONTENT": "content",
+}
+
+
+def median_seconds(function: Callable[[], None], repeats: int, setup: Callable[[], None] = lambda: None) -> float:
+    timings = []
+    for _ in range(repeats):
+        setup()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def write_ipa(path: Path, build_version: str = "1") -> Path:
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("Payload/Game.app/Info.plist", plistlib.dumps({
+            "CFBundleIdentifier": "com.example.game",
+            "CFBundleShortVersionString": "1.0",
+            "CFBundleVersion": build_version,
+            "CFBundleExecutable": "Game",
+        }))
+        archive.writestr("Payload/Game.app/Game", os.urandom(64 * 1024))
+    return path
+
+
+def write_git_history(repository: Path, commit_count: int) -> None:
+    """ commit_count empty commits in one git fast-import, far quicker than committing one at a time. """
+    subprocess.run(["git", "init", "-q", str(repository)], check=True)
+    types = ("feat", "fix", "chore", "perf", "docs", "refactor")
+    stream = io.StringIO()
+    for index in range(commit_count):
+        message = f"{types[index % len(types)]}(area{index % 7}): Change number {index}\n".encode("utf-8")
+        stream.write(f"commit refs/heads/main\ncommitter Dev <dev@example.com> {1_700_000_000 + index} +0000\n")
+        stream.write(f"data {len(message)}\n{message.decode('utf-8')}\n")
+    subprocess.run(["git", "-C", str(repository), "fast-import", "--quiet"], input=stream.getvalue(), text=True, check=True)
+    subprocess.run(["git", "-C", str(repository), "symbolic-ref", "HEAD", "refs/heads/main"], check=True)
+
+
+def bench_parameters_load(root: Path, repeats: int) -> dict:
+    env = {**CREDENTIALS, "OUTPUT_DIRECTORY": str(root), "CHANGELOG_PATH": str(root / "notes.txt"), "GROUPS": "qa,clients"}
+    with patch.dict(os.environ, env), patch("sys.argv", ["bench", "--max-upload-attempts", "3"]):
+        return {"parameters_load": median_seconds(lambda: UploadParameters().load(), repeats)}
+
+
+def bench_build_file_finder(root: Path, sizes: tuple, repeats: int) -> dict:
+    results = {}
+    for size in sizes:
+        tree = root / f"tree_{size}"
+        tree.mkdir()
+        build_tree(tree, size)
+        results[f"build_file_finder_{size}"] = median_seconds(lambda: BuildFileFinder(tree, ".ipa", recursive=True).file_path, repeats)
+    return results
+
+
+def bench_changelogs(root: Path, repeats: int) -> dict:
+    changelog_path = root / "notes.txt"
+    changelog_path.write_text("- Fixed things\n" * 250, encoding="utf-8")
+
+    repository = root / "history"
+    cache_directory = root / "changelog_cache"
+    write_git_history(repository, GIT_HISTORY_COMMITS)
+
+    def clear_cache() -> None:
+        (cache_directory / CHANGELOG_CACHE_FILE_NAME).unlink(missing_ok=True)
+
+    generate = lambda: generate_git_changelog(repository, cache_directory, None)  # noqa: E731
+    return {
+        "changelog_file": median_seconds(lambda: read_changelog_file(changelog_path), repeats),
+        "git_changelog_cold": median_seconds(generate, repeats, setup=clear_cache),
+        "git_changelog_warm": median_seconds(generate, repeats),
+    }
+
+
+def run_cmd_entry_upload(root: Path, fail_attempts: int = 0, failure_output: str = "") -> tuple:
+    """ One upload in a fresh interpreter. Returns (completed process, wall seconds, attempts made). """
+    build_directory = root / "build"
+    build_directory.mkdir(exist_ok=True)
+    write_ipa(build_directory / "Game.ipa")
+    (root / "notes.txt").write_text("Release notes", encoding="utf-8")
+    state_path = root / "fake_pilot_attempts"
+    state_path.unlink(missing_ok=True)
+    shutil.rmtree(root / "cache", ignore_errors=True)    # Every run is a first upload
+
+    env = {
+        **os.environ,
+        **CREDENTIALS,
+        "PYTHONPATH": os.pathsep.join(filter(None, [str(SRC_ROOT), os.environ.get("PYTHONPATH")])),
+        "OUTPUT_DIRECTORY": str(build_directory),
+        "CHANGELOG_PATH": str(root / "notes.txt"),
+        "CACHE_DIRECTORY": str(root / "cache"),
+        "USE_DAEMON": "false",
+        "UPLOAD_BACKEND": "pilot",
+        "WAIT_FOR_PROCESSING": "false",
+        "DUPLICATE_BUILD_CHECK": "off",
+        "PILOT_COMMAND": f"{sys.executable} {BENCHMARKS_ROOT / 'fake_pilot.py'}",
+        "RETRY_BASE_DELAY": "0",
+        "FAKE_PILOT_LATENCY": str(FAKE_PILOT_LATENCY),
+        "FAKE_PILOT_FAIL_ATTEMPTS": str(fail_attempts),
+        "FAKE_PILOT_STATE": str(state_path),
+    }
+    if failure_output:
+        env["FAKE_PILOT_FAILURE_OUTPUT"] = failure_output
+
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-m", "ucb_to_testflight.upload_to_testflight_cmd_entry"],
+        env=env,
+        cwd=root,
+        capture_output=True,
+        text=True,
+    )
+    wall = time.perf_counter() - start
+    attempts = int(state_path.read_text()) if state_path.exists() else 0
+    return process, wall, attempts
+
+
+def bench_cmd_entry(root: Path, repeats: int) -> dict:
+    cases = {
+        "cmd_entry_upload": {"expected_attempts": 1, "succeeds": True},
+        "cmd_entry_upload_two_retries": {"fail_attempts": 2, "expected_attempts": 3, "succeeds": True},
+        "cmd_entry_upload_fatal_failure": {
+            "fail_attempts": 99,
+            "failure_output": "ERROR ITMS-4238: Redundant Binary Upload",
+            "expected_attempts": 1,
+            "succeeds": False,
+        },
+    }
+
+    results = {}
+    for name, case in cases.items():
+        overheads = []
+        for _ in range(repeats):
+            process, wall, attempts = run_cmd_entry_upload(root, case.get("fail_attempts", 0), case.get("failure_output", ""))
+            if (process.returncode == 0) != case["succeeds"] or attempts != case["expected_attempts"]:
+                print(process.stdout[-2000:], process.stderr[-2000:], sep="\n")
+                raise SystemExit(f"{name}: exit code {process.returncode} after {attempts} attempts, expected {case['expected_attempts']}")
+            overheads.append(wall - attempts * FAKE_PILOT_LATENCY)
+        results[name] = statistics.median(overheads)
+    return results
+
+
+def compare_to_baseline(results: dict, baseline: dict) -> list[str]:
+    thresholds = baseline.get("thresholds", {})
+    default = {**DEFAULT_THRESHOLD, **thresholds.get("default", {})}
+    regressions = []
+    for name, seconds in results.items():
+        if name not in baseline.get("results", {}):
+            continue
+        threshold = {**default, **thresholds.get("cases", {}).get(name, {})}
+        expected = baseline["results"][name]
+        if seconds > expected * threshold["ratio"] and seconds - expected > threshold["min_delta_seconds"]:
+            regressions.append(f"{name}: {seconds * 1000:.1f} ms, baseline {expected * 1000:.1f} ms (allowed x{threshold['ratio']:g})")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--quick", action="store_true", help="fewer repeats and smaller trees (for a quick local check)")
+    parser.add_argument("--output", default=str(DEFAULT_OUTPUT_PATH), help="where to write the results JSON")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE_PATH))
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the new baseline (thresholds are kept)")
+    arguments = parser.parse_args()
+
+    repeats = QUICK_REPEATS if arguments.quick else REPEATS
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        for stage in ("parameters", "finder", "changelog", "upload"):
+            (root / stage).mkdir()
+        results.update(bench_parameters_load(root / "parameters", repeats))
+        results.update(bench_build_file_finder(root / "finder", QUICK_FINDER_SIZES if arguments.quick else FINDER_SIZES, repeats))
+        results.update(bench_changelogs(root / "changelog", repeats))
+        results.update(bench_cmd_entry(root / "upload", 1 if arguments.quick else UPLOAD_REPEATS))
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created_at": time.time(),
+        "results": results,
+    }
+    Path(arguments.output).write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+
+    baseline_path = Path(arguments.baseline)
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8")) if baseline_path.exists() else {}
+
+    print(f"{'case':<34} {'median':>10} {'baseline':>10}")
+    for name, seconds in results.items():
+        expected = baseline.get("results", {}).get(name)
+        expected_text = f"{expected * 1000:8.1f}ms" if expected is not None else "-"
+        print(f"{name:<34} {seconds * 1000:8.1f}ms {expected_text:>10}")
+    print(f"\nResults written to {arguments.output}")
+
+    if arguments.update_baseline:
+        baseline_path.write_text(json.dumps({**report, "thresholds": baseline.get("thresholds", {"default": DEFAULT_THRESHOLD})}, indent=2) + "\n", encoding="utf-8")
+        print(f"Baseline updated: {baseline_path}")
+        return
+
+    regressions = compare_to_baseline(results, baseline)
+    if regressions:
+        print("\nREGRESSION:\n  " + "\n  ".join(regressions))
+        raise SystemExit(1)
+    print("OK" if baseline else f"No baseline at {baseline_path} (create one with --update-baseline)")
+
+
+if __name__ == "__main__":
+    main()
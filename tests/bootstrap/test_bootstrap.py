@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+from contextlib import redirect_stdout
+import io
+from pathlib import Path
+import subprocess
+import tempfile
+import unittest
+import zipfile
+
+from ucb_to_testflight.bootstrap import BUILD_REQUIREMENTS, STAMP_FILE_NAME, bootstrap, input_fingerprint, venv_python, wheelhouse_distributions
+
+
+class BootstrapTests(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        root = Path(tmp.name)
+
+        self.project = root / "project"
+        self.project.mkdir()
+        (self.project / "pyproject.toml").write_text('[project]\nname = "thing"\ndependencies = ["a"]\n', encoding="utf-8")
+
+        # Enough of a venv that bootstrap doesn't try to create one
+        self.venv = root / "venv"
+        (self.venv / "bin").mkdir(parents=True)
+        (self.venv / "bin" / "python3").write_text("")
+        (self.venv / "pyvenv.cfg").write_text("home = /usr/bin\nversion = 3.12.1\n", encoding="utf-8")
+        self.site_packages = self.venv / "lib" / "python3.12" / "site-packages"
+        self.site_packages.mkdir(parents=True)
+
+        self.commands = []
+
+    def _run(self, command: list) -> None:
+        """ Stands in for pip. Installing leaves a dist-info behind like the real thing. """
+        self.commands.append(command)
+        (self.site_packages / "thing-0.1.0.dist-info").mkdir(exist_ok=True)
+
+    def test_second_run_skips_install(self) -> None:
+        self.assertTrue(bootstrap(self.project, self.venv, run=self._run))
+        install_count = len(self.commands)
+
+        self.assertFalse(bootstrap(self.project, self.venv, run=self._run))
+        self.assertEqual(len(self.commands), install_count)
+        self.assertTrue((self.venv / STAMP_FILE_NAME).exists())
+
+    def test_pyproject_change_reinstalls(self) -> None:
+        bootstrap(self.project, self.venv, run=self._run)
+        (self.project / "pyproject.toml").write_text('[project]\nname = "thing"\ndependencies = ["a", "b"]\n', encoding="utf-8")
+
+        self.assertTrue(bootstrap(self.project, self.venv, run=self._run))
+
+    def test_venv_changed_by_hand_reinstalls(self) -> None:
+        bootstrap(self.project, self.venv, run=self._run)
+        (self.site_packages / "thing-0.1.0.dist-info").rmdir()
+
+        self.assertTrue(bootstrap(self.project, self.venv, run=self._run))
+
+    def test_force_reinstalls(self) -> None:
+        bootstrap(self.project, self.venv, run=self._run)
+
+        self.assertTrue(bootstrap(self.project, self.venv, force=True, run=self._run))
+
+    def test_wheelhouse_is_part_of_the_fingerprint(self) -> None:
+        wheelhouse = self.project.parent / "wheels"
+        wheelhouse.mkdir()
+        (wheelhouse / "a-1.0-py3-none-any.whl").write_bytes(b"wheel")
+        bootstrap(self.project, self.venv, wheelhouse, run=self._run)
+
+        before = input_fingerprint(self.project, self.venv, wheelhouse)
+        (wheelhouse / "a-1.1-py3-none-any.whl").write_bytes(b"newer wheel")
+        self.assertNotEqual(input_fingerprint(self.project, self.venv, wheelhouse), before)
+        self.assertTrue(bootstrap(self.project, self.venv, wheelhouse, run=self._run))
+
+
+# An in-tree build backend, so installing the project needs nothing from the network (or the wheelhouse) to build it
+_BACKEND = """
+import os, zipfile
+
+def get_requires_for_build_editable(config_settings=None):
+    return []
+
+def build_editable(wheel_directory, config_settings=None, metadata_directory=None):
+    name = "thing-0.1.0-py3-none-any.whl"
+    files = {
+        "thing.pth": os.path.dirname(os.path.abspath(__file__)) + "\\n",
+        "thing-0.1.0.dist-info/METADATA": "Metadata-Version: 2.1\\nName: thing\\nVersion: 0.1.0\\nRequires-Dist: dep @ git+https://example.invalid/dep.git\\n",
+        "thing-0.1.0.dist-info/WHEEL": "Wheel-Version: 1.0\\nGenerator: test\\nRoot-Is-Purelib: true\\nTag: py3-none-any\\n",
+    }
+    with zipfile.ZipFile(os.path.join(wheel_directory, name), "w") as wheel:
+        for path, content in files.items():
+            wheel.writestr(path, content)
+        wheel.writestr("thing-0.1.0.dist-info/RECORD", "".join(f"{path},,\\n" for path in [*files, "thing-0.1.0.dist-info/RECORD"]))
+    return name
+"""
+
+
+def _write_wheel(wheelhouse: Path, name: str, version: str, module: str = "") -> None:
+    dist_info = f"{name}-{version}.dist-info"
+    files = {
+        f"{dist_info}/METADATA": f"Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n",
+        f"{dist_info}/WHEEL": "Wheel-Version: 1.0\nGenerator: test\nRoot-Is-Purelib: true\nTag: py3-none-any\n",
+    }
+    if module:
+        files[f"{name}.py"] = module
+    with zipfile.ZipFile(wheelhouse / f"{name}-{version}-py3-none-any.whl", "w") as wheel:
+        for path, content in files.items():
+            wheel.writestr(path, content)
+        wheel.writestr(f"{dist_info}/RECORD", "".join(f"{path},,\n" for path in [*files, f"{dist_info}/RECORD"]))
+
+
+class OfflineBootstrapTests(unittest.TestCase):
+    def test_project_with_a_git_dependency_installs_from_the_wheelhouse(self) -> None:
+        """ Real pip, no network: the git dependency must come from its wheel, not be cloned. """
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        root = Path(tmp.name)
+        project = root / "project"
+        project.mkdir()
+        (project / "pyproject.toml").write_text(
+            '[build-system]\nrequires = []\nbuild-backend = "backend"\nbackend-path = ["."]\n\n'
+            '[project]\nname = "thing"\nversion = "0.1.0"\ndependencies = ["dep @ git+https://example.invalid/dep.git"]\n',
+            encoding="utf-8",
+        )
+        (project / "backend.py").write_text(_BACKEND, encoding="utf-8")
+        (project / "thing.py").write_text("import dep\nVALUE = dep.VALUE\n", encoding="utf-8")
+        wheelhouse = root / "wheels"
+        wheelhouse.mkdir()
+        _write_wheel(wheelhouse, "dep", "1.0", "VALUE = 42\n")
+        for name in BUILD_REQUIREMENTS:
+            _write_wheel(wheelhouse, name, "0")   # Only there so the build requirements resolve offline
+        venv = root / "venv"
+
+        with redirect_stdout(io.StringIO()):
+            self.assertTrue(bootstrap(project, venv, wheelhouse, run=lambda command: subprocess.run(command, check=True, capture_output=True)))
+
+        output = subprocess.run([str(venv_python(venv)), "-c", "import thing; print(thing.VALUE)"], check=True, capture_output=True, text=True)
+        self.assertEqual(output.stdout.strip(), "42")
+        self.assertEqual(wheelhouse_distributions(wheelhouse, exclude="thing"), ["dep", "setuptools", "wheel"])
+
+if __name__ == "__main__":
+    unittest.main()
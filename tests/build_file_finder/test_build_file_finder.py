@@ -1,10 +1,19 @@
 from __future__ import annotations
 
+import os
 from pathlib import Path
+import plistlib
 import tempfile
 import unittest
+import zipfile
 
-from ucb_to_testflight.build_file_finder import BuildFileFinder, find_build_file_path
+from ucb_to_testflight.build_file_finder import BuildFileFinder, find_build_file_path, parse_bundle_version
+
+
+def _write_ipa(path: Path, bundle_version: str) -> None:
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("Payload/Game.app/Info.plist", plistlib.dumps({"CFBundleVersion": bundle_version}))
+        archive.writestr("Payload/Game.app/Game", b"binary")
 
 
 class BuildFileFinderTests(unittest.TestCase):
@@ -19,6 +28,14 @@ class BuildFileFinderTests(unittest.TestCase):
             self.assertEqual(finder.file_path, ipa_path)
             self.assertEqual(finder.file_extension, ".ipa")
 
+    def test_output_directory_can_be_the_build_file_itself(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            _write_ipa(root / "prod.ipa", "2")
+            _write_ipa(root / "staging.ipa", "3")
+
+            self.assertEqual(BuildFileFinder(root / "prod.ipa", ".ipa").file_path, root / "prod.ipa")
+
     def test_normalizes_extension_without_dot_and_with_uppercase(self) -> None:
         with tempfile.TemporaryDirectory() as tmp:
             root = Path(tmp)
@@ -56,6 +73,84 @@ class BuildFileFinderTests(unittest.TestCase):
 
             self.assertIn(found, {first, second})
 
+    def test_ignores_subdirectories_unless_recursive(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            nested = root / "build" / "ios"
+            nested.mkdir(parents=True)
+            ipa_path = nested / "game.ipa"
+            ipa_path.write_text("binary", encoding="utf-8")
+
+            with self.assertRaises(FileNotFoundError):
+                BuildFileFinder(root, ".ipa")
+
+            self.assertEqual(BuildFileFinder(root, ".ipa", recursive=True).file_path, ipa_path)
+
+    def test_recursive_search_respects_max_depth(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            nested = root / "a" / "b" / "c"
+            nested.mkdir(parents=True)
+            (nested / "game.ipa").write_text("binary", encoding="utf-8")
+
+            with self.assertRaises(FileNotFoundError):
+                BuildFileFinder(root, ".ipa", recursive=True, max_depth=2)
+
+            self.assertEqual(BuildFileFinder(root, ".ipa", recursive=True, max_depth=3).file_path, nested / "game.ipa")
+
+    def test_recursive_search_prunes_dsym_bundles(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            for pruned in (root / "Game.app.dSYM" / "Contents", root / "Game.xcarchive" / "dSYMs"):
+                pruned.mkdir(parents=True)
+                (pruned / "stale.ipa").write_text("binary", encoding="utf-8")
+
+            # The archive itself can stand in for an .ipa, but nothing inside its dSYMs is a build
+            self.assertEqual(BuildFileFinder(root, ".ipa", recursive=True).file_path, root / "Game.xcarchive")
+
+    def test_xcarchive_is_used_only_when_there_is_no_ipa(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            for name, bundle_version in (("Old.xcarchive", "1.9"), ("New.xcarchive", "1.10")):
+                (root / name).mkdir()
+                (root / name / "Info.plist").write_bytes(plistlib.dumps({"ApplicationProperties": {"CFBundleVersion": bundle_version}}))
+
+            self.assertEqual(BuildFileFinder(root, ".ipa").file_path, root / "New.xcarchive")
+            self.assertEqual(BuildFileFinder(root / "Old.xcarchive", ".ipa").file_path, root / "Old.xcarchive")
+            _write_ipa(root / "game.ipa", "1")
+            self.assertEqual(BuildFileFinder(root, ".ipa").file_path, root / "game.ipa")
+
+    def test_ranks_by_bundle_version_before_modified_time(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            newer_build = root / "a.ipa"
+            stale_build = root / "b.ipa"
+            _write_ipa(newer_build, "1.10")
+            _write_ipa(stale_build, "1.9")
+            os.utime(newer_build, (1000, 1000))
+            os.utime(stale_build, (2000, 2000))
+
+            finder = BuildFileFinder(root, ".ipa")
+
+            self.assertEqual(finder.file_path, newer_build)
+            self.assertEqual([candidate.bundle_version for candidate in finder.candidates], ["1.10", "1.9"])
+
+    def test_ranks_by_modified_time_when_versions_are_unknown(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            old = root / "old.ipa"
+            new = root / "new.ipa"
+            old.write_text("1", encoding="utf-8")
+            new.write_text("2", encoding="utf-8")
+            os.utime(old, (1000, 1000))
+            os.utime(new, (2000, 2000))
+
+            self.assertEqual(find_build_file_path(root, ".ipa"), new)
+
+    def test_parse_bundle_version(self) -> None:
+        self.assertGreater(parse_bundle_version("1.10.0"), parse_bundle_version("1.9.9"))
+        self.assertGreater(parse_bundle_version("2"), parse_bundle_version(None))
+
 
 if __name__ == "__main__":
     unittest.main()
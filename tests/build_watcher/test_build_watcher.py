@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import io
+from contextlib import redirect_stdout
+import os
+from pathlib import Path
+import tempfile
+import threading
+import time
+import unittest
+
+from ucb_to_testflight.build_watcher import BuildWatcher, watch_and_upload
+from ucb_to_testflight.upload_parameters import UploadParameters
+
+from ..support import ipa_bytes
+
+
+def _ipa_bytes(bundle_version: str = "1") -> bytes:
+    return ipa_bytes(build_version=bundle_version, executable=os.urandom(256 * 1024))   # Big enough to be written a piece at a time
+
+
+def _write_slowly(path: Path, contents: bytes, pieces: int = 8, pause: float = 0.05) -> threading.Thread:
+    """ Writes contents a piece at a time from another thread, like a build tool would. """
+    def write() -> None:
+        piece_size = len(contents) // pieces + 1
+        with open(path, "wb") as file:
+            for offset in range(0, len(contents), piece_size):
+                file.write(contents[offset:offset + piece_size])
+                file.flush()
+                time.sleep(pause)
+
+    thread = threading.Thread(target=write)
+    thread.start()
+    return thread
+
+
+class BuildWatcherTests(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+
+    def _watcher(self, **kwargs) -> BuildWatcher:
+        with redirect_stdout(io.StringIO()):
+            watcher = BuildWatcher(self.root, ".ipa", **{"settle_seconds": 0.3, "poll_interval": 0.05, **kwargs})
+        self.addCleanup(watcher.close)
+        return watcher
+
+    def _assert_waits_for_the_whole_file(self, watcher: BuildWatcher) -> None:
+        contents = _ipa_bytes()
+        writer = _write_slowly(self.root / "Game.ipa", contents)
+
+        with redirect_stdout(io.StringIO()):
+            build = watcher.next_build(timeout=5)
+        writer.join()
+
+        self.assertEqual(build, self.root / "Game.ipa")
+        self.assertEqual(build.read_bytes(), contents)
+
+    def test_polling_waits_for_the_whole_file(self) -> None:
+        self._assert_waits_for_the_whole_file(self._watcher(use_inotify=False))
+
+    def test_inotify_waits_for_the_whole_file(self) -> None:
+        watcher = self._watcher(settle_seconds=60)  # Only the close event can say it's done in time
+        with redirect_stdout(io.StringIO()):
+            watcher.next_build(timeout=0)
+        if not watcher.uses_inotify:
+            self.skipTest("inotify isn't available here")
+
+        start = time.monotonic()
+        self._assert_waits_for_the_whole_file(watcher)
+        self.assertLess(time.monotonic() - start, 5)
+
+    def test_builds_already_there_are_ignored_and_new_ones_arrive_in_turn(self) -> None:
+        (self.root / "Old.ipa").write_bytes(_ipa_bytes("1"))
+        watcher = self._watcher()
+
+        (self.root / "Prod.ipa").write_bytes(_ipa_bytes("2"))
+        self.assertEqual(watcher.next_build(timeout=5), self.root / "Prod.ipa")
+        (self.root / "Staging.ipa").write_bytes(_ipa_bytes("3"))
+        self.assertEqual(watcher.next_build(timeout=5), self.root / "Staging.ipa")
+        self.assertIsNone(watcher.next_build(timeout=0.2))
+
+    def test_file_that_never_becomes_a_valid_ipa_is_not_reported(self) -> None:
+        watcher = self._watcher(use_inotify=False)
+        (self.root / "Broken.ipa").write_bytes(_ipa_bytes()[:1000])
+
+        self.assertIsNone(watcher.next_build(timeout=0.6))
+
+    def test_waits_for_the_output_directory_to_be_made(self) -> None:
+        self.root = self.root / "Builds"
+        watcher = self._watcher()
+
+        self.root.mkdir()
+        (self.root / "Game.ipa").write_bytes(_ipa_bytes())
+
+        with redirect_stdout(io.StringIO()):
+            self.assertEqual(watcher.next_build(timeout=5), self.root / "Game.ipa")
+
+    def test_watch_and_upload_stops_after_max_uploads(self) -> None:
+        parameters = UploadParameters()
+        parameters.output_directory = self.root
+        parameters.watch_max_uploads = 2
+        parameters.watch_idle_timeout = 5
+        uploaded = []
+
+        def upload(*values):
+            uploaded.append(values[UploadParameters._parameter_names.index("output_directory")])
+
+        def write_builds() -> None:
+            for name in ("A.ipa", "B.ipa", "C.ipa"):
+                time.sleep(0.1)
+                (self.root / name).write_bytes(_ipa_bytes())
+
+        writer = threading.Thread(target=write_builds)
+        writer.start()
+        with redirect_stdout(io.StringIO()):
+            results = watch_and_upload(parameters, upload, self._watcher())
+        writer.join()
+
+        self.assertEqual(uploaded, [self.root / "A.ipa", self.root / "B.ipa"])
+        self.assertTrue(all(result.succeeded for result in results))
+
+    def test_watch_and_upload_stops_when_idle(self) -> None:
+        parameters = UploadParameters()
+        parameters.output_directory = self.root
+        parameters.watch_idle_timeout = 0.2
+
+        with redirect_stdout(io.StringIO()):
+            self.assertEqual(watch_and_upload(parameters, lambda *values: None, self._watcher()), [])
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import importlib.util
+import os
+from pathlib import Path
+import subprocess
+import sys
+import tempfile
+import unittest
+import zipfile
+
+SRC_ROOT = Path(__file__).resolve().parents[2] / "src"
+
+# Only needed once there is actually something to upload
+UPLOAD_STACK_MODULES = ("pyliot", "asyncio", "sqlite3", "hashlib", "plistlib")
+# Only needed once parameters are actually being loaded
+PARAMETER_MODULES = ("dotenv", "python_command_line_helpers", "python_pretty_print")
+
+
+def _imported_modules(arguments: list[str], env: dict = None) -> tuple[int, set]:
+    """ Run python with -X importtime and return (exit code, names of every module imported). """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", *arguments],
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [str(SRC_ROOT), os.environ.get("PYTHONPATH")])), **(env or {})},
+    )
+    modules = set()
+    for line in process.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            modules.add(line.rsplit("|", 1)[1].strip().split(".")[0])
+    return process.returncode, modules
+
+
+class LazyImportTests(unittest.TestCase):
+    def test_importing_the_package_imports_nothing_heavy(self) -> None:
+        return_code, modules = _imported_modules(["-c", "import ucb_to_testflight"])
+
+        self.assertEqual(return_code, 0)
+        self.assertFalse(modules & set(UPLOAD_STACK_MODULES + PARAMETER_MODULES))
+
+    def test_help_imports_nothing_heavy(self) -> None:
+        return_code, modules = _imported_modules(["-m", "ucb_to_testflight.upload_to_testflight_cmd_entry", "--help"])
+
+        self.assertEqual(return_code, 0)
+        self.assertFalse(modules & set(UPLOAD_STACK_MODULES + PARAMETER_MODULES))
+
+    def test_missing_output_directory_does_not_import_the_upload_stack(self) -> None:
+        if not all(importlib.util.find_spec(name) for name in PARAMETER_MODULES):
+            self.skipTest("Parameter loading dependencies aren't installed")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {
+                "APP_STORE_CONNECT_API_KEY_ISSUER_ID": "issuer",
+                "APP_STORE_CONNECT_API_KEY_ID": "key",
+                "APP_STORE_CONNECT_API_KEY_CONTENT": "content",
+                "OUTPUT_DIRECTORY": str(Path(tmp) / "missing"),
+                "CHANGELOG_PATH": str(Path(tmp) / "notes.txt"),
+            }
+            (Path(tmp) / "notes.txt").write_text("notes", encoding="utf-8")
+
+            script = (
+                "import sys\n"
+                "from ucb_to_testflight.upload_to_testflight_cmd_entry import upload_to_testflight_cmd_entry\n"
+                "try:\n"
+                "    upload_to_testflight_cmd_entry()\n"
+                "except FileNotFoundError:\n"
+                "    sys.exit(3)\n"
+            )
+            return_code, modules = _imported_modules(["-c", script], env)
+
+        self.assertEqual(return_code, 3)
+        self.assertFalse(modules & set(UPLOAD_STACK_MODULES))
+
+
+    def test_dry_run_does_not_import_the_upload_stack(self) -> None:
+        if not all(importlib.util.find_spec(name) for name in PARAMETER_MODULES):
+            self.skipTest("Parameter loading dependencies aren't installed")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            with zipfile.ZipFile(root / "build.ipa", "w") as archive:
+                archive.writestr("Payload/Game.app/Info.plist", b"<plist/>")   # Not parsed without EXPECTED_BUNDLE_ID
+                archive.writestr("Payload/Game.app/Game", b"binary")
+            (root / "notes.txt").write_text("notes", encoding="utf-8")
+            env = {
+                "APP_STORE_CONNECT_API_KEY_ISSUER_ID": "issuer",
+                "APP_STORE_CONNECT_API_KEY_ID": "key",
+                "APP_STORE_CONNECT_API_KEY_CONTENT": "content",
+                "OUTPUT_DIRECTORY": str(root),
+                "CHANGELOG_PATH": str(root / "notes.txt"),
+                "CACHE_DIRECTORY": str(root / "cache"),
+                "DRY_RUN": "true",
+            }
+
+            return_code, modules = _imported_modules(["-m", "ucb_to_testflight.upload_to_testflight_cmd_entry"], env)
+
+            self.assertFalse((root / "cache").exists())
+
+        self.assertEqual(return_code, 0)
+        self.assertFalse(modules & set(UPLOAD_STACK_MODULES))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -15,6 +15,12 @@ class UploadCmdEntryTests(unittest.TestCase):
             params_instance = params_cls.return_value
             params_instance.load = Mock()
             params_instance.get_values = Mock(return_value=["a", "b", "c"])
+            params_instance.watch = False
+            params_instance.google_play_package_name = ""
+            params_instance.symbol_upload_url = ""
+            params_instance.use_daemon = False
+            params_instance.trace_path = ""
+            params_instance.timings = False
 
             upload_to_testflight_cmd_entry()
 
@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+from pathlib import Path
+import shutil
+import subprocess
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from ucb_to_testflight import git_changelog
+from ucb_to_testflight.git_changelog import (
+    CommitSummaryCache,
+    changelog_since_last_upload,
+    format_changelog,
+    generate_git_changelog,
+    parse_commit_message,
+)
+from ucb_to_testflight.upload_ledger import UploadLedger
+
+
+class ParseCommitMessageTests(unittest.TestCase):
+    def test_conventional_commit(self) -> None:
+        summary = parse_commit_message("abc", "fix(ui): Button overlaps the notch\n\nlonger body")
+
+        self.assertEqual((summary.type, summary.scope, summary.summary, summary.breaking), ("fix", "ui", "Button overlaps the notch", False))
+
+    def test_breaking_changes(self) -> None:
+        self.assertTrue(parse_commit_message("a", "feat!: New save format").breaking)
+        self.assertTrue(parse_commit_message("a", "feat: New save format\n\nBREAKING CHANGE: old saves are gone").breaking)
+
+    def test_other_commits_have_no_type(self) -> None:
+        summary = parse_commit_message("abc", "Merge things: and stuff happened")
+
+        self.assertEqual(summary.type, "")
+        self.assertEqual(summary.summary, "Merge things: and stuff happened")
+
+
+class FormatChangelogTests(unittest.TestCase):
+    def test_groups_by_type_and_filters(self) -> None:
+        summaries = [
+            parse_commit_message("1", "fix: Crash on launch"),
+            parse_commit_message("2", "chore: Bump deps"),
+            parse_commit_message("3", "feat(shop): Gem bundles"),
+            parse_commit_message("4", "Tweak"),
+        ]
+
+        changelog = format_changelog(summaries, ["feat", "fix"])
+
+        self.assertEqual(changelog, "New:\n- shop: Gem bundles\n\nFixes:\n- Crash on launch")
+
+    def test_empty_types_keeps_everything(self) -> None:
+        changelog = format_changelog([parse_commit_message("1", "Tweak")], [])
+
+        self.assertEqual(changelog, "- Tweak")
+
+    def test_nothing_notable(self) -> None:
+        self.assertEqual(format_changelog([parse_commit_message("1", "chore: x")], ["feat"]), "No notable changes.")
+
+    def test_truncates_at_a_line_to_fit(self) -> None:
+        summaries = [parse_commit_message(str(index), f"feat: Feature number {index}") for index in range(100)]
+
+        changelog = format_changelog(summaries, ["feat"], max_length=200)
+
+        self.assertLessEqual(len(changelog), 200)
+        self.assertTrue(changelog.endswith("more"))
+        self.assertIn("- Feature number 0\n", changelog)
+
+
+    def test_truncation_counts_only_the_commits_left_out(self) -> None:
+        summaries = [parse_commit_message(str(index), f"feat: Feature number {index}") for index in range(10)]
+        summaries += [parse_commit_message(str(index), f"fix: Fix number {index}") for index in range(10, 15)]
+
+        full_length = len(format_changelog(summaries, ["feat", "fix"]))
+        for max_length in range(60, full_length, 7):
+            changelog = format_changelog(summaries, ["feat", "fix"], max_length=max_length)
+            lines = changelog.split("\n")
+            listed = sum(1 for line in lines if line.startswith("- "))
+            self.assertEqual(lines[-1], f"... and {15 - listed} more")
+            self.assertTrue(lines[-2].startswith("- "))
+
+
+@unittest.skipIf(shutil.which("git") is None, "git isn't installed")
+class GitChangelogTests(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.repository = Path(tmp.name) / "repo"
+        self.cache_directory = Path(tmp.name) / "cache"
+        self.repository.mkdir()
+        self._git("init", "-q")
+        self._git("config", "user.email", "dev@example.com")
+        self._git("config", "user.name", "Dev")
+
+    def _git(self, *arguments: str) -> str:
+        return subprocess.run(["git", "-C", str(self.repository), *arguments], check=True, capture_output=True, text=True).stdout
+
+    def _commit(self, message: str) -> str:
+        self._git("commit", "-q", "--allow-empty", "-m", message)
+        return self._git("rev-parse", "HEAD").strip()
+
+    def test_only_commits_since_the_last_upload_are_listed(self) -> None:
+        self._commit("feat: Old feature")
+        uploaded = self._commit("fix: Old fix")
+        self._commit("feat: New feature")
+        self._commit("docs: Readme")
+
+        changelog = generate_git_changelog(self.repository, self.cache_directory, uploaded, ["feat", "fix"])
+
+        self.assertEqual(changelog, "New:\n- New feature")
+
+    def test_later_runs_only_ask_git_about_new_commits(self) -> None:
+        self._commit("feat: One")
+        generate_git_changelog(self.repository, self.cache_directory, None, ["feat"])
+        self._commit("feat: Two")
+
+        real_git = git_changelog._git
+        with patch.object(git_changelog, "_git", side_effect=real_git) as git:
+            changelog = generate_git_changelog(self.repository, self.cache_directory, None, ["feat"])
+
+        self.assertEqual(changelog, "New:\n- Two\n- One")
+        log_calls = [call for call in git.call_args_list if call.args[1] == "log"]
+        self.assertEqual(len(log_calls), 1)
+        self.assertEqual(log_calls[0].kwargs["input"].split(), [self._git("rev-parse", "HEAD").strip()])
+        self.assertEqual(len(CommitSummaryCache(self.cache_directory / "changelog_cache.sqlite3").get_many(self._git("rev-list", "HEAD").split())), 2)
+
+    def test_unknown_last_commit_falls_back_to_recent_commits(self) -> None:
+        self._commit("feat: Only")
+
+        changelog = generate_git_changelog(self.repository, self.cache_directory, "0" * 40, ["feat"])
+
+        self.assertEqual(changelog, "New:\n- Only")
+
+    def test_range_starts_at_the_commit_recorded_with_the_last_upload(self) -> None:
+        ledger = UploadLedger(self.cache_directory / "ledger.sqlite3")
+        build = self.cache_directory / "build.ipa"
+        build.write_bytes(b"ipa")
+        ledger.record_upload("f1", build, bundle_id="com.example.game", git_commit=self._commit("feat: Shipped"))
+        head = self._commit("fix: Since then")
+
+        changelog, commit = changelog_since_last_upload(self.repository, ledger, "com.example.game", self.cache_directory, ["feat", "fix"])
+
+        self.assertEqual(changelog, "Fixes:\n- Since then")
+        self.assertEqual(commit, head)
+
+
+if __name__ == "__main__":
+    unittest.main()
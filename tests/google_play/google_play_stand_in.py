@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+A local stand-in for the parts of the Google Play Developer API the google_play backend uses, so it can be exercised offline.
+
+It exchanges service account assertions (RS256, checked against the account's public key) for access tokens, runs edits,
+takes bundles as resumable uploads (answering 308 with the Range it has, like the real thing) and records what was committed
+to which track. A chunk can be made to "lose" its response: the bytes are kept but the client sees an error.
+
+Run it directly to point a real upload at it:
+    python3 -m tests.google_play.google_play_stand_in --package-name com.example.game
+prints GOOGLE_PLAY_API_URL and writes a matching service account key.
+"""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+from http.server import BaseHTTPRequestHandler
+import json
+import re
+import threading
+import time
+import urllib.parse
+
+from ..http_stand_in import HttpStandIn
+
+
+def generate_service_account(token_uri: str = "") -> tuple:
+    """ (service account key JSON text, public key) for a throwaway RSA key. Set token_uri to the stand-in's. """
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = private_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()).decode()
+    account = {
+        "type": "service_account",
+        "client_email": "uploader@example.iam.gserviceaccount.com",
+        "private_key_id": "key-1",
+        "private_key": pem,
+        "token_uri": token_uri,
+    }
+    return json.dumps(account), private_key.public_key()
+
+
+def _base64url_decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class GooglePlayStandIn(HttpStandIn):
+    """ with GooglePlayStandIn(public_key, ["com.example.game"]) as server: ... server.base_url, server.token_uri ... """
+
+    def __init__(self, public_key, package_names: list, client_email: str = "uploader@example.iam.gserviceaccount.com") -> None:
+        super().__init__()
+        self.public_key = public_key
+        self.package_names = set(package_names)
+        self.client_email = client_email
+        self.version_code = 1           # versionCode of the next bundle
+        self.lose_chunk_responses = {}  # offset -> how many more PUTs starting there keep the bytes but fail with 503
+        self.chunk_latency = 0.0
+
+        self.tokens_issued = []
+        self.requests = []          # (method, path)
+        self.edits = {}             # id -> {"package", "bundles": [version codes], "tracks": {track: releases}, "committed"}
+        self.sessions = {}          # id -> {"edit", "size", "data": bytearray}
+        self.chunk_puts = []        # (session id, offset) of every chunk PUT
+        self.tracks = {}            # (package, track) -> releases, once committed
+        self.used_version_codes = set()
+
+    @property
+    def token_uri(self) -> str:
+        return self.base_url + "/token"
+
+    def _handle(self, handler: BaseHTTPRequestHandler, method: str) -> None:
+        body = handler.rfile.read(int(handler.headers.get("Content-Length") or 0))
+        url = urllib.parse.urlsplit(handler.path)
+        with self.lock:
+            self.requests.append((method, url.path))
+
+        if url.path == "/token":
+            return self._issue_token(handler, body)
+        if handler.headers.get("Authorization", "").removeprefix("Bearer ") not in self.tokens_issued:
+            return self._error(handler, 401, "Request had invalid authentication credentials.")
+
+        match = re.fullmatch(r"/upload-session/(?P<session>[^/]+)", url.path)
+        if match and method == "PUT":
+            return self._put_chunk(handler, match["session"], body)
+        match = re.fullmatch(r"(?P<upload>/upload)?/androidpublisher/v3/applications/(?P<package>[^/]+)/edits(?:/(?P<edit>[^/:]+)(?P<rest>.*))?", url.path)
+        if not match:
+            return self._error(handler, 404, f"No route for {method} {url.path}")
+        if match["package"] not in self.package_names:
+            return self._error(handler, 404, "Package not found: " + match["package"])
+        if match["edit"] is None and method == "POST":
+            return self._create_edit(handler, match["package"])
+
+        edit = self.edits.get(match["edit"])
+        if edit is None or edit["committed"]:
+            return self._error(handler, 404, "This Edit has been deleted.")
+        rest = match["rest"]
+        if match["upload"] and rest == "/bundles" and method == "POST":
+            return self._start_session(handler, match["edit"], int(handler.headers["X-Upload-Content-Length"]))
+        track = re.fullmatch(r"/tracks/(?P<track>[^/]+)", rest)
+        if track and method == "PUT":
+            edit["tracks"][track["track"]] = json.loads(body)["releases"]
+            return self._respond(handler, 200, json.loads(body))
+        if rest == ":commit" and method == "POST":
+            return self._commit(handler, match["edit"], edit)
+        self._error(handler, 404, f"No route for {method} {url.path}")
+
+    def _issue_token(self, handler: BaseHTTPRequestHandler, body: bytes) -> None:
+        from cryptography.exceptions import InvalidSignature
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.asymmetric import padding
+
+        form = urllib.parse.parse_qs(body.decode())
+        try:
+            header, payload, signature = form["assertion"][0].split(".")
+            self.public_key.verify(_base64url_decode(signature), f"{header}.{payload}".encode(), padding.PKCS1v15(), hashes.SHA256())
+            claims = json.loads(_base64url_decode(payload))
+        except (KeyError, ValueError, InvalidSignature):
+            return self._respond(handler, 400, {"error": "invalid_grant", "error_description": "Invalid JWT Signature."})
+        if claims["iss"] != self.client_email or claims["aud"] != self.token_uri or claims["exp"] < time.time():
+            return self._respond(handler, 400, {"error": "invalid_grant", "error_description": "Invalid JWT claims."})
+
+        with self.lock:
+            token = f"token-{len(self.tokens_issued) + 1}"
+            self.tokens_issued.append(token)
+        self._respond(handler, 200, {"access_token": token, "expires_in": 3599, "token_type": "Bearer"})
+
+    def _create_edit(self, handler: BaseHTTPRequestHandler, package: str) -> None:
+        with self.lock:
+            edit_id = f"edit-{len(self.edits) + 1}"
+            self.edits[edit_id] = {"package": package, "bundles": [], "tracks": {}, "committed": False}
+        self._respond(handler, 200, {"id": edit_id, "expiryTimeSeconds": str(int(time.time()) + 3600)})
+
+    def _start_session(self, handler: BaseHTTPRequestHandler, edit_id: str, size: int) -> None:
+        with self.lock:
+            session_id = f"session-{len(self.sessions) + 1}"
+            self.sessions[session_id] = {"edit": edit_id, "size": size, "data": bytearray()}
+        self._respond(handler, 200, None, {"Location": f"{self.base_url}/upload-session/{session_id}"})
+
+    def _put_chunk(self, handler: BaseHTTPRequestHandler, session_id: str, body: bytes) -> None:
+        session = self.sessions.get(session_id)
+        if session is None:
+            return self._error(handler, 404, "No such upload session.")
+        content_range = handler.headers.get("Content-Range", "")
+        if content_range.startswith("bytes */"):
+            return self._session_status(handler, session)
+
+        match = re.fullmatch(r"bytes (\d+)-(\d+)/(\d+)", content_range)
+        if not match or int(match[3]) != session["size"]:
+            return self._error(handler, 400, f"Bad Content-Range: {content_range}")
+        offset = int(match[1])
+        with self.lock:
+            self.chunk_puts.append((session_id, offset))
+            if offset != len(session["data"]):
+                return self._error(handler, 400, f"Expected bytes from {len(session['data'])}, got {offset}")
+            session["data"] += body
+            lose_response = self.lose_chunk_responses.get(offset, 0) > 0
+            if lose_response:
+                self.lose_chunk_responses[offset] -= 1
+        time.sleep(self.chunk_latency)
+        if lose_response:
+            return self._error(handler, 503, "Backend Error")
+        self._session_status(handler, session)
+
+    def _session_status(self, handler: BaseHTTPRequestHandler, session: dict) -> None:
+        received = len(session["data"])
+        if received < session["size"]:
+            headers = {"Range": f"bytes=0-{received - 1}"} if received else {}
+            return self._respond(handler, 308, None, headers)
+
+        with self.lock:
+            version_code = self.version_code
+            self.version_code += 1
+            self.edits[session["edit"]]["bundles"].append(version_code)
+        self._respond(handler, 200, {"versionCode": version_code, "sha256": hashlib.sha256(session["data"]).hexdigest()})
+
+    def _commit(self, handler: BaseHTTPRequestHandler, edit_id: str, edit: dict) -> None:
+        with self.lock:
+            version_codes = {int(code) for releases in edit["tracks"].values() for release in releases for code in release["versionCodes"]}
+            if version_codes & self.used_version_codes:
+                return self._error(handler, 403, f"APK specifies a version code that has already been used: {sorted(version_codes & self.used_version_codes)}")
+            self.used_version_codes |= version_codes
+            for track, releases in edit["tracks"].items():
+                self.tracks[(edit["package"], track)] = releases
+            edit["committed"] = True
+        self._respond(handler, 200, {"id": edit_id})
+
+    def uploaded_bytes(self, version_code: int) -> bytes:
+        """ What was uploaded as the bundle that got version_code. """
+        for session in self.sessions.values():
+            if version_code in self.edits[session["edit"]]["bundles"] and len(session["data"]) == session["size"]:
+                return bytes(session["data"])
+        raise KeyError(version_code)
+
+    def _error(self, handler: BaseHTTPRequestHandler, status: int, message: str) -> None:
+        self._respond(handler, status, {"error": {"code": status, "message": message}})
+
+def main() -> None:
+    import argparse
+    from pathlib import Path
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--package-name", required=True)
+    parser.add_argument("--key-path", default="stand_in_service_account.json")
+    arguments = parser.parse_args()
+
+    with GooglePlayStandIn(None, [arguments.package_name]) as server:
+        account_json, server.public_key = generate_service_account(server.token_uri)
+        Path(arguments.key_path).write_text(account_json)
+        print(f"GOOGLE_PLAY_API_URL={server.base_url} GOOGLE_PLAY_PACKAGE_NAME={arguments.package_name}")
+        print(f"GOOGLE_PLAY_SERVICE_ACCOUNT_JSON is in {arguments.key_path}. Ctrl+C to stop.")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import io
+from contextlib import redirect_stderr, redirect_stdout
+import os
+from pathlib import Path
+import tempfile
+import time
+import unittest
+
+from ucb_to_testflight.google_play import upload_to_google_play
+from ucb_to_testflight.multi_platform_upload import GOOGLE_PLAY_JOB_NAME, TESTFLIGHT_JOB_NAME, upload_all_platforms
+from ucb_to_testflight.retry_policy import FatalUploadError, RetryPolicy
+from ucb_to_testflight.upload_parameters import UploadParameters
+
+from .google_play_stand_in import GooglePlayStandIn, generate_service_account
+
+CHUNK_SIZE = 256 * 1024
+
+
+class GooglePlayUploadTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.server = GooglePlayStandIn(None, ["com.example.game"]).start()
+        self.addCleanup(self.server.stop)
+        self.account_json, self.server.public_key = generate_service_account(self.server.token_uri)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+        self.contents = os.urandom(3 * CHUNK_SIZE + 1000)
+        (self.root / "game.aab").write_bytes(self.contents)
+
+    def _upload(self, **kwargs) -> int:
+        with redirect_stdout(io.StringIO()):
+            return upload_to_google_play(
+                self.account_json, "com.example.game", self.root, "Release notes",
+                **{"retry_policy": RetryPolicy(max_attempts=2, base_delay=0), "api_url": self.server.base_url, "chunk_size": CHUNK_SIZE, **kwargs},
+            )
+
+    def test_bundle_is_uploaded_in_chunks_and_committed_to_the_track(self) -> None:
+        version_code = self._upload()
+
+        self.assertEqual(self.server.uploaded_bytes(version_code), self.contents)
+        self.assertEqual(len(self.server.chunk_puts), 4)
+        self.assertEqual(self.server.tracks[("com.example.game", "internal")], [{
+            "status": "completed",
+            "releaseNotes": [{"language": "en-US", "text": "Release notes"}],
+            "versionCodes": [str(version_code)],
+        }])
+        self.assertEqual(len(self.server.tokens_issued), 1)
+
+    def test_lost_chunk_response_carries_on_from_what_the_session_has(self) -> None:
+        self.server.lose_chunk_responses = {CHUNK_SIZE: 1}
+
+        version_code = self._upload()
+
+        self.assertEqual(self.server.uploaded_bytes(version_code), self.contents)
+        offsets = [offset for _, offset in self.server.chunk_puts]
+        self.assertEqual(offsets, [0, CHUNK_SIZE, 2 * CHUNK_SIZE, 3 * CHUNK_SIZE])   # Nothing was sent twice
+        self.assertEqual(len(self.server.edits), 1)     # Within the same attempt
+
+    def test_version_code_already_used_is_not_retried(self) -> None:
+        self.server.used_version_codes = {1}
+
+        with redirect_stderr(io.StringIO()), self.assertRaises(FatalUploadError):
+            self._upload(retry_policy=RetryPolicy(max_attempts=5, base_delay=0))
+
+        self.assertEqual(len(self.server.edits), 1)
+        self.assertEqual(self.server.tracks, {})
+
+
+class UploadAllPlatformsTests(unittest.TestCase):
+    def test_platforms_upload_concurrently_and_failures_stay_separate(self) -> None:
+        def upload_ios(*values) -> None:
+            time.sleep(0.3)
+
+        def upload_android(parameters: UploadParameters) -> None:
+            time.sleep(0.3)
+            raise RuntimeError("Play is down")
+
+        start = time.monotonic()
+        with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+            parameters = UploadParameters()
+            parameters.google_play_package_name = "com.example.game"
+            results = upload_all_platforms(parameters, upload_ios, upload_android)
+        duration = time.monotonic() - start
+
+        self.assertLess(duration, 0.55)
+        self.assertEqual([result.job.name for result in results], [TESTFLIGHT_JOB_NAME, GOOGLE_PLAY_JOB_NAME])
+        self.assertEqual([result.succeeded for result in results], [True, False])
+        self.assertEqual(str(results[1].error), "Play is down")
+
+
+if __name__ == "__main__":
+    unittest.main()
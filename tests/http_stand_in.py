@@ -0,0 +1,76 @@
+"""
+What every local stand-in server has in common: a keep-alive ThreadingHTTPServer on a free localhost port, served from a
+daemon thread, that sends every request to the stand-in's _handle(handler, method). Stand-ins only implement _handle.
+"""
+
+from __future__ import annotations
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+
+
+class HttpStandIn:
+    """ with SomeStandIn(...) as server: ... server.base_url ... (or start() and stop()) """
+    methods = ("GET", "POST", "PUT", "PATCH")
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join(5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def _handle(self, handler: BaseHTTPRequestHandler, method: str) -> None:
+        raise NotImplementedError
+
+    def _connected(self, handler: BaseHTTPRequestHandler) -> None:
+        """ Called for each new connection. """
+
+    def _respond(self, handler: BaseHTTPRequestHandler, status: int, document=None, headers: dict = None) -> None:
+        """ document as a JSON body (no body if None). """
+        body = json.dumps(document).encode() if document is not None else b""
+        handler.send_response(status)
+        for name, value in (headers or {}).items():
+            handler.send_header(name, value)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def _handler_class(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"   # Keep-alive, like the real things
+
+            def setup(self) -> None:
+                super().setup()
+                stand_in._connected(self)
+
+            def log_message(self, format, *args) -> None:
+                pass
+
+        for method in self.methods:
+            setattr(Handler, f"do_{method}", lambda handler, method=method: stand_in._handle(handler, method))
+        return Handler
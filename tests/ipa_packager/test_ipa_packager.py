@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import io
+from contextlib import redirect_stdout
+import os
+from pathlib import Path
+import plistlib
+import stat
+import tempfile
+import time
+import unittest
+import zipfile
+
+from ucb_to_testflight.ipa_packager import PackagedIpa, package_xcarchive
+from ucb_to_testflight.ipa_validation import IpaValidationError, inspect_ipa
+from ucb_to_testflight.parallel_zip import ParallelZipWriter
+from ucb_to_testflight.upload_ledger import UploadLedger, fingerprint_file
+from ucb_to_testflight.upload_to_testflight import upload_to_testflight
+
+
+def _make_xcarchive(root: Path) -> Path:
+    """ Game.xcarchive with a small app: a binary, code, an already compressed image, a framework with a link and an empty file. """
+    xcarchive = root / "Game.xcarchive"
+    app = xcarchive / "Products" / "Applications" / "Game.app"
+    (app / "Frameworks" / "UnityFramework.framework").mkdir(parents=True)
+    (app / "Data").mkdir()
+    (app / "Info.plist").write_bytes(plistlib.dumps({
+        "CFBundleIdentifier": "com.example.game",
+        "CFBundleShortVersionString": "1.0",
+        "CFBundleVersion": "42",
+        "CFBundleExecutable": "Game",
+    }))
+    (app / "Game").write_bytes(b"\xcf\xfa\xed\xfe" + b"code " * 200_000)
+    (app / "Game").chmod(0o755)
+    (app / "AppIcon.png").write_bytes(os.urandom(50_000))
+    (app / "Data" / "level.txt").write_text("tiles " * 10_000)
+    (app / "Data" / "empty").write_bytes(b"")
+    (app / "Frameworks" / "UnityFramework.framework" / "UnityFramework").write_bytes(b"framework " * 50_000)
+    os.symlink("UnityFramework", app / "Frameworks" / "UnityFramework.framework" / "Current")
+    (xcarchive / "dSYMs").mkdir()
+    (xcarchive / "dSYMs" / "Game.app.dSYM").write_bytes(b"symbols")
+    return xcarchive
+
+
+class IpaPackagerTests(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+        self.xcarchive = _make_xcarchive(self.root)
+
+    def _package(self, name: str = "Game.ipa", **kwargs) -> Path:
+        with redirect_stdout(io.StringIO()):
+            return package_xcarchive(self.xcarchive, self.root / "out" / name, **kwargs)
+
+    def test_app_is_packaged_under_payload(self) -> None:
+        ipa_path = self._package()
+        app = self.xcarchive / "Products" / "Applications" / "Game.app"
+
+        with zipfile.ZipFile(ipa_path) as archive:
+            self.assertIsNone(archive.testzip())
+            members = {info.filename: info for info in archive.infolist()}
+            self.assertEqual(archive.read("Payload/Game.app/Game"), (app / "Game").read_bytes())
+            self.assertEqual(archive.read("Payload/Game.app/Data/empty"), b"")
+            link = members["Payload/Game.app/Frameworks/UnityFramework.framework/Current"]
+            self.assertTrue(stat.S_ISLNK(link.external_attr >> 16))
+            self.assertEqual(archive.read(link), b"UnityFramework")
+            self.assertEqual(stat.S_IMODE(members["Payload/Game.app/Game"].external_attr >> 16), 0o755)
+            self.assertEqual(members["Payload/Game.app/Game"].compress_type, zipfile.ZIP_DEFLATED)
+            self.assertEqual(members["Payload/Game.app/AppIcon.png"].compress_type, zipfile.ZIP_STORED)
+            self.assertIn("Payload/Game.app/Data/", members)
+            self.assertFalse(any("dSYM" in name for name in members))
+
+        info = inspect_ipa(ipa_path)
+        self.assertEqual((info.bundle_id, info.build_version), ("com.example.game", "42"))
+
+    def test_same_archive_gives_the_same_bytes_whatever_the_thread_count(self) -> None:
+        one_thread = self._package("one.ipa", max_workers=1)
+        many_threads = self._package("many.ipa", max_workers=8)
+
+        self.assertEqual(one_thread.read_bytes(), many_threads.read_bytes())
+
+    def test_archive_without_an_app_is_rejected(self) -> None:
+        (self.xcarchive / "Products" / "Applications" / "Game.app").rename(self.xcarchive / "Game.app")
+
+        with self.assertRaises(IpaValidationError):
+            self._package()
+        self.assertFalse((self.root / "out" / "Game.ipa").exists())
+
+    def test_failed_write_leaves_no_partial_archive(self) -> None:
+        path = self.root / "broken.zip"
+
+        with self.assertRaises(FileNotFoundError):
+            with ParallelZipWriter(path) as writer:
+                writer.add_file(self.root / "missing", "missing")
+                writer.close()
+        self.assertFalse(path.exists())
+
+
+
+class PackagedIpaTests(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+        self.xcarchive = _make_xcarchive(self.root)
+        self.ledger = UploadLedger(self.root / "cache" / "ledger.sqlite3")
+
+    def _package(self) -> tuple:
+        packaged_ipa = PackagedIpa(self.root / "cache", self.xcarchive)
+        with redirect_stdout(io.StringIO()) as output:
+            path = packaged_ipa.package()
+        return packaged_ipa, path, output.getvalue()
+
+    def _touch_archive(self) -> None:
+        executable = self.xcarchive / "Products" / "Applications" / "Game.app" / "Game"
+        future = time.time() + 10
+        os.utime(executable, (future, future))
+
+    def test_ipa_is_reused_until_the_archive_changes(self) -> None:
+        _, path, output = self._package()
+        self.assertIn("Packaged", output)
+
+        _, reused_path, output = self._package()
+        self.assertEqual(reused_path, path)
+        self.assertIn("Reusing", output)
+
+        self._touch_archive()
+        _, _, output = self._package()
+        self.assertIn("Packaged", output)
+
+    def test_uploaded_archive_is_skipped_without_packaging_and_the_ipa_is_deleted(self) -> None:
+        packaged_ipa, path, _ = self._package()
+        fingerprint = fingerprint_file(path)
+        self.ledger.record_upload(fingerprint, path)
+        packaged_ipa.uploaded(fingerprint)
+        self.assertFalse(path.exists())
+
+        with redirect_stdout(io.StringIO()):
+            again = PackagedIpa(self.root / "cache", self.xcarchive)
+            self.assertTrue(again.is_upload_skipped(self.ledger, force=False))
+            self.assertFalse(again.is_upload_skipped(self.ledger, force=True))
+        self.assertFalse(path.exists())
+
+        self._touch_archive()
+        self.assertFalse(PackagedIpa(self.root / "cache", self.xcarchive).is_upload_skipped(self.ledger, force=False))
+
+
+    def test_dry_run_doesnt_package_the_archive(self) -> None:
+        (self.root / "notes.txt").write_text("notes", encoding="utf-8")
+
+        with redirect_stdout(io.StringIO()) as output:
+            upload_to_testflight(
+                "issuer", "key", "content", self.root, self.root / "notes.txt",
+                cache_directory=self.root / "cache", expected_bundle_id="com.example.game", dry_run=True,
+            )
+
+        self.assertIn("Dry run", output.getvalue())
+        self.assertFalse(PackagedIpa(self.root / "cache", self.xcarchive).path.exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+from pathlib import Path
+import plistlib
+import tempfile
+import unittest
+from unittest.mock import patch
+import zipfile
+
+from ucb_to_testflight.ipa_validation import (
+    IpaValidationError, check_info_plist_contents, inspect_ipa, read_info_plist, read_info_plist_contents, validate_ipa,
+)
+from ucb_to_testflight.upload_ledger import UploadLedger
+
+INFO_PLIST = {
+    "CFBundleIdentifier": "com.example.game",
+    "CFBundleShortVersionString": "1.2.0",
+    "CFBundleVersion": "45",
+    "CFBundleExecutable": "Game",
+}
+
+
+def write_ipa(path: Path, info_plist: dict = INFO_PLIST, include_executable: bool = True) -> Path:
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("Payload/Game.app/Info.plist", plistlib.dumps(info_plist))
+        if include_executable:
+            archive.writestr("Payload/Game.app/Game", b"\xcf\xfa\xed\xfe" * 1000)
+        archive.writestr("Payload/Game.app/Data/level0", b"level" * 1000, compress_type=zipfile.ZIP_STORED)
+    return path
+
+
+class InspectIpaTests(unittest.TestCase):
+    def test_reads_versions_and_bundle_id(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            info = inspect_ipa(write_ipa(Path(tmp) / "build.ipa"))
+
+        self.assertEqual(info.app_name, "Game.app")
+        self.assertEqual(info.bundle_id, "com.example.game")
+        self.assertEqual(info.short_version, "1.2.0")
+        self.assertEqual(info.build_version, "45")
+        self.assertEqual(info.member_count, 3)
+
+    def test_reads_zip64_archives(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            # Makes zipfile write zip64 extras and end records for everything
+            with patch.object(zipfile, "ZIP64_LIMIT", 16):
+                ipa_path = write_ipa(Path(tmp) / "build.ipa")
+
+            self.assertEqual(inspect_ipa(ipa_path).build_version, "45")
+            self.assertEqual(read_info_plist(ipa_path)["CFBundleExecutable"], "Game")
+
+    def test_dry_run_check_only_compares_the_bundle_id_when_one_is_expected(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            name, contents = read_info_plist_contents(write_ipa(Path(tmp) / "build.ipa"))
+
+        self.assertEqual(name, "Payload/Game.app/Info.plist")
+        check_info_plist_contents(name, contents)
+        check_info_plist_contents(name, contents, "com.example.game")
+        with self.assertRaisesRegex(IpaValidationError, "expected com.example.other"):
+            check_info_plist_contents(name, contents, "com.example.other")
+
+    def test_rejects_truncated_archives(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            ipa_path = write_ipa(Path(tmp) / "build.ipa")
+            contents = ipa_path.read_bytes()
+            ipa_path.write_bytes(contents[: len(contents) // 2])
+
+            with self.assertRaises(IpaValidationError):
+                inspect_ipa(ipa_path)
+
+    def test_rejects_non_zip_and_empty_files(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            (root / "text.ipa").write_text("not a zip", encoding="utf-8")
+            (root / "empty.ipa").write_bytes(b"")
+
+            with self.assertRaises(IpaValidationError):
+                inspect_ipa(root / "text.ipa")
+            with self.assertRaises(IpaValidationError):
+                inspect_ipa(root / "empty.ipa")
+
+    def test_rejects_missing_info_plist_keys_and_executable(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            no_version = dict(INFO_PLIST)
+            del no_version["CFBundleVersion"]
+
+            with self.assertRaisesRegex(IpaValidationError, "CFBundleVersion"):
+                inspect_ipa(write_ipa(root / "a.ipa", no_version))
+            with self.assertRaisesRegex(IpaValidationError, "executable"):
+                inspect_ipa(write_ipa(root / "b.ipa", include_executable=False))
+
+    def test_rejects_archives_without_an_app(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            ipa_path = Path(tmp) / "build.ipa"
+            with zipfile.ZipFile(ipa_path, "w") as archive:
+                archive.writestr("Game.app/Info.plist", plistlib.dumps(INFO_PLIST))
+
+            with self.assertRaises(IpaValidationError):
+                inspect_ipa(ipa_path)
+
+
+class ValidateIpaTests(unittest.TestCase):
+    def test_checks_expected_bundle_id(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            ipa_path = write_ipa(Path(tmp) / "build.ipa")
+
+            validate_ipa(ipa_path, "com.example.game")
+            with self.assertRaisesRegex(IpaValidationError, "bundle id"):
+                validate_ipa(ipa_path, "com.example.other")
+
+    def test_rejects_build_already_uploaded_from_another_file(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            ipa_path = write_ipa(root / "build.ipa")
+            ledger = UploadLedger(root / "ledger.sqlite3")
+            ledger.record_upload("old-fingerprint", ipa_path, **inspect_ipa(ipa_path).ledger_columns())
+
+            # Same file (eg. --force) is fine, a different file with the same version/build isn't
+            validate_ipa(ipa_path, ledger=ledger, fingerprint="old-fingerprint")
+            with self.assertRaisesRegex(IpaValidationError, "already uploaded"):
+                validate_ipa(ipa_path, ledger=ledger, fingerprint="new-fingerprint")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+
+from __future__ import annotations
+
+import unittest
+
+from ucb_to_testflight.retry_policy import (
+    FatalUploadError,
+    RetryPolicy,
+    UploadAttemptError,
+    find_fatal_failure,
+    run_with_retries,
+)
+
+from ..support import FakeClock
+
+
+class RetryPolicyTests(unittest.TestCase):
+    def test_delays_double_up_to_max_delay(self) -> None:
+        policy = RetryPolicy(base_delay=10, max_delay=60, jitter=0)
+
+        self.assertEqual([policy.delay_before(attempt) for attempt in range(1, 7)], [0, 10, 20, 40, 60, 60])
+
+    def test_jitter_only_shortens_delays(self) -> None:
+        low = RetryPolicy(base_delay=10, jitter=0.5, random_source=lambda: 1.0)
+        high = RetryPolicy(base_delay=10, jitter=0.5, random_source=lambda: 0.0)
+
+        self.assertEqual(low.delay_before(3), 10)
+        self.assertEqual(high.delay_before(3), 20)
+
+    def test_classifies_fatal_failures(self) -> None:
+        self.assertIsNotNone(find_fatal_failure("[!] Authentication credentials are missing or invalid."))
+        self.assertIsNotNone(find_fatal_failure("ERROR ITMS-90062: This bundle is invalid. The value for key CFBundleShortVersionString"))
+        self.assertIsNotNone(find_fatal_failure("The bundle version must be higher than the previously uploaded version."))
+        self.assertIsNone(find_fatal_failure("Connection reset by peer"))
+        self.assertIsNone(find_fatal_failure("Read timed out"))
+
+    def test_fatal_output_stops_retrying(self) -> None:
+        policy = RetryPolicy(max_attempts=10)
+
+        with self.assertRaises(FatalUploadError):
+            policy.next_delay(1, UploadAttemptError("pilot exited with 1", "ENTITY_ERROR.ATTRIBUTE.INVALID.DUPLICATE"))
+
+    def test_gives_up_after_max_attempts(self) -> None:
+        policy = RetryPolicy(max_attempts=2, jitter=0)
+
+        self.assertEqual(policy.next_delay(1, RuntimeError("flaky")), 10)
+        with self.assertRaises(RuntimeError):
+            policy.next_delay(2, RuntimeError("flaky"))
+
+    def test_total_budget_caps_attempt_timeouts_and_retries(self) -> None:
+        clock = FakeClock()
+        policy = RetryPolicy(max_attempts=10, attempt_timeout=600, base_delay=10, jitter=0, total_budget=100, min_attempt_timeout=5, clock=clock)
+        timeouts = []
+
+        def attempt(number: int, timeout: float) -> None:
+            timeouts.append(timeout)
+            clock.now += min(30, timeout)
+            raise UploadAttemptError("timed out", timed_out=True)
+
+        with self.assertRaises(RuntimeError) as ctx:
+            run_with_retries(attempt, policy, sleep=clock.sleep)
+
+        self.assertNotIsInstance(ctx.exception, FatalUploadError)
+        # 30s attempt, 10s wait, 30s attempt, 20s wait, attempt cut to the last 10s. No time for a 40s wait.
+        self.assertEqual(timeouts, [100, 60, 10])
+        self.assertEqual(clock.now, 100)
+
+    def test_no_retry_without_time_for_a_minimum_length_attempt(self) -> None:
+        clock = FakeClock()
+        policy = RetryPolicy(max_attempts=10, attempt_timeout=600, base_delay=10, jitter=0, total_budget=100, min_attempt_timeout=30, clock=clock)
+        timeouts = []
+
+        def attempt(number: int, timeout: float) -> None:
+            timeouts.append(timeout)
+            clock.now += min(30, timeout)
+            raise UploadAttemptError("timed out", timed_out=True)
+
+        with self.assertRaisesRegex(RuntimeError, "out of time"):
+            run_with_retries(attempt, policy, sleep=clock.sleep)
+
+        # 30s attempt, 10s wait, 30s attempt. 30s left, which a 20s wait would leave too little of.
+        self.assertEqual(timeouts, [100, 60])
+        self.assertEqual(clock.now, 70)
+
+    def test_attempt_timeout_is_never_below_the_minimum(self) -> None:
+        clock = FakeClock()
+        policy = RetryPolicy(attempt_timeout=600, total_budget=10, min_attempt_timeout=30, clock=clock)
+
+        self.assertEqual(policy.timeout_for_attempt(), 30)
+        self.assertEqual(RetryPolicy(attempt_timeout=20, min_attempt_timeout=30).timeout_for_attempt(), 20)
+
+    def test_run_with_retries_returns_first_success(self) -> None:
+        clock = FakeClock()
+        policy = RetryPolicy(max_attempts=5, base_delay=1, jitter=0, clock=clock)
+        results = iter([RuntimeError("flaky"), RuntimeError("flaky"), "uploaded"])
+
+        def attempt(number: int, timeout: float) -> str:
+            result = next(results)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        self.assertEqual(run_with_retries(attempt, policy, sleep=clock.sleep), "uploaded")
+        self.assertEqual(clock.now, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -30,6 +30,7 @@ def _run_tests() -> None:
     suite = unittest.defaultTestLoader.discover(
         start_dir=str(TESTS_ROOT),
         pattern="test_*.py",
+        top_level_dir=str(ROOT),     # So the test packages are tests.*, and can share tests/http_stand_in.py
     )
     result = unittest.TextTestRunner(verbosity=2).run(suite)
     if not result.wasSuccessful():
@@ -0,0 +1,69 @@
+"""
+Fixtures that more than one test module needs. (Not test_*.py, so discovery doesn't collect it.)
+"""
+
+from __future__ import annotations
+
+import importlib
+import io
+from pathlib import Path
+import plistlib
+import sys
+import types
+import unittest
+from unittest.mock import Mock, patch
+import zipfile
+
+
+class FakeClock:
+    """ A clock (call it) that only moves when slept on or set, so waits of minutes take no time. """
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.sleeps = []    # Every sleep, in seconds
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def ipa_bytes(short_version: str = "1.0", build_version: str = "1", executable: bytes = b"binary", bundle_id: str = "com.example.game") -> bytes:
+    """ A minimal .ipa that passes validation: Payload/Game.app with an Info.plist and the executable it names. """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("Payload/Game.app/Info.plist", plistlib.dumps({
+            "CFBundleIdentifier": bundle_id,
+            "CFBundleShortVersionString": short_version,
+            "CFBundleVersion": build_version,
+            "CFBundleExecutable": "Game",
+        }))
+        archive.writestr("Payload/Game.app/Game", executable)
+    return buffer.getvalue()
+
+
+def write_ipa(path: Path, **kwargs) -> Path:
+    """ ipa_bytes(**kwargs) written to path. """
+    path.write_bytes(ipa_bytes(**kwargs))
+    return path
+
+
+def import_with_stubbed_pyliot(test_case: unittest.TestCase, module_name: str = "upload_to_testflight") -> tuple:
+    """
+    (ucb_to_testflight.<module_name>, freshly imported, the Mock standing in for pyliot.<module_name>.upload_to_testflight).
+    The stub stays in sys.modules until the test ends, since pyliot is only imported once there is something to upload.
+    """
+    upload_mock = Mock()
+    pyliot_pkg = types.ModuleType("pyliot")
+    pyliot_upload_module = types.ModuleType(f"pyliot.{module_name}")
+    pyliot_upload_module.upload_to_testflight = upload_mock
+    setattr(pyliot_pkg, module_name, pyliot_upload_module)
+
+    modules_patch = patch.dict(sys.modules, {"pyliot": pyliot_pkg, f"pyliot.{module_name}": pyliot_upload_module}, clear=False)
+    modules_patch.start()
+    test_case.addCleanup(modules_patch.stop)
+    sys.modules.pop(f"ucb_to_testflight.{module_name}", None)
+    module = importlib.import_module(f"ucb_to_testflight.{module_name}")
+
+    return module, upload_mock
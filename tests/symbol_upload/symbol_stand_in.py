@@ -0,0 +1,45 @@
+"""
+A local stand in for a symbol upload endpoint: accepts chunked POSTs and records each body, answering the first failures with 500.
+"""
+from __future__ import annotations
+
+from http.server import BaseHTTPRequestHandler
+
+from ..http_stand_in import HttpStandIn
+
+
+class SymbolStandIn(HttpStandIn):
+    methods = ("POST",)
+
+    def __init__(self, failures: int = 0) -> None:
+        super().__init__()
+        self.failures = failures
+        self.bodies = []
+        self.authorizations = []
+
+    @property
+    def url(self) -> str:
+        return self.base_url + "/symbols"
+
+    def _handle(self, handler: BaseHTTPRequestHandler, method: str) -> None:
+        if handler.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            body = _read_chunked(handler.rfile)
+        else:
+            body = handler.rfile.read(int(handler.headers["Content-Length"]))
+        with self.lock:
+            self.bodies.append(body)
+            self.authorizations.append(handler.headers.get("Authorization"))
+            failed = self.failures > 0
+            self.failures -= failed
+        self._respond(handler, 500 if failed else 200)
+
+
+def _read_chunked(stream) -> bytes:
+    body = bytearray()
+    while True:
+        size = int(stream.readline().split(b";")[0], 16)
+        if size == 0:
+            stream.readline()
+            return bytes(body)
+        body += stream.read(size)
+        stream.readline()
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import io
+from contextlib import redirect_stderr, redirect_stdout
+import os
+from pathlib import Path
+import tempfile
+import time
+import unittest
+import zipfile
+
+from ucb_to_testflight.multi_platform_upload import SYMBOLS_JOB_NAME, TESTFLIGHT_JOB_NAME, upload_all_platforms
+from ucb_to_testflight.retry_policy import RetryPolicy
+from ucb_to_testflight.symbol_upload import find_dsyms, upload_symbols
+from ucb_to_testflight.upload_parameters import UploadParameters
+
+from .symbol_stand_in import SymbolStandIn
+
+
+def _make_dsym(path: Path, size: int = 1000) -> Path:
+    dwarf = path / "Contents" / "Resources" / "DWARF"
+    dwarf.mkdir(parents=True)
+    (dwarf / path.name.split(".")[0]).write_bytes(os.urandom(size // 2) + b"\0" * (size // 2))
+    (path / "Contents" / "Info.plist").write_text("<plist/>")
+    return path
+
+
+class SymbolUploadTests(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+        (self.root / "build.ipa").write_bytes(b"ipa")
+        self.game_dsym = _make_dsym(self.root / "Game.app.dSYM", 3 * 1024 * 1024)   # More than one stream block
+        self.framework_dsym = _make_dsym(self.root / "Game.xcarchive" / "dSYMs" / "UnityFramework.framework.dSYM")
+
+    def _upload(self, server: SymbolStandIn, **kwargs):
+        with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+            return upload_symbols(self.root, server.url, retry_policy=RetryPolicy(max_attempts=3, base_delay=0), **kwargs)
+
+    def test_dsyms_are_found_next_to_the_build_and_in_archives(self) -> None:
+        self.assertEqual(find_dsyms(self.root), [self.game_dsym, self.framework_dsym])
+
+    def test_dsyms_are_uploaded_as_one_zip(self) -> None:
+        server = SymbolStandIn().start()
+        self.addCleanup(server.stop)
+
+        result = self._upload(server, token="secret")
+
+        self.assertEqual(len(server.bodies), 1)
+        self.assertEqual(result.zipped_bytes, len(server.bodies[0]))
+        self.assertEqual(server.authorizations, ["Bearer secret"])
+        with zipfile.ZipFile(io.BytesIO(server.bodies[0])) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(
+                archive.read("Game.app.dSYM/Contents/Resources/DWARF/Game"),
+                (self.game_dsym / "Contents" / "Resources" / "DWARF" / "Game").read_bytes(),
+            )
+            self.assertIn("UnityFramework.framework.dSYM/Contents/Info.plist", archive.namelist())
+
+    def test_failed_upload_is_retried_with_the_same_zip(self) -> None:
+        server = SymbolStandIn(failures=1).start()
+        self.addCleanup(server.stop)
+
+        self._upload(server)
+
+        self.assertEqual(len(server.bodies), 2)
+        self.assertEqual(server.bodies[0], server.bodies[1])
+
+    def test_nothing_is_sent_without_dsyms(self) -> None:
+        server = SymbolStandIn().start()
+        self.addCleanup(server.stop)
+        (self.root / "Game.app.dSYM").rename(self.root / "elsewhere")
+        (self.root / "Game.xcarchive").rename(self.root / "elsewhere2")
+
+        self.assertIsNone(self._upload(server))
+        self.assertEqual(server.bodies, [])
+
+    def test_symbols_upload_alongside_the_build(self) -> None:
+        server = SymbolStandIn().start()
+        self.addCleanup(server.stop)
+        parameters = UploadParameters()
+        parameters.output_directory = self.root
+        parameters.symbol_upload_url = server.url
+        parameters.max_host_uploads = 0
+        parameters.retry_base_delay = 0
+
+        def upload_ios(*values) -> None:
+            time.sleep(0.5)
+
+        start = time.monotonic()
+        with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+            results = upload_all_platforms(parameters, upload_ios)
+        duration = time.monotonic() - start
+
+        self.assertLess(duration, 0.9)
+        self.assertEqual([result.job.name for result in results], [TESTFLIGHT_JOB_NAME, SYMBOLS_JOB_NAME])
+        self.assertEqual([result.succeeded for result in results], [True, True])
+        self.assertEqual(len(server.bodies), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import contextlib
+import io
+import json
+from pathlib import Path
+import tempfile
+import unittest
+
+from ucb_to_testflight import tracing
+from ucb_to_testflight.retry_policy import RetryPolicy, run_with_retries
+
+
+class TracingTests(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.trace_path = Path(tmp.name) / "trace.jsonl"
+        self.addCleanup(tracing.configure, None, False)
+
+    def _read_trace(self) -> list:
+        return [json.loads(line) for line in self.trace_path.read_text(encoding="utf-8").splitlines()]
+
+    def test_spans_are_free_and_unrecorded_while_tracing_is_off(self) -> None:
+        tracing.configure(None, False)
+
+        with tracing.span("phase", size=1) as current:
+            current.set_attribute("more", 2)
+
+        self.assertIs(tracing.span("other"), tracing.span("another"))
+        self.assertEqual(tracing.finished_spans(), [])
+        self.assertFalse(self.trace_path.exists())
+
+    def test_spans_are_written_as_opentelemetry_json_lines(self) -> None:
+        tracing.configure(self.trace_path)
+
+        with tracing.span("upload", **{"upload.backend": "pilot"}) as parent:
+            with tracing.span("upload.attempt", **{"attempt.number": 1}) as child:
+                child.set_attribute("attempt.outcome", "succeeded")
+        with self.assertRaises(ValueError):
+            with tracing.span("ipa.validate"):
+                raise ValueError("bad zip")
+
+        attempt, upload, validate = self._read_trace()
+        self.assertEqual(upload["name"], "upload")
+        self.assertEqual(upload["parent_span_id"], "")
+        self.assertEqual(attempt["parent_span_id"], parent.span_id)
+        self.assertEqual(attempt["span_id"], child.span_id)
+        self.assertEqual(len(attempt["trace_id"]), 32)
+        self.assertEqual(len(attempt["span_id"]), 16)
+        self.assertEqual(attempt["trace_id"], upload["trace_id"])
+        self.assertEqual(attempt["attributes"], {"attempt.number": 1, "attempt.outcome": "succeeded"})
+        self.assertLessEqual(upload["start_time_unix_nano"], attempt["start_time_unix_nano"])
+        self.assertLessEqual(attempt["end_time_unix_nano"], upload["end_time_unix_nano"])
+        self.assertEqual(upload["status"], {"code": "STATUS_CODE_OK"})
+        self.assertEqual(validate["status"], {"code": "STATUS_CODE_ERROR", "message": "ValueError: bad zip"})
+
+    def test_spans_before_configure_are_kept_until_we_know_where_they_go(self) -> None:
+        tracing.begin()
+        with tracing.span("parameters.load"):
+            pass
+        tracing.configure(self.trace_path)
+
+        self.assertEqual([span["name"] for span in self._read_trace()], ["parameters.load"])
+
+        tracing.begin()
+        with tracing.span("parameters.load"):
+            pass
+        tracing.configure(None, False)
+        self.assertEqual(len(self._read_trace()), 1)
+        self.assertFalse(tracing.is_enabled())
+
+    def test_retry_attempts_are_spans_with_their_outcome(self) -> None:
+        tracing.configure(None, timings=True)
+        outcomes = iter([RuntimeError("connection reset"), None])
+
+        def attempt(number: int, timeout: float) -> str:
+            error = next(outcomes)
+            if error:
+                raise error
+            return "done"
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            run_with_retries(attempt, RetryPolicy(max_attempts=3, base_delay=0), sleep=lambda seconds: None)
+
+        first, second = tracing.finished_spans()
+        self.assertEqual(first.attributes["attempt.number"], 1)
+        self.assertEqual(first.attributes["attempt.outcome"], "failed")
+        self.assertEqual(first.error, "RuntimeError: connection reset")
+        self.assertIn("retry.delay_seconds", first.attributes)
+        self.assertEqual(second.attributes["attempt.outcome"], "succeeded")
+
+    def test_timings_table_lists_phases_under_their_parents(self) -> None:
+        tracing.configure(None, timings=True)
+        with tracing.span("upload"):
+            with tracing.span("upload.attempt", **{"attempt.number": 1}):
+                pass
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            tracing.print_timings()
+
+        lines = output.getvalue().splitlines()
+        self.assertTrue(any(line.startswith("  upload ") for line in lines))
+        self.assertTrue(any(line.startswith("    upload.attempt ") and "attempt.number=1" in line for line in lines))
+        self.assertTrue(any(line.strip().startswith("total") for line in lines))
+
+
+if __name__ == "__main__":
+    unittest.main()
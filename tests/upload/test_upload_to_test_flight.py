@@ -1,32 +1,20 @@
 from __future__ import annotations
 
-import importlib
 from pathlib import Path
-import sys
+import shutil
+import subprocess
 import tempfile
-import types
 import unittest
-from unittest.mock import Mock, patch
+from unittest.mock import patch
 
+from ucb_to_testflight.upload_ledger import LEDGER_FILE_NAME, UploadLedger
 
-class UploadToTestFlightTests(unittest.TestCase):
-    def _import_module_with_stubbed_pyliot(self):
-        upload_mock = Mock()
-        pyliot_pkg = types.ModuleType("pyliot")
-        pyliot_upload_module = types.ModuleType("pyliot.upload_to_test_flight")
-        pyliot_upload_module.upload_to_testflight = upload_mock
-        pyliot_pkg.upload_to_test_flight = pyliot_upload_module
-
-        patched_modules = {
-            "pyliot": pyliot_pkg,
-            "pyliot.upload_to_test_flight": pyliot_upload_module,
-        }
+from ..support import import_with_stubbed_pyliot, write_ipa
 
-        with patch.dict(sys.modules, patched_modules, clear=False):
-            sys.modules.pop("ucb_to_testflight.upload_to_test_flight", None)
-            module = importlib.import_module("ucb_to_testflight.upload_to_test_flight")
 
-        return module, upload_mock
+class UploadToTestFlightTests(unittest.TestCase):
+    def _import_module_with_stubbed_pyliot(self):
+        return import_with_stubbed_pyliot(self, "upload_to_test_flight")
 
     def test_upload_delegates_to_pyliot_with_changelog_contents(self) -> None:
         module, pyliot_upload_mock = self._import_module_with_stubbed_pyliot()
@@ -50,6 +38,7 @@ class UploadToTestFlightTests(unittest.TestCase):
                     groups=["group-a", "group-b"],
                     max_upload_attempts=5,
                     attempt_timeout_seconds=123,
+                    wait_for_processing=False,
                 )
 
         finder_cls.assert_called_once_with(root, ".ipa")
@@ -65,5 +54,97 @@ class UploadToTestFlightTests(unittest.TestCase):
         )
 
 
+class UploadLedgerSkipTests(unittest.TestCase):
+    def _upload(self, module, root: Path, **kwargs) -> None:
+        module.upload_to_testflight(
+            app_store_connect_api_key_issuer_id="issuer-id",
+            app_store_connect_api_key_id="key-id",
+            app_store_connect_api_key_content="key-content",
+            output_directory=root,
+            cache_directory=root / "cache",
+            **{"changelog_path": root / "CHANGELOG.txt", "wait_for_processing": False, "duplicate_build_check": "off", **kwargs},
+        )
+
+    def test_skips_builds_already_in_the_ledger_unless_forced(self) -> None:
+        module, pyliot_upload_mock = import_with_stubbed_pyliot(self)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            (root / "CHANGELOG.txt").write_text("Release notes", encoding="utf-8")
+            write_ipa(root / "build.ipa")
+
+            self._upload(module, root)
+            self._upload(module, root)
+            self.assertEqual(pyliot_upload_mock.call_count, 1)
+
+            self._upload(module, root, force=True)
+            self.assertEqual(pyliot_upload_mock.call_count, 2)
+
+    def test_failed_upload_is_not_recorded(self) -> None:
+        module, pyliot_upload_mock = import_with_stubbed_pyliot(self)
+        pyliot_upload_mock.side_effect = RuntimeError("upload failed")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            (root / "CHANGELOG.txt").write_text("Release notes", encoding="utf-8")
+            write_ipa(root / "build.ipa")
+
+            with self.assertRaises(RuntimeError):
+                self._upload(module, root, max_upload_attempts=1)
+            with self.assertRaises(RuntimeError):
+                self._upload(module, root, max_upload_attempts=1)
+
+            self.assertEqual(pyliot_upload_mock.call_count, 2)
+
+    def test_pyliot_is_called_one_attempt_at_a_time_and_fatal_errors_stop_retries(self) -> None:
+        module, pyliot_upload_mock = import_with_stubbed_pyliot(self)
+        pyliot_upload_mock.side_effect = [RuntimeError("connection reset"), RuntimeError("ERROR ITMS-4238: Redundant Binary Upload")]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            (root / "CHANGELOG.txt").write_text("Release notes", encoding="utf-8")
+            write_ipa(root / "build.ipa")
+
+            with self.assertRaisesRegex(RuntimeError, "non retryable"):
+                self._upload(module, root, max_upload_attempts=5, retry_base_delay=0)
+
+        self.assertEqual(pyliot_upload_mock.call_count, 2)
+        self.assertEqual(pyliot_upload_mock.call_args.kwargs["max_upload_attempts"], 1)
+
+    def test_dry_run_stops_before_uploading(self) -> None:
+        module, pyliot_upload_mock = import_with_stubbed_pyliot(self)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            (root / "CHANGELOG.txt").write_text("Release notes", encoding="utf-8")
+            write_ipa(root / "build.ipa")
+
+            self._upload(module, root, dry_run=True)
+            self._upload(module, root, dry_run=True)
+
+        pyliot_upload_mock.assert_not_called()
+
+    @unittest.skipIf(shutil.which("git") is None, "git isn't installed")
+    def test_git_changelog_source_generates_notes_and_records_the_commit(self) -> None:
+        module, pyliot_upload_mock = import_with_stubbed_pyliot(self)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            write_ipa(root / "build.ipa")
+            repository = root / "repo"
+            repository.mkdir()
+            git = ["git", "-C", str(repository), "-c", "user.email=dev@example.com", "-c", "user.name=Dev"]
+            subprocess.run([*git, "init", "-q"], check=True)
+            subprocess.run([*git, "commit", "-q", "--allow-empty", "-m", "feat: Gem bundles"], check=True)
+            head = subprocess.run([*git, "rev-parse", "HEAD"], check=True, capture_output=True, text=True).stdout.strip()
+
+            self._upload(module, root, changelog_path=None, changelog_source="git", changelog_repository=repository)
+
+            ledger = UploadLedger(root / "cache" / LEDGER_FILE_NAME)
+            self.assertEqual(ledger.last_git_commit("com.example.game"), head)
+
+        self.assertEqual(pyliot_upload_mock.call_args.kwargs["changelog"], "New:\n- Gem bundles")
+
+
 if __name__ == "__main__":
     unittest.main()
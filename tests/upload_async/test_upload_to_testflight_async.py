@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+import shlex
+import sys
+import tempfile
+import textwrap
+import time
+import unittest
+
+from ucb_to_testflight.pilot import build_pilot_arguments, run_pilot_attempt
+from ucb_to_testflight.upload_to_testflight_async import upload_to_testflight_async
+
+from ..support import write_ipa
+
+
+def _write_script(directory: Path, name: str, source: str) -> str:
+    path = directory / name
+    path.write_text(textwrap.dedent(source), encoding="utf-8")
+    return f"{shlex.quote(sys.executable)} {shlex.quote(str(path))}"
+
+
+class RunPilotAttemptTests(unittest.TestCase):
+    def test_streams_lines_while_the_process_is_running(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            command = _write_script(Path(tmp), "pilot.py", """
+                import sys, time
+                print("starting", flush=True)
+                print("warning", file=sys.stderr, flush=True)
+                time.sleep(0.3)
+                print("done", flush=True)
+            """)
+            received = []
+            ticks = []
+
+            async def tick() -> None:
+                for _ in range(5):
+                    ticks.append(len(received))
+                    await asyncio.sleep(0.05)
+
+            async def run():
+                return (await asyncio.gather(
+                    run_pilot_attempt(shlex.split(command), 10, lambda stream, line: received.append((stream, line))),
+                    tick(),
+                ))[0]
+
+            result = asyncio.run(run())
+
+        self.assertTrue(result.succeeded)
+        self.assertEqual(sorted(received), [("stderr", "warning"), ("stdout", "done"), ("stdout", "starting")])
+        # Other work ran while pilot was sleeping, and saw output before pilot finished
+        self.assertEqual(len(ticks), 5)
+        self.assertIn(2, ticks)
+
+    def test_timeout_kills_the_whole_process_group(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            marker = root / "grandchild-survived"
+            command = _write_script(root, "pilot.py", f"""
+                import subprocess, sys, time
+                subprocess.Popen([sys.executable, "-c", "import time, pathlib; time.sleep(1.5); pathlib.Path({str(marker)!r}).touch()"])
+                print("uploading", flush=True)
+                time.sleep(30)
+            """)
+
+            start = time.monotonic()
+            result = asyncio.run(run_pilot_attempt(shlex.split(command), 0.5, lambda stream, line: None))
+            elapsed = time.monotonic() - start
+            time.sleep(2)
+
+            self.assertTrue(result.timed_out)
+            self.assertFalse(result.succeeded)
+            self.assertLess(elapsed, 10)
+            self.assertFalse(marker.exists())
+
+    def test_output_up_to_the_end_is_handed_over_after_a_timeout(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            command = _write_script(Path(tmp), "pilot.py", """
+                import signal, sys, time
+
+                def stop(*args):
+                    print("stopping", flush=True)
+                    sys.exit(1)
+
+                signal.signal(signal.SIGTERM, stop)
+                print("uploading", flush=True)
+                time.sleep(30)
+            """)
+            lines = []
+
+            result = asyncio.run(run_pilot_attempt(shlex.split(command), 1.5, lambda stream, line: lines.append((stream, line))))
+
+        self.assertTrue(result.timed_out)
+        self.assertEqual(lines, [("stdout", "uploading"), ("stdout", "stopping")])
+
+    def test_groups_are_distributed_externally(self) -> None:
+        arguments = build_pilot_arguments("fastlane pilot upload", Path("key.json"), Path("a.ipa"), "notes", ["a", "b"])
+
+        self.assertEqual(arguments[:3], ["fastlane", "pilot", "upload"])
+        self.assertIn("a,b", arguments)
+        self.assertEqual(arguments[arguments.index("--distribute_external") + 1], "true")
+
+
+class UploadToTestFlightAsyncTests(unittest.TestCase):
+    def test_retries_failed_attempts_and_records_the_upload(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            (root / "CHANGELOG.txt").write_text("Release notes", encoding="utf-8")
+            write_ipa(root / "build.ipa")
+            counter = root / "attempts"
+            command = _write_script(root, "pilot.py", f"""
+                import json, pathlib, sys
+                counter = pathlib.Path({str(counter)!r})
+                count = int(counter.read_text()) + 1 if counter.exists() else 1
+                counter.write_text(str(count))
+                key = json.loads(pathlib.Path(sys.argv[sys.argv.index("--api_key_path") + 1]).read_text())
+                assert key["key_id"] == "key-id" and key["issuer_id"] == "issuer-id"
+                assert sys.argv[sys.argv.index("--changelog") + 1] == "Release notes"
+                sys.exit(1 if count == 1 else 0)
+            """)
+
+            def upload():
+                return asyncio.run(upload_to_testflight_async(
+                    app_store_connect_api_key_issuer_id="issuer-id",
+                    app_store_connect_api_key_id="key-id",
+                    app_store_connect_api_key_content="key-content",
+                    output_directory=root,
+                    changelog_path=root / "CHANGELOG.txt",
+                    max_upload_attempts=3,
+                    cache_directory=root / "cache",
+                    retry_base_delay=0,
+                    pilot_command=command,
+                ))
+
+            attempts = upload()
+            self.assertEqual([attempt.return_code for attempt in attempts], [1, 0])
+            self.assertEqual(upload(), [])
+            self.assertEqual(counter.read_text(), "2")
+
+    def test_raises_when_every_attempt_fails(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            (root / "CHANGELOG.txt").write_text("Release notes", encoding="utf-8")
+            write_ipa(root / "build.ipa")
+            command = _write_script(root, "pilot.py", "import sys; sys.exit(3)")
+
+            with self.assertRaises(RuntimeError):
+                asyncio.run(upload_to_testflight_async(
+                    app_store_connect_api_key_issuer_id="issuer-id",
+                    app_store_connect_api_key_id="key-id",
+                    app_store_connect_api_key_content="key-content",
+                    output_directory=root,
+                    changelog_path=root / "CHANGELOG.txt",
+                    max_upload_attempts=2,
+                    cache_directory=root / "cache",
+                    retry_base_delay=0,
+                    pilot_command=command,
+                ))
+
+
+if __name__ == "__main__":
+    unittest.main()
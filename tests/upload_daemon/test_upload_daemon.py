@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import io
+from pathlib import Path
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from ucb_to_testflight.context_threads import ContextThreadPoolExecutor
+from ucb_to_testflight.upload_daemon import FifoSlots, UploadDaemon, upload_via_daemon
+from ucb_to_testflight.upload_parameters import UploadParameters
+
+
+def _parameters(output_directory: str) -> UploadParameters:
+    parameters = UploadParameters()
+    parameters.app_store_connect_api_key_issuer_id = "issuer"
+    parameters.app_store_connect_api_key_id = "key"
+    parameters.app_store_connect_api_key_content = "content"
+    parameters.output_directory = Path(output_directory)
+    parameters.changelog_path = Path("notes.txt")
+    return parameters
+
+
+class UploadDaemonTests(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.socket_path = Path(tmp.name) / "daemon.sock"
+
+        # serve() swaps sys.stdout for its per job router. Its fallback (the daemon's own output) is this buffer.
+        self.addCleanup(setattr, sys, "stdout", sys.stdout)
+        self.addCleanup(setattr, sys, "stderr", sys.stderr)
+        self.output = io.StringIO()
+        sys.stdout = self.output
+
+    def _start_daemon(self, upload, max_concurrent_uploads: int = 1) -> UploadDaemon:
+        daemon = UploadDaemon(self.socket_path, max_concurrent_uploads, upload=upload)
+        thread = threading.Thread(target=daemon.serve, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join, 5)
+        self.addCleanup(daemon.shutdown)
+        return daemon
+
+    def test_no_daemon_means_upload_in_process(self) -> None:
+        self.assertIsNone(upload_via_daemon(self.socket_path, _parameters("build")))
+
+    def test_upload_runs_in_daemon_and_output_is_streamed_back(self) -> None:
+        calls = []
+
+        def upload(*values):
+            calls.append(values)
+            print("hello from the daemon")
+
+        self._start_daemon(upload)
+
+        self.assertTrue(upload_via_daemon(self.socket_path, _parameters("build")))
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(calls[0]), len(UploadParameters._parameter_names))
+        self.assertEqual(calls[0][:3], ("issuer", "key", "content"))
+        self.assertEqual(calls[0][3], Path("build").resolve())   # Relative to the client, not the daemon
+        self.assertEqual(calls[0][5], [])
+        self.assertIn("hello from the daemon", self.output.getvalue())
+
+    def test_output_from_the_jobs_threads_is_streamed_back_to_its_client(self) -> None:
+        def upload(*values):
+            with ContextThreadPoolExecutor(2) as executor:
+                list(executor.map(lambda index: print(f"chunk {index} from {values[3].name}"), range(2)))
+            print(f"warning from {values[3].name}", file=sys.stderr)
+
+        daemon = self._start_daemon(upload)
+        client_output = io.StringIO()
+        daemon.stdout._fallback = daemon.stderr._fallback = io.StringIO()    # The daemon's own output
+        sys.stdout = client_output
+
+        self.assertTrue(upload_via_daemon(self.socket_path, _parameters("build")))
+
+        for line in ("chunk 0 from build", "chunk 1 from build", "warning from build"):
+            self.assertIn(line, client_output.getvalue())
+        self.assertNotIn("from build", daemon.stdout._fallback.getvalue())
+
+    def test_pyliot_job_showing_fastlane_logs_runs_in_process(self) -> None:
+        calls = []
+        self._start_daemon(lambda *values: calls.append(values))
+        parameters = _parameters("build")
+        parameters.show_fastlane_logs = True
+
+        self.assertIsNone(upload_via_daemon(self.socket_path, parameters))
+        self.assertEqual(calls, [])
+
+    def test_failed_upload_is_reported_to_the_client(self) -> None:
+        def upload(*values):
+            raise RuntimeError("no builds here")
+
+        self._start_daemon(upload)
+
+        self.assertFalse(upload_via_daemon(self.socket_path, _parameters("build")))
+        self.assertIn("RuntimeError: no builds here", self.output.getvalue())
+
+    def test_uploads_beyond_the_limit_wait_their_turn(self) -> None:
+        running = []
+        max_running = []
+        lock = threading.Lock()
+
+        def upload(*values):
+            with lock:
+                running.append(values[3])
+                max_running.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.remove(values[3])
+
+        self._start_daemon(upload, max_concurrent_uploads=2)
+
+        results = []
+        clients = [
+            threading.Thread(target=lambda index=index: results.append(upload_via_daemon(self.socket_path, _parameters(f"build-{index}"))))
+            for index in range(5)
+        ]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join(5)
+
+        self.assertEqual(results, [True] * 5)
+        self.assertEqual(max(max_running), 2)
+
+    def test_daemon_started_from_other_code_turns_the_job_down(self) -> None:
+        calls = []
+        daemon = self._start_daemon(lambda *values: calls.append(values))
+        daemon.code_fingerprint = "before the git pull"
+
+        self.assertIsNone(upload_via_daemon(self.socket_path, _parameters("build")))
+        self.assertEqual(calls, [])
+        self.assertIn("different code", self.output.getvalue())
+
+    def test_stale_socket_is_replaced_but_a_live_daemon_is_not(self) -> None:
+        self.socket_path.write_text("left over from a crash")
+        self._start_daemon(lambda *values: None)
+
+        self.assertTrue(self.socket_path.exists())
+        self.assertEqual(self.socket_path.stat().st_mode & 0o777, 0o600)
+        with self.assertRaisesRegex(RuntimeError, "already listening"):
+            UploadDaemon(self.socket_path, 1, upload=lambda *values: None)
+
+
+class FifoSlotsTests(unittest.TestCase):
+    def test_slots_are_handed_out_in_arrival_order(self) -> None:
+        slots = FifoSlots(1)
+        slots.acquire()
+        order = []
+
+        def wait(index: int) -> None:
+            slots.acquire()
+            order.append(index)
+            slots.release()
+
+        threads = []
+        for index in range(4):
+            thread = threading.Thread(target=wait, args=(index,))
+            thread.start()
+            threads.append(thread)
+            while slots.waiting_ahead_of_new_ticket() < index + 1:
+                time.sleep(0.001)
+
+        slots.release()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(order, [0, 1, 2, 3])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import io
+from contextlib import redirect_stdout
+from pathlib import Path
+import tempfile
+import unittest
+
+from ucb_to_testflight.retry_policy import RetryPolicy, UploadAttemptError, run_with_retries
+from ucb_to_testflight.upload_history import (
+    MIN_SAMPLES,
+    AttemptRecorder,
+    UploadHistory,
+    adaptive_attempt_timeout,
+    percentile,
+    plan_attempt_timeout,
+)
+
+from ..support import FakeClock
+
+MB = 1000 ** 2
+
+
+class AdaptiveTimeoutTests(unittest.TestCase):
+    def test_percentile_interpolates_between_ranks(self) -> None:
+        self.assertEqual(percentile([4, 1, 3, 2, 5], 0.5), 3)
+        self.assertAlmostEqual(percentile([1, 2, 3, 4, 5], 0.95), 4.8)
+        self.assertIsNone(percentile([], 0.5))
+
+    def test_timeout_scales_with_size_at_the_slow_end_of_throughput(self) -> None:
+        throughputs = [1 * MB] + [10 * MB] * 19
+
+        small = adaptive_attempt_timeout(50 * MB, throughputs, floor=60, ceiling=3600)
+        big = adaptive_attempt_timeout(500 * MB, throughputs, floor=60, ceiling=3600)
+
+        self.assertEqual(small, 60)     # Floor
+        self.assertGreater(big, 2 * 500 / 10)   # Slower than the median
+        self.assertEqual(adaptive_attempt_timeout(50_000 * MB, throughputs, floor=60, ceiling=3600), 3600)
+        self.assertIsNone(adaptive_attempt_timeout(50 * MB, throughputs[:MIN_SAMPLES - 1], floor=60, ceiling=3600))
+
+
+class UploadHistoryTests(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+        self.history = UploadHistory(self.root / "cache" / "upload_history.sqlite3")
+        self.ipa_path = self.root / "Game.ipa"
+        self.ipa_path.write_bytes(b"x" * 1000)
+
+    def test_every_attempt_is_recorded_with_its_outcome(self) -> None:
+        clock = FakeClock()
+        recorder = AttemptRecorder(self.history, "mac-1", "pyliot", self.ipa_path, clock)
+
+        def attempt_upload(attempt: int, timeout: float) -> None:
+            clock.now += 10 * attempt
+            if attempt == 1:
+                raise UploadAttemptError("pilot timed out", timed_out=True)
+            if attempt == 2:
+                raise UploadAttemptError("pilot exited with 1")
+
+        with redirect_stdout(io.StringIO()):
+            run_with_retries(recorder.wrap(attempt_upload), RetryPolicy(max_attempts=3, base_delay=0), sleep=lambda seconds: None)
+
+        [summary] = self.history.summarize()
+        self.assertEqual((summary.agent, summary.attempts, summary.failures, summary.timeouts), ("mac-1", 3, 2, 1))
+        self.assertEqual(summary.p50_duration, 30)
+        self.assertEqual(self.history.recent_throughputs("mac-1"), [1000 / 30])
+
+    def test_summaries_are_per_agent(self) -> None:
+        for duration in (10, 20, 30, 40):
+            self.history.record_attempt("mac-1", "pilot", "Game.ipa", 1000, 1, 600, duration, "succeeded")
+        self.history.record_attempt("mac-2", "pilot", "Game.ipa", 1000, 1, 600, 600, "timed_out")
+
+        summaries = {summary.agent: summary for summary in self.history.summarize()}
+
+        self.assertEqual(summaries["mac-1"].failure_rate, 0)
+        self.assertEqual(summaries["mac-1"].p50_duration, 25)
+        self.assertAlmostEqual(summaries["mac-1"].p95_duration, 38.5)
+        self.assertEqual(summaries["mac-2"].failure_rate, 1)
+        self.assertIsNone(summaries["mac-2"].p50_duration)
+
+    def test_plan_uses_other_agents_until_this_one_has_enough_uploads(self) -> None:
+        for _ in range(MIN_SAMPLES):
+            self.history.record_attempt("mac-1", "pilot", "Game.ipa", 100 * MB, 1, 600, 100, "succeeded")   # 1 MB/s
+
+        with redirect_stdout(io.StringIO()):
+            new_agent = plan_attempt_timeout(self.history, 200 * MB, "mac-2", 600, 60, 3600)
+            empty = plan_attempt_timeout(UploadHistory(self.root / "empty.sqlite3"), 200 * MB, "mac-2", 600, 60, 3600)
+
+        self.assertAlmostEqual(new_agent, 400)
+        self.assertEqual(empty, 600)
+
+
+if __name__ == "__main__":
+    unittest.main()
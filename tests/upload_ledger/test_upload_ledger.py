@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import hashlib
+from pathlib import Path
+import tempfile
+import unittest
+
+from ucb_to_testflight.upload_ledger import UploadLedger, fingerprint_file
+
+
+class FingerprintFileTests(unittest.TestCase):
+    def test_matches_sha256_of_contents_across_chunk_boundaries(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            ipa_path = Path(tmp) / "build.ipa"
+            contents = bytes(range(256)) * 41
+            ipa_path.write_bytes(contents)
+
+            self.assertEqual(fingerprint_file(ipa_path, chunk_size=1000), hashlib.sha256(contents).hexdigest())
+            self.assertEqual(fingerprint_file(ipa_path), hashlib.sha256(contents).hexdigest())
+
+    def test_empty_file(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            ipa_path = Path(tmp) / "empty.ipa"
+            ipa_path.write_bytes(b"")
+
+            self.assertEqual(fingerprint_file(ipa_path), hashlib.sha256(b"").hexdigest())
+
+
+class UploadLedgerTests(unittest.TestCase):
+    def test_records_persist_between_instances(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            ipa_path = root / "build.ipa"
+            ipa_path.write_bytes(b"binary")
+            ledger_path = root / "cache" / "ledger.sqlite3"
+
+            UploadLedger(ledger_path).record_upload("abc", ipa_path)
+            reopened = UploadLedger(ledger_path)
+
+            self.assertTrue(reopened.is_uploaded("abc"))
+            self.assertFalse(reopened.is_uploaded("def"))
+            self.assertEqual(reopened.get("abc")["file_name"], "build.ipa")
+            self.assertEqual(reopened.get("abc")["size"], 6)
+
+    def test_recording_twice_replaces_the_entry(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            first = root / "first.ipa"
+            second = root / "second.ipa"
+            first.write_bytes(b"same")
+            second.write_bytes(b"same")
+            ledger = UploadLedger(root / "ledger.sqlite3")
+
+            ledger.record_upload("abc", first)
+            ledger.record_upload("abc", second)
+
+            self.assertEqual(ledger.get("abc")["file_name"], "second.ipa")
+
+
+if __name__ == "__main__":
+    unittest.main()
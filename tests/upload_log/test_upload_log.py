@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import asyncio
+import io
+from contextlib import redirect_stdout
+from pathlib import Path
+import shlex
+import sys
+import tempfile
+import textwrap
+import unittest
+
+from ucb_to_testflight.retry_policy import RetryPolicy
+from ucb_to_testflight.upload_log import RingBuffer, UploadLogCapture, parse_progress
+from ucb_to_testflight.upload_to_testflight_async import upload_ipa_async
+
+
+class RingBufferTests(unittest.TestCase):
+    def test_keeps_only_the_last_bytes(self) -> None:
+        buffer = RingBuffer(8)
+
+        buffer.write(b"abc")
+        self.assertEqual(buffer.getvalue(), b"abc")
+        buffer.write(b"defgh")
+        buffer.write(b"ij")
+        self.assertEqual(buffer.getvalue(), b"cdefghij")
+        buffer.write(b"0123456789")
+        self.assertEqual(buffer.getvalue(), b"23456789")
+
+
+class ParseProgressTests(unittest.TestCase):
+    def test_amounts(self) -> None:
+        self.assertEqual(parse_progress("Transferred 12.5 MB of 100 MB"), 12_500_000)
+        self.assertEqual(parse_progress("[Transporter] 1,024 / 4,096 bytes"), 1024)
+        self.assertEqual(parse_progress("Uploaded 2 MiB/8 MiB"), 2 * 1024 ** 2)
+
+    def test_percentages_need_the_size_and_an_upload_line(self) -> None:
+        self.assertEqual(parse_progress("Upload progress: 25%", 1000), 250)
+        self.assertIsNone(parse_progress("Upload progress: 25%"))
+        self.assertIsNone(parse_progress("Compressing: 25%", 1000))
+        self.assertIsNone(parse_progress("Uploading 5 of 10 files"))
+
+
+class UploadLogCaptureTests(unittest.TestCase):
+    def test_tail_is_bounded_and_starts_at_a_whole_line(self) -> None:
+        capture = UploadLogCapture(failure_log_kb=1, output=lambda text: None)
+
+        for index in range(10_000):
+            capture.handle_line("stdout", f"line {index}")
+
+        tail = capture.tail()
+        self.assertLessEqual(len(tail), 1024)
+        self.assertTrue(tail.startswith("line "))
+        self.assertTrue(tail.endswith("line 9999"))
+
+    def test_progress_is_reported_at_most_every_interval(self) -> None:
+        now = [0.0]
+        printed = []
+        capture = UploadLogCapture(total_bytes=100_000_000, progress_interval=10, clock=lambda: now[0], output=printed.append)
+
+        for second in range(31):
+            now[0] = second
+            capture.handle_line("stdout", f"Upload progress: {second}%")
+
+        self.assertEqual(len(printed), 4)   # At 0, 10, 20 and 30 seconds
+        self.assertEqual(printed[-1], "Uploaded 30.0 MB of 100.0 MB (30%), 1.0 MB/s")
+        self.assertEqual(capture.bytes_uploaded, 30_000_000)
+        self.assertAlmostEqual(capture.bytes_per_second, 1_000_000)
+
+
+class PilotLogCaptureTests(unittest.TestCase):
+    def test_failed_attempt_shows_only_the_tail_and_keeps_its_throughput(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            ipa_path = root / "build.ipa"
+            ipa_path.write_bytes(b"0" * 1_000_000)
+            script = root / "pilot.py"
+            script.write_text(textwrap.dedent("""
+                import sys, time
+                for index in range(5000):
+                    print(f"noise {index} " + "x" * 100)
+                for percent in (10, 50):
+                    print(f"Upload progress: {percent}%", flush=True)
+                    time.sleep(0.1)
+                print("Connection reset by peer", file=sys.stderr)
+                sys.exit(1)
+            """))
+
+            output = io.StringIO()
+            with redirect_stdout(output), self.assertRaises(RuntimeError):
+                asyncio.run(upload_ipa_async(
+                    "issuer-id", "key-id", "key-content", ipa_path, "notes",
+                    retry_policy=RetryPolicy(max_attempts=1),
+                    pilot_command=f"{shlex.quote(sys.executable)} {shlex.quote(str(script))}",
+                    on_line=lambda stream, line: None,
+                    failure_log_kb=4,
+                    progress_interval=0,
+                ))
+
+        printed = output.getvalue()
+        self.assertIn("Connection reset by peer", printed)
+        self.assertIn("Uploaded 0.5 MB of 1.0 MB (50%)", printed)
+        self.assertNotIn("noise 0 ", printed)
+        self.assertLess(len(printed), 8 * 1024)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -121,6 +121,46 @@ class UploadParametersTests(unittest.TestCase):
             self.assertEqual(values[6], 7)
             self.assertEqual(values[7], 90)
 
+    def test_bool_parameters_work_as_bare_cli_flags(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            os.environ.update(
+                {
+                    "APP_STORE_CONNECT_API_KEY_ISSUER_ID": "issuer",
+                    "APP_STORE_CONNECT_API_KEY_ID": "key",
+                    "APP_STORE_CONNECT_API_KEY_CONTENT": "content",
+                    "OUTPUT_DIRECTORY": str(root),
+                    "CHANGELOG_PATH": str(root / "notes.txt"),
+                }
+            )
+
+            with patch("sys.argv", ["test", "--force"]):
+                parameters = UploadParameters()
+                parameters.load()
+
+            self.assertTrue(parameters.force)
+            self.assertEqual(parameters.meta_data["force"]["source"], ParameterSource.CLI)
+
+    def test_git_changelog_source_does_not_need_a_changelog_path(self) -> None:
+        os.environ.update(
+            {
+                "APP_STORE_CONNECT_API_KEY_ISSUER_ID": "issuer",
+                "APP_STORE_CONNECT_API_KEY_ID": "key",
+                "APP_STORE_CONNECT_API_KEY_CONTENT": "content",
+                "OUTPUT_DIRECTORY": "build",
+                "CHANGELOG_SOURCE": "git",
+                "CHANGELOG_COMMIT_TYPES": "feat,fix",
+            }
+        )
+
+        parameters = UploadParameters()
+        parameters.load()
+        values = dict(zip(parameters._parameter_names, parameters.get_values()))
+
+        self.assertIsNone(values["changelog_path"])
+        self.assertEqual(values["changelog_source"], "git")
+        self.assertEqual(values["changelog_commit_types"], ["feat", "fix"])
+
 
 if __name__ == "__main__":
     unittest.main()
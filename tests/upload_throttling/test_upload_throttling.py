@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from ucb_to_testflight.http_connection_pool import HttpConnectionPool
+from ucb_to_testflight.upload_throttling import HostUploadSlots, TokenBucket, throttled
+
+from ..support import FakeClock
+from . import upload_stand_in
+from .upload_stand_in import UploadStandIn
+
+
+class HostUploadSlotsTests(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = Path(tmp.name) / "upload_slots"
+
+    def test_processes_uploading_at_once_share_the_slots(self) -> None:
+        server = UploadStandIn(hold_seconds=0.3).start()
+        self.addCleanup(server.stop)
+        environment = {**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)}
+
+        processes = [
+            subprocess.Popen([sys.executable, "-m", upload_stand_in.__name__, str(self.directory), server.url], env=environment)
+            for _ in range(5)
+        ]
+        return_codes = [process.wait(30) for process in processes]
+
+        self.assertEqual(return_codes, [0] * 5)
+        self.assertEqual(len(server.bodies), 5)
+        self.assertEqual(server.max_in_flight, 2)
+
+    def test_waiters_get_slots_by_priority_then_arrival(self) -> None:
+        holder = HostUploadSlots(self.directory, 1)
+        holder.acquire()
+        order = []
+
+        def wait_for_slot(name: str, priority: int) -> None:
+            with HostUploadSlots(self.directory, 1, priority, poll_interval=0.01):
+                order.append(name)
+
+        threads = []
+        for name, priority in (("first", 0), ("second", 0), ("urgent", 5)):
+            threads.append(threading.Thread(target=wait_for_slot, args=(name, priority)))
+            threads[-1].start()
+            time.sleep(0.05)
+        holder.release()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(order, ["urgent", "first", "second"])
+
+    def test_ticket_left_by_a_dead_process_is_skipped(self) -> None:
+        (self.directory / "queue").mkdir(parents=True)
+        (self.directory / "queue" / "000-00000000000000000001-1-1.ticket").write_text("")   # Front of the queue, but nobody holds it
+
+        slots = HostUploadSlots(self.directory, 1, poll_interval=0.01)
+        start = time.monotonic()
+        with slots:
+            self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(os.listdir(self.directory / "queue"), [])
+
+
+class BandwidthTests(unittest.TestCase):
+    def test_token_bucket_keeps_to_its_rate_after_the_burst(self) -> None:
+        clock = FakeClock()
+        bucket = TokenBucket(1000, capacity=1000, clock=clock, sleep=clock.sleep)
+
+        for _ in range(10):
+            bucket.consume(1000)
+
+        self.assertAlmostEqual(clock.now, 9)
+
+    def test_throttled_body_arrives_whole_at_the_capped_rate(self) -> None:
+        server = UploadStandIn().start()
+        self.addCleanup(server.stop)
+        data = os.urandom(300 * 1024)
+
+        start = time.monotonic()
+        body, headers = throttled(memoryview(data), {"Content-Type": "application/octet-stream"}, TokenBucket(1024 * 1024, capacity=64 * 1024))
+        with HttpConnectionPool() as pool:
+            response = pool.request("PUT", server.url, body=body, headers=headers)
+        duration = time.monotonic() - start
+
+        self.assertTrue(response.ok)
+        self.assertEqual(server.bodies, [data])
+        self.assertGreater(duration, 0.2)   # (300 - 64) KiB at 1 MiB/s
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+"""
+A local stand in for an upload endpoint: accepts PUTs, holds each one for hold_seconds and records how many were in flight at once.
+Run as a module it's one uploading process instead: takes a host upload slot, then PUTs its body to the stand in.
+"""
+from __future__ import annotations
+
+from http.server import BaseHTTPRequestHandler
+from pathlib import Path
+import sys
+import time
+
+from ..http_stand_in import HttpStandIn
+
+
+class UploadStandIn(HttpStandIn):
+    methods = ("PUT",)
+
+    def __init__(self, hold_seconds: float = 0) -> None:
+        super().__init__()
+        self.hold_seconds = hold_seconds
+        self.bodies = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    @property
+    def url(self) -> str:
+        return self.base_url + "/upload"
+
+    def _handle(self, handler: BaseHTTPRequestHandler, method: str) -> None:
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        body = handler.rfile.read(int(handler.headers["Content-Length"]))
+        time.sleep(self.hold_seconds)
+        with self.lock:
+            self.in_flight -= 1
+            self.bodies.append(body)
+        self._respond(handler, 200)
+
+
+def _upload_with_a_host_slot(slots_directory: str, url: str) -> None:
+    from ucb_to_testflight.http_connection_pool import HttpConnectionPool
+    from ucb_to_testflight.upload_throttling import HostUploadSlots
+
+    with HostUploadSlots(Path(slots_directory), 2, poll_interval=0.02), HttpConnectionPool() as pool:
+        response = pool.request("PUT", url, body=b"x" * 1000)
+    sys.exit(0 if response.ok else 1)
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "src"))
+    _upload_with_a_host_slot(sys.argv[1], sys.argv[2])
@@ -5,11 +5,7 @@ SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 VENV_DIR="$SCRIPT_DIR/.venv"
 VENV_PYTHON="$VENV_DIR/bin/python3"
 
-if [[ ! -x "$VENV_PYTHON" ]]; then
-  python3 -m venv "$VENV_DIR"
-fi
-
-"$VENV_PYTHON" -m pip install --upgrade pip
-"$VENV_PYTHON" -m pip install --upgrade setuptools wheel
-"$VENV_PYTHON" -m pip install --no-build-isolation -e "$SCRIPT_DIR"
+# Creates the venv and installs into it, unless nothing has changed since last time (set WHEELHOUSE to install offline).
+# Runs even when an upload daemon is up, so a changed venv is noticed: the daemon turns down jobs from code it wasn't started from.
+python3 "$SCRIPT_DIR/src/ucb_to_testflight/bootstrap.py" "$VENV_DIR"
 "$VENV_PYTHON" -u -m ucb_to_testflight.upload_to_testflight_cmd_entry "$@"